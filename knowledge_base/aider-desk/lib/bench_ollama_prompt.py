@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the runner's own overhead and scaling, separate from
+model time.
+
+Starts fake_aiderdesk_server.py on free local ports (fixed chunk count and
+rate, so "model time" is constant) and measures:
+- overhead:       per-attempt orchestration cost from ollama_prompt.py's
+                  --results-jsonl records (setup, task creation, detection
+                  latency, and prompt elapsed minus completion)
+- event_handling: in-process cost of EventMonitor._on_event per
+                  response-chunk (tracked task), per event of a mixed
+                  stream (chunks plus log/tool/task-updated/...), and per
+                  event for an untracked task (filtered out)
+- log_tailing:    LogTailer throughput over a pre-written Ollama-style log
+                  (lines/s, with a sprinkling of error-pattern lines)
+- concurrency:    batch throughput at 1/4/16/64 concurrent tasks, per engine
+
+Results are written as stable JSON (sorted keys, schema version) so two
+versions can be compared with --compare; metrics that got worse by more than
+--threshold are reported and make the exit code 1.
+
+Usage:
+    python3 knowledge_base/aider-desk/lib/bench_ollama_prompt.py --output bench.json
+    python3 knowledge_base/aider-desk/lib/bench_ollama_prompt.py --levels 1 4 --engines threads asyncio
+    python3 knowledge_base/aider-desk/lib/bench_ollama_prompt.py --output new.json --compare bench.json
+
+Prerequisites:
+    - Everything ollama_prompt.py needs, plus aiohttp and python-socketio for the stand-in server
+
+PYTHON-ONLY: the whole module (tooling, not part of the Ruby port).
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+import ollama_prompt as op
+from ollama_prompt import percentile
+
+SCHEMA_VERSION = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNNER = os.path.join(HERE, "ollama_prompt.py")
+FAKE_SERVER = os.path.join(HERE, "fake_aiderdesk_server.py")
+
+# Fixed stand-in behaviour: ~0.25s of "model time" per task.
+SERVER_PROFILE = {
+    "chunks": 40,
+    "chunk_interval": 0.005,
+    "first_chunk_latency": 0.05,
+    "model_load_time": 0.0,
+}
+
+
+def _summary(values, digits=4):
+    if not values:
+        return None
+    return {
+        "n": len(values),
+        "mean": round(statistics.mean(values), digits),
+        "median": round(statistics.median(values), digits),
+        "p95": round(percentile(values, 95), digits),
+        "max": round(max(values), digits),
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ── Stand-in server ─────────────────────────────────────────────────────────
+
+@contextlib.contextmanager
+def fake_server(workdir):
+    """Run fake_aiderdesk_server.py on free ports; yields (aiderdesk_url, ollama_url)."""
+    port, ollama_port = _free_port(), _free_port()
+    cmd = [sys.executable, FAKE_SERVER, "--port", str(port), "--ollama-port", str(ollama_port)]
+    for key, value in SERVER_PROFILE.items():
+        cmd += [f"--{key.replace('_', '-')}", str(value)]
+    with open(os.path.join(workdir, "fake_server.log"), "w") as server_log:
+        proc = subprocess.Popen(cmd, stdout=server_log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 15
+        while True:
+            try:
+                if requests.get(f"{base_url}/api/settings", timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.ConnectionError:
+                pass
+            if proc.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"stand-in server did not start (see {server_log.name})")
+            time.sleep(0.1)
+        yield base_url, f"http://127.0.0.1:{ollama_port}"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def run_runner(workdir, base_url, ollama_url, name, prompts, concurrency, engine):
+    """Run ollama_prompt.py over a generated batch; returns its JSONL records."""
+    batch_path = os.path.join(workdir, f"{name}.jsonl")
+    records_path = os.path.join(workdir, f"{name}.results.jsonl")
+    with open(batch_path, "w") as f:
+        for i in range(prompts):
+            f.write(json.dumps({"id": f"{name}-{i}", "prompt": f"bench prompt {i}"}) + "\n")
+    project_dir = os.path.join(workdir, "project")
+    os.makedirs(project_dir, exist_ok=True)
+    cmd = [
+        sys.executable, RUNNER,
+        "--base-url", base_url, "--ollama-url", ollama_url,
+        "--project-dir", project_dir, "--no-tail-logs", "--no-warmup",
+        "--engine", engine, "--batch", batch_path, "--concurrency", str(concurrency),
+        "--timeout", "60", "--retries", "1",
+        "--results-jsonl", records_path,
+    ]
+    with open(os.path.join(workdir, f"{name}.log"), "w") as out:
+        code = subprocess.call(cmd, stdout=out, stderr=subprocess.STDOUT)
+    if code != 0:
+        op.log("WARN", f"{name}: runner exited {code} (see {out.name})")
+    with open(records_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ── Benchmarks ──────────────────────────────────────────────────────────────
+
+def bench_overhead(workdir, base_url, ollama_url, prompts, engine):
+    """Orchestration cost per attempt, from the runner's own records."""
+    records = run_runner(workdir, base_url, ollama_url, f"overhead-{engine}", prompts, 1, engine)
+    attempts = [r for r in records if r["type"] == "attempt" and r["outcome"] == "completed"]
+    prompt_records = [r for r in records if r["type"] == "prompt" and r["success"]]
+    run = next(r for r in records if r["type"] == "run")
+    return {
+        "engine": engine,
+        "prompts": prompts,
+        "setup": run["phases"].get("setup"),
+        "task_creation": _summary([a["phases"]["task_creation"] for a in attempts]),
+        "first_chunk": _summary([a["phases"]["first_chunk"] for a in attempts]),
+        "detection_latency": _summary([a["phases"]["detection_latency"] for a in attempts]),
+        # Everything outside the prompt itself: task creation, stabilize waits, bookkeeping
+        "runner_overhead": _summary([p["elapsed"] - p["phases"]["completion"] for p in prompt_records]),
+    }
+
+
+def mixed_events(events, task_id="bench"):
+    """A chunk-heavy stream with the other event types sprinkled in (about 1 in 10)."""
+    others = [
+        {"type": "log", "data": {"taskId": task_id, "level": "info", "content": "Applied edit"}},
+        {"type": "tool", "data": {"taskId": task_id, "content": "read_file app.py"}},
+        {"type": "task-updated", "data": {"id": task_id, "state": "IN_PROGRESS"}},
+        {"type": "response-completed", "data": {"taskId": task_id, "content": "step done",
+                                                "usageReport": {"sentTokens": 10,
+                                                                "receivedTokens": 5}}},
+        {"type": "context-files-updated", "data": {"taskId": task_id, "files": ["app.py"]}},
+    ]
+    return [others[(i // 10) % len(others)] if i % 10 == 9 else
+            {"type": "response-chunk", "data": {"taskId": task_id, "chunk": f"tok{i} "}}
+            for i in range(events)]
+
+
+def bench_event_handling(events, repeats=5, other_tasks=15):
+    """ns per EventMonitor._on_event call: tracked chunks, a mixed stream, untracked tasks."""
+    monitor = op.EventMonitor(base_url="http://127.0.0.1:9", project_dir="/bench")
+    for i in range(other_tasks):
+        monitor.track(f"other-{i}")
+    tracked = [{"type": "response-chunk", "data": {"taskId": "bench", "chunk": f"tok{i} "}}
+               for i in range(events)]
+    mixed = mixed_events(events)
+    ignored = [{"type": "response-chunk", "data": {"taskId": "not-ours", "chunk": f"tok{i} "}}
+               for i in range(events)]
+
+    def best_of(payloads):
+        best = None
+        for _ in range(repeats):
+            monitor.track("bench")
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                t0 = time.perf_counter_ns()
+                for payload in payloads:
+                    monitor._on_event(payload)
+                elapsed = time.perf_counter_ns() - t0
+            monitor.untrack("bench")
+            best = elapsed if best is None else min(best, elapsed)
+        return best / len(payloads)
+
+    tracked_ns = best_of(tracked)
+    mixed_ns = best_of(mixed)
+    ignored_ns = best_of(ignored)
+    return {
+        "events": events,
+        "repeats": repeats,
+        "tracked_tasks": other_tasks + 1,
+        "ns_per_chunk_event": round(tracked_ns, 1),
+        "chunk_events_per_s": round(1e9 / tracked_ns),
+        "ns_per_mixed_event": round(mixed_ns, 1),
+        "mixed_events_per_s": round(1e9 / mixed_ns),
+        "ns_per_ignored_event": round(ignored_ns, 1),
+    }
+
+
+def bench_log_tailing(lines, repeats=3, error_every=500):
+    """Lines/s through LogTailer.poll() (block reads + regex pass + dispatch)."""
+    with tempfile.TemporaryDirectory(prefix="bench_log_") as workdir:
+        path = os.path.join(workdir, "server.log")
+        with open(path, "w") as f:
+            for i in range(lines):
+                if i % error_every == 0:
+                    f.write(f"time=2026 level=ERROR msg=\"CUDA error: out of memory\" n={i}\n")
+                else:
+                    f.write(f"time=2026 level=INFO source=server.go msg=\"request\" n={i}\n")
+        best = None
+        for _ in range(repeats):
+            tailer = op.LogTailer(path, "OLLAMA")
+            tailer.open()
+            tailer._f.seek(0)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                t0 = time.perf_counter()
+                tailer.poll()
+                elapsed = time.perf_counter() - t0
+            tailer.close()
+            best = elapsed if best is None else min(best, elapsed)
+    return {
+        "lines": lines,
+        "repeats": repeats,
+        "matches": tailer.matches,
+        "log_lines_per_s": round(lines / best),
+    }
+
+
+def bench_concurrency(workdir, base_url, ollama_url, levels, engines, prompts_per_worker):
+    rows = []
+    for engine in engines:
+        for level in levels:
+            prompts = max(8, level * prompts_per_worker)
+            op.log("BENCH", f"concurrency {level} ({engine}): {prompts} prompts")
+            records = run_runner(workdir, base_url, ollama_url, f"c{level}-{engine}",
+                                 prompts, level, engine)
+            run = next(r for r in records if r["type"] == "run")
+            completions = [r["phases"]["completion"] for r in records
+                           if r["type"] == "prompt" and "completion" in r["phases"]]
+            summary = run["summary"]
+            rows.append({
+                "engine": engine,
+                "concurrency": level,
+                "prompts": summary["prompts"],
+                "succeeded": summary["succeeded"],
+                "wall_time": summary["wall_time"],
+                "prompts_per_min": summary["prompts_per_min"],
+                "completion_median": summary["completion_median"],
+                "completion_p95": round(percentile(completions, 95), 3) if completions else None,
+            })
+    return rows
+
+
+# ── Comparison ──────────────────────────────────────────────────────────────
+
+HIGHER_IS_BETTER = ("prompts_per_min", "chunk_events_per_s", "mixed_events_per_s",
+                    "log_lines_per_s", "succeeded")
+
+
+def flatten_metrics(report):
+    """{"metric path": value} for every numeric metric worth comparing."""
+    flat = {}
+    results = report["results"]
+    for row in results.get("overhead", []):
+        for key in ("task_creation", "first_chunk", "detection_latency", "runner_overhead"):
+            if row.get(key):
+                flat[f"overhead.{row['engine']}.{key}.median"] = row[key]["median"]
+        if row.get("setup") is not None:
+            flat[f"overhead.{row['engine']}.setup"] = row["setup"]
+    events = results.get("event_handling") or {}
+    for key in ("ns_per_chunk_event", "chunk_events_per_s", "ns_per_mixed_event",
+                "mixed_events_per_s", "ns_per_ignored_event"):
+        if key in events:
+            flat[f"event_handling.{key}"] = events[key]
+    tailing = results.get("log_tailing") or {}
+    if "log_lines_per_s" in tailing:
+        flat["log_tailing.log_lines_per_s"] = tailing["log_lines_per_s"]
+    for row in results.get("concurrency", []):
+        prefix = f"concurrency.{row['engine']}.c{row['concurrency']}"
+        for key in ("prompts_per_min", "completion_median", "completion_p95", "succeeded"):
+            if row.get(key) is not None:
+                flat[f"{prefix}.{key}"] = row[key]
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Print per-metric deltas; returns the list of regressed metric names."""
+    now, before = flatten_metrics(current), flatten_metrics(baseline)
+    regressions = []
+    print()
+    op.log("BENCH", f"Comparison against baseline ({baseline.get('timestamp', '?')}):")
+    for name in sorted(set(now) & set(before)):
+        old, new = before[name], now[name]
+        if old == 0:
+            continue
+        change = (new - old) / abs(old)
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = ""
+        # Sub-millisecond timings are noise-dominated; only flag relative + absolute changes
+        if worse > threshold and abs(new - old) > 0.001:
+            flag = "  ← REGRESSION"
+            regressions.append(name)
+        op.log("BENCH", f"  {name:48s} {old:>12.4f} → {new:>12.4f}  ({change:+.1%}){flag}")
+    return regressions
+
+
+# ── Main ────────────────────────────────────────────────────────────────────
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ollama_prompt.py against the local stand-in")
+    parser.add_argument("--output", "-o", default=None, help="Write results JSON here")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression (default: 0.10)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="Concurrency levels (default: 1 4 16 64)")
+    parser.add_argument("--engines", nargs="+", choices=["threads", "asyncio"], default=["threads"],
+                        help="Engines to benchmark (default: threads)")
+    parser.add_argument("--prompts-per-worker", type=int, default=2,
+                        help="Batch size per concurrency level = level x this, min 8 (default: 2)")
+    parser.add_argument("--overhead-prompts", type=int, default=5,
+                        help="Sequential prompts for the overhead run (default: 5)")
+    parser.add_argument("--events", type=int, default=20000,
+                        help="Events per on_event microbenchmark repeat (default: 20000)")
+    parser.add_argument("--log-lines", type=int, default=200000,
+                        help="Lines in the log tailing benchmark file (default: 200000)")
+    parser.add_argument("--skip", nargs="+", default=[],
+                        choices=["overhead", "event_handling", "log_tailing", "concurrency"],
+                        help="Benchmarks to skip")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {
+        "schema": SCHEMA_VERSION,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server_profile": SERVER_PROFILE,
+        "results": {},
+    }
+    results = report["results"]
+
+    if "event_handling" not in args.skip:
+        op.log("BENCH", f"EventMonitor._on_event microbenchmark ({args.events} events)")
+        results["event_handling"] = bench_event_handling(args.events)
+
+    if "log_tailing" not in args.skip:
+        op.log("BENCH", f"LogTailer throughput ({args.log_lines} lines)")
+        results["log_tailing"] = bench_log_tailing(args.log_lines)
+
+    if "overhead" not in args.skip or "concurrency" not in args.skip:
+        with tempfile.TemporaryDirectory(prefix="bench_ollama_prompt_") as workdir:
+            with fake_server(workdir) as (base_url, ollama_url):
+                if "overhead" not in args.skip:
+                    results["overhead"] = []
+                    for engine in args.engines:
+                        op.log("BENCH", f"Per-attempt overhead ({engine}, "
+                                        f"{args.overhead_prompts} sequential prompts)")
+                        results["overhead"].append(bench_overhead(
+                            workdir, base_url, ollama_url, args.overhead_prompts, engine))
+                if "concurrency" not in args.skip:
+                    results["concurrency"] = bench_concurrency(
+                        workdir, base_url, ollama_url, args.levels, args.engines,
+                        args.prompts_per_worker)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        op.log("BENCH", f"Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("schema") != SCHEMA_VERSION:
+            op.log("WARN", f"Baseline schema {baseline.get('schema')} != {SCHEMA_VERSION}; "
+                           "comparing the metrics both have")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            op.log("FAIL", f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        op.log("PASS", "No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for AiderDesk + Ollama, for deterministic load testing of
+ollama_prompt.py without a real backend or model.
+
+Implements the REST endpoints the runner calls (/api/settings,
+/api/project/*, /api/run-prompt, /api/add-context-file, ...) and the
+Socket.IO `event` stream (response-chunk, response-completed, ask-question,
+question-answered, task-updated) on one port, and the Ollama API
+(/api/tags, /api/ps, /api/generate) on another.
+
+Behaviour is configurable from the CLI: time to first chunk, chunk count and
+rate, REST latency, and the fraction of tasks that fail (run-prompt 500),
+stall (stop streaming until interrupted) or ask a question. run-prompt
+"loads" the task's main model into the Ollama stand-in if it is not resident
+(--model-load-time), and --max-loaded-models evicts the least recently used
+model, so model swaps show up as cold starts. Per-task
+randomness is seeded from --seed and the task's creation index, so a run
+with the same flags produces the same task behaviour.
+
+Usage:
+    python3 knowledge_base/aider-desk/lib/fake_aiderdesk_server.py --port 24337 --ollama-port 11434
+    python3 knowledge_base/aider-desk/lib/fake_aiderdesk_server.py --chunks 200 --chunk-interval 0.005 \\
+        --stall-rate 0.1 --question-rate 0.2 --fail-rate 0.05 --seed 7
+
+    python3 knowledge_base/aider-desk/lib/ollama_prompt.py --base-url http://localhost:24337 \\
+        --ollama-url http://localhost:11434 --project-dir /tmp/fake-project --no-tail-logs
+
+--existing-tasks N seeds N old tasks (mostly runner-named, one minute apart)
+for exercising cleanup.
+
+--ollama-log PATH writes Ollama-style server log lines (model load start and
+finish, [GIN] request lines) for the runner's tailer (--ollama-log PATH there
+too); --oom-rate and --overflow-rate make a fraction of tasks log an
+out-of-memory runner crash (and stream nothing until interrupted) or a
+prompt truncation.
+
+--sio-drop-every N drops every Socket.IO connection every N seconds, and
+--sio-down-for M refuses reconnects for M seconds after each drop, so tasks
+finish while the runner is disconnected.
+
+--fail-task-list N answers the first N GET /api/project/tasks with a 503,
+for the runner's handling of a listing that fails.
+
+--prompt-cache simulates Ollama's prompt (KV) cache, so prefix warm-up
+(--warm-prefix / --warm-context on the runner) shows up as a shorter time
+to first chunk.
+
+GET /_fake/stats on the AiderDesk port returns request, task and event counters.
+
+Prerequisites:
+    - pip install aiohttp "python-socketio[asyncio_client]"
+
+PYTHON-ONLY: the whole module (test tooling, not part of the Ruby port).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from ollama_prompt import log, render_context_files
+
+try:
+    import socketio
+    from aiohttp import web
+except ImportError:  # the runner itself does not need these
+    web = None
+
+
+def utc_now(ago=0.0):
+    stamp = datetime.now(timezone.utc) - timedelta(seconds=ago)
+    return stamp.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class FakeTask:
+    """Server-side state for one task."""
+
+    def __init__(self, task_id, index, project_dir, name, rng):
+        self.id = task_id
+        self.index = index
+        self.project_dir = project_dir
+        self.name = name
+        self.rng = rng
+        self.state = "TODO"
+        self.created_at = utc_now()
+        self.updated_at = self.created_at
+        self.completed_at = None
+        self.context_files = []
+        self.settings = {}
+        self.main_model = None
+        self.interrupted = asyncio.Event()
+        self.answered = asyncio.Event()
+
+    def data(self):
+        """TaskData shape as returned by /project/tasks and task-updated events."""
+        return {
+            "id": self.id,
+            "baseDir": self.project_dir,
+            "name": self.name,
+            "state": self.state,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
+            "completedAt": self.completed_at,
+            **self.settings,
+        }
+
+
+class FakeBackend:
+    """Routes and Socket.IO server for the AiderDesk and Ollama stand-ins."""
+
+    def __init__(self, args):
+        self.args = args
+        self.tasks = {}
+        self.task_counter = 0
+        self.subscribers = {}  # sid -> subscribe-events message
+        self.loaded_models = {}  # name -> expires_at (monotonic seconds), least recently used first
+        self.loading = {}  # name -> asyncio.Event set when its load finishes
+        self.prompt_cache = {}  # name -> (num_ctx, words of the last prompt) with --prompt-cache
+        self.stats = Counter()
+        self.started = time.time()
+        self.sio_down_until = 0.0  # monotonic; Socket.IO connects are refused until then
+        self.model_size = int(args.model_size_gb * 1e9)
+        self.ollama_log = open(args.ollama_log, "a", buffering=1) if args.ollama_log else None
+        self.sio = socketio.AsyncServer(async_mode="aiohttp", logger=False, engineio_logger=False)
+        self.sio.on("connect", self._on_connect)
+        self.sio.on("disconnect", self._on_disconnect)
+        self.sio.on("message", self._on_message)
+        self._seed_tasks(args.existing_tasks, args.existing_project_dir)
+
+    # ── Helpers ──────────────────────────────────────────────────────────
+
+    def _verbose(self, msg):
+        if self.args.verbose:
+            log("FAKE", msg)
+
+    def _olog(self, level, msg, **fields):
+        """Append a slog-style line to --ollama-log, as Ollama's server.log has them."""
+        if self.ollama_log is None:
+            return
+        extra = "".join(f" {k}={v}" for k, v in fields.items())
+        stamp = datetime.now().astimezone().isoformat(timespec="milliseconds")
+        self.ollama_log.write(f'time={stamp} level={level} source=fake_server.go msg="{msg}"{extra}\n')
+
+    def _gin(self, status, seconds, method, path):
+        """Append a [GIN] access-log line to --ollama-log."""
+        if self.ollama_log is None:
+            return
+        stamp = datetime.now().strftime("%Y/%m/%d - %H:%M:%S")
+        self.ollama_log.write(f'[GIN] {stamp} | {status} | {go_duration_text(seconds):>14s} |'
+                              f'       127.0.0.1 | {method:<8s} "{path}"\n')
+
+    async def _json(self, request):
+        try:
+            return await request.json()
+        except ValueError:
+            return {}
+
+    def _middleware(self):
+        @web.middleware
+        async def count_and_delay(request, handler):
+            self.stats[f"{request.method} {request.path}"] += 1
+            if self.args.api_latency > 0:
+                await asyncio.sleep(self.args.api_latency)
+            return await handler(request)
+        return count_and_delay
+
+    def _task_or_404(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": f"task {task_id} not found"}),
+                                   content_type="application/json")
+        return task
+
+    def _seed_tasks(self, count, project_dir):
+        """Pre-existing tasks for cleanup tests: 2 in 3 look like runner tasks, one minute apart."""
+        for i in range(count):
+            if i % 3 == 2:
+                name = f"Manual task {i}"
+            else:
+                name = f"Prompt #1 [seed-{i}] - {datetime.now().strftime('%H:%M:%S')}"
+            task = FakeTask(str(uuid.uuid4()), 0, project_dir, name, random.Random(i))
+            task.created_at = task.updated_at = utc_now(ago=60 * (i + 1))
+            self.tasks[task.id] = task
+
+    # ── Socket.IO ────────────────────────────────────────────────────────
+
+    async def _on_connect(self, sid, environ, auth=None):
+        if time.monotonic() < self.sio_down_until:
+            self.stats["sio_refused"] += 1
+            return False
+        self.stats["sio_connects"] += 1
+        self._verbose(f"Socket.IO client connected: {sid}")
+
+    async def drop_sockets(self):
+        """--sio-drop-every: disconnect every client, then refuse connects for --sio-down-for."""
+        while True:
+            await asyncio.sleep(self.args.sio_drop_every)
+            self.sio_down_until = time.monotonic() + self.args.sio_down_for
+            for sid in list(self.subscribers):
+                self.stats["sio_drops"] += 1
+                await self.sio.disconnect(sid)
+            log("FAKE", f"Dropped Socket.IO clients; refusing connects for {self.args.sio_down_for}s")
+
+    async def _on_disconnect(self, sid, *args):
+        self.subscribers.pop(sid, None)
+        self._verbose(f"Socket.IO client disconnected: {sid}")
+
+    async def _on_message(self, sid, message):
+        if isinstance(message, dict) and message.get("action") == "subscribe-events":
+            self.subscribers[sid] = message
+            self.stats["sio_subscribes"] += 1
+            self._verbose(f"{sid} subscribed to {len(message.get('eventTypes') or [])} event type(s)")
+        elif isinstance(message, dict) and message.get("action") == "unsubscribe-events":
+            self.subscribers.pop(sid, None)
+
+    def _wants(self, subscription, event_type, data):
+        event_types = subscription.get("eventTypes")
+        if event_types and event_type not in event_types:
+            return False
+        base_dirs = subscription.get("baseDirs")
+        if base_dirs and data.get("baseDir") and data["baseDir"] not in base_dirs:
+            return False
+        task_ids = subscription.get("taskIds")
+        task_id = data.get("taskId") or data.get("id")
+        if task_ids and task_id and task_id not in task_ids:
+            return False
+        return True
+
+    async def emit(self, event_type, data):
+        payload = {"type": event_type, "data": data}
+        for sid, subscription in list(self.subscribers.items()):
+            if self._wants(subscription, event_type, data):
+                await self.sio.emit("event", payload, to=sid)
+                self.stats[f"event {event_type}"] += 1
+
+    async def _task_updated(self, task, state):
+        task.state = state
+        task.updated_at = utc_now()
+        task.completed_at = task.updated_at if state in ("READY_FOR_REVIEW", "DONE") else None
+        await self.emit("task-updated", task.data())
+
+    # ── AiderDesk REST ───────────────────────────────────────────────────
+
+    async def settings(self, request):
+        return web.json_response({"fake": True, "uptime": round(time.time() - self.started, 1)})
+
+    async def ok(self, request):
+        await self._json(request)
+        return web.json_response({})
+
+    async def list_tasks(self, request):
+        if self.stats["GET /api/project/tasks"] <= self.args.fail_task_list:
+            self.stats["task_lists_failed"] += 1
+            return web.json_response({"error": "unavailable"}, status=503)
+        project_dir = request.query.get("projectDir")
+        tasks = [t.data() for t in self.tasks.values()
+                 if not project_dir or t.project_dir == project_dir]
+        return web.json_response(tasks)
+
+    async def new_task(self, request):
+        body = await self._json(request)
+        self.task_counter += 1
+        rng = random.Random(f"{self.args.seed}:{self.task_counter}")
+        task = FakeTask(str(uuid.uuid4()), self.task_counter, body.get("projectDir", ""),
+                        body.get("name") or f"Task {self.task_counter}", rng)
+        self.tasks[task.id] = task
+        self.stats["tasks_created"] += 1
+        return web.json_response(task.data())
+
+    async def update_task(self, request):
+        body = await self._json(request)
+        task = self._task_or_404(body.get("id"))
+        task.settings.update(body.get("updates") or {})
+        task.updated_at = utc_now()
+        return web.json_response(task.data())
+
+    async def delete_task(self, request):
+        body = await self._json(request)
+        task = self.tasks.pop(body.get("id"), None)
+        if task is not None:
+            task.interrupted.set()
+            self.stats["tasks_deleted"] += 1
+        return web.json_response({})
+
+    async def reset_task(self, request):
+        body = await self._json(request)
+        task = self._task_or_404(body.get("taskId"))
+        task.context_files = []
+        task.interrupted.clear()
+        self.stats["tasks_reset"] += 1
+        await self._task_updated(task, "TODO")
+        return web.json_response({})
+
+    async def add_context_file(self, request):
+        body = await self._json(request)
+        task = self._task_or_404(body.get("taskId"))
+        task.context_files.append((body.get("path"), bool(body.get("readOnly"))))
+        files = [{"path": p, "readOnly": ro} for p, ro in task.context_files]
+        await self.emit("context-files-updated",
+                        {"baseDir": task.project_dir, "taskId": task.id, "files": files})
+        return web.json_response({})
+
+    async def set_main_model(self, request):
+        body = await self._json(request)
+        task = self._task_or_404(body.get("taskId"))
+        task.main_model = body.get("mainModel")
+        return web.json_response({})
+
+    async def answer_question(self, request):
+        body = await self._json(request)
+        task = self._task_or_404(body.get("taskId"))
+        task.answered.set()
+        return web.json_response({})
+
+    async def interrupt(self, request):
+        body = await self._json(request)
+        task = self._task_or_404(body.get("taskId"))
+        task.interrupted.set()
+        self.stats["tasks_interrupted"] += 1
+        return web.json_response({})
+
+    async def run_prompt(self, request):
+        """Stream the simulated response; returns when the task finishes or is interrupted."""
+        body = await self._json(request)
+        task = self._task_or_404(body.get("taskId"))
+        args, rng = self.args, task.rng
+
+        if rng.random() < args.fail_rate:
+            self.stats["tasks_failed"] += 1
+            return web.json_response({"error": "simulated run-prompt failure"}, status=500)
+        stall = rng.random() < args.stall_rate
+        question = rng.random() < args.question_rate
+        oom = rng.random() < args.oom_rate
+        overflow = rng.random() < args.overflow_rate
+        turn_at = args.chunks // 2
+        t0 = time.monotonic()
+
+        task.interrupted.clear()
+        await self._task_updated(task, "IN_PROGRESS")
+        model = (task.main_model or "").replace("ollama/", "")
+        if model in args.models:
+            await self._load(model)
+            self._keep(model, 300)  # Ollama's default keep_alive for requests without one
+        if oom:
+            # The runner dies mid prompt-eval; AiderDesk just never gets a chunk
+            self.stats["tasks_oom"] += 1
+            self._olog("ERROR", "llama runner process has terminated",
+                       error='"cudaMalloc failed: out of memory"')
+            self.loaded_models.pop(model, None)
+            await task.interrupted.wait()
+            self._gin(500, time.monotonic() - t0, "POST", "/api/chat")
+            return await self._interrupted(task)
+        if overflow:
+            self.stats["tasks_truncated"] += 1
+            self._olog("WARN", "truncating input prompt", limit=2048,
+                       prompt=args.prompt_tokens + 2048, keep=4, new=2048)
+        latency = args.first_chunk_latency
+        if args.prompt_cache and model in args.models:
+            read_only = [p for p, ro in task.context_files if ro and p]
+            try:
+                text = render_context_files(task.project_dir, read_only) if read_only else ""
+            except OSError:
+                text = ""
+            evaluated = await self._evaluate(model, (text + body.get("prompt", "")).split(),
+                                             args.task_num_ctx)
+            latency += evaluated / args.prompt_tps
+        if await self._pause(task, latency):
+            return await self._interrupted(task)
+
+        base = {"baseDir": task.project_dir, "taskId": task.id}
+        message_id = str(uuid.uuid4())
+        sent = 0
+        for i in range(args.chunks):
+            if i == turn_at and stall:
+                self.stats["tasks_stalled"] += 1
+                await task.interrupted.wait()
+                return await self._interrupted(task)
+            if i == turn_at and question:
+                task.answered.clear()
+                await self.emit("ask-question", {**base, "question": "Apply the changes? (yes/no)"})
+                self.stats["questions_asked"] += 1
+                await task.answered.wait()
+                await self.emit("question-answered", {**base, "answer": "yes"})
+            await self.emit("response-chunk", {**base, "messageId": message_id, "chunk": f"tok{i} "})
+            sent += 1
+            interval = args.chunk_interval
+            if args.chunk_jitter:
+                interval *= 1 + rng.uniform(-args.chunk_jitter, args.chunk_jitter)
+            if await self._pause(task, interval):
+                return await self._interrupted(task)
+
+        if args.write_files:
+            self._write_context_files(task)
+        await self.emit("response-completed", {
+            **base,
+            "messageId": message_id,
+            "content": f"Done ({sent} chunks)",
+            "usageReport": {"sentTokens": args.prompt_tokens, "receivedTokens": sent},
+        })
+        if args.completion_event == "task-completed":
+            task.state = "DONE"
+            await self.emit("task-completed", {"id": task.id, "baseDir": task.project_dir})
+        else:
+            await self._task_updated(task, "READY_FOR_REVIEW")
+        self.stats["tasks_completed"] += 1
+        self._gin(200, time.monotonic() - t0, "POST", "/api/chat")
+        return web.json_response({})
+
+    async def _pause(self, task, seconds):
+        """Sleep, returning True early if the task was interrupted."""
+        if seconds <= 0:
+            return task.interrupted.is_set()
+        try:
+            await asyncio.wait_for(task.interrupted.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _interrupted(self, task):
+        await self._task_updated(task, "INTERRUPTED")
+        return web.json_response({"interrupted": True})
+
+    def _write_context_files(self, task):
+        for path, read_only in task.context_files:
+            if read_only or not path:
+                continue
+            full = path if os.path.isabs(path) else os.path.join(task.project_dir, path)
+            try:
+                with open(full, "w") as f:
+                    f.write(f"# written by fake_aiderdesk_server for task {task.id}\n")
+            except OSError as e:
+                log("WARN", f"Could not write {full}: {e}")
+
+    async def fake_stats(self, request):
+        return web.json_response({
+            "uptime": round(time.time() - self.started, 3),
+            "tasks": len(self.tasks),
+            "subscribers": len(self.subscribers),
+            "counters": dict(self.stats),
+        })
+
+    # ── Ollama REST ──────────────────────────────────────────────────────
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for name, expires in list(self.loaded_models.items()):
+            if expires <= now:
+                del self.loaded_models[name]
+
+    async def _load(self, model):
+        """Make model resident, paying --model-load-time and evicting LRU models over the limit."""
+        self._evict_expired()
+        if model in self.loaded_models:
+            return 0.0
+        t0 = time.monotonic()
+        pending = self.loading.get(model)
+        if pending is not None:  # another request is already loading it
+            await pending.wait()
+            return time.monotonic() - t0
+        pending = self.loading[model] = asyncio.Event()
+        try:
+            limit = self.args.max_loaded_models
+            while limit and len(self.loaded_models) >= limit:
+                evicted = next(iter(self.loaded_models))
+                del self.loaded_models[evicted]
+                self.stats["model_evictions"] += 1
+                self._verbose(f"Evicted {evicted} to make room for {model}")
+            self._olog("INFO", "starting llama server", model=f"/models/{model}")
+            await asyncio.sleep(self.args.model_load_time)
+            self._olog("INFO", f"llama runner started in {self.args.model_load_time:.2f} seconds")
+            self.loaded_models[model] = time.monotonic() + 300
+            self.stats["model_loads"] += 1
+            self._verbose(f"Loaded {model}")
+        finally:
+            del self.loading[model]
+            pending.set()
+        return time.monotonic() - t0
+
+    async def _evaluate(self, model, words, num_ctx):
+        """
+        --prompt-cache: prompt tokens (words) to evaluate after the longest
+        common prefix with the model's last prompt. A different num_ctx
+        reloads the model, which drops the cache.
+        """
+        cached_ctx, cached = self.prompt_cache.get(model, (num_ctx, ()))
+        if cached_ctx != num_ctx:
+            self.loaded_models.pop(model, None)
+            await self._load(model)
+            cached = ()
+        common = 0
+        for a, b in zip(cached, words):
+            if a != b:
+                break
+            common += 1
+        self.prompt_cache[model] = (num_ctx, words)
+        self.stats["prompt_cache_hit_tokens"] += common
+        return max(1, len(words) - common)
+
+    async def ollama_tags(self, request):
+        return web.json_response({"models": [{"name": m, "model": m, "size": self.model_size}
+                                             for m in self.args.models]})
+
+    async def ollama_ps(self, request):
+        self._evict_expired()
+        now = time.monotonic()
+        models = [{
+            "name": name,
+            "model": name,
+            "size": self.model_size,
+            "expires_at": datetime.fromtimestamp(time.time() + expires - now, timezone.utc).isoformat(),
+        } for name, expires in self.loaded_models.items()]
+        return web.json_response({"models": models})
+
+    async def ollama_generate(self, request):
+        body = await self._json(request)
+        args = self.args
+        model = body.get("model", "")
+        if model not in args.models:
+            return web.json_response({"error": f"model '{model}' not found"}, status=404)
+
+        t0 = time.monotonic()
+        keep_alive = parse_keep_alive(body.get("keep_alive", "5m"))
+        if "prompt" not in body:
+            # No prompt: Ollama only loads (or, with keep_alive 0, unloads) the model
+            if keep_alive == 0:
+                self.loaded_models.pop(model, None)
+                return web.json_response({"model": model, "done": True, "done_reason": "unload"})
+            load = await self._load(model)
+            self._keep(model, keep_alive)
+            self._gin(200, time.monotonic() - t0, "POST", "/api/generate")
+            return web.json_response({"model": model, "done": True, "done_reason": "load",
+                                      "load_duration": int(load * 1e9)})
+        load = await self._load(model)
+        words = str(body.get("prompt", "")).split()
+        if not body.get("raw"):
+            words = ["<template>"] * 25 + words
+        if args.prompt_cache:
+            num_ctx = (body.get("options") or {}).get("num_ctx")
+            prompt_tokens = await self._evaluate(model, words, num_ctx)
+        else:
+            prompt_tokens = max(1, len(words))
+        prompt_eval = prompt_tokens / args.prompt_tps
+        await asyncio.sleep(prompt_eval)
+
+        tokens = ["Hello", "!", " How", " can", " I", " help", " you", "?"][:max(1, args.ollama_tokens)]
+        final = {
+            "model": model,
+            "done": True,
+            "response": "",
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) / args.eval_tps * 1e9),
+        }
+
+        if not body.get("stream", True):
+            await asyncio.sleep(len(tokens) / args.eval_tps)
+            self._keep(model, keep_alive)
+            final["response"] = "".join(tokens)
+            final["total_duration"] = int((time.monotonic() - t0) * 1e9)
+            self._gin(200, time.monotonic() - t0, "POST", "/api/generate")
+            return web.json_response(final)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for token in tokens:
+            await response.write((json.dumps({"model": model, "response": token, "done": False})
+                                  + "\n").encode())
+            await asyncio.sleep(1 / args.eval_tps)
+        self._keep(model, keep_alive)
+        final["total_duration"] = int((time.monotonic() - t0) * 1e9)
+        await response.write((json.dumps(final) + "\n").encode())
+        await response.write_eof()
+        self._gin(200, time.monotonic() - t0, "POST", "/api/generate")
+        return response
+
+    def _keep(self, model, keep_alive):
+        self.loaded_models.pop(model, None)  # re-insert: most recently used last
+        if keep_alive != 0:
+            self.loaded_models[model] = time.monotonic() + keep_alive
+
+    # ── Apps ─────────────────────────────────────────────────────────────
+
+    def aiderdesk_app(self):
+        app = web.Application(middlewares=[self._middleware()])
+        self.sio.attach(app)
+        r = app.router
+        r.add_get("/api/settings", self.settings)
+        r.add_get("/api/project/tasks", self.list_tasks)
+        r.add_post("/api/project/tasks", self.update_task)
+        r.add_post("/api/project/tasks/new", self.new_task)
+        r.add_post("/api/project/tasks/delete", self.delete_task)
+        r.add_post("/api/project/tasks/reset", self.reset_task)
+        r.add_post("/api/add-context-file", self.add_context_file)
+        r.add_post("/api/project/answer-question", self.answer_question)
+        r.add_post("/api/project/interrupt", self.interrupt)
+        r.add_post("/api/project/settings/main-model", self.set_main_model)
+        r.add_post("/api/run-prompt", self.run_prompt)
+        r.add_get("/_fake/stats", self.fake_stats)
+        # add-open, set-active, settings/update, settings/edit-formats, settings/main-model, ...
+        r.add_post("/api/{tail:.*}", self.ok)
+        return app
+
+    def ollama_app(self):
+        app = web.Application(middlewares=[self._middleware()])
+        app.router.add_get("/api/tags", self.ollama_tags)
+        app.router.add_get("/api/ps", self.ollama_ps)
+        app.router.add_post("/api/generate", self.ollama_generate)
+        return app
+
+
+def go_duration_text(seconds):
+    """Format seconds the way Go's time.Duration prints (as in [GIN] lines)."""
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.6f}ms"
+    if seconds < 60:
+        return f"{seconds:.9f}s"
+    return f"{int(seconds // 60)}m{seconds % 60:.9f}s"
+
+
+def parse_keep_alive(value):
+    """Ollama keep_alive: seconds, or a duration string like "5m" / "24h". Negative = forever."""
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = str(value).strip()
+        units = {"s": 1, "m": 60, "h": 3600}
+        if text and text[-1] in units:
+            seconds = float(text[:-1]) * units[text[-1]]
+        else:
+            seconds = float(text or 0)
+    return float("inf") if seconds < 0 else seconds
+
+
+async def serve(args):
+    backend = FakeBackend(args)
+    runners = []
+    dropper = asyncio.create_task(backend.drop_sockets()) if args.sio_drop_every else None
+    sites = [(backend.aiderdesk_app(), args.port, "AiderDesk")]
+    if args.ollama_port:
+        sites.append((backend.ollama_app(), args.ollama_port, "Ollama"))
+    for app, port, name in sites:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, args.host, port).start()
+        runners.append(runner)
+        log("FAKE", f"{name} stand-in listening on http://{args.host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if dropper is not None:
+            dropper.cancel()
+        for runner in runners:
+            await runner.cleanup()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local AiderDesk + Ollama stand-in for load testing ollama_prompt.py",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=24337, help="AiderDesk port (default: 24337)")
+    parser.add_argument("--ollama-port", type=int, default=11434,
+                        help="Ollama port, 0 to disable (default: 11434)")
+
+    parser.add_argument("--chunks", type=int, default=40,
+                        help="response-chunk events per task (default: 40)")
+    parser.add_argument("--chunk-interval", type=float, default=0.02,
+                        help="Seconds between chunks (default: 0.02)")
+    parser.add_argument("--chunk-jitter", type=float, default=0.0,
+                        help="Random +/- fraction applied to each chunk interval (default: 0)")
+    parser.add_argument("--first-chunk-latency", type=float, default=0.2,
+                        help="Seconds from run-prompt to the first chunk (default: 0.2)")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="Extra seconds added to every REST call (default: 0)")
+    parser.add_argument("--prompt-tokens", type=int, default=500,
+                        help="sentTokens reported in usageReport (default: 500)")
+    parser.add_argument("--completion-event", choices=["task-updated", "task-completed"],
+                        default="task-updated",
+                        help="How completion is signalled (default: task-updated, like AiderDesk)")
+    parser.add_argument("--write-files", action="store_true",
+                        help="Write the task's writable context files on completion")
+
+    parser.add_argument("--existing-tasks", type=int, default=0,
+                        help="Tasks that already exist at startup, one minute apart (default: 0)")
+    parser.add_argument("--existing-project-dir", default="/tmp/fake-project",
+                        help="Project the --existing-tasks belong to (default: /tmp/fake-project)")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Fraction of run-prompt calls that return HTTP 500 (default: 0)")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="Fraction of tasks that stop streaming halfway until interrupted (default: 0)")
+    parser.add_argument("--question-rate", type=float, default=0.0,
+                        help="Fraction of tasks that ask a question halfway (default: 0)")
+    parser.add_argument("--oom-rate", type=float, default=0.0,
+                        help="Fraction of tasks whose runner dies out of memory (logged to "
+                             "--ollama-log; no chunks until interrupted) (default: 0)")
+    parser.add_argument("--overflow-rate", type=float, default=0.0,
+                        help="Fraction of tasks that log a prompt truncation (context overflow) "
+                             "to --ollama-log (default: 0)")
+    parser.add_argument("--ollama-log", default=None,
+                        help="Append Ollama-style server log lines to this file (default: off)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for per-task behaviour (default: 0)")
+
+    parser.add_argument("--models", nargs="+", default=["qwen2.5-coder:32b"],
+                        help="Models listed by /api/tags (default: qwen2.5-coder:32b)")
+    parser.add_argument("--model-load-time", type=float, default=0.5,
+                        help="Seconds to 'load' a model that is not resident (default: 0.5)")
+    parser.add_argument("--max-loaded-models", type=int, default=0,
+                        help="Resident models before the least recently used is evicted "
+                             "(default: 0 = unlimited)")
+    parser.add_argument("--model-size-gb", type=float, default=1.0,
+                        help="Size reported for every model by /api/tags and /api/ps (default: 1)")
+    parser.add_argument("--prompt-tps", type=float, default=500.0,
+                        help="Ollama prompt-processing tokens/sec (default: 500)")
+    parser.add_argument("--eval-tps", type=float, default=50.0,
+                        help="Ollama generation tokens/sec (default: 50)")
+    parser.add_argument("--ollama-tokens", type=int, default=8,
+                        help="Tokens streamed per /api/generate call, max 8 (default: 8)")
+    parser.add_argument("--prompt-cache", action="store_true",
+                        help="Simulate Ollama's prompt cache: /api/generate and run-prompt only "
+                             "evaluate the words after the prefix shared with the model's last "
+                             "prompt, and run-prompt's first chunk waits for that eval "
+                             "(read-only context files + prompt, at --prompt-tps)")
+    parser.add_argument("--task-num-ctx", type=int, default=None,
+                        help="num_ctx the simulated tasks run with; priming with another value "
+                             "reloads the model (default: none, like requests without options)")
+
+    parser.add_argument("--sio-drop-every", type=float, default=0.0,
+                        help="Disconnect every Socket.IO client every N seconds (default: 0, never)")
+    parser.add_argument("--sio-down-for", type=float, default=0.0,
+                        help="After a drop, refuse Socket.IO connects for N seconds, so events "
+                             "are missed (default: 0)")
+    parser.add_argument("--fail-task-list", type=int, default=0,
+                        help="Answer the first N task listings with a 503 (default: 0)")
+
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log connections and subscriptions")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if web is None:
+        log("FAIL", "The fake server needs aiohttp: "
+                    "pip install aiohttp \"python-socketio[asyncio_client]\"")
+        sys.exit(1)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
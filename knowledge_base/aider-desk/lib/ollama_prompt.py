@@ -6,15 +6,50 @@ Converted from test_ollama_submission.py with comprehensive improvements:
 - Ollama health check and model warm-up (eliminates cold-start zombies)
 - Structured error classification (replaces generic "zombie" diagnosis)
 - Stale-chunk detection and per-phase timing metrics
-- Ollama error pattern detection in log tailer
+- Concurrent startup: health checks, warm-up and project setup as a dependency graph
+- Filtered, concurrent task cleanup, optionally in the background (--cleanup-*)
+- Optional early abort on confirmed stalls (--stall-policy abort)
+- Readiness-checked retries that reuse or prefetch the retry's task (--retry-task)
+- Socket.IO reconnect with backoff, re-subscribe and task re-sync (--sio-reconnect-delay)
+- Narrower Socket.IO subscriptions: event profiles and task-scoped filtering (--event-profile / --subscribe-tasks)
+- Per-job models in batch JSONL, with Ollama model residency management (--manage-residency)
+- Optional token-throughput metrics (--measure-tokens: TTFT, load, tokens/sec)
+- Machine-readable attempt/prompt/run records (--results-json / --results-jsonl)
+- Socket.IO event recording and offline replay (--record / --replay)
+- Adaptive per-model deadlines learned from run history (--adaptive-timeouts)
+- Event-driven attempt loop (no fixed 1s polling)
+- Ollama error pattern detection in log tailer (inotify on Linux, rotation-aware)
+- Typed Ollama log events (load, OOM, context overflow, crash) that end and classify attempts
+- Prometheus metrics over HTTP or as a node_exporter textfile (--metrics-port / --metrics-textfile)
+- Prompt-prefix cache warm-up from a file or the --context-file set (--warm-prefix / --warm-context)
 - Configurable via CLI: prompt, model, debug level, retries, timeout, edit format, mode
 - Optional --prompt-file to load prompt text from a file
+- Batch mode: many prompts through one process with a bounded worker pool
+- Optional asyncio engine (--engine asyncio, see ollama_prompt_async.py)
+- Daemon mode: set up once, take prompt jobs over a local HTTP API (--serve, see ollama_prompt_daemon.py)
+- Persistent SQLite job queue with priorities; re-attaches to running tasks after a crash (--queue-db)
 
 Usage:
     python3 knowledge_base/ollama_prompt.py --prompt "Create hello.rb that prints hello world"
     python3 knowledge_base/ollama_prompt.py --prompt-file my_prompt.txt
     python3 knowledge_base/ollama_prompt.py --model ollama/qwen2.5-coder:32b --timeout 180 --retries 5
     python3 knowledge_base/ollama_prompt.py --debug --edit-format whole --mode agent
+    python3 knowledge_base/ollama_prompt.py --timeout 600 --stall-policy abort
+    python3 knowledge_base/ollama_prompt.py --batch prompts/ --retry-task prefetch
+    python3 knowledge_base/ollama_prompt.py --batch prompts/ --event-profile questions --subscribe-tasks
+    python3 knowledge_base/ollama_prompt.py --ollama-log /var/log/ollama/server.log --no-log-fail-fast
+    python3 knowledge_base/ollama_prompt.py --batch prompts.jsonl --concurrency 4
+    python3 knowledge_base/ollama_prompt.py --batch mixed.jsonl --manage-residency --ollama-memory-gb 48
+    python3 knowledge_base/ollama_prompt.py --measure-tokens --prompt "Create hello.rb"
+    python3 knowledge_base/ollama_prompt.py --batch prompts/ --results-jsonl runs.jsonl
+    python3 knowledge_base/ollama_prompt.py --cleanup-runner-only --cleanup-older-than 1d --cleanup-background
+    python3 knowledge_base/ollama_prompt.py --batch prompts.jsonl --metrics-port 9464
+    python3 knowledge_base/ollama_prompt.py --batch prompts/ --context-file CONVENTIONS.md --warm-context
+    python3 knowledge_base/ollama_prompt.py --record run.events.gz
+    python3 knowledge_base/ollama_prompt.py --replay run.events.gz --replay-speed 0
+    python3 knowledge_base/ollama_prompt.py --engine asyncio --batch prompts/ --concurrency 32
+    python3 knowledge_base/ollama_prompt.py --serve --serve-socket /tmp/ollama_prompt.sock --concurrency 2
+    python3 knowledge_base/ollama_prompt.py --batch prompts.jsonl --queue-db jobs.sqlite
 
 Prerequisites:
     - AiderDesk running on localhost:24337
@@ -24,9 +59,12 @@ Prerequisites:
 Python-only components (must be re-implemented for Ruby port):
     - argparse (CLI parsing)        → Ruby: OptionParser or Thor gem
     - requests (HTTP client)         → Ruby: Net::HTTP, Faraday, or HTTParty gem
+    - requests.Session (keep-alive)  → Ruby: Net::HTTP.start block or Faraday + net_http_persistent
     - python-socketio (Socket.IO)    → Ruby: socketio-client or faye-websocket gem
     - threading.Thread (concurrency) → Ruby: Thread class (built-in)
     - threading.Event (signalling)   → Ruby: use Mutex + ConditionVariable or Queue
+    - concurrent.futures (pool)      → Ruby: concurrent-ruby FixedThreadPool or Thread + Queue
+    - contextvars (log prefix)       → Ruby: Thread.current[:log_prefix]
     - base64 (encoding)              → Ruby: Base64 module (stdlib)
     - json (serialisation)           → Ruby: JSON module (stdlib)
     - os.path (file operations)      → Ruby: File, Dir, Pathname (stdlib)
@@ -37,17 +75,32 @@ Python-only components (must be re-implemented for Ruby port):
 # Ruby equivalents noted inline for future port.
 import argparse          # Ruby: OptionParser (stdlib) or Thor gem
 import base64            # Ruby: Base64 (stdlib)
+import contextvars       # Ruby: Thread.current[] (thread-local storage)
+import ctypes            # Ruby: Fiddle (stdlib) or the ffi gem
+import ctypes.util
+import gzip              # Ruby: Zlib::GzipWriter / GzipReader (stdlib)
+import hashlib           # Ruby: Digest::SHA256 (stdlib)
+import http.server       # Ruby: WEBrick (stdlib gem)
 import json              # Ruby: JSON (stdlib)
 import os                # Ruby: File, Dir, Pathname (stdlib)
+import queue             # Ruby: Queue (built-in)
+import re                # Ruby: Regexp (built-in)
+import select            # Ruby: IO.select
+import sqlite3           # Ruby: the sqlite3 gem
+import statistics        # Ruby: Array#sort + manual median
 import sys               # Ruby: $stdout, $stderr, exit()
 import threading         # Ruby: Thread, Mutex, ConditionVariable (built-in)
 import time              # Ruby: Time.now, sleep()
-from datetime import datetime  # Ruby: Time.now.strftime
+import uuid              # Ruby: SecureRandom.hex
+from collections import deque  # Ruby: Array#last(n)
+from concurrent.futures import ThreadPoolExecutor, as_completed  # Ruby: concurrent-ruby gem
+from datetime import datetime, timezone  # Ruby: Time.now.strftime, Time#utc
 
 # ── Python-only: third-party dependencies ────────────────────────────────────
 # These must be installed via pip; Ruby equivalents noted.
 import requests                    # Ruby: Net::HTTP (stdlib), Faraday, or HTTParty gem
-from requests.auth import HTTPBasicAuth  # Ruby: Net::HTTP basic_auth or Faraday middleware
+from requests.adapters import HTTPAdapter  # Ruby: Net::HTTP.start (persistent) or Faraday adapter
+from urllib3.util.retry import Retry       # Ruby: faraday-retry middleware
 import socketio                    # Ruby: socketio-client gem or faye-websocket gem
 
 
@@ -55,21 +108,55 @@ import socketio                    # Ruby: socketio-client gem or faye-websocket
 
 DEBUG = False
 
+# Per-job log prefix so interleaved batch output stays attributable.
+_log_prefix = contextvars.ContextVar("log_prefix", default="")
+
+# Time source for TaskState timestamps; --replay swaps in a virtual clock.
+clock = time.time
+
 
 # ── Timestamp / logging ─────────────────────────────────────────────────────
 # PORTABLE: These are simple string formatting + print functions.
 # Ruby: Time.now.strftime("%Y-%m-%dT%H:%M:%S.%L") and puts/STDOUT.flush
 
+_ts_second = (None, "")  # (epoch second, its formatted date-time), reused within the second
+
+
 def ts():
     """ISO-8601 timestamp for log cross-referencing with AiderDesk logs."""
-    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+    global _ts_second
+    now = time.time()
+    second = int(now)
+    cached = _ts_second
+    if cached[0] != second:
+        cached = _ts_second = (second, datetime.fromtimestamp(second).strftime("%Y-%m-%dT%H:%M:%S"))
+    return f"{cached[1]}.{int((now - second) * 1000):03d}"
 
 
-def log(level, msg):
-    """Print a timestamped log line. DEBUG-level lines are suppressed unless --debug."""
+def log(level, msg, *args):
+    """
+    Print a timestamped log line. DEBUG-level lines are suppressed unless --debug.
+
+    With args, msg is a %-format applied only when the line is printed, so
+    hot paths pay nothing for suppressed lines.
+    """
     if level == "DEBUG" and not DEBUG:
         return
-    print(f"{ts()} [{level}] {msg}", flush=True)
+    if args:
+        msg = msg % args
+    sys.stdout.write(f"{ts()} [{level}] {_log_prefix.get()}{msg}\n")
+    sys.stdout.flush()
+
+
+def _preview(text, limit):
+    return text[:limit] + '...' if len(text) > limit else text
+
+
+def log_lines(entries):
+    """log() for a batch of (level, msg) pairs: one timestamp, one write, one flush."""
+    stamp, prefix = ts(), _log_prefix.get()
+    sys.stdout.write("".join(f"{stamp} [{level}] {prefix}{msg}\n" for level, msg in entries))
+    sys.stdout.flush()
 
 
 # ── Failure classification ───────────────────────────────────────────────────
@@ -82,13 +169,40 @@ class FailureReason:
     QUESTION_UNANSWERED = "question"
     CONNECTION_ERROR = "connection"
     OLLAMA_ERROR = "ollama_error"
+    STALLED = "stalled"
+    # From the Ollama server log (same strings as the OllamaLogEvents kinds)
+    MODEL_LOADING = "model_loading"
+    OUT_OF_MEMORY = "oom"
+    CONTEXT_EXCEEDED = "context_exceeded"
+    RUNNER_CRASHED = "runner_crashed"
     UNKNOWN = "unknown"
 
 
-def classify_failure(monitor, prompt_result, elapsed):
-    """Return a structured failure reason instead of generic 'zombie'."""
-    if monitor.chunks_received == 0:
-        if elapsed > 60:
+COLD_START_THRESHOLD = 60  # seconds without a first chunk before blaming model load
+
+
+def classify_failure(monitor, prompt_result, elapsed, cold_start_threshold=COLD_START_THRESHOLD,
+                     log_events=(), chunk_events=True):
+    """
+    Return a structured failure reason instead of generic 'zombie'.
+
+    log_events: the Ollama log events tailed during the attempt; a fatal one
+    (OOM, context overflow, runner crash) or a model load outranks the
+    elapsed-time and exception-text heuristics.
+    chunk_events: False when the --event-profile has no response-chunk
+    events; the chunk count is then always 0 and is not used.
+    """
+    fatal = [e for e in log_events if OllamaLogEvents.is_fatal(e)]
+    if fatal:
+        return fatal[0]["event"]
+
+    if not chunk_events:
+        if model_load_in(log_events):
+            return FailureReason.MODEL_LOADING
+    elif monitor.chunks_received == 0:
+        if model_load_in(log_events):
+            return FailureReason.MODEL_LOADING
+        if elapsed > cold_start_threshold:
             return FailureReason.COLD_START
         return FailureReason.CONNECTION_ERROR
 
@@ -101,20 +215,127 @@ def classify_failure(monitor, prompt_result, elapsed):
             return FailureReason.CONNECTION_ERROR
         return FailureReason.OLLAMA_ERROR
 
-    if monitor.chunks_received > 0:
+    if chunk_events and monitor.chunks_received > 0:
         return FailureReason.PARTIAL_RESPONSE
 
     return FailureReason.UNKNOWN
 
 
+# ── HTTP clients ────────────────────────────────────────────────────────────
+# PYTHON-ONLY: requests.Session + HTTPAdapter give connection pooling, keep-alive
+# and urllib3 retry/backoff.
+# Ruby: Faraday with the net_http_persistent adapter and faraday-retry middleware,
+# or one Net::HTTP.start session per backend guarded by a Mutex.
+
+class EndpointStats:
+    """Per-endpoint call/latency/error counters, keyed by "METHOD /path"."""
+
+    def __init__(self):
+        self.stats = {}  # endpoint -> [calls, total_seconds, max_seconds, errors]
+        self._lock = threading.Lock()
+        self.metrics = None  # Metrics, with self.name as the client label (attach_metrics)
+        self.name = None
+
+    def _record(self, endpoint, seconds, error=False):
+        if self.metrics is not None:
+            self.metrics.record_http(self.name, endpoint, seconds, error)
+        with self._lock:
+            entry = self.stats.setdefault(endpoint, [0, 0.0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            if error:
+                entry[3] += 1
+
+    def latency_report(self):
+        """Per-endpoint counters, busiest endpoints first."""
+        with self._lock:
+            rows = [
+                {
+                    "endpoint": endpoint,
+                    "calls": calls,
+                    "mean_ms": round(total / calls * 1000, 1),
+                    "max_ms": round(peak * 1000, 1),
+                    "errors": errors,
+                }
+                for endpoint, (calls, total, peak, errors) in self.stats.items()
+            ]
+        return sorted(rows, key=lambda row: row["calls"] * row["mean_ms"], reverse=True)
+
+
+class HttpClient(EndpointStats):
+    """
+    Pooled keep-alive HTTP client for one backend (AiderDesk or Ollama).
+
+    Every REST helper goes through one of these so TCP connections are reused
+    across calls and threads. The Basic auth header is encoded once. Connection
+    errors are retried with exponential backoff for every method (the request
+    never reached the server); read errors and 502/503/504 only for GET/HEAD.
+    Latency is counted per "METHOD /path" endpoint (query string stripped).
+    """
+
+    def __init__(self, base_url, username=None, password=None,
+                 pool_size=10, retries=2, backoff=0.5):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        if username is not None:
+            creds = base64.b64encode(f"{username}:{password}".encode()).decode()
+            self.session.headers["Authorization"] = f"Basic {creds}"
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, **kwargs):
+        endpoint = f"{method} {path.split('?', 1)[0]}"
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except Exception:
+            self._record(endpoint, time.perf_counter() - t0, error=True)
+            raise
+        self._record(endpoint, time.perf_counter() - t0, error=r.status_code >= 400)
+        return r
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def log_latency_report(clients):
+    """Print the per-endpoint REST latency counters for each named client."""
+    print()
+    log("INFO", "  REST latency per endpoint:")
+    for name, client in clients:
+        for row in client.latency_report():
+            log("INFO", f"    {name:16s} {row['endpoint']:38s} calls={row['calls']:<5d} "
+                        f"mean={row['mean_ms']:>8.1f}ms max={row['max_ms']:>8.1f}ms "
+                        f"errors={row['errors']}")
+
+
 # ── Ollama health & warm-up ─────────────────────────────────────────────────
-# PYTHON-ONLY: Uses requests library for HTTP calls.
-# Ruby: replace requests.get/post with Net::HTTP or Faraday equivalents.
+# PYTHON-ONLY: Uses the pooled HttpClient for HTTP calls.
+# Ruby: replace client.get/post with the Faraday/Net::HTTP session equivalents.
 
-def check_ollama_health(model="qwen2.5-coder:32b", ollama_url="http://localhost:11434"):
+def check_ollama_health(client, model="qwen2.5-coder:32b"):
     """Verify Ollama is running and the model is available."""
     try:
-        r = requests.get(f"{ollama_url}/api/tags", timeout=5)
+        r = client.get("/api/tags", timeout=5)
         if r.status_code != 200:
             log("FAIL", f"Ollama not responding: HTTP {r.status_code}")
             return False
@@ -132,10 +353,10 @@ def check_ollama_health(model="qwen2.5-coder:32b", ollama_url="http://localhost:
         return False
 
 
-def check_ollama_running_models(ollama_url="http://localhost:11434"):
-    """Check what models Ollama currently has loaded."""
+async def fetch_running_models(io, client):
+    """Check what models Ollama currently has loaded (/api/ps); [] if unreachable."""
     try:
-        r = requests.get(f"{ollama_url}/api/ps", timeout=5)
+        r = await io.get(client, "/api/ps", timeout=5)
         if r.status_code == 200:
             models = r.json().get("models", [])
             for m in models:
@@ -147,18 +368,33 @@ def check_ollama_running_models(ollama_url="http://localhost:11434"):
         return []
 
 
-def warm_up_ollama(model="qwen2.5-coder:32b", timeout=300, ollama_url="http://localhost:11434"):
-    """Send a trivial prompt to force model loading into memory."""
+def check_ollama_running_models(client):
+    """fetch_running_models() for the blocking setup code."""
+    return run_sync(fetch_running_models(THREAD_IO, client))
+
+
+def warm_up_ollama(client, model="qwen2.5-coder:32b", timeout=300, stats=None, options=None):
+    """
+    Send a trivial prompt to force model loading into memory.
+
+    If a stats dict is passed, the prompt is streamed instead and the dict is
+    filled with Ollama's own timing counters (see ollama_generate_stats()).
+    options (e.g. num_ctx) should match the tasks' so they reuse this load.
+    """
     short_model = model.replace("ollama/", "")
     log("INFO", f"Warming up Ollama model: {short_model} (may take several minutes)...")
+    extra = {"options": options} if options else {}
     try:
-        r = requests.post(
-            f"{ollama_url}/api/generate",
+        if stats is not None:
+            return _warm_up_streaming(client, short_model, timeout, stats, extra)
+        r = client.post(
+            "/api/generate",
             json={
                 "model": short_model,
                 "prompt": "hi",
                 "stream": False,
                 "keep_alive": "24h",
+                **extra,
             },
             timeout=timeout,
         )
@@ -176,71 +412,714 @@ def warm_up_ollama(model="qwen2.5-coder:32b", timeout=300, ollama_url="http://lo
         return False
 
 
+def _warm_up_streaming(client, short_model, timeout, stats, extra):
+    t0 = time.perf_counter()
+    ttft = None
+    final = {}
+    with client.post(
+        "/api/generate",
+        json={
+            "model": short_model,
+            "prompt": "hi",
+            "stream": True,
+            "keep_alive": "24h",
+            **extra,
+        },
+        timeout=timeout,
+        stream=True,
+    ) as r:
+        if r.status_code != 200:
+            log("WARN", f"Warm-up returned {r.status_code}: {r.text[:200]}")
+            return False
+        # NDJSON: one object per token, the last one (done=true) carries the counters
+        for line in r.iter_lines():
+            if not line:
+                continue
+            msg = json.loads(line)
+            if ttft is None and msg.get("response"):
+                ttft = time.perf_counter() - t0
+            if msg.get("done"):
+                final = msg
+    stats.update(ollama_generate_stats(final, ttft))
+    log("PASS", f"Model {short_model} is warm and ready "
+                f"(load={stats.get('load', 0):.2f}s, ttft={stats.get('ttft', 0):.2f}s, "
+                f"gen={stats.get('gen_tps', 0):.1f} tok/s)")
+    return True
+
+
+# ── Prefix cache warm-up ────────────────────────────────────────────────────
+# PORTABLE: two /api/generate calls and arithmetic over their counters.
+# Ruby: the same JSON bodies through Net::HTTP.
+#
+# Ollama keeps the KV cache of a slot's last prompt and only evaluates the
+# tokens after the longest common prefix of the next one. Priming the model
+# with the text our tasks start with moves that prompt eval out of the first
+# task. The priming call must use the tasks' num_ctx: a different value
+# reloads the model and the cache goes with it.
+
+READ_ONLY_FILES_HEADER = ("Here are some READ ONLY files, provided for your reference.\n"
+                          "Do not edit these files!\n\n")
+
+
+def render_context_files(project_dir, paths):
+    """--context-file contents as one read-only files block, in aider's layout."""
+    parts = [READ_ONLY_FILES_HEADER]
+    for path in paths:
+        with open(os.path.join(project_dir, path)) as f:
+            parts.append(f"{path}\n```\n{f.read()}\n```\n\n")
+    return "".join(parts)
+
+
+def load_warm_prefix(args):
+    """The text --warm-prefix or --warm-context primes Ollama with, or None. Exits on bad input."""
+    try:
+        if args.warm_prefix:
+            source = args.warm_prefix
+            with open(os.path.expanduser(source)) as f:
+                prefix = f.read()
+        elif args.warm_context and args.context_file:
+            source = f"{len(args.context_file)} context file(s)"
+            prefix = render_context_files(args.project_dir, args.context_file)
+        else:
+            return None
+    except OSError as e:
+        log("FAIL", f"Could not read the warm-up prefix: {e}")
+        sys.exit(1)
+    log("INFO", f"Warm-up prefix: {len(prefix)} chars from {source}")
+    return prefix
+
+
+def ollama_options(args):
+    """Request options shared by warm-up and priming (num_ctx must match the tasks')."""
+    return {"num_ctx": args.num_ctx} if args.num_ctx else {}
+
+
+def prime_prefix(client, model, prefix, options=None, timeout=300):
+    """
+    Evaluate prefix (raw: no chat template) with a 24h keep_alive, then send
+    it again to measure the cache hit. Returns {"prefix_tokens",
+    "cold_prompt_eval", "warm_prompt_eval", "warm_tokens"} or None.
+    """
+    body = {
+        "model": model.replace("ollama/", ""),
+        "prompt": prefix,
+        "raw": True,
+        "stream": False,
+        "keep_alive": "24h",
+        "options": {**(options or {}), "num_predict": 1},
+    }
+    passes = []
+    try:
+        for _ in range(2):
+            r = client.post("/api/generate", json=body, timeout=timeout)
+            if r.status_code != 200:
+                log("WARN", f"Prefix warm-up returned {r.status_code}: {r.text[:200]}")
+                return None
+            passes.append(ollama_generate_stats(r.json()))
+    except Exception as e:
+        log("WARN", f"Prefix warm-up failed: {e}")
+        return None
+    cold, warm = passes
+    stats = {
+        "prefix_tokens": cold["prompt_tokens"],
+        "cold_prompt_eval": cold["prompt_eval"],
+        "warm_prompt_eval": warm["prompt_eval"],
+        "warm_tokens": warm["prompt_tokens"],
+    }
+    log("PASS", f"Prefix cached: {stats['prefix_tokens']} tokens, prompt eval "
+                f"{stats['cold_prompt_eval']:.2f}s cold → {stats['warm_prompt_eval']:.2f}s warm "
+                f"({stats['warm_tokens']} token(s) re-evaluated)")
+    return stats
+
+
+def record_prefix_stats(stats, phases, throughput):
+    """Prefix warm-up timings into phases, token counts into throughput."""
+    for key in ("cold_prompt_eval", "warm_prompt_eval"):
+        phases[f"warm_prefix_{key}"] = round(stats[key], 3)
+    throughput["warm_prefix_tokens"] = stats["prefix_tokens"]
+    throughput["warm_prefix_reeval_tokens"] = stats["warm_tokens"]
+
+
+def log_prefix_report(ctx, first_chunks):
+    """
+    Mean time to first chunk with the primed prefix, against the attempts in
+    the history (same model/mode/edit format) that ran without one. The mean,
+    not the median: the prefix eval is paid by the first task of a run.
+    """
+    if ctx.warm_prefix is None or not first_chunks:
+        return
+    mean = statistics.mean(first_chunks)
+    line = f"  First chunk mean with the primed prefix: {mean:.2f}s ({len(first_chunks)} task(s))"
+    if ctx.history is not None:
+        key = ctx.deadlines(ctx.model)["history_key"]
+        before = [s["first_chunk"] for s in ctx.history.samples(key)
+                  if s.get("first_chunk") is not None and not s.get("warm_prefix")]
+        if before:
+            baseline = statistics.mean(before)
+            change = f" ({(mean - baseline) / baseline:+.0%})" if baseline else ""
+            line += f", {baseline:.2f}s over {len(before)} attempt(s) without{change}"
+    log("INFO", line)
+
+
+# ── Token throughput ────────────────────────────────────────────────────────
+# PORTABLE: Arithmetic over Ollama's final /api/generate record and the
+# per-task counters kept by TaskState. Ruby: plain Hash math.
+#
+# Ollama reports durations in nanoseconds. For the real task AiderDesk does
+# not relay those counters, so task rates come from the response-completed
+# usageReport token counts over the chunk timings seen on Socket.IO.
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if count and seconds and seconds > 0 else None
+
+
+def ollama_generate_stats(final, ttft=None):
+    """Seconds and tokens/sec from the done=true record of an /api/generate call."""
+    ns = 1e9
+    stats = {
+        "load": final.get("load_duration", 0) / ns,
+        "prompt_eval": final.get("prompt_eval_duration", 0) / ns,
+        "eval": final.get("eval_duration", 0) / ns,
+        "prompt_tokens": final.get("prompt_eval_count", 0),
+        "gen_tokens": final.get("eval_count", 0),
+    }
+    if ttft is not None:
+        stats["ttft"] = ttft
+    stats["prompt_tps"] = _rate(stats["prompt_tokens"], stats["prompt_eval"])
+    stats["gen_tps"] = _rate(stats["gen_tokens"], stats["eval"])
+    return stats
+
+
+def record_warm_up_stats(stats, phases, throughput):
+    """Split warm-up stats into timings (phases) and rates/counts (throughput)."""
+    for key in ("ttft", "load", "prompt_eval", "eval"):
+        if key in stats:
+            phases[f"warm_up_{key}"] = round(stats[key], 3)
+    for key in ("prompt_tokens", "gen_tokens", "prompt_tps", "gen_tps"):
+        if stats.get(key) is not None:
+            throughput[f"warm_up_{key}"] = stats[key]
+
+
+def task_throughput(state, start):
+    """
+    Token and chunk rates for one completed attempt.
+
+    Prompt processing is approximated by prompt tokens over time-to-first-chunk
+    (it includes AiderDesk's own overhead); generation by completion tokens
+    over the first-to-last chunk window.
+    """
+    if state is None or state.first_chunk_at is None:
+        return {}
+    ttft = state.first_chunk_at - start
+    generation = (state.last_chunk_at or state.first_chunk_at) - state.first_chunk_at
+    metrics = {
+        "task_prompt_tokens": state.prompt_tokens,
+        "task_gen_tokens": state.completion_tokens,
+        "task_prompt_tps": _rate(state.prompt_tokens, ttft),
+        "task_gen_tps": _rate(state.completion_tokens, generation),
+        "task_chunks_per_s": _rate(state.chunks_received - 1, generation),
+        "task_bytes_per_s": _rate(state.chunk_bytes, generation),
+    }
+    return {k: v for k, v in metrics.items() if v}
+
+
+def _throughput_unit(name):
+    if name.endswith("_tps"):
+        return "tok/s"
+    if name.endswith("_tokens"):
+        return "tok"
+    if name.endswith("_chunks_per_s"):
+        return "chunks/s"
+    return "B/s"
+
+
+def log_throughput(throughput):
+    if not throughput:
+        return
+    print()
+    log("INFO", "  Token throughput:")
+    for name, value in throughput.items():
+        shown = f"{value:>9d}" if isinstance(value, int) else f"{value:>9.1f}"
+        log("INFO", f"    {name:22s} {shown} {_throughput_unit(name)}")
+
+
+# ── Model residency ─────────────────────────────────────────────────────────
+# PORTABLE: Bookkeeping over /api/ps snapshots; loads and unloads are plain
+# /api/generate calls with keep_alive. Ruby: a class with a Mutex around the
+# counters, Thread.new for the background preload (ctx.io.spawn()).
+
+def ollama_model_name(model):
+    """Ollama's name for an AiderDesk model id ("ollama/x" → "x"), None for other providers."""
+    return model.split("/", 1)[1] if model.startswith("ollama/") else None
+
+
+async def load_model(io, client, name, keep_alive="24h", timeout=300):
+    """Load a model without generating (a prompt-less /api/generate). Returns True on success."""
+    t0 = time.time()
+    try:
+        r = await io.post(client, "/api/generate", {"model": name, "keep_alive": keep_alive},
+                          timeout=timeout)
+    except Exception as e:
+        log("WARN", f"Loading {name} failed: {e}")
+        return False
+    if r.status_code != 200:
+        log("WARN", f"Loading {name} returned {r.status_code}: {r.text[:200]}")
+        return False
+    log("RESIDENCY", f"{name} resident after {time.time() - t0:.1f}s")
+    return True
+
+
+async def unload_model(io, client, name):
+    """Ask Ollama to drop a model now (keep_alive 0)."""
+    try:
+        await io.post(client, "/api/generate", {"model": name, "keep_alive": 0})
+        log("RESIDENCY", f"Unloaded {name}")
+    except Exception as e:
+        log("WARN", f"Unloading {name} failed: {e}")
+
+
+def unload_ollama_model(client, name):
+    """unload_model() for blocking callers (sweep_ollama_prompt.py)."""
+    run_sync(unload_model(THREAD_IO, client, name))
+
+
+def ollama_model_sizes(client):
+    """Model name → bytes on disk from /api/tags ({} if unreachable)."""
+    try:
+        r = client.get("/api/tags", timeout=5)
+        if r.status_code == 200:
+            return {m["name"]: m.get("size") or 0 for m in r.json().get("models", [])}
+    except Exception:
+        pass
+    return {}
+
+
+def order_jobs_by_model(jobs, default_model, loaded=()):
+    """
+    Stable-group jobs by model so each model is loaded as few times as
+    possible, without crossing priorities: jobs re-attached after a crash
+    (--queue-db "resume") stay first, then each "priority" level, highest
+    first, is grouped on its own. Within a level, resident models go first
+    (after the first level: the model the previous level ended on), then in
+    order of first appearance.
+    """
+    levels = {}
+    for job in jobs:
+        level = (0, 0) if job.get("resume") else (1, -job.get("priority", 0))
+        levels.setdefault(level, []).append(job)
+    ordered = []
+    resident = set(loaded)
+    for level in sorted(levels):
+        group = levels[level]
+        models = list(dict.fromkeys(job.get("model") or default_model for job in group))
+        models.sort(key=lambda m: ollama_model_name(m) not in resident)
+        ordered += [job for model in models for job in group
+                    if (job.get("model") or default_model) == model]
+        resident = {ollama_model_name(models[-1])} - {None}
+    return ordered
+
+
+def model_switches(jobs, default_model):
+    """How many times consecutive jobs change model (each one a potential reload)."""
+    models = [job.get("model") or default_model for job in jobs]
+    return sum(1 for a, b in zip(models, models[1:]) if a != b)
+
+
+class ModelResidency:
+    """
+    Which Ollama models the queued prompts still need vs. what /api/ps says
+    is loaded.
+
+    Decides what to unload before a load and what to preload while the
+    current model generates; the engines do the HTTP so the thread and
+    asyncio engines share the bookkeeping. Loads and evictions are counted
+    from the differences between successive /api/ps snapshots.
+    """
+
+    def __init__(self, jobs, default_model, running=(), sizes=None, budget_gb=None):
+        self.queue = [ollama_model_name(j.get("model") or default_model) for j in jobs]
+        self.active = {}       # model → prompts in flight
+        self.loaded = {m["name"]: m.get("size") or 0 for m in running}
+        self.sizes = dict(sizes or {})
+        self.budget = budget_gb * 1e9 if budget_gb else None
+        self.loading = {}      # model → threading.Event set when our load of it finishes
+        self.unloading = set()  # unloads we asked for and have not seen yet
+        self.loads = 0
+        self.evictions = 0
+        self.unloads = 0
+        self.preloads = 0
+        self._lock = threading.Lock()
+
+    def observe(self, running):
+        """Update from an /api/ps model list."""
+        now = {m["name"]: m.get("size") or 0 for m in running}
+        with self._lock:
+            for name in now.keys() - self.loaded.keys():
+                self.loads += 1
+                log("RESIDENCY", f"{name} is now loaded")
+            for name in self.loaded.keys() - now.keys():
+                if name in self.unloading:
+                    self.unloads += 1
+                else:
+                    self.evictions += 1
+                    log("RESIDENCY", f"⚠️  {name} was evicted / expired")
+                self.unloading.discard(name)
+            for name, size in now.items():
+                self.sizes[name] = max(self.sizes.get(name, 0), size)
+            self.loaded = now
+
+    def job_started(self, model):
+        with self._lock:
+            if model in self.queue:
+                self.queue.remove(model)
+            self.active[model] = self.active.get(model, 0) + 1
+
+    def job_finished(self, model):
+        with self._lock:
+            self.active[model] = self.active.get(model, 1) - 1
+
+    def busy_models(self):
+        """Models with prompts in flight."""
+        with self._lock:
+            return {m for m, n in self.active.items() if n > 0}
+
+    def _resident_bytes(self, exclude=()):
+        return sum(self.sizes.get(m, 0) for m in self.loaded if m not in exclude)
+
+    def unload_plan(self, model):
+        """
+        Idle models to unload before loading model: those no queued prompt
+        needs, and with a memory budget also the ones needed latest, until
+        model fits.
+        """
+        with self._lock:
+            if model in self.loaded:
+                return []
+            idle = [m for m in self.loaded if not self.active.get(m) and m not in self.unloading]
+            plan = [m for m in idle if m not in self.queue]
+            if self.budget is not None:
+                later = sorted((m for m in idle if m in self.queue), key=self.queue.index, reverse=True)
+                for m in later:
+                    if self._resident_bytes(plan) + self.sizes.get(model, 0) <= self.budget:
+                        break
+                    plan.append(m)
+            self.unloading.update(plan)
+            return plan
+
+    def begin_load(self, model):
+        """
+        True if the caller should load model (not resident, nobody loading it).
+        When another job or a preload is loading it, wait on load_pending().
+        """
+        with self._lock:
+            if model in self.loaded or model in self.loading:
+                return False
+            self.loading[model] = threading.Event()
+            return True
+
+    def load_pending(self, model):
+        """The Event of a load of model in progress, or None."""
+        with self._lock:
+            return self.loading.get(model)
+
+    def load_done(self, model):
+        with self._lock:
+            pending = self.loading.pop(model, None)
+        if pending is not None:
+            pending.set()
+
+    def next_preload(self, current):
+        """
+        The next queued model to load while current generates, or None.
+        Only with a memory budget, and only if it fits next to what is resident.
+        """
+        with self._lock:
+            if self.budget is None:
+                return None
+            upcoming = next((m for m in self.queue if m and m != current
+                             and m not in self.loaded and m not in self.loading), None)
+            if upcoming is None:
+                return None
+            if self._resident_bytes() + self.sizes.get(upcoming, 0) > self.budget:
+                log("DEBUG", f"Not preloading {upcoming}: would exceed the memory budget")
+                return None
+            self.loading[upcoming] = threading.Event()
+            self.preloads += 1
+            return upcoming
+
+    def summary(self):
+        return {"model_loads": self.loads, "model_evictions": self.evictions,
+                "model_unloads": self.unloads, "model_preloads": self.preloads}
+
+
+def make_residency(args, ollama, jobs):
+    """
+    --manage-residency: order jobs by model and build the ModelResidency.
+    Returns (jobs, residency); residency is None when disabled.
+    """
+    if not args.manage_residency:
+        return jobs, None
+    running = check_ollama_running_models(ollama)
+    ordered = order_jobs_by_model(jobs, args.model, {m["name"] for m in running})
+    before, after = model_switches(jobs, args.model), model_switches(ordered, args.model)
+    if after < before:
+        log("RESIDENCY", f"Reordered prompts by model: {before} → {after} model switch(es)")
+    residency = ModelResidency(ordered, args.model, running, ollama_model_sizes(ollama),
+                               args.ollama_memory_gb)
+    models = sorted({m for m in residency.queue if m})
+    budget = f"{args.ollama_memory_gb}GB" if args.ollama_memory_gb else "not set (no preloading)"
+    log("RESIDENCY", f"Models needed: {', '.join(models) or '(none on Ollama)'}; "
+                     f"memory budget: {budget}")
+    return ordered, residency
+
+
+async def residency_acquire(ctx, job):
+    """
+    Before a prompt job: make its model resident, unloading idle models first.
+    If another job (or a preload) is already loading it, wait for that load.
+    """
+    residency, name = ctx.residency, ollama_model_name(job_model(ctx, job))
+    if residency is None or name is None:
+        return
+    residency.job_started(name)
+    residency.observe(await fetch_running_models(ctx.io, ctx.ollama))
+    for idle in residency.unload_plan(name):
+        await unload_model(ctx.io, ctx.ollama, idle)
+    if residency.begin_load(name):
+        log("RESIDENCY", f"Loading {name}...")
+        try:
+            await load_model(ctx.io, ctx.ollama, name, timeout=ctx.args.warmup_timeout)
+        finally:
+            residency.load_done(name)
+        residency.observe(await fetch_running_models(ctx.io, ctx.ollama))
+        return
+    pending = residency.load_pending(name)
+    if pending is not None:
+        log("RESIDENCY", f"Waiting for the load of {name} already in progress...")
+        if not await ctx.io.wait_event(pending, ctx.args.warmup_timeout):
+            log("WARN", f"{name} still loading after {ctx.args.warmup_timeout}s — starting anyway")
+
+
+def residency_release(ctx, job):
+    residency, name = ctx.residency, ollama_model_name(job_model(ctx, job))
+    if residency is not None and name is not None:
+        residency.job_finished(name)
+
+
+def residency_preload(ctx, job):
+    """While job's model generates, load the next queued model in the background."""
+    residency = ctx.residency
+    if residency is None:
+        return
+    upcoming = residency.next_preload(ollama_model_name(job_model(ctx, job)))
+    if upcoming is None:
+        return
+    log("RESIDENCY", f"Preloading {upcoming} in the background")
+
+    async def _preload():
+        try:
+            await load_model(ctx.io, ctx.ollama, upcoming, timeout=ctx.args.warmup_timeout)
+        finally:
+            residency.load_done(upcoming)
+        residency.observe(await fetch_running_models(ctx.io, ctx.ollama))
+
+    ctx.io.spawn(_preload(), name=f"preload-{upcoming}")
+
+
 # ── AiderDesk API helpers ────────────────────────────────────────────────────
-# PYTHON-ONLY: Uses requests library with HTTPBasicAuth.
+# PYTHON-ONLY: Uses the pooled HttpClient (Basic auth header set once on the session).
 # Ruby: use Net::HTTP with req.basic_auth(user, pass), or Faraday basic_auth.
+# Paths are relative to the AiderDesk client's base URL (<base-url>/api).
 
-def api_get(api_url, auth, path, **kwargs):
-    url = f"{api_url}{path}"
-    log("DEBUG", f"GET  {url}")
-    r = requests.get(url, auth=auth, timeout=30, **kwargs)
+def api_get(client, path, timeout=30, **kwargs):
+    log("DEBUG", f"GET  {client.base_url}{path}")
+    r = client.get(path, timeout=timeout, **kwargs)
     log("DEBUG", f"  -> {r.status_code} ({len(r.content)}B)")
     return r
 
 
-def api_post(api_url, auth, path, payload=None, timeout=30, **kwargs):
-    url = f"{api_url}{path}"
+def api_post(client, path, payload=None, timeout=30, **kwargs):
     body_preview = json.dumps(payload, separators=(',', ':'))[:200] if payload else "null"
-    log("DEBUG", f"POST {url}  body={body_preview}")
-    r = requests.post(url, auth=auth, json=payload, timeout=timeout, **kwargs)
+    log("DEBUG", f"POST {client.base_url}{path}  body={body_preview}")
+    r = client.post(path, json=payload, timeout=timeout, **kwargs)
     log("DEBUG", f"  -> {r.status_code} ({len(r.content)}B)")
     return r
 
 
-def health_check(api_url, auth):
+def health_check(client):
     try:
-        r = requests.get(f"{api_url}/settings", auth=auth, timeout=5)
+        r = client.get("/settings", timeout=5)
         return r.status_code == 200
     except Exception:
         return False
 
 
-# ── Background prompt sender ────────────────────────────────────────────────
-# PYTHON-ONLY: Uses threading.Thread for async HTTP call.
-# Ruby: use Thread.new { ... } with a shared hash/struct for the result.
+# ── Engine I/O ──────────────────────────────────────────────────────────────
+# The attempt code (task setup, the attempt loop, model residency, --queue-db
+# recovery) is written once, as coroutines over ctx.io: HTTP calls, waiting on
+# a TaskState or a threading.Event, background work and the worker pool. ThreadIO does all of it
+# blocking, so its coroutines never suspend and run_sync() runs them on the
+# calling thread; the asyncio engine's LoopIO (ollama_prompt_async.py) runs
+# the same coroutines on an event loop over aiohttp.
+#
+# The invariant that keeps this safe: ThreadIO's methods are plain blocking
+# calls that return a Ready, which cannot suspend, and the shared coroutines
+# only await ctx.io / io methods and each other (tests/test_engine_io.py
+# checks both). Anything else would suspend, and run_sync() raises.
+# PYTHON-ONLY: async/await is only there so one body serves both engines.
+# Ruby: plain methods (drop async/await) calling ThreadIO's blocking methods.
+
+class Ready:
+    """The result of a call that already happened: awaiting it never suspends."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def __await__(self):
+        return self.value
+        yield  # a generator that finishes on its first step
+
+
+def run_sync(coro):
+    """Run a coroutine over ThreadIO to completion on this thread; returns its result."""
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError("run_sync(): the coroutine awaited something other than ThreadIO")
+
+
+class ThreadIO:
+    """
+    The thread engine's I/O layer: pooled requests clients, threading.Event
+    waits, daemon threads for background work and a ThreadPoolExecutor for
+    batch workers. Each method blocks until it is done and returns a Ready.
+    """
+
+    name = "threads"
+
+    def run(self, coro):
+        """Run a shared coroutine from plain code (main(), daemon workers)."""
+        return run_sync(coro)
+
+    def get(self, client, path, timeout=30):
+        return Ready(api_get(client, path, timeout=timeout))
+
+    def post(self, client, path, payload=None, timeout=30):
+        return Ready(api_post(client, path, payload, timeout=timeout))
+
+    def wait(self, state, timeout):
+        """Until a handler signals state (state.wake) or timeout seconds pass."""
+        state.wake.wait(timeout)
+        state.wake.clear()
+        return Ready()
+
+    def wait_event(self, event, timeout):
+        """Until event (a threading.Event) is set or timeout seconds pass; True if set."""
+        return Ready(event.wait(timeout))
 
-def fire_prompt_async(api_url, auth, project_dir, task_id, prompt, mode="code"):
-    """Fire run-prompt in a background thread. Returns a dict holding the result."""
+    def spawn(self, coro, name=None):
+        """
+        Run coro on a daemon thread, in a copy of the caller's context (so it
+        logs with the job's prefix). Returns the handle join() takes.
+        """
+        handle = {"result": None}
+
+        def _run():
+            handle["result"] = run_sync(coro)
+
+        handle["thread"] = threading.Thread(target=contextvars.copy_context().run,
+                                            args=(_run,), daemon=True, name=name)
+        handle["thread"].start()
+        return handle
+
+    def join(self, handle):
+        """What a spawn()ed coroutine returned, once it has."""
+        handle["thread"].join()
+        return Ready(handle["result"])
+
+    def watch_file(self, path, state):
+        """Start the target-file watcher. Returns the callable that stops it."""
+        return start_file_watcher(path, state).set
+
+    def run_all(self, coros, concurrency, done):
+        """Run coros on `concurrency` worker threads; done(index, result) as each finishes."""
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prompt") as pool:
+            futures = {pool.submit(run_sync, coro): idx for idx, coro in enumerate(coros)}
+            for fut in as_completed(futures):
+                done(futures[fut], fut.result())
+
+    def http_clients(self, args, concurrency, aiderdesk, ollama):
+        """The attempt clients: the setup clients themselves."""
+        return aiderdesk, ollama
+
+    def event_monitor(self, **kwargs):
+        return EventMonitor(**kwargs)
+
+    def start_tailers(self, args):
+        return [start_log_tailer(path, label) for path, label in log_tail_targets(args)]
+
+    def close(self):
+        pass
+
+
+THREAD_IO = ThreadIO()
+
+
+def make_io(args):
+    """The I/O layer for --engine: THREAD_IO, or a LoopIO (exits if aiohttp is missing)."""
+    if args.engine != "asyncio":
+        return THREAD_IO
+    import ollama_prompt_async
+    if ollama_prompt_async.aiohttp is None:
+        log("FAIL", "The asyncio engine needs aiohttp: "
+                    "pip install aiohttp \"python-socketio[asyncio_client]\"")
+        sys.exit(1)
+    return ollama_prompt_async.LoopIO()
+
+
+def fire_prompt(ctx, task_id, prompt, waker):
+    """
+    Send run-prompt in the background (ctx.io.spawn()). Returns the dict
+    holding its result; waker (the task's TaskState) is signalled when the
+    request returns.
+    """
     result = {"status": None, "error": None, "done": False}
 
-    def _run():
+    async def _run():
         try:
-            r = requests.post(
-                f"{api_url}/run-prompt",
-                auth=auth,
-                json={
-                    "projectDir": project_dir,
-                    "taskId": task_id,
-                    "prompt": prompt,
-                    "mode": mode,
-                },
-                timeout=300,
-            )
+            r = await ctx.io.post(ctx.aiderdesk, "/run-prompt", {
+                "projectDir": ctx.project_dir,
+                "taskId": task_id,
+                "prompt": prompt,
+                "mode": ctx.mode,
+            }, timeout=300)
             result["status"] = r.status_code
         except Exception as e:
-            result["error"] = str(e)
+            result["error"] = str(e) or type(e).__name__
         finally:
             result["done"] = True
+            waker.signal("prompt_done")
 
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
-    log("INFO", f"run-prompt fired in background thread (tid={t.ident})")
-    return result, t
+    ctx.io.spawn(_run(), name=f"run-prompt-{task_id}")
+    log("INFO", "run-prompt sent in the background")
+    return result
 
 
 # ── Log file tailer ─────────────────────────────────────────────────────────
-# PYTHON-ONLY: Uses threading.Thread + threading.Event for background file tailing.
-# Ruby: use Thread.new with File.open and IO#gets in a loop; signal via Queue or flag.
+# PYTHON-ONLY: Uses threading.Thread + threading.Event for background file tailing,
+# and ctypes for inotify(7). Ruby: Thread.new around a LogTailer object; the
+# rb-inotify gem (or the listen gem) for change notification, sleep-polling
+# elsewhere; IO#read_nonblock for the block reads.
+#
+# LogTailer itself does no waiting: an engine calls poll() whenever it is woken
+# (inotify readable, or a poll interval elapsed) and poll() reads everything new
+# in LOG_READ_SIZE blocks, splits complete lines, prints each block with one
+# write, and follows truncation (copytruncate) and rotation (inode change, or a
+# new day for dated paths).
 
 OLLAMA_ERROR_PATTERNS = [
     "error",
@@ -251,37 +1130,499 @@ OLLAMA_ERROR_PATTERNS = [
     "connection refused",
 ]
 
+# All patterns in one pass over lowercased text (the patterns are lowercase).
+# Lowercasing a whole block once and matching case-sensitively is several times
+# faster than re.IGNORECASE, which defeats sre's literal-prefix scan.
+OLLAMA_ERROR_RE = re.compile("|".join(re.escape(p) for p in OLLAMA_ERROR_PATTERNS))
+
+LOG_READ_SIZE = 64 * 1024     # bytes per read() while catching up
+LOG_POLL_INTERVAL = 0.5       # s between polls without inotify; idle re-check with it
+
+
+# label → time.time() of the last line tailed from that log (stall confirmation)
+_log_activity = {}
+
+
+def log_activity_age(label):
+    """Seconds since the tailer last saw a line in label's log, or None if never."""
+    seen = _log_activity.get(label)
+    return None if seen is None else time.time() - seen
+
+
+def handle_log_line(label, line):
+    """Print one tailed log line, flagging Ollama error patterns. Returns True if flagged.
+
+    LogTailer does the same per block (one regex pass, one write); this is the
+    single-line form.
+    """
+    _log_activity[label] = time.time()
+    if label == "OLLAMA":
+        event = parse_ollama_event(line)
+        if event is not None:
+            ollama_log_events.add(event)
+    if label == "OLLAMA" and OLLAMA_ERROR_RE.search(line.lower()) is not None:
+        log("OLLAMA-ERR", f"⚠️  {line}")
+        return True
+    log(label, line)
+    return False
+
+
+class Inotify:
+    """Minimal inotify(7) binding: a non-blocking fd that turns readable when a
+    watched directory sees a write, create or rename. Linux only."""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._libc = libc
+        self.fd = fd
+
+    def watch(self, directory):
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def drain(self):
+        """Discard queued events (the tailer re-reads the file, not the events)."""
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_inotify(directory):
+    """An Inotify watching directory, or None (non-Linux, or setup failed → poll)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        notify = Inotify()
+    except (OSError, AttributeError) as e:
+        log("DEBUG", f"inotify unavailable ({e}) — polling logs every {LOG_POLL_INTERVAL}s")
+        return None
+    try:
+        notify.watch(directory)
+    except OSError as e:
+        notify.close()
+        log("DEBUG", f"{e} — polling logs every {LOG_POLL_INTERVAL}s")
+        return None
+    return notify
+
+
+class LogTailer:
+    """Follows one log file from its end and feeds new lines to handle_log_line().
+
+    path may contain strftime codes (dated logs such as combined-%Y-%m-%d.log);
+    it is re-expanded on every idle poll so the tailer moves to the next day's
+    file once it appears.
+    """
+
+    def __init__(self, path, label):
+        self.pattern = path
+        self.label = label
+        self.path = self._expand()
+        self.mode = "off"             # "inotify" | "poll" once running
+        self.stop_event = threading.Event()   # set to stop tailing (either engine)
+        self.lines = 0
+        self.bytes = 0
+        self.matches = 0
+        self.rotations = 0
+        self.truncations = 0
+        self.events = {}              # OllamaLogEvents kind → count (OLLAMA only)
+        self.started = time.time()
+        self._f = None
+        self._inode = None
+        self._pending = b""
+
+    def _expand(self):
+        return datetime.now().strftime(self.pattern) if "%" in self.pattern else self.pattern
+
+    def open(self):
+        """Open the file positioned at its end. False if it does not exist."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        f.seek(0, os.SEEK_END)
+        self._f = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self.started = time.time()
+        return True
+
+    def watch(self):
+        """Pick inotify or polling for this file; returns the Inotify or None."""
+        notify = make_inotify(os.path.dirname(self.path) or ".")
+        self.mode = "inotify" if notify is not None else "poll"
+        return notify
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def poll(self, max_blocks=None):
+        """Handle everything appended since the last call (at most max_blocks
+        reads). Returns True if it stopped early with more data left to read."""
+        blocks = 0
+        while max_blocks is None or blocks < max_blocks:
+            chunk = self._f.read(LOG_READ_SIZE)
+            if not chunk:
+                if self._follow():
+                    continue
+                return False
+            blocks += 1
+            self._feed(chunk)
+        return True
+
+    def _feed(self, chunk):
+        self.bytes += len(chunk)
+        data = self._pending + chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._pending = data
+            return
+        self._pending = data[end + 1:]
+        text = data[:end].decode("utf-8", errors="replace")
+        flagged = typed = ()
+        if self.label == "OLLAMA":
+            low = text.lower()
+            flagged = self._hit_lines(low, OLLAMA_ERROR_RE)
+            typed = self._hit_lines(low, OLLAMA_EVENT_RE)
+        entries = []
+        for i, line in enumerate(text.split("\n")):
+            line = line.rstrip()
+            if not line:
+                continue
+            if i in typed:
+                event = parse_ollama_event(line)
+                if event is not None:
+                    self.events[event["event"]] = self.events.get(event["event"], 0) + 1
+                    ollama_log_events.add(event)
+            if i in flagged:
+                entries.append(("OLLAMA-ERR", f"⚠️  {line}"))
+                self.matches += 1
+            else:
+                entries.append((self.label, line))
+        if entries:
+            _log_activity[self.label] = time.time()
+            self.lines += len(entries)
+            log_lines(entries)
+
+    @staticmethod
+    def _hit_lines(low, pattern):
+        """Indexes of the lines in a lowercased block that pattern matches (one
+        regex pass; lower() never adds or removes newlines, so they carry over)."""
+        flagged = set()
+        line_no = pos = 0
+        for m in pattern.finditer(low):
+            line_no += low.count("\n", pos, m.start())
+            pos = m.start()
+            flagged.add(line_no)
+        return flagged
+
+    def _follow(self):
+        """At EOF: reopen after truncation or rotation. True if there is a new
+        position to read from."""
+        try:
+            size = os.fstat(self._f.fileno()).st_size
+        except OSError:
+            size = None
+        if size is not None and size < self._f.tell():
+            log("DEBUG", f"{self.label} log truncated — reading from the start")
+            self._f.seek(0)
+            self._pending = b""
+            self.truncations += 1
+            return True
+        path = self._expand()
+        try:
+            inode = os.stat(path).st_ino
+        except OSError:
+            return False                  # rotated away, new file not there yet
+        if path == self.path and inode == self._inode:
+            return False
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return False
+        log("DEBUG", f"{self.label} log rotated — following {path}")
+        self._f.close()
+        self._f = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self.path = path
+        self._pending = b""
+        self.rotations += 1
+        return True
+
+    def stats(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            "label": self.label,
+            "path": self.path,
+            "mode": self.mode,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "lines_per_s": round(self.lines / elapsed, 1),
+            "matches": self.matches,
+            "rotations": self.rotations,
+            "truncations": self.truncations,
+            "events": dict(self.events),
+        }
+
 
 def start_log_tailer(log_path, label):
-    """Start a background thread that tails a log file and prints new lines."""
-    stop_event = threading.Event()
+    """Tail a log file on a background thread. Returns its LogTailer (stop it
+    with tailer.stop_event.set())."""
+    tailer = LogTailer(log_path, label)
+    if not tailer.open():
+        log("WARN", f"{label} log not found at {tailer.path} — tailing disabled")
+        return tailer
 
     def _tail():
-        if not os.path.exists(log_path):
-            log("WARN", f"{label} log not found at {log_path} — tailing disabled")
-            return
+        notify = tailer.watch()
         try:
-            with open(log_path, "r") as f:
-                f.seek(0, 2)
-                while not stop_event.is_set():
-                    line = f.readline()
-                    if line:
-                        line = line.rstrip()
-                        if line:
-                            # Detect Ollama errors in log lines
-                            if label == "OLLAMA" and any(
-                                p in line.lower() for p in OLLAMA_ERROR_PATTERNS
-                            ):
-                                log("OLLAMA-ERR", f"⚠️  {line}")
-                            else:
-                                log(label, line)
-                    else:
-                        stop_event.wait(0.5)
+            while not tailer.stop_event.is_set():
+                tailer.poll()
+                if notify is None:
+                    tailer.stop_event.wait(LOG_POLL_INTERVAL)
+                elif select.select([notify.fd], [], [], LOG_POLL_INTERVAL)[0]:
+                    notify.drain()
         except Exception as e:
             log("WARN", f"{label} log tailer error: {e}")
+        finally:
+            tailer.close()
+            if notify is not None:
+                notify.close()
 
     t = threading.Thread(target=_tail, daemon=True)
     t.start()
+    return tailer
+
+
+def tailer_stats(tailers):
+    """stats() of the tailers that ran (for the "run" results record)."""
+    return [t.stats() for t in tailers or () if t.mode != "off"]
+
+
+def log_tailer_report(tailers):
+    """Per-log line rate and error-match counters."""
+    active = tailer_stats(tailers)
+    if not active:
+        return
+    print()
+    log("INFO", "  Log tailers:")
+    for s in active:
+        log("INFO", f"    {s['label']:8s} {s['lines']} lines ({s['lines_per_s']}/s), "
+                    f"{s['matches']} error match(es), {s['rotations']} rotation(s), "
+                    f"{s['truncations']} truncation(s) [{s['mode']}]")
+        if s["events"]:
+            counts = ", ".join(f"{kind}={n}" for kind, n in sorted(s["events"].items()))
+            log("INFO", f"    {'':8s} events: {counts}")
+
+
+# ── Ollama log events ───────────────────────────────────────────────────────
+# PORTABLE: Regexp matching + logfmt key=value parsing, and a Mutex-guarded
+# list of recent events. Ruby: Regexp#match?, String#scan(/(\w+)=("[^"]*"|\S+)/),
+# a Mutex around an Array.
+#
+# The OLLAMA tailer turns server.log lines into typed events: model load
+# start/finish, out of memory, context overflow (prompt truncation), runner
+# crashes and per-request timings from the [GIN] access log. Ollama's log does
+# not name the task a line belongs to, so events carry the time they were
+# tailed and an attempt owns the ones that arrived inside its window.
+
+class OllamaLogEvents:
+    """
+    Recent typed events from the Ollama server log, shared by the tailer and
+    the attempts.
+
+    An attempt registers its TaskState with watch(); a FATAL event signals
+    every watched state ("ollama_log") so AttemptWatch ends the attempt at
+    once instead of waiting for --timeout. OOM and runner crashes take down
+    every request on the runner, but a context overflow belongs to one
+    request: with several attempts in flight it cannot be attributed, so it
+    is marked "ambiguous" and neither ends nor classifies any of them.
+    """
+
+    MODEL_LOADING = "model_loading"
+    MODEL_LOADED = "model_loaded"
+    OUT_OF_MEMORY = "oom"
+    CONTEXT_EXCEEDED = "context_exceeded"
+    RUNNER_CRASHED = "runner_crashed"
+    REQUEST = "request"
+
+    FATAL = (OUT_OF_MEMORY, CONTEXT_EXCEEDED, RUNNER_CRASHED)
+    PER_REQUEST = (CONTEXT_EXCEEDED,)
+
+    def __init__(self, maxlen=2000):
+        self._events = deque(maxlen=maxlen)
+        self._watchers = set()
+        self._lock = threading.Lock()
+        self.recorder = None  # set for --record (REQUEST events are not recorded)
+
+    def add(self, event):
+        with self._lock:
+            if event["event"] in self.PER_REQUEST and len(self._watchers) > 1:
+                event["ambiguous"] = True
+            self._events.append(event)
+            watchers = list(self._watchers) if self.is_fatal(event) else ()
+        if self.recorder is not None and event["event"] != self.REQUEST:
+            self.recorder.mark("ollama_event", event["at"], **event)
+        for state in watchers:
+            state.signal("ollama_log")
+
+    def watch(self, state):
+        with self._lock:
+            self._watchers.add(state)
+
+    def unwatch(self, state):
+        with self._lock:
+            self._watchers.discard(state)
+
+    def since(self, t, kinds=None):
+        """Events tailed at or after t (optionally only those kinds), oldest first."""
+        with self._lock:
+            return [e for e in self._events
+                    if e["at"] >= t and (kinds is None or e["event"] in kinds)]
+
+    @classmethod
+    def is_fatal(cls, event):
+        return event["event"] in cls.FATAL and not event.get("ambiguous")
+
+
+# Checked in order against the lowercased line; the first rule that matches wins
+# (an OOM that kills the runner is an OOM, not a crash).
+OLLAMA_EVENT_RULES = [
+    (OllamaLogEvents.OUT_OF_MEMORY,
+     r"out of memory|cudamalloc failed|failed to allocate|unable to allocate"
+     r"|requires more system memory"),
+    (OllamaLogEvents.CONTEXT_EXCEEDED,
+     r"truncating input|context length exceeded|exceeds? (?:the )?(?:maximum )?context length"),
+    (OllamaLogEvents.RUNNER_CRASHED,
+     r"llama runner process (?:has terminated|no longer running)|llama runner terminated"),
+    (OllamaLogEvents.MODEL_LOADED, r"llama runner started in"),
+    (OllamaLogEvents.MODEL_LOADING,
+     r"msg=\"starting llama server\"|msg=\"loading model\"|msg=\"new model will fit"),
+    (OllamaLogEvents.REQUEST, r"\[gin\]"),
+]
+OLLAMA_EVENT_RULES = [(kind, re.compile(pattern)) for kind, pattern in OLLAMA_EVENT_RULES]
+# Every rule in one pass over a lowercased block; only the lines it hits are parsed
+OLLAMA_EVENT_RE = re.compile("|".join(f"(?:{p.pattern})" for _, p in OLLAMA_EVENT_RULES))
+
+_LOGFMT_FIELD = re.compile(r'(\w+)=("(?:[^"\\]|\\.)*"|\S+)')
+_GO_DURATION_PART = re.compile(r"([\d.]+)(h|ms|µs|us|ns|m|s)")
+_GO_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "µs": 1e-6, "us": 1e-6, "ns": 1e-9}
+
+ollama_log_events = OllamaLogEvents()
+
+
+def go_duration(text):
+    """Seconds in a Go duration string ("3.02s", "512.3µs", "1m2.5s"), or None."""
+    parts = _GO_DURATION_PART.findall(text)
+    if not parts:
+        return None
+    return sum(float(value) * _GO_DURATION_UNITS[unit] for value, unit in parts)
+
+
+def _as_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def parse_ollama_event(line, at=None):
+    """Typed event dict for one Ollama server log line, or None if it is not one."""
+    low = line.lower()
+    kind = next((k for k, pattern in OLLAMA_EVENT_RULES if pattern.search(low)), None)
+    if kind is None:
+        return None
+    event = {"event": kind, "at": at if at is not None else time.time(), "line": line[:500]}
+    if kind == OllamaLogEvents.REQUEST:
+        # [GIN] 2024/08/06 - 10:20:41 | 200 |  3.021554916s |  127.0.0.1 | POST  "/api/chat"
+        cells = [c.strip() for c in line.split("|")]
+        if len(cells) >= 5:
+            event["status"] = _as_number(cells[1])
+            event["duration"] = go_duration(cells[2])
+            method, _, path = cells[4].partition(" ")
+            event["method"], event["path"] = method, path.strip().strip('"')
+        return event
+    fields = {k: v.strip('"') for k, v in _LOGFMT_FIELD.findall(line)}
+    if kind == OllamaLogEvents.MODEL_LOADED:
+        m = re.search(r"started in ([\d.]+) seconds", low)
+        if m:
+            event["seconds"] = float(m.group(1))
+    elif kind == OllamaLogEvents.CONTEXT_EXCEEDED:
+        for key in ("limit", "prompt", "keep", "new"):
+            if key in fields:
+                event[key] = _as_number(fields[key])
+    elif kind == OllamaLogEvents.MODEL_LOADING and "model" in fields:
+        event["model"] = fields["model"]
+    elif "error" in fields:
+        event["error"] = fields["error"]
+    return event
+
+
+def model_load_in(events):
+    """True if the events show a model load (started or finished) — a cold
+    start spent the attempt's time, not a dead connection."""
+    return any(e["event"] in (OllamaLogEvents.MODEL_LOADING, OllamaLogEvents.MODEL_LOADED)
+               for e in events)
+
+
+# Log-classified failure → what to do before the next attempt
+FAILURE_REMEDIES = {
+    OllamaLogEvents.OUT_OF_MEMORY: "free_memory",    # unload idle models, then load this one
+    OllamaLogEvents.RUNNER_CRASHED: "reload",        # load the model again before retrying
+    OllamaLogEvents.MODEL_LOADING: "reload",         # wait for the load, then retry warm
+    OllamaLogEvents.CONTEXT_EXCEEDED: "give_up",     # the same prompt overflows again
+}
+
+
+def context_advice(event):
+    """One-line remedy for a context overflow, with the token counts if logged."""
+    sizes = ""
+    if event and event.get("limit") and event.get("prompt"):
+        sizes = f" ({event['prompt']} prompt tokens > num_ctx {event['limit']})"
+    return (f"prompt does not fit the context window{sizes}: raise num_ctx "
+            f"(OLLAMA_CONTEXT_LENGTH or the Modelfile) or shrink the prompt/context files")
+
+
+# ── Target file watcher ─────────────────────────────────────────────────────
+# PYTHON-ONLY: Uses threading.Thread to watch for the target file gaining content.
+# Ruby: Thread.new polling File.size?(path), or the listen gem for fs events.
+
+FILE_WATCH_INTERVAL = 0.25  # seconds between stat() calls
+
+
+def start_file_watcher(path, waker, interval=FILE_WATCH_INTERVAL):
+    """Signal waker ("file") once path exists with content. Returns a stop event."""
+    stop_event = threading.Event()
+
+    def _watch():
+        while not stop_event.is_set():
+            try:
+                if os.path.getsize(path) > 0:
+                    waker.signal("file")
+                    return
+            except OSError:
+                pass
+            stop_event.wait(interval)
+
+    t = threading.Thread(target=_watch, daemon=True)
+    t.start()
     return stop_event
 
 
@@ -295,147 +1636,410 @@ STALE_CHUNK_TIMEOUT = 30  # seconds with no new chunks
 # The threading.Event objects used for signalling should become Mutex + ConditionVariable
 # or a simple Queue-based flag in the Ruby version.
 
-class EventMonitor:
+class TaskState:
     """
-    Connects to AiderDesk via Socket.IO and subscribes to real-time events.
-    Tracks response-completed, ask-question, response-chunk, log, and tool events.
+    Per-task view of the Socket.IO event stream.
+    One EventMonitor connection feeds many TaskStates, keyed by taskId.
+
+    `wake` is the single primitive the attempt loop blocks on: Socket.IO
+    handlers, the run-prompt thread and the file watcher all call signal(),
+    which records when each kind of signal first fired (for detection latency).
     """
 
-    def __init__(self, task_id, base_url, project_dir):
+    # Slots: the chunk handler reads and writes several of these per event
+    __slots__ = ("task_id", "label", "completed", "question_pending", "question_text",
+                 "file_dropped", "chunks_received", "response_completed_count",
+                 "last_activity", "first_chunk_at", "last_chunk_at", "max_chunk_gap",
+                 "chunk_bytes", "step_completed_at", "prompt_tokens", "completion_tokens",
+                 "context_files", "wake", "signals")
+
+    def __init__(self, task_id, label="", wake=None):
         self.task_id = task_id
-        self.base_url = base_url
-        self.project_dir = project_dir
+        self.label = label
         self.completed = threading.Event()
         self.question_pending = threading.Event()
         self.question_text = None
         self.file_dropped = False
         self.chunks_received = 0
         self.response_completed_count = 0
-        self.last_activity = time.time()
-        self.sio = socketio.Client(logger=False, engineio_logger=False)
-        self._setup_handlers()
+        self.last_activity = clock()
+        self.first_chunk_at = None
+        self.last_chunk_at = None
+        self.max_chunk_gap = 0.0
+        self.chunk_bytes = 0
+        self.step_completed_at = None  # last response-completed (end of an agent step)
+        # Token counts summed over response-completed usageReports (one per agent step)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.context_files = 0  # files in the task's context (context-files-updated)
+        # threading.Event for the thread engine, asyncio.Event for the asyncio engine
+        self.wake = wake if wake is not None else threading.Event()
+        self.signals = {}
+
+    def signal(self, kind):
+        """Record the first occurrence of kind and wake the attempt loop."""
+        self.signals.setdefault(kind, clock())
+        self.wake.set()
 
-    def _setup_handlers(self):
-        @self.sio.on('connect')
-        def on_connect():
-            log("SIO", "✅ Connected to AiderDesk Socket.IO")
-            self.sio.emit('message', {
-                'action': 'subscribe-events',
-                'eventTypes': [
-                    'response-chunk',
-                    'response-completed',
-                    'ask-question',
-                    'question-answered',
-                    'user-message',
-                    'log',
-                    'tool',
-                    'context-files-updated',
-                    'task-completed',
-                    'task-cancelled',
-                    'task-updated',
-                ],
-                'baseDirs': [self.project_dir],
-            })
-            log("SIO", f"Subscribed to events for {self.project_dir}")
 
-        @self.sio.on('disconnect')
-        def on_disconnect():
-            log("SIO", "Disconnected from AiderDesk Socket.IO")
+class EventMonitor:
+    """
+    Connects to AiderDesk via Socket.IO and subscribes to real-time events.
+    Tracks response-completed, ask-question, response-chunk, log, and tool events.
 
-        @self.sio.on('event')
-        def on_event(payload):
-            event_type = payload.get('type', 'unknown')
-            data = payload.get('data', {})
-            # Most events use 'taskId', but task-updated/task-completed use 'id' (TaskData shape)
-            event_task = data.get('taskId') or data.get('id') or ''
+    A single connection is shared by every in-flight task: events are
+    demultiplexed by taskId onto the TaskState registered with track().
 
-            if event_task and event_task != self.task_id:
-                return
+    A dropped connection (transport error or server-side disconnect) is
+    re-established by _reconnect() with exponential backoff, reconnect_delay
+    doubling up to reconnect_delay_max, until disconnect() is called.
+    _on_connect() then re-subscribes and, when resync_client is set,
+    re-syncs the tracked tasks from /project/tasks (resync()).
 
-            self.last_activity = time.time()
-
-            if event_type == 'response-chunk':
-                self.chunks_received += 1
-                content = str(data.get('content') or data.get('chunk') or '')
-                if self.chunks_received <= 5 or self.chunks_received % 20 == 0:
-                    preview = (content[:100] + '...') if len(content) > 100 else content
-                    log("SIO", f"  [chunk #{self.chunks_received}] {preview}")
-
-                if 'dropping' in content.lower():
-                    self.file_dropped = True
-                    log("DETECT", "⚠️  Aider dropped a file from chat context")
-
-            elif event_type == 'response-completed':
-                self.response_completed_count += 1
-                content = str(data.get('content') or '')
-                preview = (content[:150] + '...') if len(content) > 150 else content
-                log("SIO", f"  [response-completed #{self.response_completed_count}] {preview}")
-                # NOTE: Do NOT set self.completed here. In agent mode, response-completed
-                # fires after each agent step, not when the full task is done.
-                # Only task-completed / task-cancelled signals true completion.
-
-            elif event_type == 'ask-question':
-                q = data.get('question') or data.get('content') or str(data)
-                q_text = str(q)[:200]
-                self.question_text = q_text
-                self.question_pending.set()
-                log("SIO", f"  ❓ [ask-question] {q_text}")
-
-            elif event_type == 'question-answered':
-                log("SIO", "  [question-answered]")
-                self.question_pending.clear()
-
-            elif event_type == 'log':
-                content = str(data.get('content') or data.get('message') or '')
-                level = data.get('level', 'info')
-                preview = (content[:120] + '...') if len(content) > 120 else content
-                log("SIO", f"  [log/{level}] {preview}")
-
-                if 'dropping' in content.lower():
-                    self.file_dropped = True
-                    log("DETECT", "⚠️  Aider dropped a file from chat context")
-
-            elif event_type == 'tool':
-                content = str(data.get('content') or '')
-                preview = (content[:120] + '...') if len(content) > 120 else content
-                log("SIO", f"  [tool] {preview}")
-
-            elif event_type == 'user-message':
-                content = str(data.get('content') or '')
-                preview = (content[:120] + '...') if len(content) > 120 else content
-                log("SIO", f"  [user-message] {preview}")
-
-            elif event_type in ('task-completed', 'task-cancelled'):
-                log("SIO", f"  [{event_type}]")
-                self.completed.set()
-
-            elif event_type == 'task-updated':
-                # AiderDesk never emits task-completed; instead it saves the task
-                # with state=READY_FOR_REVIEW/DONE and completedAt when finished.
-                # Detect completion via state change in task-updated events.
-                state = data.get('state', '')
-                completed_at = data.get('completedAt', '')
-                TERMINAL_STATES = ('READY_FOR_REVIEW', 'DONE', 'INTERRUPTED')
-                if state in TERMINAL_STATES or completed_at:
-                    log("SIO", f"  [task-updated] state={state} completedAt={completed_at} → task finished")
-                    self.completed.set()
-                else:
-                    log("DEBUG", f"  [task-updated] state={state} (not terminal)")
+    profile (SUBSCRIPTION_PROFILES) narrows the event types subscribed to
+    and handled; task_filter adds the tracked task ids to the subscription
+    (`taskIds`) and re-subscribes on every track()/untrack(), so AiderDesk
+    does not send other tasks' events at all.
+    """
+
+    def __init__(self, base_url, project_dir, reconnect_delay=1.0, reconnect_delay_max=10.0,
+                 profile="full", task_filter=False):
+        self.base_url = base_url
+        self.project_dir = project_dir
+        self.profile = profile
+        # False for profiles without response-chunk: chunk counts and gaps mean nothing
+        self.chunk_events = 'response-chunk' in self.SUBSCRIPTION_PROFILES[profile]
+        self.task_filter = task_filter
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_delay_max = reconnect_delay_max
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self.recorder = None  # set for --record
+        self.metrics = None   # set for --metrics-port / --metrics-textfile
+        self.resync_client = None  # AiderDesk client for resync(); None disables it
+        self.connects = 0
+        self.disconnected_at = None
+        self._headers = None
+        self._closing = False
+        self.resynced = 0  # finished tasks found by resync() that the stream missed
+        self.event_counts = {}  # event type → events handled for tracked tasks
+        self.events_ignored = 0  # events for untracked tasks or types outside the profile
+        self.ignored_counts = {}  # event type → events ignored
+        self._handlers = {t: getattr(self, self.EVENT_HANDLERS[t])
+                          for t in self.SUBSCRIPTION_PROFILES[profile]}
+        self.sio = self._make_client()
+        self._setup_handlers()
 
-            elif event_type == 'context-files-updated':
-                files = data.get('files', [])
-                log("SIO", f"  [context-files-updated] {len(files)} file(s)")
+    def _make_client(self):
+        # Reconnects are ours (_reconnect): the client's own only cover transport errors
+        return socketio.Client(logger=False, engineio_logger=False, reconnection=False)
 
+    def _setup_handlers(self):
+        self.sio.on('connect', self._on_connect)
+        self.sio.on('disconnect', self._on_disconnect)
+        self.sio.on('event', self._on_event)
+
+    def _subscribe_message(self):
+        message = {
+            'action': 'subscribe-events',
+            'eventTypes': list(self._handlers),
+            'baseDirs': [self.project_dir],
+        }
+        if self.task_filter:
+            message['taskIds'] = list(self.tasks)
+        return message
+
+    def _resubscribe(self):
+        """--subscribe-tasks: send the subscription again with the current task ids."""
+        if not self.sio.connected:
+            return  # _on_connect() subscribes with them
+        try:
+            self.sio.emit('message', self._subscribe_message())
+        except Exception as e:
+            log("WARN", f"Re-subscribing failed: {e}")
+
+    def _count_connect(self):
+        self.connects += 1
+        if self.metrics is not None:
+            self.metrics.inc("socketio_connects_total")
+            if self.connects > 1:
+                self.metrics.inc("socketio_reconnects_total")
+
+    def _on_connect(self):
+        self._count_connect()
+        self.sio.emit('message', self._subscribe_message())
+        if self.connects == 1:
+            log("SIO", "✅ Connected to AiderDesk Socket.IO")
+            log("SIO", f"Subscribed to events for {self.project_dir}")
+            return
+        self._log_reconnect()
+        # Not on the Socket.IO thread: events keep flowing during the REST call
+        threading.Thread(target=self.resync, daemon=True, name="sio-resync").start()
+
+    def _on_disconnect(self):
+        if self.metrics is not None:
+            self.metrics.inc("socketio_disconnects_total")
+        if self._closing:
+            log("SIO", "Disconnected from AiderDesk Socket.IO")
+            return
+        self.disconnected_at = clock()
+        log("SIO", f"Disconnected from AiderDesk Socket.IO — reconnecting "
+                   f"({len(self.tasks)} task(s) in flight)")
+        threading.Thread(target=self._reconnect, daemon=True, name="sio-reconnect").start()
+
+    def _reconnect(self):
+        delay = self.reconnect_delay
+        while not self._closing:
+            time.sleep(delay)
+            try:
+                self.sio.connect(self.base_url, headers=self._headers, wait_timeout=10)
+                return
+            except Exception as e:
+                delay = min(delay * 2, self.reconnect_delay_max)
+                log("SIO", f"Reconnect failed ({e}) — next try in {delay:.1f}s")
+
+    def _log_reconnect(self):
+        down = clock() - self.disconnected_at if self.disconnected_at is not None else 0.0
+        self.disconnected_at = None
+        log("SIO", f"✅ Reconnected after {down:.1f}s — re-subscribed for {self.project_dir}")
+
+    def resync(self):
+        """
+        After a reconnect: fetch the tracked tasks from AiderDesk and apply
+        what the stream missed. Returns the number of tasks found finished.
+        """
+        if self.resync_client is None or not self.tasks:
+            return 0
+        try:
+            r = api_get(self.resync_client, f"/project/tasks?projectDir={self.project_dir}")
+            tasks = r.json() if r.status_code == 200 else None
+        except Exception as e:
+            log("WARN", f"Re-sync after reconnect failed: {e}")
+            return 0
+        if tasks is None:
+            log("WARN", f"Re-sync after reconnect: /project/tasks returned {r.status_code}")
+            return 0
+        return self._apply_resync(tasks)
+
+    def _apply_resync(self, tasks):
+        """
+        A tracked task AiderDesk reports finished gets a synthetic
+        task-updated (through _on_event, so --record keeps it). Unfinished
+        ones restart their chunk-gap clock: the gap spans the outage.
+        """
+        by_id = {t.get("id"): t for t in tasks if isinstance(t, dict)}
+        tracked = list(self.tasks.items())
+        found = 0
+        for task_id, state in tracked:
+            data = by_id.get(task_id)
+            if data is None or state.completed.is_set():
+                continue
+            _log_prefix.set(state.label)
+            if data.get("state") in self.TERMINAL_STATES or data.get("completedAt"):
+                log("SIO", f"Re-sync: task finished while disconnected (state={data.get('state')})")
+                self._on_event({"type": "task-updated", "data": data})
+                found += 1
             else:
-                log("DEBUG", f"  [{event_type}] (unhandled)")
+                state.last_activity = clock()
+                state.wake.set()
+        self.resynced += found
+        _log_prefix.set("")
+        log("SIO", f"Re-sync: {len(tracked)} tracked task(s), {found} finished while disconnected")
+        return found
+
+    def _on_event(self, payload):
+        if self.recorder is not None:
+            self.recorder.event(payload)
+        data = payload.get('data') or {}
+        # Most events use 'taskId', but task-updated/task-completed use 'id' (TaskData shape)
+        event_task = data.get('taskId') or data.get('id')
+
+        event_type = payload.get('type', 'unknown')
+        handler = self._handlers.get(event_type)
+        if event_task:
+            state = self.tasks.get(event_task)
+            if state is None or handler is None:
+                self._ignore(event_type)
+                return
+            states = (state,)
+        elif handler is None:
+            self._ignore(event_type)
+            return
+        else:
+            # Untagged events apply to every in-flight task
+            states = tuple(self.tasks.values())
+
+        counts = self.event_counts
+        counts[event_type] = counts.get(event_type, 0) + 1
+        now = clock()
+        for state in states:
+            if _log_prefix.get() is not state.label:
+                _log_prefix.set(state.label)
+            state.last_activity = now
+            handler(state, data, event_type)
+
+    def _ignore(self, event_type):
+        self.events_ignored += 1
+        ignored = self.ignored_counts
+        ignored[event_type] = ignored.get(event_type, 0) + 1
+
+    def _handle(self, state, event_type, data):
+        """Dispatch one event to its handler (for callers outside _on_event)."""
+        state.last_activity = clock()
+        self._handlers.get(event_type, self._on_unhandled)(state, data, event_type)
+
+    def event_stats(self):
+        """Per-type counts of events handled and ignored (received = both)."""
+        received = sum(self.event_counts.values()) + self.events_ignored
+        return {"profile": self.profile,
+                "task_filter": self.task_filter,
+                "received": received,
+                "handled": dict(sorted(self.event_counts.items())),
+                "ignored": self.events_ignored,
+                "ignored_by_type": dict(sorted(self.ignored_counts.items())),
+                "reconnects": max(0, self.connects - 1),
+                "resynced": self.resynced}
+
+    def log_event_stats(self):
+        stats = self.event_stats()
+        used = stats["received"] - stats["ignored"]
+        share = f" ({used / stats['received']:.0%} used)" if stats["received"] else ""
+        log("INFO", f"Socket.IO events ({self.profile}"
+                    f"{', task-filtered' if self.task_filter else ''}): "
+                    f"{stats['received']} received, {used} used{share}")
+        for event_type in sorted(set(self.event_counts) | set(self.ignored_counts)):
+            log("INFO", f"  {event_type:22s} used={self.event_counts.get(event_type, 0):<7d} "
+                        f"ignored={self.ignored_counts.get(event_type, 0)}")
+        if self.connects > 1:
+            log("INFO", f"Socket.IO reconnects: {self.connects - 1} "
+                        f"({self.resynced} task(s) found finished by re-sync)")
+
+    # ── Per-type handlers: (state, data, event_type) ─────────────────────
+    # response-chunk is the hot path: no str() of str content, no lowercase
+    # copy unless "ropping" is present, preview formatting only when sampled.
+
+    def _on_chunk(self, state, data, event_type):
+        now = state.last_activity
+        n = state.chunks_received = state.chunks_received + 1
+        last = state.last_chunk_at
+        if last is None:
+            state.first_chunk_at = now
+            state.signal("first_chunk")
+        elif now - last > state.max_chunk_gap:
+            state.max_chunk_gap = now - last
+        state.last_chunk_at = now
+        content = data.get('content') or data.get('chunk') or ''
+        if content.__class__ is not str:
+            content = str(content)
+        state.chunk_bytes += len(content)
+        if n <= 5 or n % 20 == 0:
+            log("SIO", "  [chunk #%d] %s", n, _preview(content, 100))
+        if 'ropping' in content or 'ROPPING' in content:
+            self._check_dropped(state, content)
+
+    def _check_dropped(self, state, content):
+        if 'dropping' in content.lower():
+            state.file_dropped = True
+            state.signal("file_dropped")
+            log("DETECT", "⚠️  Aider dropped a file from chat context")
+
+    def _on_response_completed(self, state, data, event_type):
+        state.response_completed_count += 1
+        state.step_completed_at = state.last_activity
+        usage = data.get('usageReport') or {}
+        state.prompt_tokens += int(usage.get('sentTokens') or 0)
+        state.completion_tokens += int(usage.get('receivedTokens') or 0)
+        log("SIO", "  [response-completed #%d] %s", state.response_completed_count,
+            _preview(str(data.get('content') or ''), 150))
+        # NOTE: Do NOT set state.completed here. In agent mode, response-completed
+        # fires after each agent step, not when the full task is done.
+        # Only task-completed / task-cancelled signals true completion.
+
+    def _on_ask_question(self, state, data, event_type):
+        q = data.get('question') or data.get('content') or str(data)
+        q_text = str(q)[:200]
+        state.question_text = q_text
+        state.question_pending.set()
+        state.signal("question")
+        log("SIO", f"  ❓ [ask-question] {q_text}")
+
+    def _on_question_answered(self, state, data, event_type):
+        log("SIO", "  [question-answered]")
+        state.question_pending.clear()
+
+    def _on_log(self, state, data, event_type):
+        content = str(data.get('content') or data.get('message') or '')
+        log("SIO", "  [log/%s] %s", data.get('level', 'info'), _preview(content, 120))
+        self._check_dropped(state, content)
+
+    def _on_content(self, state, data, event_type):
+        # tool, user-message
+        log("SIO", "  [%s] %s", event_type, _preview(str(data.get('content') or ''), 120))
+
+    def _on_task_done(self, state, data, event_type):
+        # task-completed, task-cancelled
+        log("SIO", f"  [{event_type}]")
+        state.completed.set()
+        state.signal("completed")
+
+    TERMINAL_STATES = ('READY_FOR_REVIEW', 'DONE', 'INTERRUPTED')
+
+    def _on_task_updated(self, state, data, event_type):
+        # AiderDesk never emits task-completed; instead it saves the task
+        # with state=READY_FOR_REVIEW/DONE and completedAt when finished.
+        # Detect completion via state change in task-updated events.
+        task_state = data.get('state', '')
+        completed_at = data.get('completedAt', '')
+        if task_state in self.TERMINAL_STATES or completed_at:
+            log("SIO", f"  [task-updated] state={task_state} completedAt={completed_at} → task finished")
+            state.completed.set()
+            state.signal("completed")
+        else:
+            log("DEBUG", "  [task-updated] state=%s (not terminal)", task_state)
+
+    def _on_context_files(self, state, data, event_type):
+        state.context_files = len(data.get('files', []))
+        log("SIO", "  [context-files-updated] %d file(s)", state.context_files)
+        state.wake.set()  # wait_context_ready()
+
+    def _on_unhandled(self, state, data, event_type):
+        log("DEBUG", "  [%s] (unhandled)", event_type)
+
+    # event type → handler method name; every type in _subscribe_message()
+    EVENT_HANDLERS = {
+        'response-chunk': '_on_chunk',
+        'response-completed': '_on_response_completed',
+        'ask-question': '_on_ask_question',
+        'question-answered': '_on_question_answered',
+        'log': '_on_log',
+        'tool': '_on_content',
+        'user-message': '_on_content',
+        'task-completed': '_on_task_done',
+        'task-cancelled': '_on_task_done',
+        'task-updated': '_on_task_updated',
+        'context-files-updated': '_on_context_files',
+    }
+
+    # --event-profile → event types subscribed to and handled. Every profile
+    # keeps completion detection and context-files-updated (wait_context_ready).
+    # Without response-chunk there is no first-chunk time, stall detection or
+    # chunk throughput; without ask-question, questions go unanswered.
+    COMPLETION_EVENTS = ('task-updated', 'task-completed', 'task-cancelled',
+                         'response-completed', 'context-files-updated')
+    SUBSCRIPTION_PROFILES = {
+        'completion': COMPLETION_EVENTS,
+        'questions': COMPLETION_EVENTS + ('ask-question', 'question-answered'),
+        'full': tuple(EVENT_HANDLERS),
+    }
 
     def connect(self, username, password):
         """Connect to AiderDesk Socket.IO server."""
         creds = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self._headers = {"Authorization": f"Basic {creds}"}
         try:
             self.sio.connect(
                 self.base_url,
-                headers={"Authorization": f"Basic {creds}"},
+                headers=self._headers,
                 wait_timeout=10,
             )
             return True
@@ -444,21 +2048,2408 @@ class EventMonitor:
             return False
 
     def disconnect(self):
+        self._closing = True
         try:
             self.sio.disconnect()
         except Exception:
             pass
 
-    def update_task_id(self, new_task_id):
-        """Update the task ID filter (for retry attempts with new tasks)."""
-        self.task_id = new_task_id
-        self.completed.clear()
-        self.question_pending.clear()
-        self.question_text = None
-        self.file_dropped = False
-        self.chunks_received = 0
-        self.response_completed_count = 0
-        self.last_activity = time.time()
+    def track(self, task_id, label=""):
+        """Start routing events for task_id to a fresh TaskState and return it."""
+        state = TaskState(task_id, label, wake=self._new_wake())
+        with self._lock:
+            self.tasks[task_id] = state
+        if self.task_filter:
+            self._resubscribe()
+        return state
+
+    def untrack(self, task_id):
+        """Stop routing events for task_id (attempt finished or abandoned)."""
+        with self._lock:
+            known = self.tasks.pop(task_id, None) is not None
+        if self.task_filter and known:
+            self._resubscribe()
+
+    def _new_wake(self):
+        return threading.Event()
+
+    def mark(self, kind, t=None, **fields):
+        """Write an attempt marker into the --record file (no-op when not recording)."""
+        if self.recorder is not None:
+            self.recorder.mark(kind, t, **fields)
+
+
+# ── Prompt jobs ─────────────────────────────────────────────────────────────
+# PORTABLE: Plain file parsing into a list of job hashes.
+# Ruby: Dir.glob + File.read for directories, File.foreach + JSON.parse for JSONL.
+
+BATCH_PROMPT_EXTENSIONS = (".txt", ".md", ".prompt")
+
+
+def load_batch(batch_path):
+    """
+    Load prompt jobs from a directory of prompt files or a JSONL file.
+
+    Directory: every *.txt / *.md / *.prompt file is one prompt, id = file stem.
+    JSONL: one job per line, either a JSON string or an object with "prompt"
+    and optional "id", "target_file", "model" (overrides --model) and
+    "priority" (integer, higher runs first).
+    """
+    jobs = []
+    if os.path.isdir(batch_path):
+        for name in sorted(os.listdir(batch_path)):
+            if not name.endswith(BATCH_PROMPT_EXTENSIONS):
+                continue
+            with open(os.path.join(batch_path, name), "r") as pf:
+                text = pf.read().strip()
+            if text:
+                jobs.append({"id": os.path.splitext(name)[0], "prompt": text})
+        return jobs
+
+    with open(batch_path, "r") as bf:
+        for lineno, line in enumerate(bf, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                jobs.append(job_from_entry(json.loads(line), f"line-{lineno}"))
+            except ValueError as e:
+                raise ValueError(f"{batch_path}:{lineno}: {e}")
+    return jobs
+
+
+def job_from_entry(entry, default_id):
+    """
+    One prompt job from a JSONL line or a --serve submission: a JSON string,
+    or an object with "prompt" and optional "id", "target_file", "model",
+    "priority". Raises ValueError if there is no prompt or a field has the
+    wrong type, before anything is queued.
+    """
+    if isinstance(entry, str):
+        entry = {"prompt": entry}
+    if not isinstance(entry, dict):
+        raise ValueError(f"not a job object: {entry!r}")
+    prompt = entry.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ValueError("'prompt' must be a non-empty string")
+    for field in ("target_file", "model"):
+        if entry.get(field) is not None and not isinstance(entry[field], str):
+            raise ValueError(f"'{field}' must be a string: {entry[field]!r}")
+    job = {"id": str(entry.get("id") or default_id), "prompt": prompt}
+    if entry.get("target_file"):
+        job["target_file"] = entry["target_file"]
+    if entry.get("model"):
+        job["model"] = entry["model"]
+    if entry.get("priority") is not None:
+        try:
+            job["priority"] = int(entry["priority"])
+        except (TypeError, ValueError):
+            raise ValueError(f"'priority' is not an integer: {entry['priority']!r}")
+    return job
+
+
+# ── Persistent job queue ────────────────────────────────────────────────────
+# PYTHON-ONLY: sqlite3 + fcntl.flock. Ruby: the sqlite3 gem and File#flock;
+# the SQL carries over unchanged.
+#
+# --queue-db keeps every prompt job in a SQLite file: state, priority, the
+# current attempt and its task id, the last FailureReason and the result.
+# Each transition is committed when it happens, so after a crash the next
+# run finds the jobs that were running and re-attaches to their tasks
+# (reattach_jobs()) before running the queued ones. One runner per file.
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    id             TEXT NOT NULL UNIQUE,
+    priority       INTEGER NOT NULL DEFAULT 0,
+    state          TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed
+    job            TEXT NOT NULL,                   -- the job dict as JSON
+    task_id        TEXT,
+    attempt        INTEGER NOT NULL DEFAULT 0,
+    failure_reason TEXT,
+    result         TEXT,                            -- the per-prompt result dict as JSON
+    submitted_at   REAL NOT NULL,
+    started_at     REAL,
+    finished_at    REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (state, priority DESC, seq);
+"""
+JOB_STATES = ("queued", "running", "done", "failed")
+
+
+class JobStore:
+    """
+    The --queue-db file. Thread-safe (one connection behind a lock); the
+    write hooks are called from run_job(), notify_progress() and
+    record_prompt().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_file = self._flock(path)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(JOB_SCHEMA)
+
+    @staticmethod
+    def _flock(path):
+        """Hold PATH.lock so a second runner on the same queue fails at once."""
+        try:
+            import fcntl
+        except ImportError:  # not POSIX: no guard
+            return None
+        lock_file = open(path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError("in use by another runner")
+        return lock_file
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def add(self, jobs):
+        """Queue the jobs whose id is not in the file yet. Returns how many were new."""
+        now = time.time()
+        with self._lock:
+            before = self.db.total_changes
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO jobs (id, priority, job, submitted_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(job["id"], job.get("priority", 0), json.dumps(job), now) for job in jobs])
+                self.db.execute("COMMIT")
+            except BaseException:
+                # Or the shared connection stays in the transaction and no later write commits
+                self.db.execute("ROLLBACK")
+                raise
+            return self.db.total_changes - before
+
+    def known(self, job_ids):
+        """The subset of job_ids already in the file."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        rows = self._execute(f"SELECT id FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})",
+                             job_ids)
+        return {row[0] for row in rows}
+
+    def pending(self):
+        """
+        Jobs left to run: those a crashed run left running first, each with a
+        "resume" of its task and attempt, then the queued ones by priority.
+        """
+        rows = self._execute("SELECT job, state, task_id, attempt FROM jobs "
+                             "WHERE state IN ('running', 'queued') "
+                             "ORDER BY state = 'queued', priority DESC, seq")
+        jobs = []
+        for job_json, state, task_id, attempt in rows:
+            job = json.loads(job_json)
+            if state == "running":
+                job["resume"] = {"task_id": task_id, "attempt": max(1, attempt)}
+            jobs.append(job)
+        return jobs
+
+    def active_task_ids(self):
+        """Task ids of running jobs: the tasks a crashed run left behind."""
+        return {row[0] for row in self._execute(
+            "SELECT task_id FROM jobs WHERE state = 'running' AND task_id IS NOT NULL")}
+
+    def counts(self):
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+        return counts
+
+    # ── Write hooks ──────────────────────────────────────────────────────
+
+    def started(self, job):
+        self._execute("UPDATE jobs SET state = 'running', started_at = COALESCE(started_at, ?) "
+                      "WHERE id = ?", (time.time(), job["id"]))
+
+    def progress(self, job, event, fields):
+        if event == "attempt_start":
+            self._execute("UPDATE jobs SET attempt = ?, task_id = ? WHERE id = ?",
+                          (fields["attempt"], fields["task_id"], job["id"]))
+        elif event == "attempt" and fields.get("failure_reason"):
+            self._execute("UPDATE jobs SET failure_reason = ? WHERE id = ?",
+                          (fields["failure_reason"], job["id"]))
+
+    def finished(self, job, result):
+        self._execute("UPDATE jobs SET state = ?, failure_reason = ?, result = ?, "
+                      "attempt = MAX(attempt, ?), finished_at = ? WHERE id = ?",
+                      ("done" if result["success"] else "failed", result["failure_reason"],
+                       json.dumps(result), result["attempts"], time.time(), job["id"]))
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+
+def open_job_store(args):
+    """
+    --queue-db: open the queue and add the --batch jobs. Returns (store,
+    jobs left to run); (None, None) without --queue-db. Exits if the file is
+    in use or unreadable.
+    """
+    if not args.queue_db:
+        return None, None
+    try:
+        store = JobStore(args.queue_db)
+    except (RuntimeError, sqlite3.Error) as e:
+        log("FAIL", f"Could not open job queue {args.queue_db}: {e}")
+        sys.exit(1)
+    if args.batch:
+        batch = resolve_jobs(args)
+        added = store.add(batch)
+        log("INFO", f"Queued {added} new job(s) from the batch "
+                    f"({len(batch) - added} already in the queue)")
+    jobs = store.pending()
+    counts = store.counts()
+    log("INFO", f"Job queue {args.queue_db}: {counts['running']} to recover, "
+                f"{counts['queued']} queued, {counts['done']} done, {counts['failed']} failed")
+    return store, jobs
+
+
+def close_job_store(store):
+    """Close the queue; returns its job counts for the "run" record (None without one)."""
+    if store is None:
+        return None
+    counts = store.counts()
+    store.close()
+    log("INFO", f"Job queue {store.path}: " + ", ".join(f"{n} {state}"
+                                                        for state, n in counts.items()))
+    return counts
+
+
+async def reattach_jobs(ctx, jobs):
+    """
+    --queue-db recovery, before any job runs: track the tasks a crashed run
+    left running, then look them up in /project/tasks. A finished task gets a
+    synthetic task-updated, so its job completes at once; a running one is
+    waited on by run_prompt(); a task missing from the listing or interrupted
+    loses its "task_id" and the attempt runs again on a new task.
+
+    The listing is retried like any GET (HttpClient's backoff). If it still
+    fails, every task is kept: run_prompt() waits on it, and the Socket.IO
+    re-sync or the attempt timeout settles it, rather than running a prompt
+    twice for a task that may be alive.
+    """
+    resumed = [job for job in jobs if (job.get("resume") or {}).get("task_id")]
+    if not resumed:
+        return
+    for job in resumed:
+        ctx.monitor.track(job["resume"]["task_id"], f"[{job['id']}] ")
+    try:
+        r = await ctx.io.get(ctx.aiderdesk, f"/project/tasks?projectDir={ctx.project_dir}")
+        tasks = r.json() if r.status_code == 200 else None
+        failure = None if tasks is not None else f"/project/tasks returned {r.status_code}"
+    except Exception as e:
+        tasks, failure = None, str(e)
+    if tasks is None:
+        log("WARN", f"Could not list tasks to re-attach ({failure}): waiting on "
+                    f"{len(resumed)} task(s) left running as they are")
+        return
+    by_id = {t.get("id"): t for t in tasks if isinstance(t, dict)}
+    found = 0
+    for job in resumed:
+        _log_prefix.set(f"[{job['id']}] ")
+        task_id = job["resume"]["task_id"]
+        data = by_id.get(task_id)
+        state = data.get("state") if data else None
+        if data is None or state == "INTERRUPTED":
+            ctx.monitor.untrack(task_id)
+            job["resume"]["task_id"] = None
+            log("WARN", f"Task {task_id} is {'gone' if data is None else state} "
+                        f"— attempt {job['resume']['attempt']} runs again")
+            continue
+        found += 1
+        if state in EventMonitor.TERMINAL_STATES or data.get("completedAt"):
+            ctx.monitor._on_event({"type": "task-updated", "data": data})
+        log("PASS", f"Re-attached to task {task_id} (state={state})")
+    _log_prefix.set("")
+    log("INFO", f"Re-attached {found} of {len(resumed)} task(s) left running")
+
+
+# ── Results output ──────────────────────────────────────────────────────────
+# PORTABLE: Plain JSON records appended to a file. Ruby: File.open(path, "a")
+# + JSON.generate, with a Mutex around writes.
+
+class ResultsWriter:
+    """
+    Machine-readable run records for --results-json / --results-jsonl.
+
+    Three record types share one envelope (type, timestamp, run_id, model,
+    mode, edit_format, engine): "attempt" per attempt, "prompt" per prompt
+    job, and one "run" per process. JSONL records are appended and flushed as
+    they happen; the JSON file holds one array that is extended on close().
+    Both accumulate across runs.
+    """
+
+    def __init__(self, args):
+        self.json_path = args.results_json
+        self.jsonl_path = args.results_jsonl
+        self.envelope = {
+            "run_id": uuid.uuid4().hex,
+            "model": args.model,
+            "mode": args.mode,
+            "edit_format": args.edit_format,
+            "engine": args.engine,
+        }
+        self._records = []
+        self._lock = threading.Lock()
+        self._jsonl = open(self.jsonl_path, "a") if self.jsonl_path else None
+
+    def write(self, record_type, **fields):
+        record = {
+            "type": record_type,
+            "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+            **self.envelope,
+            **fields,
+        }
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record) + "\n")
+                self._jsonl.flush()
+            if self.json_path:
+                self._records.append(record)
+
+    def close(self):
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+            if self.json_path and self._records:
+                self._extend_json_file()
+                self._records = []
+
+    def _extend_json_file(self):
+        path = self.json_path
+        records = []
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                with open(path) as f:
+                    records = json.load(f)
+            except ValueError:
+                records = None
+            if not isinstance(records, list):
+                # Never clobber a file we cannot parse; write this run beside it
+                path = f"{path}.{self.envelope['run_id']}"
+                log("WARN", f"{self.json_path} is not a JSON array — writing records to {path}")
+                records = []
+        records.extend(self._records)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(records, f, indent=1)
+        os.replace(tmp, path)
+        log("INFO", f"Results written to {path} ({len(self._records)} record(s) this run)")
+
+
+def make_results_writer(args):
+    if not (args.results_json or args.results_jsonl):
+        return None
+    return ResultsWriter(args)
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+def record_attempt(ctx, job, attempt, task_id, state, outcome, reason, phases, throughput=None,
+                   time_saved=None):
+    """One "attempt" record: completed / file_on_disk / stalled / timeout / create_failed."""
+    if ctx.metrics is not None:
+        ctx.metrics.record_attempt(job_model(ctx, job), attempt, state, outcome, reason, phases,
+                                   throughput)
+    notify_progress(ctx, job, "attempt", attempt=attempt, task_id=task_id, outcome=outcome,
+                    failure_reason=reason, phases=phases)
+    if ctx.results is None:
+        return
+    ctx.results.write(
+        "attempt",
+        model=job_model(ctx, job),
+        id=job.get("id"),
+        prompt_hash=prompt_hash(job["prompt"]),
+        attempt=attempt,
+        task_id=task_id,
+        outcome=outcome,
+        failure_reason=reason,
+        chunks_received=state.chunks_received if state else 0,
+        response_completed_count=state.response_completed_count if state else 0,
+        phases=phases,
+        throughput=throughput or {},
+        time_saved=time_saved,
+    )
+
+
+def record_prompt(ctx, job, result):
+    """One "prompt" record: the per-prompt result dict."""
+    if ctx.metrics is not None:
+        ctx.metrics.record_prompt(job_model(ctx, job), result)
+    if ctx.job_store is not None:
+        ctx.job_store.finished(job, result)
+    if ctx.results is None:
+        return
+    ctx.results.write(
+        "prompt",
+        model=job_model(ctx, job),
+        prompt_hash=prompt_hash(job["prompt"]),
+        outcome="success" if result["success"] else "failed",
+        **result,
+    )
+
+
+def finish_results(results, exit_code, phases, **fields):
+    """Write the "run" record and flush/close the writer (no-op without one)."""
+    if results is None:
+        return
+    results.write("run", exit_code=exit_code, phases=phases, **fields)
+    results.close()
+
+
+# ── Prometheus metrics ──────────────────────────────────────────────────────
+# PORTABLE: the registry is plain counters/histograms rendered in the
+# Prometheus text exposition format. PYTHON-ONLY: --metrics-port serves it
+# with http.server on a daemon thread.
+# Ruby: the prometheus-client gem (Registry + Rack exporter), or WEBrick
+# serving the same text; File.rename for the atomic textfile write.
+#
+# Every sample carries model / mode / edit_format labels (model is the job's
+# model for attempt and prompt metrics, --model for REST and Socket.IO ones).
+
+METRIC_PREFIX = "ollama_prompt_"
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name → (type, help, buckets)
+METRIC_FAMILIES = {
+    "attempts_total": ("counter", "Prompt attempts, by outcome", None),
+    "failures_total": ("counter", "Failed attempts, by FailureReason", None),
+    "retries_total": ("counter", "Attempts after the first for a prompt", None),
+    "prompts_total": ("counter", "Finished prompts, by outcome", None),
+    "chunks_total": ("counter", "response-chunk events received by attempts", None),
+    "first_chunk_seconds": ("histogram", "Attempt start to first response-chunk", LATENCY_BUCKETS),
+    "completion_seconds": ("histogram", "Attempt start to task completion", LATENCY_BUCKETS),
+    "retry_latency_seconds": ("histogram", "Failure detected to the next attempt's prompt "
+                              "submitted", LATENCY_BUCKETS),
+    "chunks_per_second": ("histogram", "Chunk rate over an attempt's generation window",
+                          RATE_BUCKETS),
+    "http_request_seconds": ("histogram", "REST call latency, by client and endpoint",
+                             HTTP_BUCKETS),
+    "http_errors_total": ("counter", "REST calls that raised or returned HTTP >= 400", None),
+    "socketio_connects_total": ("counter", "Socket.IO connects (the first one included)", None),
+    "socketio_reconnects_total": ("counter", "Socket.IO connects after the first", None),
+    "socketio_disconnects_total": ("counter", "Socket.IO disconnects", None),
+}
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metrics:
+    """
+    Counters and histograms for METRIC_FAMILIES, exposed over HTTP
+    (--metrics-port) and/or written to a node_exporter textfile
+    (--metrics-textfile). Thread-safe; the asyncio engine calls it from the
+    loop.
+    """
+
+    def __init__(self, model, mode, edit_format, textfile=None):
+        self.base_labels = {"model": model, "mode": mode, "edit_format": edit_format or "default"}
+        self.textfile = textfile
+        self.server = None
+        self._samples = {}  # (name, labels tuple) → value | [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def _key(self, name, labels):
+        merged = dict(self.base_labels, **{k: v for k, v in labels.items() if v is not None})
+        return name, tuple(sorted(merged.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRIC_FAMILIES[name][2]
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._samples.get(key)
+            if series is None:
+                series = self._samples[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    # ── Domain hooks ─────────────────────────────────────────────────────
+
+    def record_attempt(self, model, attempt, state, outcome, reason, phases, throughput):
+        self.inc("attempts_total", model=model, outcome=outcome)
+        if attempt > 1:
+            self.inc("retries_total", model=model)
+        if reason is not None:
+            self.inc("failures_total", model=model, reason=reason)
+        if state is not None and state.chunks_received:
+            self.inc("chunks_total", state.chunks_received, model=model)
+        if "first_chunk" in phases:
+            self.observe("first_chunk_seconds", phases["first_chunk"], model=model)
+        if "completion" in phases:
+            self.observe("completion_seconds", phases["completion"], model=model)
+        if "retry_latency" in phases:
+            self.observe("retry_latency_seconds", phases["retry_latency"], model=model)
+        if throughput and throughput.get("task_chunks_per_s"):
+            self.observe("chunks_per_second", throughput["task_chunks_per_s"], model=model)
+        self.flush()
+
+    def record_prompt(self, model, result):
+        self.inc("prompts_total", model=model, outcome="success" if result["success"] else "failed")
+        self.flush()
+
+    def record_http(self, client, endpoint, seconds, error):
+        self.observe("http_request_seconds", seconds, client=client, endpoint=endpoint)
+        if error:
+            self.inc("http_errors_total", client=client, endpoint=endpoint)
+
+    # ── Exposition ───────────────────────────────────────────────────────
+
+    def render(self):
+        """The registry in Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            samples = sorted(self._samples.items())
+        by_name = {}
+        for (name, labels), value in samples:
+            by_name.setdefault(name, []).append((labels, value))
+        out = []
+        for name, (kind, help_text, buckets) in METRIC_FAMILIES.items():
+            full = METRIC_PREFIX + name
+            out.append(f"# HELP {full} {help_text}")
+            out.append(f"# TYPE {full} {kind}")
+            for labels, value in by_name.get(name, ()):
+                text = ",".join(f'{k}="{_label_value(v)}"' for k, v in labels)
+                if kind == "counter":
+                    out.append(f"{full}{{{text}}} {value}")
+                    continue
+                for bound, count in zip(buckets, value):
+                    out.append(f'{full}_bucket{{{text},le="{bound}"}} {count}')
+                out.append(f'{full}_bucket{{{text},le="+Inf"}} {value[-1]}')
+                out.append(f"{full}_sum{{{text}}} {round(value[-2], 6)}")
+                out.append(f"{full}_count{{{text}}} {value[-1]}")
+        return "\n".join(out) + "\n"
+
+    def flush(self):
+        """Rewrite --metrics-textfile atomically (no-op without one)."""
+        if self.textfile is None:
+            return
+        tmp = f"{self.textfile}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.render())
+            os.replace(tmp, self.textfile)
+        except OSError as e:
+            log("WARN", f"Could not write metrics to {self.textfile}: {e}")
+
+    def serve(self, host, port):
+        """Serve GET /metrics on a daemon thread."""
+        metrics = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                log("DEBUG", f"metrics: {fmt % args}")
+
+        self.server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics").start()
+        log("INFO", f"Prometheus metrics on http://{host}:{self.server.server_address[1]}/metrics")
+
+    def close(self):
+        self.flush()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def make_metrics(args, clients=()):
+    """
+    --metrics-port / --metrics-textfile: build the registry, start exporting,
+    and hook the (name, client) pairs' REST timings into it. None when off.
+    """
+    if args.metrics_port is None and not args.metrics_textfile:
+        return None
+    metrics = Metrics(args.model, args.mode, args.edit_format, args.metrics_textfile)
+    if args.metrics_port is not None:
+        try:
+            metrics.serve(args.metrics_host, args.metrics_port)
+        except OSError as e:
+            log("WARN", f"Could not serve metrics on {args.metrics_host}:{args.metrics_port}: {e}")
+    if args.metrics_textfile:
+        log("INFO", f"Prometheus metrics written to {args.metrics_textfile}")
+    attach_metrics(metrics, clients)
+    return metrics
+
+
+def attach_metrics(metrics, clients):
+    for name, client in clients:
+        client.metrics, client.name = metrics, name
+
+
+# ── Run history & adaptive deadlines ────────────────────────────────────────
+# PORTABLE: JSON lines + percentile arithmetic. Ruby: File.foreach + JSON.parse,
+# Array#sort for the percentile.
+#
+# Every completed attempt appends its completion time, first-chunk time and
+# largest inter-chunk gap under a (model, mode, edit format) key. With
+# --adaptive-timeouts the attempt timeout, stall threshold and cold-start
+# threshold become p99 of the recent samples plus --adaptive-margin, instead
+# of --timeout / STALE_CHUNK_TIMEOUT / COLD_START_THRESHOLD.
+
+DEFAULT_HISTORY_FILE = "~/.aider-desk/ollama_prompt_history.jsonl"
+HISTORY_WINDOW = 200          # most recent samples per key considered
+ADAPTIVE_MIN_SAMPLES = 5      # fewer samples than this → fixed deadlines
+ADAPTIVE_FLOORS = {"timeout": 30, "stall_timeout": 10, "cold_start_threshold": 15}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (values need not be sorted)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class RunHistory:
+    """Completed-attempt timings per (model, mode, edit format), one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model, mode, edit_format):
+        return f"{model}|{mode}|{edit_format or 'default'}"
+
+    def samples(self, key):
+        if not os.path.exists(self.path):
+            return []
+        recent = deque(maxlen=HISTORY_WINDOW)
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    continue
+                if sample.get("key") == key:
+                    recent.append(sample)
+        return list(recent)
+
+    def append(self, key, sample):
+        line = json.dumps({"key": key, "timestamp": datetime.now().isoformat(timespec="seconds"),
+                           **sample}, separators=(",", ":"))
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+def make_run_history(args):
+    path = args.history_file or (DEFAULT_HISTORY_FILE if args.adaptive_timeouts else None)
+    return RunHistory(path) if path else None
+
+
+def adaptive_deadlines(args, history, key):
+    """Attempt timeout, stall threshold and cold-start threshold for this run."""
+    deadlines = {
+        "timeout": args.timeout,
+        "stall_timeout": STALE_CHUNK_TIMEOUT,
+        "cold_start_threshold": COLD_START_THRESHOLD,
+    }
+    if history is None or not args.adaptive_timeouts:
+        return deadlines
+
+    samples = history.samples(key)
+    if len(samples) < ADAPTIVE_MIN_SAMPLES:
+        log("INFO", f"Adaptive timeouts: {len(samples)} completed run(s) of {key} in history "
+                    f"(need {ADAPTIVE_MIN_SAMPLES}) — using fixed deadlines")
+        return deadlines
+
+    sources = {"timeout": "completion", "stall_timeout": "max_chunk_gap",
+               "cold_start_threshold": "first_chunk"}
+    for name, field in sources.items():
+        values = [s[field] for s in samples if s.get(field) is not None]
+        if values:
+            derived = percentile(values, 99) * (1 + args.adaptive_margin)
+            deadlines[name] = round(max(ADAPTIVE_FLOORS[name], derived), 1)
+    log("INFO", f"Adaptive timeouts from {len(samples)} run(s) of {key}: "
+                f"timeout={deadlines['timeout']}s, stall={deadlines['stall_timeout']}s, "
+                f"cold_start={deadlines['cold_start_threshold']}s")
+    return deadlines
+
+
+def record_history(ctx, state, phases, key):
+    """
+    Append a completed attempt's timings to the run history (if enabled).
+    Runs without response-chunk events are left out: they have no first
+    chunk or chunk gaps, and would pull the adaptive deadlines down.
+    """
+    if ctx.history is None or "completion" not in phases or not ctx.monitor.chunk_events:
+        return
+    ctx.history.append(key, {
+        "completion": phases["completion"],
+        "first_chunk": phases.get("first_chunk"),
+        "max_chunk_gap": round(state.max_chunk_gap, 3),
+        "chunks": state.chunks_received,
+        **({"warm_prefix": ctx.warm_prefix} if ctx.warm_prefix else {}),
+    })
+
+
+# ── Prompt execution ────────────────────────────────────────────────────────
+# PORTABLE: Orchestration over the API helpers and EventMonitor above, shared
+# by both engines through ctx.io (see "Engine I/O").
+# Ruby: a RunContext Struct plus plain methods; the worker pool maps to
+# concurrent-ruby's FixedThreadPool (or N Threads draining a Queue).
+
+class RunContext:
+    """Connection settings and the shared EventMonitor used by every prompt job."""
+
+    def __init__(self, args, aiderdesk, ollama, monitor, results=None, residency=None,
+                 metrics=None, warm_prefix=None):
+        self.args = args
+        self.aiderdesk = aiderdesk
+        self.ollama = ollama
+        self.monitor = monitor
+        self.project_dir = args.project_dir
+        self.model = args.model
+        self.mode = args.mode
+        self.max_attempts = args.retries
+        self.results = results
+        self.residency = residency
+        self.metrics = metrics
+        # Short hash of the primed prefix: tags history samples for log_prefix_report()
+        self.warm_prefix = prompt_hash(warm_prefix)[:12] if warm_prefix else None
+        self.history = make_run_history(args)
+        self.stall_policy = args.stall_policy
+        self.log_events = ollama_log_events
+        self.log_fail_fast = not args.no_log_fail_fast
+        # Callback(job, event, fields) for per-job progress (--serve streams it)
+        self.progress = None
+        self.job_store = None  # --queue-db
+        self.io = THREAD_IO    # --engine asyncio: its LoopIO
+        self._deadlines = {}
+        self.deadlines(args.model)
+
+    def deadlines(self, model):
+        """Attempt deadlines for model (adaptive per model/mode/edit format), computed once."""
+        if model not in self._deadlines:
+            key = RunHistory.key(model, self.mode, self.args.edit_format)
+            self._deadlines[model] = dict(adaptive_deadlines(self.args, self.history, key),
+                                          history_key=key)
+        return self._deadlines[model]
+
+
+def job_model(ctx, job):
+    """The job's own "model" (batch JSONL) or --model."""
+    return job.get("model") or ctx.model
+
+
+def notify_progress(ctx, job, event, **fields):
+    """Hand a progress event to the --queue-db store and ctx.progress (if set)."""
+    if ctx.job_store is not None:
+        ctx.job_store.progress(job, event, fields)
+    if ctx.progress is not None:
+        ctx.progress(job, event, fields)
+
+
+def stall_verdict(state, running_models, model, log_age, stall_timeout):
+    """
+    Decide whether a chunk gap is a real stall or a slow prompt-eval phase.
+    Returns (confirmed, why). Pure: the engines gather /api/ps and the log
+    age, so the thread engine, asyncio engine and --replay share this rule.
+    """
+    gap = round(clock() - state.last_activity)
+    name = ollama_model_name(model)
+    if name is not None and not any(m.get("name") == name for m in running_models):
+        return True, f"{name} is not loaded according to /api/ps"
+    if log_age is not None and log_age < stall_timeout:
+        return False, f"Ollama log active {round(log_age)}s ago (loading / prompt eval)"
+    if state.step_completed_at is not None and state.step_completed_at >= (state.last_chunk_at or 0):
+        return False, "between agent steps — next step is still in prompt eval"
+    return True, f"model loaded but no chunks or Ollama log output for {gap}s"
+
+
+async def confirm_stall(ctx, state, model, stall_timeout):
+    """Query Ollama and the log tailer, then apply stall_verdict()."""
+    running = await fetch_running_models(ctx.io, ctx.ollama)
+    return stall_verdict(state, running, model, log_activity_age("OLLAMA"), stall_timeout)
+
+
+class AttemptWatch:
+    """
+    Decision logic for one attempt, shared by the thread and asyncio engines.
+
+    step() turns the TaskState signals and the clock into an action
+    (COMPLETED / QUESTION / STALL / OLLAMA_FAILURE / TIMEOUT, or None to keep
+    waiting) and logs and records phases as it goes. The engine performs the
+    I/O the action needs (answer the question, confirm the stall, interrupt
+    the task) and sleeps on state.wake until wake_at(), then calls close().
+
+    chunk_events=False (an --event-profile without response-chunk) turns off
+    the chunk-based parts: first-chunk time, stall detection and the
+    chunk-count failure reasons.
+    """
+
+    COMPLETED = "completed"
+    QUESTION = "question"
+    STALL = "stall"
+    OLLAMA_FAILURE = "ollama_failure"
+    TIMEOUT = "timeout"
+
+    QUESTION_RETRY_INTERVAL = 1.0  # seconds between failed answer attempts
+    MAX_STALL_DEFERRALS = 2        # unconfirmed stall checks before aborting anyway
+
+    def __init__(self, state, prompt_result, timeout, phases, target_file=None, start=None,
+                 stale_timeout=STALE_CHUNK_TIMEOUT, cold_start_threshold=COLD_START_THRESHOLD,
+                 stall_policy="warn", log_events=None, log_fail_fast=True, chunk_events=True):
+        self.state = state
+        self.prompt_result = prompt_result
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.cold_start_threshold = cold_start_threshold
+        self.stall_policy = stall_policy
+        self.phases = phases
+        self.target_file = target_file
+        self.start = start if start is not None else time.time()
+        self.deadline = self.start + timeout
+        self.file_on_disk = False
+        self.file_drop_logged = False
+        self.prompt_done_logged = False
+        self.next_stale_warn = 0.0
+        self.question_retry_at = 0.0
+        self.stale_due = None
+        self.next_stall_check = 0.0
+        self.stall_deferrals = 0
+        self.time_saved = None  # set when the stall policy aborted the attempt
+        self.log_events = log_events
+        self.log_fail_fast = log_fail_fast
+        self.chunk_events = chunk_events
+        self.log_event = None     # the Ollama log event the failure was classified by
+        self.failed_fast = False  # ended early on a fatal Ollama log event
+        self.throughput = {}
+        if log_events is not None:
+            log_events.watch(state)
+            if any(map(OllamaLogEvents.is_fatal, log_events.since(self.start))):
+                state.signal("ollama_log")  # tailed before the watch was registered
+
+    def close(self):
+        if self.log_events is not None:
+            self.log_events.unwatch(self.state)
+
+    def step(self, now):
+        state, phases = self.state, self.phases
+        elapsed = now - self.start
+
+        # ── Track first chunk time ───────────────────────────────────────
+        if self.chunk_events and state.first_chunk_at is not None and "first_chunk" not in phases:
+            phases["first_chunk"] = round(state.first_chunk_at - self.start, 2)
+
+        # ── Check for completion via Socket.IO ───────────────────────────
+        if state.completed.is_set():
+            completed_at = state.signals.get("completed", now)
+            log("PASS", f"✅ task-completed received after {round(completed_at - self.start, 1)}s")
+            if self.chunk_events:
+                log("INFO", f"  Total chunks received: {state.chunks_received}")
+            log("INFO", f"  Response-completed events: {state.response_completed_count}")
+            phases["completion"] = round(completed_at - self.start, 2)
+            phases["detection_latency"] = round(now - completed_at, 4)
+            if state.last_chunk_at is not None:
+                phases["generation"] = round(state.last_chunk_at - state.first_chunk_at, 2)
+            self.throughput = task_throughput(state, self.start)
+            return self.COMPLETED
+
+        # ── Check for question via Socket.IO ─────────────────────────────
+        if state.question_pending.is_set() and now >= self.question_retry_at:
+            log("QUESTION", f"Task asking: {state.question_text}")
+            log("QUESTION", "Auto-answering: 'yes'")
+            return self.QUESTION
+
+        # ── Fatal Ollama server log event during this attempt ────────────
+        if self.log_fail_fast and "ollama_log" in state.signals and not self.failed_fast:
+            fatal = [e for e in self.log_events.since(self.start) if OllamaLogEvents.is_fatal(e)]
+            if fatal:
+                self.log_event = fatal[0]
+                self.failed_fast = True
+                return self.OLLAMA_FAILURE
+
+        # ── Check if target file has content on disk ─────────────────────
+        if self.target_file and not self.file_on_disk and "file" in state.signals:
+            log("INFO", f"📄 {os.path.basename(self.target_file)} has content on disk")
+            self.file_on_disk = True
+            phases["file_on_disk"] = round(state.signals["file"] - self.start, 2)
+
+        # ── File on disk + dropped from chat (informational) ────────────
+        if state.file_dropped and self.file_on_disk and not self.file_drop_logged:
+            log("DETECT", "File created + dropped from chat (waiting for task-completed)")
+            self.file_drop_logged = True
+
+        # ── Stale chunk detection ────────────────────────────────────────
+        self.stale_due = None
+        stalled = False
+        if self.chunk_events and state.chunks_received > 0:
+            stale = now - state.last_activity
+            if stale > self.stale_timeout and now >= self.next_stale_warn:
+                log("WARN", f"No new chunks for {round(stale)}s — generation may have stalled")
+                self.next_stale_warn = now + self.stale_timeout
+            self.stale_due = max(state.last_activity + self.stale_timeout, self.next_stale_warn)
+            if self.stall_policy == "abort" and not self.prompt_result["done"]:
+                stalled = stale > self.stale_timeout and now >= self.next_stall_check
+                self.stale_due = max(self.stale_due, self.next_stall_check)
+
+        # ── Check if run-prompt request finished ─────────────────────────
+        prompt_result = self.prompt_result
+        if prompt_result["done"] and not state.completed.is_set() and not self.prompt_done_logged:
+            if prompt_result["error"]:
+                log("WARN", f"run-prompt thread error: {prompt_result['error']}")
+            else:
+                log("INFO", f"run-prompt returned HTTP {prompt_result['status']}")
+            log("INFO", f"  Response-completed events so far: {state.response_completed_count}")
+            log("INFO", "  Waiting for task-completed signal...")
+            self.prompt_done_logged = True
+
+        if elapsed > self.timeout:
+            return self.TIMEOUT
+        if stalled:
+            return self.STALL
+        return None
+
+    def question_answered(self):
+        self.state.question_pending.clear()
+
+    def question_failed(self, now):
+        self.question_retry_at = now + self.QUESTION_RETRY_INTERVAL
+
+    def defer_stall(self, now, why):
+        """
+        The stall was not confirmed: check again one stall window later.
+        Returns False once MAX_STALL_DEFERRALS is used up (abort anyway).
+        """
+        if self.stall_deferrals >= self.MAX_STALL_DEFERRALS:
+            return False
+        self.stall_deferrals += 1
+        self.next_stall_check = now + self.stale_timeout
+        log("STALL", f"Not aborting yet: {why} — rechecking in {self.stale_timeout}s")
+        return True
+
+    def stall_report(self, now, why):
+        """Log a confirmed stall and record the time saved. Returns the FailureReason."""
+        if self.stall_deferrals >= self.MAX_STALL_DEFERRALS:
+            why = f"still no chunks after {self.stall_deferrals} rechecks ({why})"
+        self.time_saved = round(max(0.0, self.deadline - now), 1)
+        self.phases["stall_abort"] = round(now - self.start, 2)
+        print()
+        log("STALL", f"⛔ Stall confirmed {round(now - self.state.last_activity)}s after the "
+                     f"last event: {why}")
+        log("STALL", f"  Chunks received: {self.state.chunks_received}")
+        log("STALL", f"  Interrupting now instead of at --timeout ({self.time_saved}s saved)")
+        return FailureReason.STALLED
+
+    def log_failure_report(self, now):
+        """Log the fatal Ollama log event that ends the attempt. Returns the FailureReason."""
+        event = self.log_event
+        self.phases["ollama_failure"] = round(now - self.start, 2)
+        print()
+        log("OLLAMA-ERR", f"⛔ Ollama {event['event']} {round(event['at'] - self.start, 1)}s "
+                          f"into the attempt: {event['line'][:200]}")
+        if self.chunk_events:
+            log("OLLAMA-ERR", f"  Chunks received: {self.state.chunks_received}")
+        log("OLLAMA-ERR", f"  Interrupting now instead of at the {self.timeout}s timeout")
+        return event["event"]
+
+    def wake_at(self):
+        """Absolute time of the next deadline the engine must wake up for."""
+        wake = self.deadline + 0.001
+        if self.stale_due is not None:
+            wake = min(wake, self.stale_due)
+        if self.state.question_pending.is_set():
+            wake = min(wake, self.question_retry_at)
+        return wake
+
+    def timeout_report(self, now):
+        """Classify and log a timed-out attempt. Returns the FailureReason."""
+        state, prompt_result = self.state, self.prompt_result
+        events = self.log_events.since(self.start) if self.log_events is not None else ()
+        reason = classify_failure(state, prompt_result, now - self.start, self.cold_start_threshold,
+                                  events, self.chunk_events)
+        self.log_event = next((e for e in events if e["event"] == reason), None)
+        stale_duration = round(now - state.last_activity, 1)
+        print()
+        log("TIMEOUT", f"⚠️  No completion within {self.timeout}s.")
+        log("TIMEOUT", f"  Failure reason:  {reason}")
+        if self.chunk_events:
+            log("TIMEOUT", f"  Chunks received: {state.chunks_received}")
+        log("TIMEOUT", f"  Response-completed events: {state.response_completed_count}")
+        log("TIMEOUT", f"  Stale for:       {stale_duration}s")
+        log("TIMEOUT", f"  run-prompt done={prompt_result['done']}, "
+                       f"status={prompt_result['status']}, error={prompt_result['error']}")
+        return reason
+
+
+def attempt_banner(attempt, max_attempts):
+    print()
+    print("━" * 70)
+    log("INFO", f"  ATTEMPT {attempt} of {max_attempts}")
+    print("━" * 70)
+
+
+# Matches every name task_name_for() produces (--cleanup-runner-only)
+RUNNER_TASK_NAME = re.compile(r"^Prompt #\d+ (\[[^\]]*\] )?- \d{2}:\d{2}:\d{2}$")
+
+
+def task_name_for(job, attempt):
+    stamp = datetime.now().strftime('%H:%M:%S')
+    if job.get("id"):
+        return f"Prompt #{attempt} [{job['id']}] - {stamp}"
+    return f"Prompt #{attempt} - {stamp}"
+
+
+async def create_task(ctx, job, attempt, activate=True):
+    """
+    Create and configure a fresh task for one attempt. Returns the task id
+    (already tracked on ctx.monitor) or None if AiderDesk refused.
+    A prefetched task is not activated, so the running attempt keeps focus.
+    """
+    aiderdesk, project_dir = ctx.aiderdesk, ctx.project_dir
+    model = job_model(ctx, job)
+
+    res = await ctx.io.post(aiderdesk, "/project/tasks/new", {
+        "projectDir": project_dir,
+        "name": task_name_for(job, attempt),
+        "activate": activate,
+    })
+    if res.status_code != 200:
+        log("FAIL", f"Could not create task: {res.status_code} {res.text[:200]}")
+        return None
+
+    task_id = res.json().get("id")
+    log("PASS", f"Task created: {task_id}")
+    ctx.monitor.track(task_id, _log_prefix.get())
+
+    # ── Configure model and task ─────────────────────────────────────────
+    await ctx.io.post(aiderdesk, "/project/settings/main-model", {
+        "projectDir": project_dir,
+        "taskId": task_id,
+        "mainModel": model,
+    })
+    await ctx.io.post(aiderdesk, "/project/tasks", {
+        "projectDir": project_dir,
+        "id": task_id,
+        "updates": {"autoApprove": True, "currentMode": ctx.mode},
+    })
+    log("INFO", f"Model={model}, autoApprove=true, mode={ctx.mode}")
+    return task_id
+
+
+async def add_context_files(ctx, task_id):
+    """--context-file: add each file to the task's context, read-only."""
+    for path in ctx.args.context_file:
+        r = await ctx.io.post(ctx.aiderdesk, "/add-context-file", {
+            "projectDir": ctx.project_dir,
+            "taskId": task_id,
+            "path": path,
+            "readOnly": True,
+        })
+        if r.status_code != 200:
+            log("WARN", f"Could not add {path} to context: {r.status_code}")
+
+
+async def add_target_file(ctx, task_id, target_file):
+    """Pre-create an empty target file and add it to the task's context."""
+    if os.path.exists(target_file):
+        os.remove(target_file)
+    target_basename = os.path.basename(target_file)
+    log("INFO", f"Pre-creating empty {target_basename} for edit-format")
+    open(target_file, "w").close()
+    client_add = await ctx.io.post(ctx.aiderdesk, "/add-context-file", {
+        "projectDir": ctx.project_dir,
+        "taskId": task_id,
+        "path": target_basename,
+        "readOnly": False,
+    })
+    if client_add.status_code == 200:
+        log("PASS", f"{target_basename} added to task context")
+    else:
+        log("WARN", f"Could not add file to context: {client_add.status_code}")
+
+
+async def answer_question(ctx, task_id):
+    """Auto-answer 'yes'. Returns False if the request itself failed."""
+    try:
+        await ctx.io.post(ctx.aiderdesk, "/project/answer-question", {
+            "projectDir": ctx.project_dir,
+            "taskId": task_id,
+            "answer": "yes",
+        })
+        return True
+    except Exception as e:
+        log("WARN", f"Failed to answer question: {e}")
+        return False
+
+
+async def interrupt_task(ctx, task_id):
+    """Interrupt a stuck task."""
+    log("INFO", f"Interrupting task {task_id}...")
+    try:
+        int_res = await ctx.io.post(ctx.aiderdesk, "/project/interrupt", {
+            "projectDir": ctx.project_dir,
+            "taskId": task_id,
+        })
+        if int_res.status_code == 200:
+            log("INFO", "Interrupt sent successfully")
+        else:
+            log("WARN", f"Interrupt returned {int_res.status_code}")
+    except Exception as e:
+        log("WARN", f"Interrupt failed: {e}")
+
+
+# ── Retry readiness ─────────────────────────────────────────────────────────
+# Instead of fixed sleeps, the attempt loop waits for AiderDesk to say the
+# task is ready: context-files-updated before a prompt is submitted, and a
+# terminal task-updated (or run-prompt returning) after an interrupt. The
+# fixed sleeps they replace are the upper bounds.
+# Ruby: the same loops around ConditionVariable#wait(mutex, remaining) (io.wait()).
+
+CONTEXT_READY_TIMEOUT = 1.0
+
+
+async def wait_context_ready(io, state, files, timeout=CONTEXT_READY_TIMEOUT):
+    """
+    Wait until AiderDesk reports at least `files` files in the task's context.
+    Returns the seconds waited (timeout if the event never came).
+    """
+    start = time.time()
+    while state.context_files < files:
+        remaining = timeout - (time.time() - start)
+        if remaining <= 0:
+            log("DEBUG", "context-files-updated not seen within %.1fs", timeout)
+            break
+        await io.wait(state, remaining)
+    return time.time() - start
+
+
+def settled(state, prompt_result):
+    """An interrupted task is idle once it reached a terminal state or run-prompt returned."""
+    return state.completed.is_set() or prompt_result["done"]
+
+
+async def settle_task(io, state, prompt_result, timeout):
+    """
+    After an interrupt, wait (up to timeout) for the task to go idle.
+    Returns True if it did.
+    """
+    deadline = time.time() + timeout
+    while not settled(state, prompt_result):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            log("WARN", f"Task still busy {timeout:.0f}s after the interrupt")
+            return False
+        await io.wait(state, remaining)
+    return True
+
+
+async def reset_task(ctx, task_id):
+    """
+    --retry-task reuse: reset an interrupted task (messages and context
+    files) and track it again. Model and mode settings survive a reset.
+    Returns False if AiderDesk refused.
+    """
+    try:
+        res = await ctx.io.post(ctx.aiderdesk, "/project/tasks/reset", {
+            "projectDir": ctx.project_dir,
+            "taskId": task_id,
+        })
+    except Exception as e:
+        log("WARN", f"Task reset failed: {e}")
+        return False
+    if res.status_code != 200:
+        log("WARN", f"Task reset returned {res.status_code} — creating a new task")
+        return False
+    log("PASS", f"Task reset: {task_id}")
+    ctx.monitor.track(task_id, _log_prefix.get())
+    return True
+
+
+def prefetch_task(ctx, job, attempt):
+    """
+    --retry-task prefetch: create and configure the task for `attempt` in
+    the background (context files included) while the current attempt
+    runs. Returns the handle take_prefetched() / discard_prefetched() accept.
+    """
+    async def _create():
+        try:
+            task_id = await create_task(ctx, job, attempt, activate=False)
+            if task_id is not None and ctx.args.context_file:
+                await add_context_files(ctx, task_id)
+            return task_id
+        except Exception as e:
+            log("WARN", f"Prefetching the next task failed: {e}")
+            return None
+
+    return ctx.io.spawn(_create(), name="prefetch")
+
+
+async def take_prefetched(ctx, pending):
+    """The prefetched task id (waiting for the prefetch if it is still running), or None."""
+    return await ctx.io.join(pending)
+
+
+async def discard_prefetched(ctx, pending):
+    """Delete a prefetched task the prompt no longer needs."""
+    task_id = await take_prefetched(ctx, pending)
+    if task_id is None:
+        return
+    ctx.monitor.untrack(task_id)
+    try:
+        await ctx.io.post(ctx.aiderdesk, "/project/tasks/delete", {
+            "projectDir": ctx.project_dir,
+            "id": task_id,
+        })
+        log("INFO", f"Deleted unused prefetched task {task_id}")
+    except Exception as e:
+        log("WARN", f"Could not delete prefetched task {task_id}: {e}")
+
+
+async def next_task(ctx, job, attempt, previous, pending):
+    """
+    The task for `attempt` per --retry-task. previous is the last attempt's
+    task when it settled after its interrupt (safe to reset), else None.
+    Returns (task_id, source) with source "new", "reset" or "prefetched".
+    """
+    if pending is not None:
+        task_id = await take_prefetched(ctx, pending)
+        if task_id is not None:
+            log("PASS", f"Using prefetched task: {task_id}")
+            return task_id, "prefetched"
+    if (ctx.args.retry_task == "reuse" and previous is not None
+            and await reset_task(ctx, previous)):
+        return previous, "reset"
+    return await create_task(ctx, job, attempt), "new"
+
+
+async def apply_remedy(ctx, job, reason, event=None):
+    """
+    Before retrying a failure the Ollama log explained, act on it
+    (FAILURE_REMEDIES). Returns False when retrying cannot help.
+    """
+    remedy = FAILURE_REMEDIES.get(reason)
+    if remedy is None:
+        return True
+    if remedy == "give_up":
+        log("REMEDY", f"Not retrying: {context_advice(event)}")
+        return False
+    name = ollama_model_name(job_model(ctx, job))
+    if name is None:
+        return True
+    if remedy == "free_memory":
+        busy = ctx.residency.busy_models() if ctx.residency is not None else set()
+        for m in await fetch_running_models(ctx.io, ctx.ollama):
+            if m["name"] != name and m["name"] not in busy:
+                log("REMEDY", f"Out of memory: unloading idle {m['name']}")
+                await unload_model(ctx.io, ctx.ollama, m["name"])
+    log("REMEDY", f"{reason}: loading {name} before the next attempt")
+    await load_model(ctx.io, ctx.ollama, name, timeout=ctx.args.warmup_timeout)
+    return True
+
+
+def prompt_result_dict(job, task_id, state, reason, completed, file_exists, attempts,
+                       total_start, phases, throughput=None, stall_aborts=0, time_saved=0.0,
+                       retry_latencies=()):
+    """Per-prompt result shape shared by both engines and the batch summary."""
+    target_file = job.get("target_file")
+    if target_file and not file_exists:
+        file_exists = os.path.exists(target_file) and os.path.getsize(target_file) > 0
+    return {
+        "id": job.get("id"),
+        "task_id": task_id,
+        "target_file": target_file,
+        "completed": completed,
+        "file_exists": file_exists,
+        "success": completed or file_exists,
+        "failure_reason": None if completed or file_exists else reason,
+        "attempts": attempts,
+        "elapsed": round(time.time() - total_start, 1),
+        "chunks_received": state.chunks_received if state else 0,
+        "response_completed_count": state.response_completed_count if state else 0,
+        "phases": phases,
+        "throughput": throughput or {},
+        "stall_aborts": stall_aborts,
+        "time_saved": round(time_saved, 1),
+        "retry_latencies": list(retry_latencies),
+    }
+
+
+def attempt_outcome(attempt_completed, watch):
+    if attempt_completed:
+        return "completed"
+    if watch.file_on_disk:
+        return "file_on_disk"
+    if watch.failed_fast:
+        return "ollama_failure"
+    return "stalled" if watch.time_saved is not None else "timeout"
+
+
+def crashed_result(job):
+    return {
+        "id": job["id"], "task_id": None, "target_file": job.get("target_file"),
+        "completed": False, "file_exists": False, "success": False,
+        "failure_reason": FailureReason.UNKNOWN, "attempts": 0, "elapsed": 0.0,
+        "chunks_received": 0, "response_completed_count": 0, "phases": {},
+        "throughput": {}, "stall_aborts": 0, "time_saved": 0.0, "retry_latencies": [],
+    }
+
+
+async def run_prompt(ctx, job):
+    """
+    Run one prompt job through the attempt loop (create task → fire prompt →
+    wait for completion, retrying on timeout). Returns a per-prompt result dict.
+    """
+    monitor = ctx.monitor
+    prompt = job["prompt"]
+    target_file = job.get("target_file")
+    model = job_model(ctx, job)
+    deadlines = ctx.deadlines(model)
+
+    # Per-prompt timing metrics (each attempt's phases overwrite the previous one's)
+    phases = {}
+
+    # --queue-db recovery: the attempt a crashed run was on, and its task
+    # when reattach_jobs() found it still there (tracked already)
+    resume = job.get("resume") or {}
+    reattach = resume.get("task_id")
+
+    # ── Remove target file if it exists ──────────────────────────────────────
+    if target_file and os.path.exists(target_file) and reattach is None:
+        log("INFO", f"Removing pre-existing {target_file}")
+        os.remove(target_file)
+        log("PASS", "File removed — clean slate")
+
+    task_id = None
+    state = None
+    reason = None
+    completed = False
+    file_exists = False
+    attempts = 0
+    throughput = {}
+    stall_aborts = 0
+    time_saved = 0.0
+    retry_latencies = []
+    failed_at = None      # when the last attempt's failure was detected
+    retry_settle = None   # seconds its interrupted task took to go idle
+    reusable = None       # that task, when it settled (--retry-task reuse)
+    pending = None        # the next attempt's task being prefetched
+    total_start = time.time()
+
+    for attempt in range(resume.get("attempt", 1), ctx.max_attempts + 1):
+        attempts = attempt
+        attempt_banner(attempt, ctx.max_attempts)
+
+        # Check Ollama status at start of each attempt
+        await fetch_running_models(ctx.io, ctx.ollama)
+
+        # ── Get a task (fresh, reset, prefetched or re-attached) ─────────
+        t0 = time.time()
+        if reattach is not None:
+            task_id, source, reattach = reattach, "reattached", None
+        else:
+            task_id, source = await next_task(ctx, job, attempt, reusable, pending)
+        pending = reusable = None
+        if task_id is None:
+            record_attempt(ctx, job, attempt, None, None, "create_failed", None, {})
+            continue
+        state = monitor.tasks[task_id]
+        attempt_phases = {"task_creation": round(time.time() - t0, 2)}
+        attempt_reason = None
+
+        files = 0
+        if ctx.args.context_file and source != "reattached":
+            files += len(ctx.args.context_file)
+            if source != "prefetched":
+                await add_context_files(ctx, task_id)
+        if target_file and source != "reattached":
+            files += 1
+            await add_target_file(ctx, task_id, target_file)
+        if files:
+            attempt_phases["context_ready"] = round(
+                await wait_context_ready(ctx.io, state, files), 2)
+
+        # ── Submit prompt (a re-attached task is already running it) ─────
+        attempt_start = time.time()
+        if source == "reattached":
+            log("INFO", f"Waiting on re-attached task {task_id}")
+            prompt_result = {"status": None, "error": None, "done": False}
+        else:
+            log("INFO", f"Submitting prompt ({len(prompt)} chars)...")
+            prompt_result = fire_prompt(ctx, task_id, prompt, state)
+        if failed_at is not None:
+            latency = attempt_start - failed_at
+            retry_latencies.append(round(latency, 2))
+            attempt_phases["retry_latency"] = round(latency, 2)
+            attempt_phases["retry_settle"] = round(retry_settle, 2)
+            log("INFO", f"Retry latency: {latency:.2f}s (settle {retry_settle:.2f}s, "
+                        f"{source} task {attempt_phases['task_creation']:.2f}s)")
+            failed_at = None
+        notify_progress(ctx, job, "attempt_start", attempt=attempt, task_id=task_id)
+        if ctx.args.retry_task == "prefetch" and attempt < ctx.max_attempts:
+            pending = prefetch_task(ctx, job, attempt + 1)
+        stop_file_watch = ctx.io.watch_file(target_file, state) if target_file else None
+        if attempt == 1:
+            residency_preload(ctx, job)
+        log("INFO", f"Waiting up to {deadlines['timeout']}s for completion...")
+        print("-" * 70)
+
+        watch = AttemptWatch(state, prompt_result, deadlines["timeout"], attempt_phases,
+                             target_file, attempt_start, deadlines["stall_timeout"],
+                             deadlines["cold_start_threshold"], ctx.stall_policy,
+                             ctx.log_events, ctx.log_fail_fast, monitor.chunk_events)
+        monitor.mark("attempt", attempt_start, task_id=task_id, id=job.get("id"),
+                     label=_log_prefix.get(), attempt=attempt, timeout=deadlines["timeout"],
+                     stall_timeout=deadlines["stall_timeout"],
+                     cold_start_threshold=deadlines["cold_start_threshold"],
+                     stall_policy=ctx.stall_policy, log_fail_fast=ctx.log_fail_fast,
+                     chunk_events=monitor.chunk_events, target_file=target_file)
+        attempt_completed = False
+
+        # Event-driven: block on state.wake until a handler signals or the
+        # next deadline (stale warning / timeout) comes due.
+        while True:
+            action = watch.step(time.time())
+            if action == AttemptWatch.COMPLETED:
+                attempt_completed = True
+                break
+            if action == AttemptWatch.QUESTION:
+                if await answer_question(ctx, task_id):
+                    watch.question_answered()
+                else:
+                    watch.question_failed(time.time())
+                continue
+            if action == AttemptWatch.STALL:
+                confirmed, why = await confirm_stall(ctx, state, model,
+                                                     deadlines["stall_timeout"])
+                monitor.mark("stall_check", task_id=task_id, confirmed=confirmed, why=why)
+                if confirmed or not watch.defer_stall(time.time(), why):
+                    failed_at = time.time()
+                    reason = attempt_reason = watch.stall_report(failed_at, why)
+                    await interrupt_task(ctx, task_id)
+                    break
+                continue
+            if action == AttemptWatch.OLLAMA_FAILURE:
+                failed_at = time.time()
+                reason = attempt_reason = watch.log_failure_report(failed_at)
+                await interrupt_task(ctx, task_id)
+                break
+            if action == AttemptWatch.TIMEOUT:
+                failed_at = time.time()
+                reason = attempt_reason = watch.timeout_report(failed_at)
+                # Check Ollama state when failure occurs
+                await fetch_running_models(ctx.io, ctx.ollama)
+                await interrupt_task(ctx, task_id)
+                break
+
+            await ctx.io.wait(state, max(0.0, watch.wake_at() - time.time()))
+
+        if stop_file_watch is not None:
+            stop_file_watch()
+        if failed_at is not None:
+            # Wait for the interrupt to land rather than a fixed sleep
+            t_settle = time.time()
+            if await settle_task(ctx.io, state, prompt_result, ctx.args.settle_timeout):
+                reusable = task_id
+            retry_settle = time.time() - t_settle
+        watch.close()
+        monitor.untrack(task_id)
+        file_exists = file_exists or watch.file_on_disk
+        throughput = watch.throughput
+        if watch.time_saved is not None:
+            stall_aborts += 1
+            time_saved += watch.time_saved
+        phases.update(attempt_phases)
+        outcome = attempt_outcome(attempt_completed, watch)
+        monitor.mark("attempt_end", task_id=task_id, outcome=outcome, reason=attempt_reason,
+                     prompt_status=prompt_result["status"], signals=state.signals)
+        record_attempt(ctx, job, attempt, task_id, state, outcome,
+                       attempt_reason, attempt_phases, throughput, watch.time_saved)
+        record_history(ctx, state, attempt_phases, deadlines["history_key"])
+
+        if attempt_completed or file_exists:
+            completed = True
+            break
+        if attempt < ctx.max_attempts and not await apply_remedy(ctx, job, attempt_reason,
+                                                                 watch.log_event):
+            break
+
+    if pending is not None:
+        await discard_prefetched(ctx, pending)
+    result = prompt_result_dict(job, task_id, state, reason, completed, file_exists,
+                                attempts, total_start, phases, throughput,
+                                stall_aborts, time_saved, retry_latencies)
+    record_prompt(ctx, job, result)
+    return result
+
+
+async def run_job(ctx, job):
+    """One batch or daemon job, with a log prefix; never let an exception kill the batch."""
+    _log_prefix.set(f"[{job['id']}] ")
+    if ctx.job_store is not None:
+        ctx.job_store.started(job)
+    try:
+        await residency_acquire(ctx, job)
+        return await run_prompt(ctx, job)
+    except Exception as e:
+        log("FAIL", f"Prompt job crashed: {e}")
+        result = crashed_result(job)
+        record_prompt(ctx, job, result)
+        return result
+    finally:
+        residency_release(ctx, job)
+
+
+def _run_job(ctx, job):
+    """run_job() from a worker thread (the daemon's): on ctx.io, so on its loop under asyncio."""
+    return ctx.io.run(run_job(ctx, job))
+
+
+def log_job_done(result, done, total):
+    outcome = "✅ success" if result["success"] else f"❌ {result['failure_reason']}"
+    log("BATCH", f"[{result['id']}] {outcome} after {result['elapsed']}s ({done}/{total} done)")
+
+
+def summarize_batch(results, wall, concurrency, residency=None):
+    """Aggregate throughput summary for a finished batch (+ model residency counters)."""
+    completions = [r["phases"]["completion"] for r in results if "completion" in r["phases"]]
+    first_chunks = [r["phases"]["first_chunk"] for r in results if "first_chunk" in r["phases"]]
+    gen_rates = [r["throughput"]["task_gen_tps"] for r in results
+                 if "task_gen_tps" in r.get("throughput", {})]
+    retry_latencies = [x for r in results for x in r.get("retry_latencies", [])]
+    succeeded = sum(1 for r in results if r["success"])
+    return {
+        "prompts": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "attempts": sum(r["attempts"] for r in results),
+        "concurrency": concurrency,
+        "wall_time": round(wall, 1),
+        "prompts_per_min": round(len(results) / wall * 60, 2) if wall > 0 else 0.0,
+        "completion_mean": round(statistics.mean(completions), 2) if completions else None,
+        "completion_median": round(statistics.median(completions), 2) if completions else None,
+        "first_chunk_median": round(statistics.median(first_chunks), 2) if first_chunks else None,
+        "gen_tps_median": round(statistics.median(gen_rates), 1) if gen_rates else None,
+        "stall_aborts": sum(r.get("stall_aborts", 0) for r in results),
+        "time_saved": round(sum(r.get("time_saved", 0.0) for r in results), 1),
+        "retries": len(retry_latencies),
+        "retry_latency_median": (round(statistics.median(retry_latencies), 2)
+                                 if retry_latencies else None),
+        "retry_latency_max": max(retry_latencies) if retry_latencies else None,
+        **(residency.summary() if residency is not None else {}),
+    }
+
+
+def run_batch(ctx, jobs, concurrency):
+    """
+    Run prompt jobs, at most `concurrency` at a time (ctx.io.run_all(): a
+    worker pool, or asyncio tasks), sharing ctx.monitor.
+    Returns (results in job order, aggregate summary dict).
+    """
+    batch_start = time.time()
+    results = {}
+
+    def _done(idx, result):
+        # Called outside the jobs' log prefix
+        results[idx] = result
+        log_job_done(result, len(results), len(jobs))
+
+    ctx.io.run_all([run_job(ctx, job) for job in jobs], concurrency, _done)
+
+    ordered = [results[idx] for idx in range(len(jobs))]
+    return ordered, summarize_batch(ordered, time.time() - batch_start, concurrency,
+                                    ctx.residency)
+
+
+# ── Event recording & replay ────────────────────────────────────────────────
+# PYTHON-ONLY: gzip + json lines; the replay drives EventMonitor and AttemptWatch
+# single-threaded on a virtual clock. Ruby: Zlib::GzipWriter + JSON, and a
+# clock lambda in place of Time.now for the same replay loop.
+#
+# A recording is JSON lines: one header, then {"t": <epoch secs>, "e": <raw
+# event payload>} for every Socket.IO event received and {"t", "mark": ...}
+# markers for attempt start/end (task id, timeout, run-prompt/file signal
+# times). Paths ending in .gz are gzip-compressed.
+
+class Recorder:
+    """Writes every raw Socket.IO event and attempt marker for --record."""
+
+    VERSION = 1
+
+    def __init__(self, path, header):
+        self.path = path
+        self._f = gzip.open(path, "wt") if path.endswith(".gz") else open(path, "w")
+        self._lock = threading.Lock()
+        self.events = 0
+        self._write({"type": "header", "version": self.VERSION,
+                     "started": datetime.now().isoformat(timespec="milliseconds"), **header})
+
+    def _write(self, record, flush=False):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._f is None:
+                return
+            self._f.write(line)
+            if flush:
+                self._f.flush()
+
+    def event(self, payload):
+        self.events += 1
+        self._write({"t": time.time(), "e": payload})
+
+    def mark(self, kind, t=None, **fields):
+        self._write({"t": t if t is not None else time.time(), "mark": kind, **fields}, flush=True)
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+        log("INFO", f"Recorded {self.events} event(s) to {self.path}")
+
+
+def start_recording(args, monitor):
+    if args.record:
+        monitor.recorder = Recorder(args.record, {
+            "project_dir": args.project_dir, "model": args.model, "mode": args.mode,
+            "edit_format": args.edit_format, "engine": args.engine,
+        })
+        ollama_log_events.recorder = monitor.recorder
+        log("INFO", f"Recording Socket.IO events to {args.record}")
+
+
+def read_recording(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayClock:
+    """Virtual time for replay: TaskState and AttemptWatch see recorded timestamps."""
+
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class ReplayAttempt:
+    def __init__(self, mark, state, watch, prompt_result):
+        self.mark = mark
+        self.state = state
+        self.watch = watch
+        self.prompt_result = prompt_result
+        self.outcome = None
+        self.reason = None
+
+
+def replay_recording(path, speed=1.0):
+    """
+    Feed a --record file through EventMonitor and AttemptWatch.
+
+    Events, run-prompt returns and file-on-disk signals are applied at their
+    recorded times; stale warnings, stall checks and timeouts fire at the
+    virtual times the live run would have hit them, with stall checks taking
+    the recorded /api/ps + log verdicts. speed scales the real-time pacing
+    (1 = as recorded, 10 = ten times faster, 0 = no pacing). Answers and
+    interrupts are logged, not sent. Returns the process exit code.
+    """
+    global clock
+    try:
+        records = read_recording(path)
+    except (OSError, ValueError) as e:
+        log("FAIL", f"Could not read recording {path}: {e}")
+        return 1
+    header = records[0] if records and records[0].get("type") == "header" else {}
+    timeline = [r for r in records if "t" in r]
+    if not timeline:
+        log("FAIL", f"Recording has no events: {path}")
+        return 1
+    # Signals the live loop got from the run-prompt thread / file watcher
+    for r in list(timeline):
+        if r.get("mark") == "attempt_end":
+            for kind in ("prompt_done", "file"):
+                at = (r.get("signals") or {}).get(kind)
+                if at is not None:
+                    timeline.append({"t": at, "inject": kind, "task_id": r["task_id"],
+                                     "status": r.get("prompt_status")})
+    timeline.sort(key=lambda r: r["t"])
+    stall_checks = {}
+    log_events = OllamaLogEvents()
+    for r in timeline:
+        if r.get("mark") == "stall_check":
+            stall_checks.setdefault(r["task_id"], deque()).append(r)
+
+    t0 = timeline[0]["t"]
+    replay_clock = ReplayClock(t0)
+    live_clock, clock = clock, replay_clock
+    monitor = EventMonitor(base_url="replay://", project_dir=header.get("project_dir", ""))
+    active, finished, recorded = {}, [], {}
+    events, handle_ns = 0, 0
+    wall0 = time.time()
+
+    log("REPLAY", f"Replaying {path}: {len(timeline)} record(s), "
+                  f"{round(timeline[-1]['t'] - t0, 1)}s recorded, speed={speed or 'max'}")
+
+    def move_to(t):
+        if speed > 0:
+            delay = wall0 + (t - t0) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        replay_clock.now = max(replay_clock.now, t)
+
+    def finish(attempt, outcome):
+        attempt.outcome = outcome
+        attempt.watch.close()
+        monitor.untrack(attempt.state.task_id)
+        active.pop(attempt.state.task_id, None)
+        finished.append(attempt)
+
+    def step(attempt):
+        _log_prefix.set(attempt.state.label)
+        now = replay_clock.now
+        action = attempt.watch.step(now)
+        if action == AttemptWatch.COMPLETED:
+            finish(attempt, "completed")
+        elif action == AttemptWatch.QUESTION:
+            log("REPLAY", "(not sending answer — replay)")
+            attempt.watch.question_answered()
+        elif action == AttemptWatch.STALL:
+            checks = stall_checks.get(attempt.state.task_id)
+            check = checks.popleft() if checks else {"confirmed": False, "why": "no recorded check"}
+            if check["confirmed"] or not attempt.watch.defer_stall(now, check["why"]):
+                attempt.reason = attempt.watch.stall_report(now, check["why"])
+                log("REPLAY", "(not sending interrupt — replay)")
+                finish(attempt, "stalled")
+        elif action == AttemptWatch.OLLAMA_FAILURE:
+            attempt.reason = attempt.watch.log_failure_report(now)
+            log("REPLAY", "(not sending interrupt — replay)")
+            finish(attempt, "ollama_failure")
+        elif action == AttemptWatch.TIMEOUT:
+            attempt.reason = attempt.watch.timeout_report(now)
+            log("REPLAY", "(not sending interrupt — replay)")
+            finish(attempt, "timeout")
+        return action
+
+    def advance(t):
+        """Run every attempt deadline (stale warning, timeout) due before t."""
+        while active:
+            at, attempt = min(((a.watch.wake_at(), a) for a in active.values()),
+                              key=lambda pair: pair[0])
+            if at > t:
+                return
+            move_to(at)
+            if step(attempt) is None and attempt.watch.wake_at() <= at:
+                return  # nothing further is scheduled for this attempt
+
+    try:
+        for r in timeline:
+            advance(r["t"])
+            move_to(r["t"])
+            if "e" in r:
+                events += 1
+                t_start = time.perf_counter_ns()
+                monitor._on_event(r["e"])
+                handle_ns += time.perf_counter_ns() - t_start
+                for attempt in list(active.values()):
+                    step(attempt)
+            elif r.get("mark") == "attempt":
+                _log_prefix.set(r.get("label") or "")
+                attempt_banner(r.get("attempt", 1), r.get("attempt", 1))
+                state = monitor.track(r["task_id"], r.get("label") or "")
+                prompt_result = {"done": False, "status": None, "error": None}
+                watch = AttemptWatch(state, prompt_result, r.get("timeout", 120), {},
+                                     r.get("target_file"), start=r["t"],
+                                     stale_timeout=r.get("stall_timeout", STALE_CHUNK_TIMEOUT),
+                                     cold_start_threshold=r.get("cold_start_threshold",
+                                                                COLD_START_THRESHOLD),
+                                     stall_policy=r.get("stall_policy", "warn"),
+                                     log_events=log_events,
+                                     log_fail_fast=r.get("log_fail_fast", True),
+                                     chunk_events=r.get("chunk_events", True))
+                active[r["task_id"]] = ReplayAttempt(r, state, watch, prompt_result)
+            elif r.get("mark") == "ollama_event":
+                log_events.add({k: v for k, v in r.items() if k not in ("t", "mark")})
+                for attempt in list(active.values()):
+                    step(attempt)
+            elif r.get("mark") == "attempt_end":
+                recorded[r["task_id"]] = r.get("outcome")
+                if r["task_id"] in active:
+                    finish(active[r["task_id"]], "ended")
+            elif r.get("inject") and r["task_id"] in active:
+                attempt = active[r["task_id"]]
+                if r["inject"] == "prompt_done":
+                    attempt.prompt_result.update(done=True, status=r.get("status"))
+                attempt.state.signal(r["inject"])
+                step(attempt)
+        advance(float("inf"))  # recording cut off mid-attempt: run it to its deadline
+    finally:
+        clock = live_clock
+        _log_prefix.set("")
+
+    wall = time.time() - wall0
+    print()
+    print("=" * 70)
+    log("INFO", "  REPLAY RESULTS")
+    print("=" * 70)
+    for a in finished:
+        phases = " ".join(f"{k}={v}" for k, v in a.watch.phases.items())
+        log("INFO", f"  {a.mark.get('id') or '-':16s} attempt={a.mark.get('attempt')} "
+                    f"recorded={recorded.get(a.state.task_id, '(cut off)'):14s} "
+                    f"replayed={a.outcome:10s} {a.reason or ''} chunks={a.state.chunks_received}")
+        if phases:
+            log("INFO", f"    {phases}")
+    print()
+    log("INFO", f"  Events replayed:   {events} in {wall:.2f}s wall")
+    if events:
+        log("INFO", f"  EventMonitor cost: {handle_ns / events / 1000:.1f}µs/event "
+                    f"({events / (handle_ns / 1e9):.0f} events/s, including log output)")
+    print()
+    return 0
+
+
+# ── Run setup & reporting ───────────────────────────────────────────────────
+# PORTABLE: The once-per-process phases and the final report, shared by
+# the thread engine (main) and the asyncio engine (ollama_prompt_async.py).
+
+def resolve_jobs(args):
+    """Turn --batch / --prompt-file / --prompt into a job list. Exits on bad input."""
+    if args.batch:
+        if not os.path.exists(args.batch):
+            log("FAIL", f"Batch source not found: {args.batch}")
+            sys.exit(1)
+        try:
+            jobs = load_batch(args.batch)
+        except (OSError, ValueError) as e:
+            log("FAIL", f"Could not load batch {args.batch}: {e}")
+            sys.exit(1)
+        if not jobs:
+            log("FAIL", f"Batch source has no prompts: {args.batch}")
+            sys.exit(1)
+        log("INFO", f"Loaded {len(jobs)} prompt(s) from batch: {args.batch}")
+        # Highest "priority" first; ties keep the file order
+        return sorted(jobs, key=lambda job: -job.get("priority", 0))
+
+    if args.prompt_file:
+        prompt_file_path = args.prompt_file
+        if not os.path.isabs(prompt_file_path):
+            prompt_file_path = os.path.abspath(prompt_file_path)
+        if not os.path.exists(prompt_file_path):
+            log("FAIL", f"Prompt file not found: {prompt_file_path}")
+            sys.exit(1)
+        with open(prompt_file_path, "r") as pf:
+            prompt = pf.read().strip()
+        if not prompt:
+            log("FAIL", f"Prompt file is empty: {prompt_file_path}")
+            sys.exit(1)
+        log("INFO", f"Loaded prompt from file: {prompt_file_path} ({len(prompt)} chars)")
+    else:
+        prompt = args.prompt
+    return [{"id": None, "prompt": prompt, "target_file": args.target_file}]
+
+
+def batch_models(args, jobs):
+    """Every model the jobs use, --model first."""
+    models = [args.model]
+    for job in jobs:
+        if job.get("model") and job["model"] not in models:
+            models.append(job["model"])
+    return models
+
+
+def print_run_header(args, jobs, concurrency, engine="threads"):
+    print("=" * 70)
+    log("INFO", "AiderDesk + Ollama Prompt Runner")
+    log("INFO", f"Model:        {', '.join(batch_models(args, jobs))}")
+    log("INFO", f"Timeout:      {args.timeout}s per attempt")
+    log("INFO", f"Max attempts: {args.retries}")
+    log("INFO", f"Mode:         {args.mode}")
+    log("INFO", f"Edit format:  {args.edit_format or '(server default)'}")
+    log("INFO", f"Engine:       {engine}")
+    if args.serve:
+        where = args.serve_socket or f"{args.serve_host}:{args.serve_port}"
+        log("INFO", f"Serve:        {where}, concurrency={concurrency}, "
+                    f"{len(jobs)} prompt(s) queued at start")
+    elif args.batch or args.queue_db:
+        log("INFO", f"Batch:        {len(jobs)} prompt(s), concurrency={concurrency}")
+    else:
+        prompt = jobs[0]["prompt"]
+        log("INFO", f"Prompt:       {prompt[:80]}{'...' if len(prompt) > 80 else ''}")
+    if args.target_file:
+        log("INFO", f"Target file:  {args.target_file}")
+    log("INFO", f"Debug:        {DEBUG}")
+    print("=" * 70)
+
+
+def check_aiderdesk(args, aiderdesk):
+    if not health_check(aiderdesk):
+        log("FAIL", f"Cannot reach AiderDesk at {args.base_url}")
+        return False
+    log("PASS", "AiderDesk is reachable")
+    return True
+
+
+def check_ollama(args, ollama):
+    if not check_ollama_health(ollama, args.model.replace("ollama/", "")):
+        log("FAIL", "Ollama not available — exiting")
+        return False
+    check_ollama_running_models(ollama)
+    return True
+
+
+def log_tail_targets(args):
+    """(path, label) pairs for the Ollama and AiderDesk log tailers.
+
+    The AiderDesk log is dated; LogTailer expands the strftime codes itself so
+    it follows the daily rotation.
+    """
+    ollama_log = os.path.expanduser(args.ollama_log)
+    aiderdesk_log = os.path.expanduser(
+        "~/Library/Application Support/aider-desk-dev/logs/combined-%Y-%m-%d.log"
+    )
+    log("INFO", f"Tailing Ollama logs from: {ollama_log}")
+    log("INFO", f"Tailing AiderDesk logs from: {aiderdesk_log}")
+    return [(ollama_log, "OLLAMA"), (aiderdesk_log, "AIDESK")]
+
+
+def open_project(args, aiderdesk):
+    """Open and activate the project (everything else in setup needs it)."""
+    api_post(aiderdesk, "/project/add-open", {"projectDir": args.project_dir})
+    api_post(aiderdesk, "/project/set-active", {"projectDir": args.project_dir})
+    log("INFO", f"Project set active: {args.project_dir}")
+
+
+def apply_project_settings(args, aiderdesk, models=None):
+    """Edit formats (optional) and auto-approve at the project level."""
+    project_dir = args.project_dir
+    if args.edit_format:
+        models = models or [args.model]
+        log("INFO", f"Setting edit format to '{args.edit_format}' for {', '.join(models)}")
+        api_post(aiderdesk, "/project/settings/edit-formats", {
+            "projectDir": project_dir,
+            "updatedFormats": {model: args.edit_format for model in models},
+        })
+
+    api_post(aiderdesk, "/project/settings/update", {
+        "projectDir": project_dir,
+        "autoApprove": True,
+    })
+
+
+def parse_duration(text):
+    """ "90", "90s", "30m", "2h", "7d" → seconds (argparse type for --cleanup-older-than)."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text = str(text).strip()
+    try:
+        if text and text[-1] in units:
+            return float(text[:-1]) * units[text[-1]]
+        return float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a duration: {text!r} (use e.g. 90s, 30m, 2h, 7d)")
+
+
+def _task_age(task, now):
+    """Seconds since the task's createdAt, or None if missing/unparseable."""
+    try:
+        created = datetime.fromisoformat(str(task["createdAt"]).replace("Z", "+00:00"))
+    except (KeyError, ValueError):
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return (now - created).total_seconds()
+
+
+class TaskCleanup:
+    """
+    Deletes the project's existing tasks through a bounded pool.
+
+    AiderDesk's task list has no query filters, so --cleanup-prefix,
+    --cleanup-runner-only and --cleanup-older-than are applied to the listed
+    TaskData (name, createdAt); all given filters must match. The list is a
+    snapshot taken before any prompt runs, so with --cleanup-background the
+    deletes can overlap the first attempts without touching this run's tasks.
+    """
+
+    def __init__(self, args, aiderdesk, keep=()):
+        self.args = args
+        self.aiderdesk = aiderdesk
+        self.keep = set(keep)  # --queue-db: tasks to re-attach to, never deleted
+        self.listed = 0
+        self.matched = 0
+        self.deleted = 0
+        self.failed = 0
+        self.elapsed = None
+        self._thread = None
+
+    def matches(self, task, now):
+        args = self.args
+        name = task.get("name") or ""
+        if args.cleanup_prefix and not name.startswith(args.cleanup_prefix):
+            return False
+        if args.cleanup_runner_only and not RUNNER_TASK_NAME.match(name):
+            return False
+        if args.cleanup_older_than is not None:
+            age = _task_age(task, now)
+            if age is None or age < args.cleanup_older_than:
+                return False
+        return True
+
+    def run(self):
+        """Startup phase: list + filter, then delete (or start deleting in the background)."""
+        project_dir = self.args.project_dir
+        log("INFO", "Cleaning up existing tasks before starting...")
+        try:
+            res = api_get(self.aiderdesk, f"/project/tasks?projectDir={project_dir}")
+            tasks = res.json() if res.status_code == 200 else []
+        except Exception as e:
+            log("WARN", f"Could not list existing tasks: {e}")
+            return
+        if not isinstance(tasks, list):
+            tasks = []
+        now = datetime.now(timezone.utc)
+        selected = [t["id"] for t in tasks
+                    if t.get("id") and t["id"] not in self.keep and self.matches(t, now)]
+        self.listed, self.matched = len(tasks), len(selected)
+        kept = sum(1 for t in tasks if t.get("id") in self.keep)
+        note = f", {kept} kept to re-attach" if kept else ""
+        if not selected:
+            log("INFO", f"  No tasks to delete ({self.listed} listed{note}) — clean slate")
+            return
+        log("INFO", f"  {self.matched} of {self.listed} task(s) match{note} — deleting "
+                    f"with concurrency {self.args.cleanup_concurrency}")
+        if self.args.cleanup_background:
+            self._thread = threading.Thread(target=self._delete_all, args=(selected,),
+                                            daemon=True, name="cleanup")
+            self._thread.start()
+            return
+        self._delete_all(selected)
+        time.sleep(0.5)
+
+    def _delete(self, task_id):
+        try:
+            res = api_post(self.aiderdesk, "/project/tasks/delete", {
+                "projectDir": self.args.project_dir,
+                "id": task_id,
+            })
+            if res.status_code == 200:
+                return True
+            log("WARN", f"    Failed to delete {task_id}: HTTP {res.status_code}")
+        except Exception as e:
+            log("WARN", f"    Failed to delete {task_id}: {e}")
+        return False
+
+    def _delete_all(self, task_ids):
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=self.args.cleanup_concurrency,
+                                thread_name_prefix="cleanup") as pool:
+            for ok in pool.map(self._delete, task_ids):
+                if ok:
+                    self.deleted += 1
+                else:
+                    self.failed += 1
+        self.elapsed = time.time() - t0
+        log("PASS", f"Deleted {self.deleted}/{self.matched} task(s) in {self.elapsed:.2f}s "
+                    f"({self.rate()} tasks/s)")
+
+    def rate(self):
+        return round(self.deleted / self.elapsed, 1) if self.elapsed else 0.0
+
+    def finish(self, phases):
+        """Wait for a background cleanup; record its duration. Returns the summary dict."""
+        if self._thread is not None:
+            if self._thread.is_alive():
+                log("INFO", "Waiting for background task cleanup to finish...")
+            self._thread.join()
+            phases["cleanup_background"] = round(self.elapsed or 0.0, 2)
+        return {
+            "listed": self.listed,
+            "matched": self.matched,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "tasks_per_s": self.rate(),
+        }
+
+
+# ── Startup phase graph ─────────────────────────────────────────────────────
+# PORTABLE: A small dependency scheduler. Ruby: one Thread per ready phase
+# reporting to a Queue; the main thread starts phases whose deps are done.
+#
+#   aiderdesk_health ──► project_open ──► project_settings
+#                                    └──► cleanup
+#   ollama_health ─────► warm_up
+
+def run_phase_graph(graph):
+    """
+    Run (name, deps, fn) phases, each on its own daemon thread as soon as all
+    of its deps have finished. A phase fails if fn returns False or raises.
+
+    Returns ({name: (start, end)}, failed_name). On failure it returns at once,
+    and phases still running are abandoned (daemon threads do not block exit).
+    """
+    done = queue.Queue()
+    pending = {name: (deps, fn) for name, deps, fn in graph}
+    spans = {}
+    running = 0
+
+    def _run(name, fn):
+        start = time.time()
+        try:
+            ok = fn() is not False
+        except Exception as e:
+            log("FAIL", f"Startup phase {name} crashed: {e}")
+            ok = False
+        done.put((name, ok, start, time.time()))
+
+    while True:
+        for name, (deps, fn) in list(pending.items()):
+            if all(dep in spans for dep in deps):
+                del pending[name]
+                running += 1
+                threading.Thread(target=_run, args=(name, fn), daemon=True,
+                                 name=f"startup-{name}").start()
+        if not running:
+            return spans, None
+        name, ok, start, end = done.get()
+        running -= 1
+        if not ok:
+            return spans, name
+        spans[name] = (start, end)
+
+
+def critical_path(graph, spans):
+    """The chain of phases that set the total startup time, first to last."""
+    deps = {name: d for name, d, _ in graph}
+    name = max(spans, key=lambda n: spans[n][1])
+    path = [name]
+    while deps[name]:
+        name = max(deps[name], key=lambda d: spans[d][1])
+        path.append(name)
+    return path[::-1]
+
+
+def run_startup(args, aiderdesk, ollama, phases, throughput=None, models=None, cleanup=None,
+                prefix=None):
+    """
+    Health checks, warm-up and project setup, with independent phases run
+    concurrently (warm-up does not wait for AiderDesk, project setup does not
+    wait for Ollama). Records each phase's duration plus "setup" (project
+    open → settings/cleanup), "startup" (wall time) and "startup_sequential"
+    (what the phases would take one after another) in phases, and logs the
+    critical path. cleanup is a TaskCleanup (None with --no-cleanup). With
+    --measure-tokens the warm-up's Ollama counters go into throughput. prefix
+    (--warm-prefix / --warm-context) is primed into Ollama's cache after the
+    warm-up. Returns False if a backend is unusable.
+    """
+    stats = {} if args.measure_tokens else None
+    prefix_stats = {}
+
+    def _warm_up():
+        # A failed warm-up is not fatal: the first prompt pays the load instead
+        warm_up_ollama(ollama, args.model.replace("ollama/", ""),
+                       timeout=args.warmup_timeout, stats=stats, options=ollama_options(args))
+
+    def _warm_prefix():
+        # Not fatal either: the tasks just evaluate the prefix themselves
+        prefix_stats.update(prime_prefix(ollama, args.model, prefix, ollama_options(args),
+                                         timeout=args.warmup_timeout) or {})
+
+    graph = [
+        ("aiderdesk_health", (), lambda: check_aiderdesk(args, aiderdesk)),
+        ("ollama_health", (), lambda: check_ollama(args, ollama)),
+        ("project_open", ("aiderdesk_health",), lambda: open_project(args, aiderdesk)),
+        ("project_settings", ("project_open",),
+         lambda: apply_project_settings(args, aiderdesk, models)),
+    ]
+    if args.no_warmup:
+        log("INFO", "Skipping Ollama warm-up (--no-warmup)")
+    else:
+        graph.append(("warm_up", ("ollama_health",), _warm_up))
+    if prefix:
+        graph.append(("warm_prefix", ("ollama_health",) if args.no_warmup else ("warm_up",),
+                      _warm_prefix))
+    if cleanup is not None:
+        graph.append(("cleanup", ("project_open",), cleanup.run))
+
+    t0 = time.time()
+    spans, failed = run_phase_graph(graph)
+    if failed is not None:
+        log("FAIL", f"Startup phase {failed} failed")
+        return False
+
+    for name, _, _ in graph:
+        start, end = spans[name]
+        phases[name] = round(end - start, 2)
+    setup_names = [n for n in ("project_open", "project_settings", "cleanup") if n in spans]
+    phases["setup"] = round(max(spans[n][1] for n in setup_names) - spans["project_open"][0], 2)
+    if stats:
+        record_warm_up_stats(stats, phases, throughput if throughput is not None else {})
+    if prefix_stats:
+        record_prefix_stats(prefix_stats, phases, throughput if throughput is not None else {})
+    phases["startup"] = round(max(end for _, end in spans.values()) - t0, 2)
+    phases["startup_sequential"] = round(sum(end - start for start, end in spans.values()), 2)
+    path = critical_path(graph, spans)
+    log("PASS", f"Startup done in {phases['startup']}s "
+                f"(one after another: {phases['startup_sequential']}s); "
+                f"critical path: {' → '.join(path)}")
+    return True
+
+
+def report_batch(results, summary, phases, clients, throughput=None, tailers=None):
+    print()
+    print("=" * 70)
+    log("INFO", "  BATCH RESULTS")
+    print("=" * 70)
+    for r in results:
+        outcome = "success" if r["success"] else f"failed ({r['failure_reason']})"
+        log("INFO", f"  {r['id']:24s} {outcome:24s} attempts={r['attempts']} "
+                    f"elapsed={r['elapsed']}s chunks={r['chunks_received']} task={r['task_id']}")
+    print()
+    log("INFO", f"  Prompts:           {summary['prompts']} "
+                f"({summary['succeeded']} succeeded, {summary['failed']} failed)")
+    log("INFO", f"  Attempts:          {summary['attempts']}")
+    log("INFO", f"  Concurrency:       {summary['concurrency']}")
+    log("INFO", f"  Wall time:         {summary['wall_time']}s")
+    log("INFO", f"  Throughput:        {summary['prompts_per_min']} prompts/min")
+    if summary["completion_median"] is not None:
+        log("INFO", f"  Completion mean:   {summary['completion_mean']}s")
+        log("INFO", f"  Completion median: {summary['completion_median']}s")
+    if summary["first_chunk_median"] is not None:
+        log("INFO", f"  First chunk median: {summary['first_chunk_median']}s")
+    if throughput is not None and summary["gen_tps_median"] is not None:
+        log("INFO", f"  Generation median: {summary['gen_tps_median']} tok/s")
+    if summary["stall_aborts"]:
+        log("INFO", f"  Stall aborts:      {summary['stall_aborts']} "
+                    f"({summary['time_saved']}s of timeout not waited out)")
+    if summary["retries"]:
+        log("INFO", f"  Retry latency:     median {summary['retry_latency_median']}s, "
+                    f"max {summary['retry_latency_max']}s over {summary['retries']} retries")
+    if "model_loads" in summary:
+        log("INFO", f"  Model loads:       {summary['model_loads']} "
+                    f"({summary['model_preloads']} preloaded), evictions: "
+                    f"{summary['model_evictions']}, unloads: {summary['model_unloads']}")
+
+    if phases:
+        print()
+        log("INFO", "  Setup phase timing (seconds, paid once):")
+        for phase, duration in phases.items():
+            log("INFO", f"    {phase:20s} {duration:>9.3f}s")
+    if throughput is not None:
+        log_throughput(throughput)
+    log_latency_report(clients)
+    log_tailer_report(tailers)
+    print()
+
+
+def report_single(result, phases, target_file, clients, throughput=None, tailers=None):
+    print()
+    print("=" * 70)
+    log("INFO", "  FINAL RESULTS")
+    print("=" * 70)
+    log("INFO", f"  Total elapsed:     {result['elapsed']}s")
+    log("INFO", f"  Task ID:           {result['task_id']}")
+    log("INFO", f"  Completed signal:  {result['completed']}")
+    if target_file:
+        log("INFO", f"  File created:      {result['file_exists']}")
+    log("INFO", f"  Chunks received:   {result['chunks_received']}")
+    log("INFO", f"  Response-completed: {result['response_completed_count']}")
+    if result["stall_aborts"]:
+        log("INFO", f"  Stall aborts:      {result['stall_aborts']} "
+                    f"({result['time_saved']}s of timeout not waited out)")
+    if result["retry_latencies"]:
+        log("INFO", f"  Retry latency:     "
+                    f"{', '.join(f'{x}s' for x in result['retry_latencies'])}")
+
+    # Print phase timing
+    if phases:
+        print()
+        log("INFO", "  Phase timing (seconds):")
+        for phase, duration in phases.items():
+            log("INFO", f"    {phase:20s} {duration:>9.3f}s")
+    if throughput is not None:
+        log_throughput(throughput)
+    log_latency_report(clients)
+    log_tailer_report(tailers)
+
+    print()
+
+
+def report_outcome(result, target_file, max_attempts):
+    """Print the PASS/FAIL verdict (and file preview). Returns the exit code."""
+    if result["success"]:
+        log("PASS", "✅ Prompt processed successfully.")
+        if target_file and result["file_exists"]:
+            print()
+            basename = os.path.basename(target_file)
+            print(f"--- {basename} (first 30 lines) ---")
+            try:
+                with open(target_file) as f:
+                    for i, line in enumerate(f):
+                        if i >= 30:
+                            break
+                        print(f"  {line}", end="")
+            except Exception as e:
+                log("WARN", f"Could not read file: {e}")
+        return 0
+
+    log("FAIL", f"❌ All {max_attempts} attempts failed.")
+    print()
+    log("INFO", "  Troubleshooting:")
+    log("INFO", "    1. Check Ollama is running:  ollama ps")
+    log("INFO", "    2. Check model is loaded:    curl http://localhost:11434/api/tags")
+    log("INFO", "    3. Restart Ollama:           ollama stop && ollama serve")
+    log("INFO", "    4. Try with --no-warmup if warm-up itself is hanging")
+    log("INFO", "    5. Try --edit-format whole to avoid SEARCH/REPLACE issues")
+    log("INFO", "    6. Try --mode agent for better multi-step handling")
+    return 1
+
+
+def make_http_clients(args, concurrency):
+    """Pooled keep-alive clients for AiderDesk and Ollama."""
+    # Each worker holds one AiderDesk connection for its long-running
+    # run-prompt call plus one for short calls.
+    pool_size = args.http_pool_size or max(10, 2 * concurrency + 4, args.cleanup_concurrency)
+    aiderdesk = HttpClient(
+        f"{args.base_url}/api", args.username, args.password,
+        pool_size=pool_size, retries=args.http_retries, backoff=args.http_backoff,
+    )
+    ollama = HttpClient(
+        args.ollama_url,
+        pool_size=pool_size, retries=args.http_retries, backoff=args.http_backoff,
+    )
+    return aiderdesk, ollama
 
 
 # ── CLI argument parsing ─────────────────────────────────────────────────────
@@ -476,6 +4467,7 @@ Examples:
   %(prog)s --model ollama/qwen2.5-coder:32b --timeout 180 --retries 5
   %(prog)s --debug --edit-format whole --mode agent
   %(prog)s --prompt "Fix the bug in app.py" --no-warmup --no-cleanup
+  %(prog)s --batch prompts/ --concurrency 4
 """,
     )
 
@@ -494,6 +4486,24 @@ Examples:
         default=None,
         help="Path to a file containing the prompt text. Overrides --prompt if set.",
     )
+    parser.add_argument(
+        "--batch", "-b",
+        default=None,
+        help="Directory of prompt files (*.txt, *.md, *.prompt) or a JSONL file of "
+             "prompt jobs. Overrides --prompt/--prompt-file; setup runs once for all.",
+    )
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int, default=1,
+        help="Number of batch prompts run in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="Execution engine: threads (default) or asyncio (aiohttp + socketio.AsyncClient; "
+             "see ollama_prompt_async.py)",
+    )
     parser.add_argument(
         "--model", "-m",
         default="ollama/qwen2.5-coder:32b",
@@ -511,6 +4521,39 @@ Examples:
         type=int, default=3,
         help="Max retry attempts after zombie detection (default: 3)",
     )
+    parser.add_argument(
+        "--manage-residency",
+        action="store_true",
+        help="Batch mode: order prompts by model, load each job's model before it runs, "
+             "unload idle models and report Ollama model loads/evictions",
+    )
+    parser.add_argument(
+        "--ollama-memory-gb",
+        type=float, default=None,
+        help="Memory Ollama can use for models; with --manage-residency, enables preloading "
+             "the next model while the current one generates when both fit",
+    )
+    parser.add_argument(
+        "--stall-policy",
+        choices=["warn", "abort"],
+        default="warn",
+        help="On a chunk stall: warn and wait for --timeout (default), or abort = confirm "
+             "via Ollama /api/ps and the Ollama log, then interrupt and retry at once",
+    )
+    parser.add_argument(
+        "--retry-task",
+        choices=["new", "reuse", "prefetch"],
+        default="new",
+        help="Task for a retry: new = create one per attempt (default), reuse = reset the "
+             "interrupted task and run the retry in it, prefetch = create the next "
+             "attempt's task in the background while the current attempt runs",
+    )
+    parser.add_argument(
+        "--settle-timeout",
+        type=float, default=5.0,
+        help="Seconds to wait for an interrupted task to go idle before retrying "
+             "(default: 5)",
+    )
     parser.add_argument(
         "--mode",
         choices=["code", "agent", "ask", "architect"],
@@ -545,6 +4588,46 @@ Examples:
         default="booberry",
         help="AiderDesk password (default: booberry)",
     )
+    parser.add_argument(
+        "--http-pool-size",
+        type=int, default=None,
+        help="Keep-alive connections per backend (default: max(10, 2*concurrency+4))",
+    )
+    parser.add_argument(
+        "--http-retries",
+        type=int, default=2,
+        help="Retries for failed connections / GET 502-504 responses (default: 2)",
+    )
+    parser.add_argument(
+        "--http-backoff",
+        type=float, default=0.5,
+        help="Exponential backoff factor between HTTP retries in seconds (default: 0.5)",
+    )
+    parser.add_argument(
+        "--sio-reconnect-delay",
+        type=float, default=1.0,
+        help="First delay before reconnecting a dropped Socket.IO connection; doubles per "
+             "failed try (default: 1.0)",
+    )
+    parser.add_argument(
+        "--sio-reconnect-delay-max",
+        type=float, default=10.0,
+        help="Cap on the Socket.IO reconnect delay in seconds (default: 10)",
+    )
+    parser.add_argument(
+        "--event-profile",
+        choices=["full", "questions", "completion"],
+        default="full",
+        help="Socket.IO event types to subscribe to: full (default), questions = completion "
+             "+ ask-question, completion = task state, response-completed and context files "
+             "only (no chunks: no first-chunk time or stall detection)",
+    )
+    parser.add_argument(
+        "--subscribe-tasks",
+        action="store_true",
+        help="Subscribe only to the runner's own tasks (taskIds), re-subscribing as tasks "
+             "start and finish, instead of the whole project",
+    )
 
     # Project
     parser.add_argument(
@@ -580,11 +4663,173 @@ Examples:
         action="store_true",
         help="Disable tailing Ollama and AiderDesk log files",
     )
+    parser.add_argument(
+        "--ollama-log",
+        default="~/.ollama/logs/server.log",
+        help="Ollama server log to tail (default: ~/.ollama/logs/server.log)",
+    )
+    parser.add_argument(
+        "--no-log-fail-fast",
+        action="store_true",
+        help="Do not end an attempt as soon as the Ollama log shows OOM, a context overflow "
+             "or a runner crash (still used to classify the failure at timeout)",
+    )
+    parser.add_argument(
+        "--context-file",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="Add this file (relative to --project-dir) to every task's context, read-only. "
+             "Repeatable",
+    )
+    parser.add_argument(
+        "--warm-prefix",
+        default=None,
+        metavar="FILE",
+        help="Prime Ollama's prompt cache with this text (the exact start of the tasks' "
+             "prompt) after the warm-up, and keep the model resident",
+    )
+    parser.add_argument(
+        "--warm-context",
+        action="store_true",
+        help="Prime Ollama's prompt cache with the --context-file contents",
+    )
+    parser.add_argument(
+        "--num-ctx",
+        type=int,
+        default=None,
+        help="num_ctx for the warm-up and prefix priming. Set it to the context length the "
+             "tasks run with, or Ollama reloads the model and drops the cache (default: "
+             "server default)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics on this port at /metrics (0 picks a free port)",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="Address for --metrics-port (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        default=None,
+        help="Also write metrics to this .prom file for node_exporter's textfile collector "
+             "(rewritten atomically after every attempt)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Daemon mode: set up once, then take prompt jobs over a local HTTP API until "
+             "POST /shutdown or SIGTERM (see ollama_prompt_daemon.py). --batch jobs are "
+             "queued at start",
+    )
+    parser.add_argument(
+        "--queue-db",
+        default=None,
+        metavar="PATH",
+        help="Keep prompt jobs in this SQLite queue: --batch and --serve jobs are added to "
+             "it, jobs run by priority, and a run after a crash re-attaches to the tasks "
+             "its jobs left running. Without --serve, runs the queue until it is empty",
+    )
+    parser.add_argument(
+        "--serve-port",
+        type=int, default=8765,
+        help="Port for --serve (default: 8765, 0 picks a free port)",
+    )
+    parser.add_argument(
+        "--serve-host",
+        default="127.0.0.1",
+        help="Address for --serve (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--serve-socket",
+        default=None,
+        metavar="PATH",
+        help="Serve on this Unix socket instead of --serve-host/--serve-port",
+    )
+    parser.add_argument(
+        "--cleanup-prefix",
+        default=None,
+        help="Only delete existing tasks whose name starts with this (e.g. 'Prompt #')",
+    )
+    parser.add_argument(
+        "--cleanup-runner-only",
+        action="store_true",
+        help="Only delete tasks this runner created (names like 'Prompt #1 [id] - 12:00:00')",
+    )
+    parser.add_argument(
+        "--cleanup-older-than",
+        type=parse_duration, default=None,
+        help="Only delete tasks created longer ago than this (e.g. 30m, 2h, 7d)",
+    )
+    parser.add_argument(
+        "--cleanup-concurrency",
+        type=int, default=8,
+        help="Parallel delete requests during cleanup (default: 8)",
+    )
+    parser.add_argument(
+        "--cleanup-background",
+        action="store_true",
+        help="Delete in the background so the first prompt does not wait for cleanup",
+    )
     parser.add_argument(
         "--warmup-timeout",
         type=int, default=300,
         help="Timeout for Ollama warm-up request in seconds (default: 300)",
     )
+    parser.add_argument(
+        "--results-json",
+        default=None,
+        help="Append structured attempt/prompt/run records to a JSON array file",
+    )
+    parser.add_argument(
+        "--results-jsonl",
+        default=None,
+        help="Append structured attempt/prompt/run records to a JSONL file (one per line)",
+    )
+    parser.add_argument(
+        "--adaptive-timeouts",
+        action="store_true",
+        help="Derive the attempt timeout, stall and cold-start thresholds from run history "
+             "(p99 + margin per model/mode/edit format) instead of the fixed values",
+    )
+    parser.add_argument(
+        "--history-file",
+        default=None,
+        help=f"Run history for --adaptive-timeouts; giving it also records history "
+             f"without adapting (default with --adaptive-timeouts: {DEFAULT_HISTORY_FILE})",
+    )
+    parser.add_argument(
+        "--adaptive-margin",
+        type=float, default=0.5,
+        help="Margin added on top of the history p99, as a fraction (default: 0.5 = +50%%)",
+    )
+    parser.add_argument(
+        "--record",
+        default=None,
+        help="Write every raw Socket.IO event and attempt marker to this file "
+             "(JSON lines, gzip if it ends in .gz) for --replay",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        help="Replay a --record file through EventMonitor and the attempt loop "
+             "(no AiderDesk/Ollama needed) and exit",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float, default=1.0,
+        help="Replay pacing: 1 = as recorded, 10 = 10x faster, 0 = as fast as possible (default: 1)",
+    )
+    parser.add_argument(
+        "--measure-tokens",
+        action="store_true",
+        help="Stream the warm-up and report TTFT, load time and prompt/generation "
+             "tokens/sec for the warm-up and the task",
+    )
 
     return parser.parse_args()
 
@@ -595,392 +4840,144 @@ Examples:
 # translates directly to Ruby. Replace Python-specific calls with Ruby equivalents
 # as noted in the component sections above.
 
-def main():
-    args = parse_args()
+def main(args=None):
+    args = args or parse_args()
 
     global DEBUG
     DEBUG = args.debug
 
-    api_url = f"{args.base_url}/api"
-    auth = HTTPBasicAuth(args.username, args.password)
-    project_dir = args.project_dir
-    model = args.model
-    # ── Resolve prompt: --prompt-file overrides --prompt ───────────────────
-    if args.prompt_file:
-        prompt_file_path = args.prompt_file
-        if not os.path.isabs(prompt_file_path):
-            prompt_file_path = os.path.abspath(prompt_file_path)
-        if not os.path.exists(prompt_file_path):
-            log("FAIL", f"Prompt file not found: {prompt_file_path}")
-            sys.exit(1)
-        with open(prompt_file_path, "r") as pf:
-            prompt = pf.read().strip()
-        if not prompt:
-            log("FAIL", f"Prompt file is empty: {prompt_file_path}")
-            sys.exit(1)
-        log("INFO", f"Loaded prompt from file: {prompt_file_path} ({len(prompt)} chars)")
-    else:
-        prompt = args.prompt
-    timeout = args.timeout
-    max_attempts = args.retries
-    mode = args.mode
-    target_file = args.target_file
-
-    # Per-phase timing metrics
+    if args.replay:
+        sys.exit(replay_recording(args.replay, args.replay_speed))
+
+    if args.event_profile != "full" and args.stall_policy == "abort":
+        log("WARN", f"--event-profile {args.event_profile} has no response-chunk events: "
+                    "--stall-policy abort cannot see stalls, attempts end at --timeout")
+    if args.event_profile != "full" and args.adaptive_timeouts:
+        log("WARN", f"--event-profile {args.event_profile} has no response-chunk events: "
+                    "this run is not added to the --adaptive-timeouts history")
+
+    # ── Resolve prompts: --batch overrides --prompt-file overrides --prompt ──
+    store, jobs = open_job_store(args)
+    if store is None:
+        jobs = resolve_jobs(args) if args.batch or not args.serve else []
+    elif not jobs and not args.serve:
+        log("PASS", "Job queue is empty — nothing to run")
+        close_job_store(store)
+        sys.exit(0)
+    concurrency = max(1, args.concurrency)
+    # --engine: the attempt code's I/O layer. Startup and cleanup use the
+    # pooled clients; the asyncio engine has its own aiohttp clients for tasks.
+    io = make_io(args)
+    aiderdesk, ollama = make_http_clients(args, concurrency)
+    task_aiderdesk, task_ollama = io.http_clients(args, concurrency, aiderdesk, ollama)
+    clients = [("aiderdesk", task_aiderdesk), ("ollama", task_ollama)]
+    if task_aiderdesk is not aiderdesk:
+        clients += [("setup:aiderdesk", aiderdesk), ("setup:ollama", ollama)]
+
+    # Per-phase timing metrics (+ token rates with --measure-tokens)
     phases = {}
-
-    print("=" * 70)
-    log("INFO", "AiderDesk + Ollama Prompt Runner")
-    log("INFO", f"Model:        {model}")
-    log("INFO", f"Timeout:      {timeout}s per attempt")
-    log("INFO", f"Max attempts: {max_attempts}")
-    log("INFO", f"Mode:         {mode}")
-    log("INFO", f"Edit format:  {args.edit_format or '(server default)'}")
-    log("INFO", f"Prompt:       {prompt[:80]}{'...' if len(prompt) > 80 else ''}")
-    if target_file:
-        log("INFO", f"Target file:  {target_file}")
-    log("INFO", f"Debug:        {DEBUG}")
-    print("=" * 70)
-
-    # ── Phase: AiderDesk health check ────────────────────────────────────────
-    t0 = time.time()
-    if not health_check(api_url, auth):
-        log("FAIL", f"Cannot reach AiderDesk at {args.base_url}")
-        sys.exit(1)
-    log("PASS", "AiderDesk is reachable")
-    phases["aiderdesk_health"] = round(time.time() - t0, 2)
-
-    # ── Phase: Ollama health check ───────────────────────────────────────────
-    t0 = time.time()
-    short_model = model.replace("ollama/", "")
-    if not check_ollama_health(short_model, args.ollama_url):
-        log("FAIL", "Ollama not available — exiting")
+    throughput = {} if args.measure_tokens else None
+
+    results = make_results_writer(args)
+    metrics = make_metrics(args, clients)
+
+    print_run_header(args, jobs, concurrency, engine=io.name)
+    prefix = load_warm_prefix(args)
+
+    # ── Start log tailers (they follow the warm-up too) ──────────────────────
+    tailers = [] if args.no_tail_logs else io.start_tailers(args)
+
+    # ── Phases: health checks, warm-up, project setup (concurrent graph) ─────
+    cleanup = None if args.no_cleanup else TaskCleanup(
+        args, aiderdesk, store.active_task_ids() if store is not None else ())
+    if not run_startup(args, aiderdesk, ollama, phases, throughput, batch_models(args, jobs),
+                       cleanup, prefix):
+        for tailer in tailers:
+            tailer.stop_event.set()
+        io.close()
+        finish_results(results, 1, phases, error="startup failed")
         sys.exit(1)
-    check_ollama_running_models(args.ollama_url)
-    phases["ollama_health"] = round(time.time() - t0, 2)
-
-    # ── Phase: Ollama warm-up ────────────────────────────────────────────────
-    if not args.no_warmup:
-        t0 = time.time()
-        warm_up_ollama(short_model, timeout=args.warmup_timeout, ollama_url=args.ollama_url)
-        phases["warm_up"] = round(time.time() - t0, 2)
-    else:
-        log("INFO", "Skipping Ollama warm-up (--no-warmup)")
-
-    # ── Start log tailers ────────────────────────────────────────────────────
-    ollama_stop = threading.Event()
-    aiderdesk_stop = threading.Event()
-    if not args.no_tail_logs:
-        ollama_log = os.path.expanduser("~/.ollama/logs/server.log")
-        _today = datetime.now().strftime("%Y-%m-%d")
-        aiderdesk_log = os.path.expanduser(
-            f"~/Library/Application Support/aider-desk-dev/logs/combined-{_today}.log"
-        )
-        log("INFO", f"Tailing Ollama logs from: {ollama_log}")
-        log("INFO", f"Tailing AiderDesk logs from: {aiderdesk_log}")
-        ollama_stop = start_log_tailer(ollama_log, "OLLAMA")
-        aiderdesk_stop = start_log_tailer(aiderdesk_log, "AIDESK")
-
-    # ── Set up project ───────────────────────────────────────────────────────
-    t0 = time.time()
-    api_post(api_url, auth, "/project/add-open", {"projectDir": project_dir})
-    api_post(api_url, auth, "/project/set-active", {"projectDir": project_dir})
-    log("INFO", f"Project set active: {project_dir}")
-
-    # Optionally set edit format at the project level
-    if args.edit_format:
-        log("INFO", f"Setting edit format to '{args.edit_format}' for {model}")
-        api_post(api_url, auth, "/project/settings/edit-formats", {
-            "projectDir": project_dir,
-            "updatedFormats": {model: args.edit_format},
-        })
-
-    # Set auto-approve at project level
-    api_post(api_url, auth, "/project/settings/update", {
-        "projectDir": project_dir,
-        "autoApprove": True,
-    })
-
-    # ── Clean up existing tasks ──────────────────────────────────────────────
-    if not args.no_cleanup:
-        log("INFO", "Deleting all existing tasks before starting...")
-        try:
-            tasks_res = api_get(api_url, auth, f"/project/tasks?projectDir={project_dir}")
-            if tasks_res.status_code == 200:
-                tasks_list = tasks_res.json()
-                if isinstance(tasks_list, list) and len(tasks_list) > 0:
-                    log("INFO", f"  Found {len(tasks_list)} existing task(s) — deleting all")
-                    for t in tasks_list:
-                        tid = t.get("id", "")
-                        if tid:
-                            try:
-                                api_post(api_url, auth, "/project/tasks/delete", {
-                                    "projectDir": project_dir,
-                                    "id": tid,
-                                })
-                            except Exception as e:
-                                log("WARN", f"    Failed to delete {tid}: {e}")
-                    log("PASS", "All existing tasks deleted")
-                else:
-                    log("INFO", "  No existing tasks found — clean slate")
-        except Exception as e:
-            log("WARN", f"Could not delete existing tasks: {e}")
-        time.sleep(0.5)
-    phases["setup"] = round(time.time() - t0, 2)
-
-    # ── Remove target file if it exists ──────────────────────────────────────
-    if target_file and os.path.exists(target_file):
-        log("INFO", f"Removing pre-existing {target_file}")
-        os.remove(target_file)
-        log("PASS", "File removed — clean slate")
 
     # ── Connect Socket.IO event monitor ──────────────────────────────────────
-    monitor = EventMonitor(task_id="pending", base_url=args.base_url, project_dir=project_dir)
+    monitor = io.event_monitor(base_url=args.base_url, project_dir=args.project_dir,
+                               reconnect_delay=args.sio_reconnect_delay,
+                               reconnect_delay_max=args.sio_reconnect_delay_max,
+                               profile=args.event_profile, task_filter=args.subscribe_tasks)
+    monitor.metrics = metrics
+    monitor.resync_client = task_aiderdesk
     if not monitor.connect(args.username, args.password):
         log("FAIL", "Could not connect Socket.IO — cannot monitor events")
+        io.close()
+        finish_results(results, 1, phases, error="Socket.IO connect failed")
         sys.exit(1)
     log("PASS", "Socket.IO event monitor connected")
-
-    # ── Attempt loop ─────────────────────────────────────────────────────────
-    task_id = None
-    completed = False
-    file_exists = False
-    total_start = time.time()
-
-    for attempt in range(1, max_attempts + 1):
-        print()
-        print("━" * 70)
-        log("INFO", f"  ATTEMPT {attempt} of {max_attempts}")
-        print("━" * 70)
-
-        # Check Ollama status at start of each attempt
-        check_ollama_running_models(args.ollama_url)
-
-        # ── Create a fresh task ──────────────────────────────────────────
-        t0 = time.time()
-        task_name = f"Prompt #{attempt} - {datetime.now().strftime('%H:%M:%S')}"
-        res = api_post(api_url, auth, "/project/tasks/new", {
-            "projectDir": project_dir,
-            "name": task_name,
-            "activate": True,
-        })
-        if res.status_code != 200:
-            log("FAIL", f"Could not create task: {res.status_code} {res.text[:200]}")
-            continue
-
-        task_id = res.json().get("id")
-        log("PASS", f"Task created: {task_id}")
-        monitor.update_task_id(task_id)
-
-        # ── Configure model and task ─────────────────────────────────────
-        api_post(api_url, auth, "/project/settings/main-model", {
-            "projectDir": project_dir,
-            "taskId": task_id,
-            "mainModel": model,
-        })
-        api_post(api_url, auth, "/project/tasks", {
-            "projectDir": project_dir,
-            "id": task_id,
-            "updates": {"autoApprove": True, "currentMode": mode},
-        })
-        log("INFO", f"Model={model}, autoApprove=true, mode={mode}")
-        phases["task_creation"] = round(time.time() - t0, 2)
-
-        # ── Pre-create empty target file if specified ────────────────────
-        if target_file:
-            if os.path.exists(target_file):
-                os.remove(target_file)
-            target_basename = os.path.basename(target_file)
-            log("INFO", f"Pre-creating empty {target_basename} for edit-format")
-            open(target_file, "w").close()
-            client_add = api_post(api_url, auth, "/add-context-file", {
-                "projectDir": project_dir,
-                "taskId": task_id,
-                "path": target_basename,
-                "readOnly": False,
-            })
-            if client_add.status_code == 200:
-                log("PASS", f"{target_basename} added to task context")
-            else:
-                log("WARN", f"Could not add file to context: {client_add.status_code}")
-
-        time.sleep(1)  # let backend stabilize
-
-        # ── Submit prompt ────────────────────────────────────────────────
-        log("INFO", f"Submitting prompt ({len(prompt)} chars)...")
-        prompt_result, prompt_thread = fire_prompt_async(
-            api_url, auth, project_dir, task_id, prompt, mode,
-        )
-        log("INFO", f"Waiting up to {timeout}s for completion...")
-        print("-" * 70)
-
-        attempt_start = time.time()
-        attempt_completed = False
-        file_on_disk = False
-        first_chunk_time = None
-        file_drop_logged = False
-        prompt_done_logged = False
-
-        while True:
-            elapsed = time.time() - attempt_start
-
-            # ── Track first chunk time ───────────────────────────────────
-            if monitor.chunks_received > 0 and first_chunk_time is None:
-                first_chunk_time = round(elapsed, 2)
-                phases["first_chunk"] = first_chunk_time
-
-            # ── Check for completion via Socket.IO ───────────────────────
-            if monitor.completed.is_set():
-                log("PASS", f"✅ task-completed received after {round(elapsed, 1)}s")
-                log("INFO", f"  Total chunks received: {monitor.chunks_received}")
-                log("INFO", f"  Response-completed events: {monitor.response_completed_count}")
-                phases["completion"] = round(elapsed, 2)
-                attempt_completed = True
-                break
-
-            # ── Check for question via Socket.IO ─────────────────────────
-            if monitor.question_pending.is_set():
-                log("QUESTION", f"Task asking: {monitor.question_text}")
-                log("QUESTION", "Auto-answering: 'yes'")
-                try:
-                    api_post(api_url, auth, "/project/answer-question", {
-                        "projectDir": project_dir,
-                        "taskId": task_id,
-                        "answer": "yes",
-                    })
-                    monitor.question_pending.clear()
-                except Exception as e:
-                    log("WARN", f"Failed to answer question: {e}")
-
-            # ── Check if target file has content on disk ─────────────────
-            if target_file and not file_on_disk:
-                if os.path.exists(target_file) and os.path.getsize(target_file) > 0:
-                    log("INFO", f"📄 {os.path.basename(target_file)} has content on disk")
-                    file_on_disk = True
-                    file_exists = True
-                    phases["file_on_disk"] = round(elapsed, 2)
-
-            # ── File on disk + dropped from chat (informational) ────────
-            if monitor.file_dropped and file_on_disk and not file_drop_logged:
-                log("DETECT", "File created + dropped from chat (waiting for task-completed)")
-                file_drop_logged = True
-
-            # ── Stale chunk detection ────────────────────────────────────
-            if monitor.chunks_received > 0:
-                stale = time.time() - monitor.last_activity
-                if stale > STALE_CHUNK_TIMEOUT:
-                    log("WARN", f"No new chunks for {round(stale)}s — generation may have stalled")
-
-            # ── Check if run-prompt thread finished ──────────────────────
-            if prompt_result["done"] and not monitor.completed.is_set() and not prompt_done_logged:
-                if prompt_result["error"]:
-                    log("WARN", f"run-prompt thread error: {prompt_result['error']}")
-                else:
-                    log("INFO", f"run-prompt returned HTTP {prompt_result['status']}")
-                log("INFO", f"  Response-completed events so far: {monitor.response_completed_count}")
-                log("INFO", "  Waiting for task-completed signal...")
-                prompt_done_logged = True
-
-            # ── Timeout → classify failure ───────────────────────────────
-            if elapsed > timeout:
-                reason = classify_failure(monitor, prompt_result, elapsed)
-                stale_duration = round(time.time() - monitor.last_activity, 1)
-                print()
-                log("TIMEOUT", f"⚠️  No completion within {timeout}s.")
-                log("TIMEOUT", f"  Failure reason:  {reason}")
-                log("TIMEOUT", f"  Chunks received: {monitor.chunks_received}")
-                log("TIMEOUT", f"  Response-completed events: {monitor.response_completed_count}")
-                log("TIMEOUT", f"  Stale for:       {stale_duration}s")
-                log("TIMEOUT", f"  run-prompt done={prompt_result['done']}, "
-                               f"status={prompt_result['status']}, error={prompt_result['error']}")
-
-                # Check Ollama state when failure occurs
-                check_ollama_running_models(args.ollama_url)
-
-                # Interrupt the stuck task
-                log("INFO", f"Interrupting task {task_id}...")
-                try:
-                    int_res = api_post(api_url, auth, "/project/interrupt", {
-                        "projectDir": project_dir,
-                        "taskId": task_id,
-                    })
-                    if int_res.status_code == 200:
-                        log("INFO", "Interrupt sent successfully")
-                    else:
-                        log("WARN", f"Interrupt returned {int_res.status_code}")
-                except Exception as e:
-                    log("WARN", f"Interrupt failed: {e}")
-                time.sleep(2)
-                break
-
-            time.sleep(1)
-
-        if attempt_completed or file_exists:
-            completed = True
-            break
-
-        # Breather between attempts
-        if attempt < max_attempts:
-            log("INFO", "Waiting 5s before next attempt...")
-            time.sleep(5)
-
-    # ── Final results ────────────────────────────────────────────────────────
-    total_elapsed = round(time.time() - total_start, 1)
-    if target_file and not file_exists:
-        file_exists = os.path.exists(target_file) and os.path.getsize(target_file) > 0
-
-    print()
-    print("=" * 70)
-    log("INFO", "  FINAL RESULTS")
-    print("=" * 70)
-    log("INFO", f"  Total elapsed:     {total_elapsed}s")
-    log("INFO", f"  Task ID:           {task_id}")
-    log("INFO", f"  Completed signal:  {completed}")
-    if target_file:
-        log("INFO", f"  File created:      {file_exists}")
-    log("INFO", f"  Chunks received:   {monitor.chunks_received}")
-    log("INFO", f"  Response-completed: {monitor.response_completed_count}")
-
-    # Print phase timing
-    if phases:
-        print()
-        log("INFO", "  Phase timing (seconds):")
-        for phase, duration in phases.items():
-            log("INFO", f"    {phase:20s} {duration:>8.2f}s")
-
-    print()
-
-    # Stop log tailers and Socket.IO
-    ollama_stop.set()
-    aiderdesk_stop.set()
-    monitor.disconnect()
-
-    if completed or file_exists:
-        log("PASS", "✅ Prompt processed successfully.")
-        if target_file and file_exists:
-            print()
-            basename = os.path.basename(target_file)
-            print(f"--- {basename} (first 30 lines) ---")
-            try:
-                with open(target_file) as f:
-                    for i, line in enumerate(f):
-                        if i >= 30:
-                            break
-                        print(f"  {line}", end="")
-            except Exception as e:
-                log("WARN", f"Could not read file: {e}")
-        sys.exit(0)
-    else:
-        log("FAIL", f"❌ All {max_attempts} attempts failed.")
-        print()
-        log("INFO", "  Troubleshooting:")
-        log("INFO", "    1. Check Ollama is running:  ollama ps")
-        log("INFO", "    2. Check model is loaded:    curl http://localhost:11434/api/tags")
-        log("INFO", "    3. Restart Ollama:           ollama stop && ollama serve")
-        log("INFO", "    4. Try with --no-warmup if warm-up itself is hanging")
-        log("INFO", "    5. Try --edit-format whole to avoid SEARCH/REPLACE issues")
-        log("INFO", "    6. Try --mode agent for better multi-step handling")
-        sys.exit(1)
+    start_recording(args, monitor)
+
+    residency = None
+    if (args.batch or store is not None) and not args.serve:
+        jobs, residency = make_residency(args, ollama, jobs)
+    ctx = RunContext(args, task_aiderdesk, task_ollama, monitor, results, residency, metrics,
+                     prefix)
+    ctx.io = io
+    if store is not None:
+        ctx.job_store = store
+        io.run(reattach_jobs(ctx, jobs))
+
+    def shutdown():
+        # Stop log tailers, Socket.IO, the recording and the HTTP pools
+        for tailer in tailers:
+            tailer.stop_event.set()
+        monitor.log_event_stats()
+        monitor.disconnect()
+        if monitor.recorder is not None:
+            monitor.recorder.close()
+        if metrics is not None:
+            metrics.close()
+        aiderdesk.close()
+        ollama.close()
+        io.close()
+
+    # ── Daemon mode: jobs over a local API until drained ─────────────────────
+    if args.serve:
+        from ollama_prompt_daemon import serve_daemon
+        served, summary = serve_daemon(ctx, args, jobs)
+        cleaned = cleanup.finish(phases) if cleanup is not None else None
+        report_batch(served, summary, phases, clients, throughput, tailers)
+        shutdown()
+        exit_code = 0 if summary["failed"] == 0 else 1
+        finish_results(results, exit_code, phases, summary=summary, throughput=throughput,
+                       cleanup=cleaned, log_tailers=tailer_stats(tailers),
+                       events=monitor.event_stats(), queue=close_job_store(store))
+        sys.exit(exit_code)
+
+    # ── Batch mode: worker pool over all jobs (or the --queue-db queue) ─────
+    if args.batch or store is not None:
+        batch_results, summary = run_batch(ctx, jobs, concurrency)
+        cleaned = cleanup.finish(phases) if cleanup is not None else None
+        report_batch(batch_results, summary, phases, clients, throughput, tailers)
+        log_prefix_report(ctx, [r["phases"]["first_chunk"] for r in batch_results
+                                if "first_chunk" in r["phases"]])
+        shutdown()
+        exit_code = 0 if summary["failed"] == 0 else 1
+        finish_results(results, exit_code, phases, summary=summary, throughput=throughput,
+                       cleanup=cleaned, log_tailers=tailer_stats(tailers),
+                       events=monitor.event_stats(), queue=close_job_store(store))
+        sys.exit(exit_code)
+
+    # ── Single prompt ────────────────────────────────────────────────────────
+    result = io.run(run_prompt(ctx, jobs[0]))
+    cleaned = cleanup.finish(phases) if cleanup is not None else None
+    phases.update(result["phases"])
+    if throughput is not None:
+        throughput.update(result["throughput"])
+    report_single(result, phases, args.target_file, clients, throughput, tailers)
+    log_prefix_report(ctx, [result["phases"]["first_chunk"]] if "first_chunk" in result["phases"]
+                      else [])
+    shutdown()
+    exit_code = report_outcome(result, args.target_file, ctx.max_attempts)
+    finish_results(results, exit_code, phases, throughput=throughput, cleanup=cleaned,
+                   log_tailers=tailer_stats(tailers), events=monitor.event_stats())
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
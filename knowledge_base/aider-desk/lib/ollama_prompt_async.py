@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+asyncio engine for the AiderDesk + Ollama prompt runner (--engine asyncio).
+
+Same CLI, phases, FailureReason classification and output as the thread
+engine, because it runs the same code: main() and the attempt coroutines in
+ollama_prompt.py are shared, and this module only supplies their I/O layer.
+One event loop, on its own thread, supervises every in-flight task instead
+of a thread per prompt sender, log tailer and worker:
+- LoopIO: the loop, ollama_prompt.ThreadIO's counterpart
+- aiohttp for the per-task REST calls (task creation, run-prompt, answers, interrupts)
+- socketio.AsyncClient for the shared event stream
+- asyncio tasks for log tailing, the target-file watcher and the batch workers
+
+The once-per-process phases (health checks, warm-up, project setup) and the
+--serve HTTP API stay on the pooled clients and threads of the thread engine.
+
+Usage:
+    python3 knowledge_base/aider-desk/lib/ollama_prompt_async.py --batch prompts.jsonl --concurrency 32
+    python3 knowledge_base/aider-desk/lib/ollama_prompt.py --engine asyncio --batch prompts/ -c 32
+
+Prerequisites:
+    - Everything ollama_prompt.py needs
+    - pip install aiohttp "python-socketio[asyncio_client]"
+
+PYTHON-ONLY: the whole module. A Ruby port would use the async gem
+(Async::HTTP::Internet, Async::Task, Async::Condition) or stay on the
+thread engine.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+
+import ollama_prompt as op
+from ollama_prompt import log
+
+try:
+    import aiohttp
+    import socketio
+except ImportError:  # reported by ollama_prompt.make_io()
+    aiohttp = None
+
+
+# ── Async HTTP client ───────────────────────────────────────────────────────
+
+class AsyncResponse:
+    """The slice of requests.Response the runner reads: status, body, JSON."""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncHttpClient(op.EndpointStats):
+    """
+    aiohttp counterpart of HttpClient: one pooled keep-alive session per
+    backend, precomputed Basic auth, same retry rules (connection errors for
+    any method, 502/503/504 for GET/HEAD only) and per-endpoint counters.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, base_url, username=None, password=None,
+                 pool_size=10, retries=2, backoff=0.5):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.headers = {}
+        if username is not None:
+            creds = base64.b64encode(f"{username}:{password}".encode()).decode()
+            self.headers["Authorization"] = f"Basic {creds}"
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            headers=self.headers,
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def request(self, method, path, payload=None, timeout=30):
+        endpoint = f"{method} {path.split('?', 1)[0]}"
+        url = f"{self.base_url}{path}"
+        retry = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                async with self.session.request(
+                    method, url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as r:
+                    content = await r.read()
+            except aiohttp.ClientConnectorError:
+                self._record(endpoint, time.perf_counter() - t0, error=True)
+                if retry >= self.retries:
+                    raise
+            except Exception:
+                self._record(endpoint, time.perf_counter() - t0, error=True)
+                raise
+            else:
+                self._record(endpoint, time.perf_counter() - t0, error=r.status >= 400)
+                retryable = method in ("GET", "HEAD") and r.status in self.RETRY_STATUSES
+                if not retryable or retry >= self.retries:
+                    return AsyncResponse(r.status, content)
+            await asyncio.sleep(self.backoff * (2 ** retry))
+            retry += 1
+
+
+async def api_get(client, path, timeout=30):
+    log("DEBUG", f"GET  {client.base_url}{path}")
+    r = await client.request("GET", path, timeout=timeout)
+    log("DEBUG", f"  -> {r.status_code} ({len(r.content)}B)")
+    return r
+
+
+async def api_post(client, path, payload=None, timeout=30):
+    body_preview = json.dumps(payload, separators=(',', ':'))[:200] if payload else "null"
+    log("DEBUG", f"POST {client.base_url}{path}  body={body_preview}")
+    r = await client.request("POST", path, payload, timeout=timeout)
+    log("DEBUG", f"  -> {r.status_code} ({len(r.content)}B)")
+    return r
+
+
+# ── Async log tailer & file watcher ─────────────────────────────────────────
+
+async def tail_log(tailer):
+    """Drive an op.LogTailer on the loop until tailer.stop_event: wake on inotify
+    (add_reader) or every LOG_POLL_INTERVAL, and yield between LOG_READ_SIZE
+    blocks while catching up."""
+    if not tailer.open():
+        log("WARN", f"{tailer.label} log not found at {tailer.path} — tailing disabled")
+        return
+    loop = asyncio.get_running_loop()
+    notify = tailer.watch()
+    wake = asyncio.Event()
+    if notify is not None:
+        loop.add_reader(notify.fd, wake.set)
+    try:
+        while not tailer.stop_event.is_set():
+            if tailer.poll(max_blocks=1):
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), op.LOG_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            if notify is not None:
+                notify.drain()
+    except Exception as e:
+        log("WARN", f"{tailer.label} log tailer error: {e}")
+    finally:
+        tailer.close()
+        if notify is not None:
+            loop.remove_reader(notify.fd)
+            notify.close()
+
+
+async def watch_file(path, waker, interval=op.FILE_WATCH_INTERVAL):
+    """Signal waker ("file") once path exists with content; cancel to stop."""
+    while True:
+        try:
+            if os.path.getsize(path) > 0:
+                waker.signal("file")
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(interval)
+
+
+# ── Async Socket.IO event monitor ───────────────────────────────────────────
+
+class AsyncEventMonitor(op.EventMonitor):
+    """
+    EventMonitor over socketio.AsyncClient. Event demultiplexing and handling
+    are inherited unchanged; handlers run on the loop, so each TaskState
+    wakes its attempt through an asyncio.Event. connect() and disconnect()
+    keep EventMonitor's blocking signatures for main() and run on the loop.
+    """
+
+    def __init__(self, io, **kwargs):
+        self.io = io
+        super().__init__(**kwargs)
+
+    def _make_client(self):
+        return socketio.AsyncClient(logger=False, engineio_logger=False, reconnection=False)
+
+    def _new_wake(self):
+        return asyncio.Event()
+
+    def _resubscribe(self):
+        """Async twin of ollama_prompt.EventMonitor._resubscribe(), run as a loop task."""
+        if self.sio.connected:
+            self._resubscribe_task = asyncio.get_running_loop().create_task(self._emit_subscribe())
+
+    async def _emit_subscribe(self):
+        try:
+            await self.sio.emit('message', self._subscribe_message())
+        except Exception as e:
+            log("WARN", f"Re-subscribing failed: {e}")
+
+    async def _on_connect(self):
+        self._count_connect()
+        await self.sio.emit('message', self._subscribe_message())
+        if self.connects == 1:
+            log("SIO", "✅ Connected to AiderDesk Socket.IO")
+            log("SIO", f"Subscribed to events for {self.project_dir}")
+            return
+        self._log_reconnect()
+        self._resync_task = asyncio.create_task(self.resync())
+
+    async def _on_disconnect(self):
+        if self.metrics is not None:
+            self.metrics.inc("socketio_disconnects_total")
+        if self._closing:
+            log("SIO", "Disconnected from AiderDesk Socket.IO")
+            return
+        self.disconnected_at = op.clock()
+        log("SIO", f"Disconnected from AiderDesk Socket.IO — reconnecting "
+                   f"({len(self.tasks)} task(s) in flight)")
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        """Async twin of ollama_prompt.EventMonitor._reconnect()."""
+        delay = self.reconnect_delay
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                await self.sio.connect(self.base_url, headers=self._headers, wait_timeout=10)
+                return
+            except Exception as e:
+                delay = min(delay * 2, self.reconnect_delay_max)
+                log("SIO", f"Reconnect failed ({e}) — next try in {delay:.1f}s")
+
+    async def resync(self):
+        """Async twin of ollama_prompt.EventMonitor.resync()."""
+        if self.resync_client is None or not self.tasks:
+            return 0
+        try:
+            r = await api_get(self.resync_client, f"/project/tasks?projectDir={self.project_dir}")
+            tasks = r.json() if r.status_code == 200 else None
+        except Exception as e:
+            log("WARN", f"Re-sync after reconnect failed: {e}")
+            return 0
+        if tasks is None:
+            log("WARN", f"Re-sync after reconnect: /project/tasks returned {r.status_code}")
+            return 0
+        return self._apply_resync(tasks)
+
+    def connect(self, username, password):
+        return self.io.run(self._connect(username, password))
+
+    def disconnect(self):
+        self.io.run(self._disconnect())
+
+    async def _connect(self, username, password):
+        creds = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self._headers = {"Authorization": f"Basic {creds}"}
+        try:
+            await self.sio.connect(
+                self.base_url,
+                headers=self._headers,
+                wait_timeout=10,
+            )
+            return True
+        except Exception as e:
+            log("SIO", f"❌ Connection failed: {e}")
+            return False
+
+    async def _disconnect(self):
+        self._closing = True
+        try:
+            await self.sio.disconnect()
+        except Exception:
+            pass
+
+
+# ── Loop I/O layer ──────────────────────────────────────────────────────────
+
+class LoopIO:
+    """
+    The asyncio engine's I/O layer for the shared attempt coroutines (see
+    ollama_prompt.ThreadIO): an event loop on its own thread, aiohttp
+    clients, asyncio.Event waits and asyncio tasks. Plain code (main(), the
+    daemon's workers) hands it coroutines with run().
+    """
+
+    name = "asyncio"
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._tasks = set()  # spawned tasks, referenced until done
+        self._clients = []
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True,
+                                        name="asyncio")
+        self._thread.start()
+
+    def run(self, coro):
+        """Run coro on the loop and wait for its result (from any other thread)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def get(self, client, path, timeout=30):
+        return await api_get(client, path, timeout)
+
+    async def post(self, client, path, payload=None, timeout=30):
+        return await api_post(client, path, payload, timeout)
+
+    async def wait(self, state, timeout):
+        """Until a handler signals state (state.wake) or timeout seconds pass."""
+        try:
+            await asyncio.wait_for(state.wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        state.wake.clear()
+
+    async def wait_event(self, event, timeout):
+        """ThreadIO.wait_event() without blocking the loop: the wait runs on the default executor."""
+        return await self.loop.run_in_executor(None, event.wait, timeout)
+
+    def spawn(self, coro, name=None):
+        """Run coro as an asyncio task (in a copy of the caller's context). Called on the loop."""
+        task = self.loop.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def join(self, handle):
+        return await handle
+
+    def watch_file(self, path, state):
+        return self.spawn(watch_file(path, state), name="watch-file").cancel
+
+    def run_all(self, coros, concurrency, done):
+        """Run coros as asyncio tasks, at most `concurrency` at once; done(index, result) as each finishes."""
+        self.run(self._run_all(coros, concurrency, done))
+
+    async def _run_all(self, coros, concurrency, done):
+        gate = asyncio.Semaphore(concurrency)
+
+        async def _gated(coro):
+            async with gate:
+                return await coro
+
+        # Every task has its own context copy: the jobs' log prefixes stay out of done()
+        running = {self.spawn(_gated(coro)): idx for idx, coro in enumerate(coros)}
+        while running:
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                done(running.pop(task), task.result())
+
+    def http_clients(self, args, concurrency, aiderdesk, ollama):
+        """aiohttp clients for the attempts; the pooled ones stay for startup and cleanup."""
+        pool_size = args.http_pool_size or max(10, 2 * concurrency + 4)
+        self._clients = [
+            AsyncHttpClient(f"{args.base_url}/api", args.username, args.password,
+                            pool_size=pool_size, retries=args.http_retries,
+                            backoff=args.http_backoff),
+            AsyncHttpClient(args.ollama_url, pool_size=pool_size, retries=args.http_retries,
+                            backoff=args.http_backoff),
+        ]
+        for client in self._clients:
+            self.run(client.open())
+        return tuple(self._clients)
+
+    def event_monitor(self, **kwargs):
+        return AsyncEventMonitor(self, **kwargs)
+
+    def start_tailers(self, args):
+        """LogTailers driven by tail_log() tasks; stopped by tailer.stop_event, as on threads."""
+        tailers = [op.LogTailer(path, label) for path, label in op.log_tail_targets(args)]
+        for tailer in tailers:
+            self.loop.call_soon_threadsafe(self.spawn, tail_log(tailer), f"tail-{tailer.label}")
+        return tailers
+
+    def close(self):
+        """Cancel what is still running, close the aiohttp clients, stop the loop."""
+        self.run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    async def _close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for client in self._clients:
+            await client.close()
+
+
+if __name__ == "__main__":
+    cli_args = op.parse_args()
+    cli_args.engine = "asyncio"
+    op.main(cli_args)
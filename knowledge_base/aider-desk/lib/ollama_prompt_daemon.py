@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+Daemon mode for the AiderDesk + Ollama prompt runner (ollama_prompt.py --serve).
+
+The startup phases (health checks, warm-up, project setup, Socket.IO connect)
+run once; the process then stays up and takes prompt jobs over a local HTTP
+API, on TCP (--serve-port) or a Unix socket (--serve-socket). Jobs queue up,
+highest "priority" first, and run --concurrency at a time through the same
+run_prompt() as a batch, sharing the HTTP pools, the warm model and the
+EventMonitor, so a prompt costs one request instead of a process start.
+With --queue-db, submitted jobs are also kept in the SQLite queue, and the
+jobs it holds from earlier runs are queued at start.
+
+API (JSON in, JSON or NDJSON out):
+    POST /jobs               {"prompt": ..., "id"?, "target_file"?, "model"?, "priority"?},
+                             a JSON string, or {"jobs": [...]}. 202 with the
+                             queued jobs; 400 bad job (none queued), 409 id in use,
+                             503 draining
+    POST /jobs?stream=1      the same, then one NDJSON event per line until
+                             every submitted job is done
+    GET  /jobs               every job's status, plus the queue counts
+    GET  /jobs/<id>          one job, with its result once done
+    GET  /jobs/<id>/events   NDJSON events of one job, until it is done
+    GET  /status             queue depth, running, finished, uptime, events
+    POST /shutdown           drain: finish queued and running jobs, then exit
+
+Events: queued, started, attempt_start (attempt, task_id), attempt (outcome,
+failure_reason, phases), done (result), and while a stream waits, a progress
+heartbeat (queue position, or the running attempt's chunk counts).
+
+SIGTERM drains like POST /shutdown; Ctrl-C interrupts running tasks and
+exits at once. Either way the run ends with the batch report and "run"
+record. --batch jobs given with --serve are queued at start. Ctrl-C leaves
+--queue-db jobs queued, and their interrupted attempts run again next time.
+
+Usage:
+    python3 knowledge_base/aider-desk/lib/ollama_prompt.py --serve --concurrency 2
+    curl -s localhost:8765/jobs -d '{"id": "hello", "prompt": "Create hello.rb"}'
+    curl -sN 'localhost:8765/jobs?stream=1' -d '"Create hello.rb"'
+    curl -s localhost:8765/status
+    python3 knowledge_base/aider-desk/lib/ollama_prompt.py --serve --serve-socket /tmp/op.sock
+    curl -s --unix-socket /tmp/op.sock http://op/status
+
+PYTHON-ONLY: the whole module (http.server/socketserver and a Condition-guarded
+heapq). Ruby: WEBrick or Puma on a UNIXServer, with a Mutex + ConditionVariable
+around a sorted Array for the queue.
+"""
+
+import contextvars
+import heapq
+import http.server
+import json
+import os
+import re
+import signal
+import socketserver
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import ollama_prompt as op
+from ollama_prompt import log
+
+HEARTBEAT_INTERVAL = 1.0   # seconds between progress events on a quiet stream
+FINISHED_JOBS_KEPT = 1000  # finished jobs GET /jobs/<id> still answers for
+STOP_JOIN_TIMEOUT = 30.0   # seconds Ctrl-C waits for the interrupted jobs to return
+
+
+class DaemonError(Exception):
+    """A rejected request: HTTP status and message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ── Job queue ───────────────────────────────────────────────────────────────
+
+class DaemonJob:
+    """One submitted prompt job: status, timestamps, its events and its result."""
+
+    def __init__(self, job):
+        self.job = job
+        self.id = job["id"]
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.attempt = 0
+        self.task_id = None
+        self.result = None
+        self.events = []
+
+    def add(self, event, **fields):
+        self.events.append({"event": event, "id": self.id, "at": round(time.time(), 3),
+                            **fields})
+
+    def view(self, position=None):
+        out = {"id": self.id, "status": self.status, "attempt": self.attempt,
+               "task_id": self.task_id, "submitted_at": round(self.submitted_at, 3)}
+        if position is not None:
+            out["position"] = position
+        if self.started_at is not None:
+            out["started_at"] = round(self.started_at, 3)
+        if self.result is not None:
+            out["finished_at"] = round(self.finished_at, 3)
+            out["result"] = self.result
+        return out
+
+
+class PromptDaemon:
+    """
+    Priority queue of DaemonJobs (jobs re-attached by --queue-db first, then
+    highest "priority", then submission order, as order_jobs_by_model())
+    drained by `concurrency` worker threads through ollama_prompt._run_job();
+    with --engine asyncio the jobs run on its event loop and the workers wait
+    for them. Every field is guarded by `changed`, which is notified whenever
+    a job is queued, starts, reports progress or finishes.
+    """
+
+    def __init__(self, ctx, concurrency):
+        self.ctx = ctx
+        self.concurrency = concurrency
+        self.jobs = {}         # id → DaemonJob, submission order
+        self.queue = []        # heap of (not resumed, -priority, seq, DaemonJob)
+        self.reserved = set()  # ids of submitted jobs still being written to --queue-db
+        self.results = []      # finished result dicts, completion order
+        self.running = 0
+        self.submitted = 0
+        self.draining = False
+        self.started_at = time.time()
+        self.changed = threading.Condition()
+        ctx.progress = self._on_progress
+        self.workers = [threading.Thread(target=self._work, daemon=True, name=f"prompt-{i}")
+                        for i in range(concurrency)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, entries):
+        """
+        Queue entries (job_from_entry() input), adding them to the --queue-db
+        store too. All or nothing; raises DaemonError.
+
+        The store is written before the jobs are queued (a job in memory is
+        always in the file too) but outside `changed`, so a slow SQLite
+        commit does not hold up the workers and the other requests; the ids
+        are reserved meanwhile.
+        """
+        store = self.ctx.job_store
+        with self.changed:
+            if self.draining:
+                raise DaemonError(503, "draining: not accepting jobs")
+            first = self.submitted + len(self.reserved) + 1
+            jobs = []
+            for n, entry in enumerate(entries, first):
+                try:
+                    jobs.append(op.job_from_entry(entry, f"job-{n}"))
+                except ValueError as e:
+                    raise DaemonError(400, f"job {n - first + 1}: {e}")
+            self._check_ids(jobs)
+            ids = {job["id"] for job in jobs}
+            self.reserved |= ids
+        try:
+            if store is not None:
+                try:
+                    taken = store.known(ids)
+                    if taken:
+                        raise DaemonError(409, f"job id in use: {sorted(taken)[0]}")
+                    store.add(jobs)
+                except sqlite3.Error as e:
+                    raise DaemonError(500, f"could not store the jobs in --queue-db: {e}")
+            with self.changed:
+                self.reserved -= ids
+                # Accepted before a drain started: they run before the workers exit
+                return self.enqueue(jobs)
+        finally:
+            with self.changed:
+                self.reserved -= ids
+
+    def _check_ids(self, jobs):
+        ids = [job["id"] for job in jobs]
+        for job_id in ids:
+            if job_id in self.jobs or job_id in self.reserved or ids.count(job_id) > 1:
+                raise DaemonError(409, f"job id in use: {job_id}")
+
+    def enqueue(self, jobs):
+        """Queue job dicts as they are (--batch / --queue-db jobs at start). Raises DaemonError."""
+        with self.changed:
+            self._check_ids(jobs)
+            batch = [DaemonJob(job) for job in jobs]
+            for djob in batch:
+                self.jobs[djob.id] = djob
+                self.submitted += 1
+                key = (0 if djob.job.get("resume") else 1, -djob.job.get("priority", 0),
+                       self.submitted)
+                heapq.heappush(self.queue, (*key, djob))
+            for djob in batch:
+                djob.add("queued", position=self._position(djob))
+            self.changed.notify_all()
+        return batch
+
+    def _work(self):
+        while True:
+            with self.changed:
+                while not self.queue:
+                    if self.draining:
+                        return
+                    self.changed.wait()
+                djob = heapq.heappop(self.queue)[-1]
+                djob.status, djob.started_at = "running", time.time()
+                djob.add("started")
+                self.running += 1
+                self.changed.notify_all()
+            # Own context: _run_job()'s log prefix stays out of log_job_done()
+            result = contextvars.copy_context().run(op._run_job, self.ctx, djob.job)
+            with self.changed:
+                djob.status, djob.finished_at, djob.result = "done", time.time(), result
+                djob.add("done", success=result["success"],
+                         failure_reason=result["failure_reason"], result=result)
+                self.running -= 1
+                self.results.append(result)
+                self._forget_finished()
+                done, total = len(self.results), self.submitted
+                self.changed.notify_all()
+            op.log_job_done(result, done, total)
+
+    def _forget_finished(self):
+        finished = [jid for jid, d in self.jobs.items() if d.status == "done"]
+        for jid in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self.jobs[jid]
+
+    def _on_progress(self, job, event, fields):
+        """RunContext.progress: attach run_prompt()'s attempt events to the job."""
+        with self.changed:
+            djob = self.jobs.get(job["id"])
+            if djob is None:
+                return
+            djob.attempt = fields.get("attempt", djob.attempt)
+            djob.task_id = fields.get("task_id") or djob.task_id
+            djob.add(event, **fields)
+            self.changed.notify_all()
+
+    # ── Views ────────────────────────────────────────────────────────────
+
+    def get(self, job_id):
+        with self.changed:
+            djob = self.jobs.get(job_id)
+            if djob is None:
+                raise DaemonError(404, f"no such job: {job_id}")
+            return djob.view(self._position(djob))
+
+    def _position(self, djob):
+        if djob.status != "queued":
+            return None
+        key = next(entry[:-1] for entry in self.queue if entry[-1] is djob)
+        return 1 + sum(1 for entry in self.queue if entry[:-1] < key)
+
+    def views(self, djobs):
+        with self.changed:
+            return [d.view(self._position(d)) for d in djobs]
+
+    def list_jobs(self):
+        with self.changed:
+            return {"jobs": self.views(self.jobs.values()), **self._counts()}
+
+    def _counts(self):
+        succeeded = sum(1 for r in self.results if r["success"])
+        return {"queue_depth": len(self.queue), "running": self.running,
+                "finished": len(self.results), "succeeded": succeeded,
+                "failed": len(self.results) - succeeded}
+
+    def status(self):
+        with self.changed:
+            counts = self._counts()
+        store = self.ctx.job_store
+        return {"uptime": round(time.time() - self.started_at, 1),
+                "concurrency": self.concurrency, "submitted": self.submitted,
+                "draining": self.draining, **counts,
+                "queue_db": store.counts() if store is not None else None,
+                "events": self.ctx.monitor.event_stats()}
+
+    def summary(self):
+        """summarize_batch() over every finished job, uptime as the wall time."""
+        with self.changed:
+            results = list(self.results)
+        return op.summarize_batch(results, time.time() - self.started_at, self.concurrency)
+
+    def follow(self, djobs, heartbeat=HEARTBEAT_INTERVAL):
+        """
+        Yield djobs' events, from the first, until every one is done. A quiet
+        stream gets a progress event per queued/running job every heartbeat.
+        """
+        seen = {d.id: 0 for d in djobs}
+        last_beat = time.time()
+        while True:
+            with self.changed:
+                fresh = self._collect(djobs, seen)
+                if not fresh and not all(d.status == "done" for d in djobs):
+                    self.changed.wait(max(0.0, last_beat + heartbeat - time.time()))
+                    fresh = self._collect(djobs, seen)
+                finished = all(d.status == "done" for d in djobs)
+                beats = []
+                if not fresh and not finished and time.time() - last_beat >= heartbeat:
+                    beats = [self._progress(d) for d in djobs if d.status != "done"]
+            for event in fresh + beats:
+                yield event
+            if finished:
+                return
+            if fresh or beats:
+                last_beat = time.time()
+
+    @staticmethod
+    def _collect(djobs, seen):
+        fresh = []
+        for d in djobs:
+            fresh += d.events[seen[d.id]:]
+            seen[d.id] = len(d.events)
+        return fresh
+
+    def _progress(self, djob):
+        """Heartbeat for a queued or running job (caller holds `changed`)."""
+        fields = {"event": "progress", "id": djob.id, "at": round(time.time(), 3),
+                  "status": djob.status}
+        if djob.status == "queued":
+            fields["position"] = self._position(djob)
+            return fields
+        fields.update(attempt=djob.attempt, task_id=djob.task_id,
+                      elapsed=round(time.time() - djob.started_at, 1))
+        state = self.ctx.monitor.tasks.get(djob.task_id)
+        if state is not None:
+            fields.update(chunks=state.chunks_received, chunk_bytes=state.chunk_bytes,
+                          completion_tokens=state.completion_tokens)
+        return fields
+
+    # ── Shutdown ─────────────────────────────────────────────────────────
+
+    def drain(self):
+        """Stop accepting jobs; the workers exit once the queue is empty."""
+        with self.changed:
+            if not self.draining:
+                log("INFO", f"Draining: {len(self.queue)} queued, {self.running} running")
+            self.draining = True
+            self.changed.notify_all()
+
+    def wait_drained(self, timeout):
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: self.draining and not self.queue and not self.running, timeout)
+
+    def stop(self):
+        """Drop the queue and interrupt the running jobs' tasks."""
+        with self.changed:
+            self.draining = True
+            self.queue.clear()
+            task_ids = [d.task_id for d in self.jobs.values()
+                        if d.status == "running" and d.task_id]
+            self.changed.notify_all()
+        for task_id in task_ids:
+            self.ctx.io.run(op.interrupt_task(self.ctx, task_id))
+
+    def join(self, timeout):
+        """
+        Wait up to timeout seconds for the workers to exit (after drain() or
+        stop()), so the results and the summary include the jobs that were
+        running. Returns False if some are still busy.
+        """
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.time()))
+        with self.changed:
+            busy = [d.id for d in self.jobs.values() if d.status == "running"]
+        if busy:
+            log("WARN", f"Not waiting any longer for {len(busy)} running job(s): "
+                        f"{', '.join(busy)}")
+        return not busy
+
+
+# ── HTTP API ────────────────────────────────────────────────────────────────
+
+JOB_PATH = re.compile(r"/jobs/([^/]+)(/events)?")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_handler(daemon):
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _ = self._target()
+            match = JOB_PATH.fullmatch(path)
+            try:
+                if path == "/status":
+                    self._json(200, daemon.status())
+                elif path == "/jobs":
+                    self._json(200, daemon.list_jobs())
+                elif match and match.group(2):
+                    job_id = unquote(match.group(1))
+                    with daemon.changed:
+                        djob = daemon.jobs.get(job_id)
+                    if djob is None:
+                        raise DaemonError(404, f"no such job: {job_id}")
+                    self._stream([djob])
+                elif match:
+                    self._json(200, daemon.get(unquote(match.group(1))))
+                else:
+                    raise DaemonError(404, f"no route: GET {path}")
+            except DaemonError as e:
+                self._json(e.status, {"error": str(e)})
+            except Exception as e:
+                log("WARN", f"serve: {self.command} {self.path} failed: {e}")
+                self._json(500, {"error": str(e)})
+
+        def do_POST(self):
+            path, query = self._target()
+            try:
+                if path == "/jobs":
+                    djobs = daemon.submit(self._entries())
+                    if query.get("stream", ["0"])[0] not in ("0", ""):
+                        self._stream(djobs)
+                        return
+                    self._json(202, {"jobs": daemon.views(djobs),
+                                     "queue_depth": len(daemon.queue)})
+                elif path == "/shutdown":
+                    daemon.drain()
+                    self._json(202, daemon.status())
+                else:
+                    raise DaemonError(404, f"no route: POST {path}")
+            except DaemonError as e:
+                self._json(e.status, {"error": str(e)})
+            except Exception as e:
+                log("WARN", f"serve: {self.command} {self.path} failed: {e}")
+                self._json(500, {"error": str(e)})
+
+        def _target(self):
+            parts = urlsplit(self.path)
+            return parts.path.rstrip("/") or "/", parse_qs(parts.query)
+
+        def _entries(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"null")
+            except ValueError as e:
+                raise DaemonError(400, f"invalid JSON: {e}")
+            if isinstance(body, dict) and "jobs" in body:
+                body = body["jobs"]
+            entries = body if isinstance(body, list) else [body]
+            if not entries:
+                raise DaemonError(400, "no jobs")
+            return entries
+
+        def _json(self, status, body):
+            data = (json.dumps(body) + "\n").encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, djobs):
+            # HTTP/1.0: no Content-Length, the body ends when the connection closes
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                for event in daemon.follow(djobs):
+                    self.wfile.write((json.dumps(event) + "\n").encode())
+            except (BrokenPipeError, ConnectionResetError):
+                log("DEBUG", "serve: stream client went away")
+
+        def address_string(self):
+            # Unix-socket peers have no (host, port)
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, fmt, *args):
+            log("DEBUG", f"serve: {self.address_string()} {fmt % args}")
+
+    return _Handler
+
+
+def make_server(args, daemon):
+    """ThreadingHTTPServer on --serve-host:--serve-port, or on --serve-socket."""
+    handler = make_handler(daemon)
+    if args.serve_socket:
+        if os.path.exists(args.serve_socket):
+            os.unlink(args.serve_socket)  # left over from a killed daemon
+        server = UnixHTTPServer(args.serve_socket, handler)
+        where = f"unix:{args.serve_socket}"
+    else:
+        server = http.server.ThreadingHTTPServer((args.serve_host, args.serve_port), handler)
+        server.daemon_threads = True
+        where = f"http://{args.serve_host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True, name="serve").start()
+    log("PASS", f"Serving prompt jobs on {where} (concurrency={daemon.concurrency})")
+    return server
+
+
+def serve_daemon(ctx, args, jobs=()):
+    """
+    Run the daemon until drained (POST /shutdown, SIGTERM) or interrupted
+    (Ctrl-C). Returns (finished results, summarize_batch() summary).
+    """
+    daemon = PromptDaemon(ctx, max(1, args.concurrency))
+    try:
+        server = make_server(args, daemon)
+    except OSError as e:
+        log("FAIL", f"Could not serve on {args.serve_socket or args.serve_port}: {e}")
+        daemon.stop()
+        return [], daemon.summary()
+    if jobs:
+        try:
+            daemon.enqueue(jobs)
+            log("INFO", f"Queued {len(jobs)} prompt(s) from "
+                        f"{'--queue-db' if args.queue_db else '--batch'}")
+        except DaemonError as e:
+            log("WARN", f"Not queueing the --batch prompts: {e}")
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: daemon.drain())
+    try:
+        while not daemon.wait_drained(1.0):
+            pass
+    except KeyboardInterrupt:
+        print()
+        log("WARN", "Interrupted: dropping the queue and interrupting running tasks")
+        daemon.stop()
+        try:
+            daemon.join(STOP_JOIN_TIMEOUT)
+        except KeyboardInterrupt:
+            log("WARN", "Interrupted again: not waiting for the running jobs")
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.shutdown()
+        server.server_close()
+        if args.serve_socket and os.path.exists(args.serve_socket):
+            os.unlink(args.serve_socket)
+    return list(daemon.results), daemon.summary()
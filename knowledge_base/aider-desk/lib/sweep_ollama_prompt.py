@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Sweep a grid of models × modes × edit formats over the same prompts, with N
+repetitions per cell, and summarise each cell.
+
+Every cell is one ollama_prompt.py batch run (edit formats are an AiderDesk
+project setting, so two formats of one model cannot share a run). Cells are
+scheduled model by model, starting with a model Ollama already has loaded,
+and a model is unloaded once its cells are done, so each model is loaded at
+most once per sweep. The runner's --results-jsonl records of all cells go to
+one file; the summary table is built from them:
+
+    success rate, completion median / p95, first-chunk median / p95,
+    generation tokens/sec median, and the cell's warm-up time (a reload
+    shows up here)
+
+Output directory (--output-dir, default sweep-YYYYmmdd-HHMMSS/):
+    jobs.jsonl      the prompts × repetitions batch every cell runs
+    results.jsonl   the runner's attempt/prompt/run records, all cells
+    cell-N.log      runner output per cell
+    summary.json    the table as JSON
+    summary.md      the table as Markdown (for evaluation_logs/)
+
+Usage:
+    python3 knowledge_base/aider-desk/lib/sweep_ollama_prompt.py \\
+        --models ollama/qwen2.5-coder:32b ollama/qwen2.5:72b --modes code agent \\
+        --edit-formats diff whole --prompts prompts/ --repeat 3
+    python3 knowledge_base/aider-desk/lib/sweep_ollama_prompt.py --models ollama/qwen2.5-coder:32b \\
+        --prompt "Create hello.rb that prints hello world" --repeat 5 -- --timeout 300 --concurrency 2
+
+Arguments after "--" are passed to every ollama_prompt.py run.
+
+Prerequisites:
+    - Everything ollama_prompt.py needs
+
+PYTHON-ONLY: the whole module (tooling, not part of the Ruby port).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import ollama_prompt as op
+from ollama_prompt import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNNER = os.path.join(HERE, "ollama_prompt.py")
+DEFAULT_EDIT_FORMAT = "default"  # leave the project's edit format alone
+
+SUMMARY_COLUMNS = [
+    # (key, header, format)
+    ("model", "Model", "{}"),
+    ("mode", "Mode", "{}"),
+    ("edit_format", "Edit format", "{}"),
+    ("success_rate", "Success", "{:.0%}"),
+    ("completion_median", "Completion p50", "{:.1f}s"),
+    ("completion_p95", "Completion p95", "{:.1f}s"),
+    ("first_chunk_median", "First chunk p50", "{:.2f}s"),
+    ("first_chunk_p95", "First chunk p95", "{:.2f}s"),
+    ("gen_tps_median", "Gen tok/s", "{:.1f}"),
+    ("warm_up", "Warm-up", "{:.1f}s"),
+]
+
+
+# ── Scheduling ──────────────────────────────────────────────────────────────
+
+def schedule_cells(models, modes, edit_formats, loaded=()):
+    """
+    Cells in run order: grouped by model (models Ollama has loaded first,
+    then the given order), then edit format, then mode.
+    """
+    resident = {name for name in loaded}
+    ordered = sorted(models, key=lambda m: op.ollama_model_name(m) not in resident)
+    return [{"model": model, "mode": mode, "edit_format": edit_format}
+            for model in ordered for edit_format in edit_formats for mode in modes]
+
+
+def loaded_models(ollama):
+    """Names Ollama reports in /api/ps (empty if unreachable)."""
+    try:
+        r = ollama.get("/api/ps", timeout=5)
+        return [m["name"] for m in r.json().get("models", [])] if r.status_code == 200 else []
+    except Exception:
+        return []
+
+
+def write_jobs(path, jobs, repeat):
+    """
+    The sweep's batch: every prompt job repeat times, ids suffixed #rN.
+    A job's own "model" is dropped: the cell's --model has to apply, or the
+    runner's records would not match the cell they are summarised under.
+    """
+    pinned = [job["id"] for job in jobs if job.get("model")]
+    if pinned:
+        op.log("WARN", f"Ignoring the \"model\" of {len(pinned)} prompt(s) "
+                       f"({', '.join(pinned[:5])}{', …' if len(pinned) > 5 else ''}): "
+                       f"the sweep sets the model per cell")
+    with open(path, "w") as f:
+        for job in jobs:
+            job = {k: v for k, v in job.items() if k != "model"}
+            for rep in range(1, repeat + 1):
+                f.write(json.dumps({**job, "id": f"{job['id']}#r{rep}"}) + "\n")
+    return len(jobs) * repeat
+
+
+# ── Running ─────────────────────────────────────────────────────────────────
+
+def run_cell(args, index, cell, jobs_path, records_path):
+    """One ollama_prompt.py batch run for cell. Returns the runner's exit code."""
+    cmd = [
+        sys.executable, RUNNER,
+        "--base-url", args.base_url, "--ollama-url", args.ollama_url,
+        "--batch", jobs_path, "--model", cell["model"], "--mode", cell["mode"],
+        "--results-jsonl", records_path, "--measure-tokens",
+    ]
+    if cell["edit_format"] != DEFAULT_EDIT_FORMAT:
+        cmd += ["--edit-format", cell["edit_format"]]
+    cmd += args.runner_args
+    log_path = os.path.join(args.output_dir, f"cell-{index}.log")
+    with open(log_path, "w") as out:
+        return subprocess.call(cmd, stdout=out, stderr=subprocess.STDOUT)
+
+
+def run_sweep(args, cells, jobs_path, records_path):
+    ollama = op.HttpClient(args.ollama_url)
+    for index, cell in enumerate(cells, 1):
+        name = f"{cell['model']} / {cell['mode']} / {cell['edit_format']}"
+        op.log("SWEEP", f"[{index}/{len(cells)}] {name}")
+        t0 = time.time()
+        code = run_cell(args, index, cell, jobs_path, records_path)
+        op.log("SWEEP", f"[{index}/{len(cells)}] done in {time.time() - t0:.1f}s "
+                        f"(exit {code}, log: cell-{index}.log)")
+        next_model = cells[index]["model"] if index < len(cells) else None
+        short = op.ollama_model_name(cell["model"])
+        if not args.no_unload and short and next_model != cell["model"]:
+            # Its last cell: free the memory before the next model loads
+            op.unload_ollama_model(ollama, short)
+    ollama.close()
+
+
+# ── Summary ─────────────────────────────────────────────────────────────────
+
+def _median(values, digits):
+    return round(statistics.median(values), digits) if values else None
+
+
+def _p95(values, digits):
+    return round(percentile(values, 95), digits) if values else None
+
+
+def summarize_cells(cells, records):
+    """One summary row per cell from the runner's prompt and run records."""
+    rows = []
+    for cell in cells:
+        def matches(r):
+            return (r["mode"] == cell["mode"]
+                    and (r["edit_format"] or DEFAULT_EDIT_FORMAT) == cell["edit_format"]
+                    and r["model"] == cell["model"])
+        prompts = [r for r in records if r["type"] == "prompt" and matches(r)]
+        runs = [r for r in records if r["type"] == "run" and matches(r)]
+        completions = [p["phases"]["completion"] for p in prompts if "completion" in p["phases"]]
+        first_chunks = [p["phases"]["first_chunk"] for p in prompts if "first_chunk" in p["phases"]]
+        gen_rates = [p["throughput"]["task_gen_tps"] for p in prompts
+                     if "task_gen_tps" in p.get("throughput", {})]
+        succeeded = sum(1 for p in prompts if p["success"])
+        rows.append({
+            **cell,
+            "prompts": len(prompts),
+            "succeeded": succeeded,
+            "success_rate": round(succeeded / len(prompts), 3) if prompts else None,
+            "attempts": sum(p["attempts"] for p in prompts),
+            "completion_median": _median(completions, 2),
+            "completion_p95": _p95(completions, 2),
+            "first_chunk_median": _median(first_chunks, 3),
+            "first_chunk_p95": _p95(first_chunks, 3),
+            "gen_tps_median": _median(gen_rates, 1),
+            "warm_up": runs[-1]["phases"].get("warm_up") if runs else None,
+        })
+    return rows
+
+
+def _cell_text(row, key, fmt):
+    value = row.get(key)
+    return "—" if value is None else fmt.format(value)
+
+
+def markdown_table(rows):
+    lines = ["| " + " | ".join(header for _, header, _ in SUMMARY_COLUMNS) + " |",
+             "|" + "---|" * len(SUMMARY_COLUMNS)]
+    for row in rows:
+        lines.append("| " + " | ".join(_cell_text(row, key, fmt)
+                                       for key, _, fmt in SUMMARY_COLUMNS) + " |")
+    return "\n".join(lines)
+
+
+def log_table(rows):
+    table = [[header for _, header, _ in SUMMARY_COLUMNS]]
+    table += [[_cell_text(row, key, fmt) for key, _, fmt in SUMMARY_COLUMNS] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(SUMMARY_COLUMNS))]
+    print()
+    for line in table:
+        op.log("SWEEP", "  ".join(text.ljust(width) for text, width in zip(line, widths)))
+
+
+# ── Main ────────────────────────────────────────────────────────────────────
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    runner_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, runner_args = argv[:split], argv[split + 1:]
+    parser = argparse.ArgumentParser(
+        description="Run ollama_prompt.py over a grid of models × modes × edit formats")
+    parser.add_argument("--models", nargs="+", required=True,
+                        help="AiderDesk model ids (e.g. ollama/qwen2.5-coder:32b)")
+    parser.add_argument("--modes", nargs="+", default=["code"],
+                        choices=["code", "agent", "ask", "architect"],
+                        help="Modes to sweep (default: code)")
+    parser.add_argument("--edit-formats", nargs="+", default=[DEFAULT_EDIT_FORMAT],
+                        help=f"Edit formats to sweep, '{DEFAULT_EDIT_FORMAT}' for the project's "
+                             f"setting (default: {DEFAULT_EDIT_FORMAT})")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--prompts", help="Directory of prompt files or a JSONL batch "
+                                          "(same formats as ollama_prompt.py --batch)")
+    source.add_argument("--prompt", help="A single prompt")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs of every prompt per cell (default: 1)")
+    parser.add_argument("--base-url", default="http://localhost:24337",
+                        help="AiderDesk base URL (default: http://localhost:24337)")
+    parser.add_argument("--ollama-url", default="http://localhost:11434",
+                        help="Ollama base URL (default: http://localhost:11434)")
+    parser.add_argument("--output-dir", default=None,
+                        help="Where jobs, records, logs and the summary go "
+                             "(default: sweep-YYYYmmdd-HHMMSS)")
+    parser.add_argument("--no-unload", action="store_true",
+                        help="Leave each model loaded after its last cell")
+    args = parser.parse_args(argv)
+    args.runner_args = runner_args
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.prompts:
+        jobs = op.load_batch(args.prompts)
+    else:
+        jobs = [{"id": "prompt", "prompt": args.prompt}]
+    if not jobs:
+        op.log("FAIL", f"No prompts in {args.prompts}")
+        sys.exit(1)
+    args.output_dir = args.output_dir or datetime.now().strftime("sweep-%Y%m%d-%H%M%S")
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs_path = os.path.join(args.output_dir, "jobs.jsonl")
+    records_path = os.path.join(args.output_dir, "results.jsonl")
+    if os.path.exists(records_path):
+        os.remove(records_path)
+
+    runs_per_cell = write_jobs(jobs_path, jobs, max(1, args.repeat))
+    ollama = op.HttpClient(args.ollama_url)
+    resident = loaded_models(ollama)
+    ollama.close()
+    cells = schedule_cells(args.models, args.modes, args.edit_formats, resident)
+    op.log("SWEEP", f"{len(cells)} cell(s) × {runs_per_cell} run(s) "
+                    f"({len(jobs)} prompt(s) × {max(1, args.repeat)}), "
+                    f"model order: {' → '.join(dict.fromkeys(c['model'] for c in cells))}")
+
+    run_sweep(args, cells, jobs_path, records_path)
+
+    records = []
+    if os.path.exists(records_path):
+        with open(records_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    rows = summarize_cells(cells, records)
+    log_table(rows)
+    with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(timespec="seconds"),
+                   "repeat": args.repeat, "prompts": len(jobs), "cells": rows}, f, indent=2)
+    with open(os.path.join(args.output_dir, "summary.md"), "w") as f:
+        f.write(markdown_table(rows) + "\n")
+    op.log("SWEEP", f"Summary written to {args.output_dir}/summary.md and summary.json")
+    sys.exit(0 if all(r["prompts"] for r in rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Shared fixtures for the ollama_prompt tests.
+
+Run from knowledge_base/aider-desk:
+    python3 -m pytest -q tests
+
+The end-to-end tests drive lib/fake_aiderdesk_server.py and need its
+prerequisites (pip install aiohttp "python-socketio[asyncio_client]").
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+LIB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+sys.path.insert(0, LIB)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeServer:
+    """A fake_aiderdesk_server.py subprocess on free ports."""
+
+    def __init__(self, tmp_path, *extra_args):
+        self.port = free_port()
+        self.ollama_port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.ollama_url = f"http://127.0.0.1:{self.ollama_port}"
+        self.api = self.base_url + "/api"
+        self.log_path = tmp_path / f"fake_server_{self.port}.log"
+        self._log = open(self.log_path, "w")
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.join(LIB, "fake_aiderdesk_server.py"),
+             "--port", str(self.port), "--ollama-port", str(self.ollama_port), *extra_args],
+            stdout=self._log, stderr=subprocess.STDOUT)
+        self._wait_ready()
+
+    def _wait_ready(self, timeout=15):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"fake server exited: {self.log_path.read_text()}")
+            try:
+                requests.get(self.api + "/settings", timeout=1)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        raise RuntimeError("fake server did not start")
+
+    def stats(self):
+        return requests.get(self.base_url + "/_fake/stats", timeout=5).json()["counters"]
+
+    def tasks(self, project_dir):
+        r = requests.get(self.api + "/project/tasks", params={"projectDir": project_dir}, timeout=5)
+        return {t["id"]: t for t in r.json()}
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+
+
+@pytest.fixture
+def start_fake_server(tmp_path):
+    """start_fake_server(*cli_args) → a running FakeServer, stopped after the test."""
+    pytest.importorskip("aiohttp")
+    servers = []
+
+    def _start(*extra_args):
+        servers.append(FakeServer(tmp_path, *extra_args))
+        return servers[-1]
+
+    yield _start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def fake_server(start_fake_server):
+    """Stand-in with 40 chunks 0.05s apart: a prompt takes about 2s."""
+    return start_fake_server("--chunks", "40", "--chunk-interval", "0.05",
+                             "--first-chunk-latency", "0.1", "--model-load-time", "0")
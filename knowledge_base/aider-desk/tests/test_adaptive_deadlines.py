@@ -0,0 +1,136 @@
+"""--adaptive-timeouts: run history and the deadlines derived from it."""
+
+import json
+from types import SimpleNamespace
+
+import ollama_prompt as op
+from ollama_prompt import RunHistory, TaskState, adaptive_deadlines, percentile, record_history
+
+KEY = RunHistory.key("ollama/qwen2.5-coder:32b", "code", None)
+
+
+# ── percentile ──────────────────────────────────────────────────────────────
+
+def test_percentile_nearest_rank():
+    values = [15, 20, 35, 40, 50]
+    assert percentile(values, 30) == 20
+    assert percentile(values, 40) == 20
+    assert percentile(values, 50) == 35
+    assert percentile(values, 100) == 50
+
+
+def test_percentile_unsorted_and_edges():
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([7], 99) == 7
+    assert percentile([4, 9], 0) == 4
+    assert percentile([], 50) is None
+
+
+# ── RunHistory ──────────────────────────────────────────────────────────────
+
+def test_history_key_and_samples(tmp_path):
+    history = RunHistory(str(tmp_path / "sub" / "history.jsonl"))
+    assert KEY == "ollama/qwen2.5-coder:32b|code|default"
+    assert history.samples(KEY) == []
+
+    history.append(KEY, {"completion": 1.0})
+    history.append("other|code|default", {"completion": 2.0})
+    with open(history.path, "a") as f:
+        f.write("not json\n")
+    history.append(KEY, {"completion": 3.0})
+
+    assert [s["completion"] for s in history.samples(KEY)] == [1.0, 3.0]
+
+
+def test_history_keeps_the_most_recent_window(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    with open(history.path, "w") as f:
+        for i in range(op.HISTORY_WINDOW + 10):
+            f.write(json.dumps({"key": KEY, "completion": float(i)}) + "\n")
+    samples = history.samples(KEY)
+    assert len(samples) == op.HISTORY_WINDOW
+    assert samples[0]["completion"] == 10.0
+
+
+# ── adaptive_deadlines ──────────────────────────────────────────────────────
+
+def deadline_args(adaptive=True, timeout=600, margin=0.5):
+    return SimpleNamespace(timeout=timeout, adaptive_timeouts=adaptive, adaptive_margin=margin)
+
+
+def fill_history(history, count, completion=100.0, first_chunk=2.0, max_chunk_gap=8.0):
+    for i in range(count):
+        history.append(KEY, {"completion": completion + i, "first_chunk": first_chunk,
+                             "max_chunk_gap": max_chunk_gap, "chunks": 40})
+
+
+FIXED = {"timeout": 600, "stall_timeout": op.STALE_CHUNK_TIMEOUT,
+         "cold_start_threshold": op.COLD_START_THRESHOLD}
+
+
+def test_adaptive_deadlines_off_or_no_history(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    fill_history(history, 10)
+    assert adaptive_deadlines(deadline_args(adaptive=False), history, KEY) == FIXED
+    assert adaptive_deadlines(deadline_args(), None, KEY) == FIXED
+
+
+def test_adaptive_deadlines_need_enough_samples(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    fill_history(history, op.ADAPTIVE_MIN_SAMPLES - 1)
+    assert adaptive_deadlines(deadline_args(), history, KEY) == FIXED
+
+
+def test_adaptive_deadlines_from_p99_with_margin_and_floors(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    fill_history(history, 10)  # completions 100..109
+    history.append(RunHistory.key("other", "code", None), {"completion": 5000.0})
+
+    deadlines = adaptive_deadlines(deadline_args(margin=0.5), history, KEY)
+
+    assert deadlines["timeout"] == 163.5       # p99 109 * 1.5
+    assert deadlines["stall_timeout"] == 12.0  # 8 * 1.5, above the 10s floor
+    assert deadlines["cold_start_threshold"] == op.ADAPTIVE_FLOORS["cold_start_threshold"]
+
+
+def test_adaptive_deadlines_ignore_missing_fields(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    for _ in range(op.ADAPTIVE_MIN_SAMPLES):
+        history.append(KEY, {"completion": 40.0, "first_chunk": None, "max_chunk_gap": 4.0})
+
+    deadlines = adaptive_deadlines(deadline_args(margin=0), history, KEY)
+
+    assert deadlines["timeout"] == 40.0
+    assert deadlines["stall_timeout"] == op.ADAPTIVE_FLOORS["stall_timeout"]
+    assert deadlines["cold_start_threshold"] == op.COLD_START_THRESHOLD
+
+
+# ── record_history ──────────────────────────────────────────────────────────
+
+def history_ctx(history, chunk_events=True):
+    return SimpleNamespace(history=history, warm_prefix=None,
+                           monitor=SimpleNamespace(chunk_events=chunk_events))
+
+
+def completed_state():
+    state = TaskState("task-1")
+    state.max_chunk_gap, state.chunks_received = 0.4567, 40
+    return state
+
+
+def test_record_history_appends_completed_attempts(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    record_history(history_ctx(history), completed_state(),
+                   {"completion": 12.5, "first_chunk": 1.5}, KEY)
+    record_history(history_ctx(history), completed_state(), {"first_chunk": 1.5}, KEY)
+
+    [sample] = history.samples(KEY)
+    assert (sample["completion"], sample["first_chunk"], sample["max_chunk_gap"],
+            sample["chunks"]) == (12.5, 1.5, 0.457, 40)
+
+
+def test_record_history_skips_runs_without_chunk_events(tmp_path):
+    history = RunHistory(str(tmp_path / "history.jsonl"))
+    record_history(history_ctx(history, chunk_events=False), completed_state(),
+                   {"completion": 12.5}, KEY)
+    assert history.samples(KEY) == []
@@ -0,0 +1,105 @@
+"""AttemptWatch: the event-driven attempt loop's decisions, without a server."""
+
+import time
+
+from ollama_prompt import AttemptWatch, FailureReason, TaskState
+
+
+def make_watch(timeout=10.0, **kwargs):
+    state = TaskState("task-1")
+    prompt_result = {"status": None, "error": None, "done": False}
+    phases = {}
+    watch = AttemptWatch(state, prompt_result, timeout, phases, start=time.time(), **kwargs)
+    return watch, state, prompt_result, phases
+
+
+def chunk(state, at):
+    state.chunks_received += 1
+    if state.first_chunk_at is None:
+        state.first_chunk_at = at
+        state.signals.setdefault("first_chunk", at)
+    state.last_chunk_at = state.last_activity = at
+
+
+def test_nothing_to_do_until_the_deadline():
+    watch, state, _, _ = make_watch(timeout=10)
+    assert watch.step(watch.start + 1) is None
+    assert watch.wake_at() == watch.deadline + 0.001
+
+
+def test_completion_is_measured_from_the_signal():
+    watch, state, _, phases = make_watch()
+    chunk(state, watch.start + 0.5)
+    chunk(state, watch.start + 1.5)
+    state.completed.set()
+    state.signals["completed"] = watch.start + 2.0
+
+    assert watch.step(watch.start + 2.25) == AttemptWatch.COMPLETED
+    assert phases["first_chunk"] == 0.5
+    assert phases["completion"] == 2.0
+    assert phases["generation"] == 1.0
+    assert phases["detection_latency"] == 0.25
+
+
+def test_question_is_answered_then_retried_after_a_failure():
+    watch, state, _, _ = make_watch()
+    state.question_text = "Apply the changes?"
+    state.question_pending.set()
+
+    assert watch.step(watch.start + 1) == AttemptWatch.QUESTION
+    watch.question_failed(watch.start + 1)
+    assert watch.step(watch.start + 1.5) is None
+    assert watch.wake_at() == watch.start + 1 + AttemptWatch.QUESTION_RETRY_INTERVAL
+    assert watch.step(watch.start + 2.1) == AttemptWatch.QUESTION
+
+    watch.question_answered()
+    assert not state.question_pending.is_set()
+
+
+def test_target_file_on_disk_is_recorded():
+    watch, state, _, phases = make_watch(target_file="/tmp/out.rb")
+    state.signals["file"] = watch.start + 3.0
+    assert watch.step(watch.start + 3.1) is None
+    assert watch.file_on_disk
+    assert phases["file_on_disk"] == 3.0
+
+
+def test_stale_chunks_move_the_wake_up_forward():
+    watch, state, _, _ = make_watch(timeout=100, stale_timeout=5)
+    chunk(state, watch.start + 1)
+    assert watch.step(watch.start + 2) is None
+    assert watch.wake_at() == watch.start + 1 + 5
+
+
+def test_timeout_without_chunks_is_a_connection_error():
+    watch, state, prompt_result, _ = make_watch(timeout=10, cold_start_threshold=60)
+    assert watch.step(watch.start + 10.5) == AttemptWatch.TIMEOUT
+    assert watch.timeout_report(watch.start + 10.5) == FailureReason.CONNECTION_ERROR
+
+
+def test_timeout_classification():
+    watch, state, prompt_result, _ = make_watch(timeout=90, cold_start_threshold=60)
+    assert watch.timeout_report(watch.start + 91) == FailureReason.COLD_START
+
+    chunk(state, watch.start + 5)
+    assert watch.timeout_report(watch.start + 91) == FailureReason.PARTIAL_RESPONSE
+
+    state.question_pending.set()
+    assert watch.timeout_report(watch.start + 91) == FailureReason.QUESTION_UNANSWERED
+
+    state.question_pending.clear()
+    prompt_result.update(done=True, error="ConnectionError: connection aborted")
+    assert watch.timeout_report(watch.start + 91) == FailureReason.CONNECTION_ERROR
+
+    prompt_result.update(error="500 Server Error")
+    assert watch.timeout_report(watch.start + 91) == FailureReason.OLLAMA_ERROR
+
+
+def test_signal_records_the_first_time_and_wakes():
+    state = TaskState("task-1")
+    state.signal("completed")
+    first = state.signals["completed"]
+    state.wake.clear()
+    state.signal("completed")
+    assert state.signals["completed"] == first
+    assert state.wake.is_set()
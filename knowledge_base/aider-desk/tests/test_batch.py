@@ -0,0 +1,82 @@
+"""--batch: loading prompt jobs, the aggregate summary and per-task event routing."""
+
+import pytest
+
+from ollama_prompt import EventMonitor, load_batch, summarize_batch
+
+
+def test_load_batch_directory(tmp_path):
+    (tmp_path / "b.md").write_text("second prompt\n")
+    (tmp_path / "a.txt").write_text("  first prompt  ")
+    (tmp_path / "c.prompt").write_text("third")
+    (tmp_path / "empty.txt").write_text("\n")
+    (tmp_path / "notes.json").write_text("not a prompt")
+
+    jobs = load_batch(str(tmp_path))
+
+    assert jobs == [{"id": "a", "prompt": "first prompt"},
+                    {"id": "b", "prompt": "second prompt"},
+                    {"id": "c", "prompt": "third"}]
+
+
+def test_load_batch_jsonl(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text('"plain string prompt"\n'
+                    '\n'
+                    '{"id": "fix-1", "prompt": "Fix it", "target_file": "a.rb", "model": "ollama/x"}\n'
+                    '{"prompt": "No id"}\n')
+
+    jobs = load_batch(str(path))
+
+    assert jobs == [{"id": "line-1", "prompt": "plain string prompt"},
+                    {"id": "fix-1", "prompt": "Fix it", "target_file": "a.rb", "model": "ollama/x"},
+                    {"id": "line-4", "prompt": "No id"}]
+
+
+def test_load_batch_reports_the_bad_line(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text('{"prompt": "ok"}\n{"id": "x"}\n')
+    with pytest.raises(ValueError, match=r"jobs.jsonl:2: 'prompt' must be a non-empty string"):
+        load_batch(str(path))
+
+
+def result(success, attempts=1, completion=None, first_chunk=None):
+    phases = {}
+    if completion is not None:
+        phases["completion"] = completion
+    if first_chunk is not None:
+        phases["first_chunk"] = first_chunk
+    return {"success": success, "attempts": attempts, "phases": phases}
+
+
+def test_summarize_batch():
+    results = [result(True, completion=2.0, first_chunk=0.5),
+               result(True, completion=4.0, first_chunk=1.5),
+               result(False, attempts=3)]
+
+    summary = summarize_batch(results, wall=6.0, concurrency=2)
+
+    assert summary["prompts"] == 3
+    assert (summary["succeeded"], summary["failed"], summary["attempts"]) == (2, 1, 5)
+    assert summary["prompts_per_min"] == 30.0
+    assert summary["completion_mean"] == 3.0
+    assert summary["completion_median"] == 3.0
+    assert summary["first_chunk_median"] == 1.0
+    assert summary["gen_tps_median"] is None
+
+
+def test_one_monitor_routes_events_by_task():
+    monitor = EventMonitor("http://localhost:1", "/tmp/project")
+    a, b = monitor.track("task-a", "[a] "), monitor.track("task-b", "[b] ")
+
+    monitor._on_event({"type": "response-chunk", "data": {"taskId": "task-a", "chunk": "x"}})
+    monitor._on_event({"type": "response-chunk", "data": {"taskId": "task-a", "chunk": "y"}})
+    monitor._on_event({"type": "task-updated", "data": {"id": "task-b", "state": "DONE"}})
+    monitor._on_event({"type": "response-chunk", "data": {"taskId": "other", "chunk": "z"}})
+
+    assert (a.chunks_received, b.chunks_received) == (2, 0)
+    assert not a.completed.is_set() and b.completed.is_set()
+    assert monitor.events_ignored == 1
+
+    monitor.untrack("task-b")
+    assert list(monitor.tasks) == ["task-a"]
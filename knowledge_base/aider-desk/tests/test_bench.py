@@ -0,0 +1,70 @@
+"""bench_ollama_prompt.py: summaries, the event mix and regression comparison."""
+
+import bench_ollama_prompt as bench
+
+
+def report(concurrency_ppm=1000.0, completion=0.3, ns_per_chunk=2000.0, setup=0.01):
+    return {
+        "timestamp": "2026-01-01T00:00:00",
+        "results": {
+            "overhead": [{"engine": "threads", "setup": setup,
+                          "task_creation": {"median": 0.004}, "first_chunk": None}],
+            "event_handling": {"ns_per_chunk_event": ns_per_chunk,
+                               "chunk_events_per_s": round(1e9 / ns_per_chunk)},
+            "log_tailing": {"log_lines_per_s": 500000},
+            "concurrency": [{"engine": "asyncio", "concurrency": 16,
+                             "prompts_per_min": concurrency_ppm, "completion_median": completion,
+                             "completion_p95": None, "succeeded": 32}],
+        },
+    }
+
+
+def test_summary():
+    assert bench._summary([]) is None
+    assert bench._summary([1.0, 2.0, 3.0, 10.0]) == {"n": 4, "mean": 4.0, "median": 2.5,
+                                                     "p95": 10.0, "max": 10.0}
+
+
+def test_mixed_events_are_one_in_ten_other_types():
+    events = bench.mixed_events(100)
+    others = [e for e in events if e["type"] != "response-chunk"]
+    assert len(events) == 100 and len(others) == 10
+    assert len({e["type"] for e in others}) == 5
+
+
+def test_flatten_metrics():
+    flat = bench.flatten_metrics(report())
+    assert flat == {
+        "overhead.threads.task_creation.median": 0.004,
+        "overhead.threads.setup": 0.01,
+        "event_handling.ns_per_chunk_event": 2000.0,
+        "event_handling.chunk_events_per_s": 500000,
+        "log_tailing.log_lines_per_s": 500000,
+        "concurrency.asyncio.c16.prompts_per_min": 1000.0,
+        "concurrency.asyncio.c16.completion_median": 0.3,
+        "concurrency.asyncio.c16.succeeded": 32,
+    }
+
+
+def test_compare_flags_regressions_in_the_right_direction():
+    baseline = report()
+    better = report(concurrency_ppm=1500.0, completion=0.2, ns_per_chunk=1500.0)
+    assert bench.compare(better, baseline, threshold=0.1) == []
+
+    worse = report(concurrency_ppm=800.0, completion=0.4, ns_per_chunk=3000.0)
+    assert sorted(bench.compare(worse, baseline, threshold=0.1)) == [
+        "concurrency.asyncio.c16.completion_median",
+        "concurrency.asyncio.c16.prompts_per_min",
+        "event_handling.chunk_events_per_s",
+        "event_handling.ns_per_chunk_event",
+    ]
+
+
+def test_compare_ignores_sub_millisecond_noise():
+    assert bench.compare(report(setup=0.0105), report(setup=0.01), threshold=0.01) == []
+
+
+def test_event_handling_bench_runs():
+    result = bench.bench_event_handling(200, repeats=1, other_tasks=2)
+    assert result["tracked_tasks"] == 3
+    assert result["chunk_events_per_s"] > 0 and result["ns_per_ignored_event"] > 0
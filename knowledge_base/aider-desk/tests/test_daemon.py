@@ -0,0 +1,117 @@
+"""--serve: the daemon's queue order, job validation, --queue-db writes and Ctrl-C."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import ollama_prompt as op
+from ollama_prompt import JobStore
+from ollama_prompt_daemon import DaemonError, PromptDaemon
+
+
+def daemon_with(concurrency=0, job_store=None):
+    """A daemon whose workers (none by default) never reach AiderDesk."""
+    return PromptDaemon(SimpleNamespace(job_store=job_store), concurrency)
+
+
+def queued_ids(daemon):
+    return [entry[-1].id for entry in sorted(daemon.queue, key=lambda entry: entry[:-1])]
+
+
+def test_reattached_jobs_run_first_then_priority_then_submission():
+    daemon = daemon_with()
+    daemon.enqueue([{"id": "low", "prompt": "p"}, {"id": "high", "prompt": "p", "priority": 5}])
+    daemon.enqueue([{"id": "resumed", "prompt": "p", "priority": -1,
+                     "resume": {"task_id": "t-1", "attempt": 2}}])
+    daemon.submit([{"id": "also-high", "prompt": "p", "priority": 5}])
+
+    assert queued_ids(daemon) == ["resumed", "high", "also-high", "low"]
+    assert [daemon.get(job_id)["position"] for job_id in queued_ids(daemon)] == [1, 2, 3, 4]
+
+
+def test_submit_is_all_or_nothing():
+    daemon = daemon_with()
+    daemon.submit(["first"])
+    with pytest.raises(DaemonError) as bad:
+        daemon.submit([{"prompt": "ok"}, {"id": "no-prompt"}])
+    assert bad.value.status == 400 and str(bad.value).startswith("job 2:")
+    for entries in ([{"id": "job-1", "prompt": "p"}],
+                    [{"id": "twice", "prompt": "p"}, {"id": "twice", "prompt": "p"}]):
+        with pytest.raises(DaemonError) as taken:
+            daemon.submit(entries)
+        assert taken.value.status == 409
+    assert list(daemon.jobs) == ["job-1"]
+
+    daemon.drain()
+    with pytest.raises(DaemonError) as draining:
+        daemon.submit(["late"])
+    assert draining.value.status == 503
+
+
+class SlowStore:
+    """JobStore stand-in whose add() waits until released."""
+
+    def __init__(self):
+        self.adding, self.release, self.added = threading.Event(), threading.Event(), []
+
+    def known(self, ids):
+        return set()
+
+    def add(self, jobs):
+        self.adding.set()
+        assert self.release.wait(5)
+        self.added += [job["id"] for job in jobs]
+
+
+def test_store_is_written_outside_the_queue_lock():
+    store = SlowStore()
+    daemon = daemon_with(job_store=store)
+    submitting = threading.Thread(target=daemon.submit, args=([{"id": "a", "prompt": "p"}],))
+    submitting.start()
+    assert store.adding.wait(5)
+    try:
+        assert daemon.list_jobs()["queue_depth"] == 0  # not blocked by the commit
+        with pytest.raises(DaemonError) as reserved:
+            daemon.submit([{"id": "a", "prompt": "again"}])
+        assert reserved.value.status == 409
+    finally:
+        store.release.set()
+        submitting.join()
+    assert store.added == ["a"] and queued_ids(daemon) == ["a"]
+    assert daemon.reserved == set()
+
+
+def test_submit_checks_ids_kept_in_the_queue_db(tmp_path):
+    store = JobStore(str(tmp_path / "queue.db"))
+    try:
+        store.add([{"id": "earlier", "prompt": "p"}])
+        daemon = daemon_with(job_store=store)
+        with pytest.raises(DaemonError) as taken:
+            daemon.submit([{"id": "earlier", "prompt": "p"}])
+        assert taken.value.status == 409 and daemon.reserved == set()
+        daemon.submit([{"id": "new", "prompt": "p"}])
+        assert store.counts()["queued"] == 2
+    finally:
+        store.close()
+
+
+def test_join_waits_for_the_running_jobs(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+
+    def run_job(ctx, job):
+        started.set()
+        finish.wait(5)
+        return {"id": job["id"], "success": False, "failure_reason": "interrupted",
+                "elapsed": 0.1}
+
+    monkeypatch.setattr(op, "_run_job", run_job)
+    daemon = daemon_with(concurrency=1)
+    daemon.submit(["running", "queued"])
+    assert started.wait(5)
+
+    daemon.stop()  # no task id yet: nothing to interrupt
+    assert not daemon.join(0.1)
+    finish.set()
+    assert daemon.join(5)
+    assert [r["id"] for r in daemon.results] == ["job-1"]  # the dropped job never ran
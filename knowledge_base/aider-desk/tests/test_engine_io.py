@@ -0,0 +1,196 @@
+"""
+The engine I/O layer: the shared attempt coroutines run unchanged on
+ThreadIO (driven inline by run_sync) and on the asyncio engine's LoopIO.
+
+ThreadIO's awaitables must never suspend, or run_sync() fails at run time.
+The static checks below keep that a property of the code, not of a run.
+"""
+
+import ast
+import asyncio
+import inspect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ollama_prompt as op
+from conftest import LIB
+from ollama_prompt import THREAD_IO, HttpClient, Ready, TaskState, ThreadIO, run_sync
+
+try:
+    import ollama_prompt_async as opa
+except ImportError:
+    opa = None
+
+needs_asyncio = pytest.mark.skipif(opa is None or opa.aiohttp is None,
+                                   reason="the asyncio engine needs aiohttp")
+
+
+# ── The invariant ───────────────────────────────────────────────────────────
+
+def io_methods():
+    """ThreadIO's methods that the shared coroutines await."""
+    return [name for name, _ in inspect.getmembers(ThreadIO, inspect.isfunction)
+            if name in ("get", "post", "wait", "wait_event", "join")]
+
+
+def test_thread_io_methods_are_plain_functions():
+    for name in io_methods():
+        assert not inspect.iscoroutinefunction(getattr(ThreadIO, name)), name
+
+
+def test_ready_never_suspends():
+    it = Ready(42).__await__()
+    with pytest.raises(StopIteration) as done:
+        next(it)
+    assert done.value.value == 42
+
+
+def shared_coroutines(tree):
+    return [node for node in ast.walk(tree) if isinstance(node, ast.AsyncFunctionDef)]
+
+
+def test_shared_coroutines_only_await_io_or_each_other():
+    """Every await in ollama_prompt.py is an io method or another module coroutine."""
+    with open(f"{LIB}/ollama_prompt.py") as f:
+        tree = ast.parse(f.read())
+    coroutines = {node.name for node in shared_coroutines(tree)}
+    awaitable_io = set(io_methods())
+    offenders = []
+    for func in shared_coroutines(tree):
+        for node in ast.walk(func):
+            if isinstance(node, (ast.AsyncFor, ast.AsyncWith)):
+                offenders.append(f"{func.name}: async for/with")
+            if not isinstance(node, ast.Await):
+                continue
+            call = node.value
+            target = call.func if isinstance(call, ast.Call) else None
+            if isinstance(target, ast.Name) and target.id in coroutines:
+                continue
+            if (isinstance(target, ast.Attribute) and target.attr in awaitable_io
+                    and ast.unparse(target.value) in ("io", "ctx.io")):
+                continue
+            offenders.append(f"{func.name}: await {ast.unparse(call)}")
+    assert offenders == []
+
+
+def test_run_sync_returns_the_result():
+    async def add(a, b):
+        return await Ready(a) + await Ready(b)
+    assert run_sync(add(1, 2)) == 3
+
+
+def test_run_sync_rejects_a_suspending_coroutine():
+    async def sleeps():
+        await asyncio.sleep(0)
+    with pytest.raises(RuntimeError, match="other than ThreadIO"):
+        run_sync(sleeps())
+
+
+# ── Both engines run the same coroutines ────────────────────────────────────
+
+@pytest.fixture
+def loop_io():
+    io = opa.LoopIO()
+    yield io
+    io.close()
+
+
+@pytest.fixture(params=["threads", pytest.param("asyncio", marks=needs_asyncio)])
+def engine(request):
+    """(io, TaskState factory, signal(state, kind) from another thread)."""
+    if request.param == "threads":
+        yield THREAD_IO, TaskState, lambda state, kind: state.signal(kind)
+        return
+    io = opa.LoopIO()
+
+    def new_state(task_id):
+        async def _new():
+            return TaskState(task_id, wake=asyncio.Event())
+        return io.run(_new())
+
+    yield io, new_state, lambda state, kind: io.loop.call_soon_threadsafe(state.signal, kind)
+    io.close()
+
+
+def test_wait_context_ready_wakes_on_signal(engine):
+    io, new_state, signal = engine
+    state = new_state("task-1")
+
+    def files_added():
+        state.context_files = 2
+        signal(state, "context_files")
+    threading.Timer(0.1, files_added).start()
+
+    waited = io.run(op.wait_context_ready(io, state, 2, timeout=5))
+    assert 0.05 < waited < 2
+
+
+def test_settle_task_times_out(engine):
+    io, new_state, _ = engine
+    state = new_state("task-1")
+    assert io.run(op.settle_task(io, state, {"done": False}, timeout=0.2)) is False
+    assert io.run(op.settle_task(io, state, {"done": True}, timeout=0.2)) is True
+
+
+def test_spawn_and_join(engine):
+    io, _, _ = engine
+
+    async def child():
+        return "child result"
+
+    async def parent():
+        return await io.join(io.spawn(child(), name="child"))
+
+    assert io.run(parent()) == "child result"
+
+
+def test_run_all_reports_every_job(engine):
+    io, _, _ = engine
+
+    async def job(n):
+        return n * n
+
+    finished = {}
+    io.run_all([job(n) for n in range(6)], 3, finished.__setitem__)
+    assert finished == {n: n * n for n in range(6)}
+
+
+class OllamaPs(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({"models": [{"name": "qwen2.5-coder:32b", "size": 1}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama_ps():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OllamaPs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_running_models_on_threads(ollama_ps):
+    models = op.check_ollama_running_models(HttpClient(ollama_ps))
+    assert [m["name"] for m in models] == ["qwen2.5-coder:32b"]
+
+
+@needs_asyncio
+def test_fetch_running_models_on_the_loop(ollama_ps, loop_io):
+    client = opa.AsyncHttpClient(ollama_ps)
+    loop_io.run(client.open())
+    try:
+        models = loop_io.run(op.fetch_running_models(loop_io, client))
+    finally:
+        loop_io.run(client.close())
+    assert [m["name"] for m in models] == ["qwen2.5-coder:32b"]
@@ -0,0 +1,96 @@
+"""The Socket.IO event hot path: the dispatch table, per-type counters and lazy logging."""
+
+import re
+
+import ollama_prompt as op
+from ollama_prompt import EventMonitor
+
+
+def monitor_with(*task_ids):
+    monitor = EventMonitor("http://localhost:1", "/tmp/project")
+    states = [monitor.track(task_id) for task_id in task_ids]
+    return monitor, states
+
+
+def test_every_handler_in_the_table_exists():
+    monitor, _ = monitor_with()
+    for event_type, method in EventMonitor.EVENT_HANDLERS.items():
+        assert callable(getattr(monitor, method)), event_type
+    assert monitor._subscribe_message()["eventTypes"] == list(EventMonitor.EVENT_HANDLERS)
+
+
+def test_counts_handled_and_ignored_events_by_type():
+    monitor, _ = monitor_with("task-a")
+    for payload in [
+        {"type": "response-chunk", "data": {"taskId": "task-a", "chunk": "x"}},
+        {"type": "response-chunk", "data": {"taskId": "task-a", "chunk": "y"}},
+        {"type": "tool", "data": {"taskId": "task-a", "content": "ls"}},
+        {"type": "response-chunk", "data": {"taskId": "other", "chunk": "z"}},
+        {"type": "mystery", "data": {"taskId": "task-a"}},
+    ]:
+        monitor._on_event(payload)
+
+    stats = monitor.event_stats()
+    assert stats["handled"] == {"response-chunk": 2, "tool": 1}
+    assert stats["ignored"] == 2
+    assert stats["ignored_by_type"] == {"mystery": 1, "response-chunk": 1}
+    assert stats["received"] == 5
+
+
+def test_untagged_events_reach_every_tracked_task():
+    monitor, (a, b) = monitor_with("task-a", "task-b")
+    monitor._on_event({"type": "log", "data": {"level": "info", "content": "Dropping foo.rb"}})
+    assert a.file_dropped and b.file_dropped
+    assert monitor.event_counts == {"log": 1}
+
+
+def test_chunk_handler_tracks_gaps_and_bytes(monkeypatch):
+    monitor, (state,) = monitor_with("task-a")
+    now = [0.0]
+    monkeypatch.setattr(op, "clock", lambda: now[0])
+    for now[0], text in ((10.0, "ab"), (10.5, 3), (12.0, "cde")):
+        monitor._on_event({"type": "response-chunk", "data": {"taskId": "task-a", "content": text}})
+
+    assert state.chunks_received == 3
+    assert (state.first_chunk_at, state.last_chunk_at) == (10.0, 12.0)
+    assert state.max_chunk_gap == 1.5
+    assert state.chunk_bytes == 6  # the int is counted as "3"
+    assert "first_chunk" in state.signals and not state.file_dropped
+
+
+def test_dropped_file_is_detected_in_either_case():
+    monitor, (state,) = monitor_with("task-a")
+    monitor._on_event({"type": "response-chunk",
+                       "data": {"taskId": "task-a", "chunk": "DROPPING src/app.rb"}})
+    assert state.file_dropped and "file_dropped" in state.signals
+
+
+def test_only_sampled_chunks_are_logged(capsys):
+    monitor, _ = monitor_with("task-a")
+    for _ in range(40):
+        monitor._on_event({"type": "response-chunk", "data": {"taskId": "task-a", "chunk": "t"}})
+    logged = re.findall(r"\[chunk #(\d+)\]", capsys.readouterr().out)
+    assert logged == ["1", "2", "3", "4", "5", "20", "40"]
+
+
+class Unprintable:
+    def __str__(self):
+        raise AssertionError("formatted a suppressed line")
+
+
+def test_suppressed_debug_lines_are_not_formatted(monkeypatch, capsys):
+    monkeypatch.setattr(op, "DEBUG", False)
+    op.log("DEBUG", "value: %s", Unprintable())
+    assert capsys.readouterr().out == ""
+
+    op.log("INFO", "%d%% done", 50)
+    assert capsys.readouterr().out.endswith("[INFO] 50% done\n")
+
+
+def test_timestamps_keep_milliseconds_within_a_second(monkeypatch):
+    monkeypatch.setattr(op.time, "time", lambda: 1_700_000_000.25)
+    first = op.ts()
+    monkeypatch.setattr(op.time, "time", lambda: 1_700_000_000.75)
+    second = op.ts()
+    assert first[:-4] == second[:-4]
+    assert (first[-4:], second[-4:]) == (".250", ".750")
@@ -0,0 +1,97 @@
+"""--event-profile / --subscribe-tasks: the subscription and what runs without chunk events."""
+
+import time
+
+import pytest
+import requests
+
+from ollama_prompt import AttemptWatch, EventMonitor, FailureReason, TaskState, classify_failure
+
+PROFILES = EventMonitor.SUBSCRIPTION_PROFILES
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_subscription_lists_the_profile_types(profile):
+    monitor = EventMonitor("http://localhost:1", "/tmp/project", profile=profile)
+    message = monitor._subscribe_message()
+    assert message["eventTypes"] == list(PROFILES[profile])
+    assert message["baseDirs"] == ["/tmp/project"]
+    assert "taskIds" not in message
+    assert monitor.chunk_events == (profile == "full")
+
+
+def test_every_profile_keeps_completion_detection():
+    for types in PROFILES.values():
+        assert set(EventMonitor.COMPLETION_EVENTS) <= set(types)
+    assert {"ask-question", "question-answered"} <= set(PROFILES["questions"])
+
+
+def test_task_filter_resubscribes_with_the_tracked_ids():
+    monitor = EventMonitor("http://localhost:1", "/tmp/project", task_filter=True)
+    sent = []
+    monitor.sio.connected = True
+    monitor.sio.emit = lambda event, message: sent.append(message["taskIds"])
+
+    monitor.track("a")
+    monitor.track("b")
+    monitor.untrack("a")
+    monitor.untrack("unknown")  # not tracked: no new subscription
+
+    assert sent == [["a"], ["a", "b"], ["b"]]
+
+
+def test_types_outside_the_profile_are_ignored():
+    monitor = EventMonitor("http://localhost:1", "/tmp/project", profile="completion")
+    state = monitor.track("a")
+    monitor._on_event({"type": "response-chunk", "data": {"taskId": "a", "chunk": "x"}})
+    monitor._on_event({"type": "task-updated", "data": {"id": "a", "state": "DONE"}})
+
+    assert state.chunks_received == 0 and state.completed.is_set()
+    stats = monitor.event_stats()
+    assert (stats["profile"], stats["handled"], stats["ignored_by_type"]) == \
+        ("completion", {"task-updated": 1}, {"response-chunk": 1})
+
+
+def test_classification_without_chunk_events():
+    state = TaskState("a")  # chunks_received is always 0 under these profiles
+    assert classify_failure(state, {}, 900, chunk_events=False) == FailureReason.UNKNOWN
+    assert classify_failure(state, {"error": "Read timeout"}, 900, chunk_events=False) == \
+        FailureReason.CONNECTION_ERROR
+    state.question_pending.set()
+    assert classify_failure(state, {}, 900, chunk_events=False) == \
+        FailureReason.QUESTION_UNANSWERED
+    loaded = [{"event": "model_loaded", "at": 1.0, "line": ""}]
+    assert classify_failure(state, {}, 900, log_events=loaded, chunk_events=False) == \
+        FailureReason.MODEL_LOADING
+
+
+def test_no_stall_checks_without_chunk_events():
+    state = TaskState("a")
+    watch = AttemptWatch(state, {"status": None, "error": None, "done": False}, 120, {},
+                         start=time.time(), stale_timeout=5, stall_policy="abort",
+                         chunk_events=False)
+    state.chunks_received, state.first_chunk_at = 3, watch.start  # would count under "full"
+    state.last_activity = watch.start
+    assert watch.step(watch.start + 60) is None
+    assert "first_chunk" not in watch.phases
+
+
+def test_the_stand_in_honours_task_ids(start_fake_server, tmp_path):
+    server = start_fake_server("--chunks", "5", "--chunk-interval", "0.01",
+                               "--first-chunk-latency", "0")
+    project_dir = str(tmp_path)
+    monitor = EventMonitor(server.base_url, project_dir, task_filter=True)
+    assert monitor.connect("admin", "admin")
+    try:
+        ids = [requests.post(server.api + "/project/tasks/new", json={"projectDir": project_dir},
+                             timeout=5).json()["id"] for _ in range(2)]
+        state = monitor.track(ids[0])
+        time.sleep(0.2)  # the re-subscription reaches the server
+        for task_id in ids:
+            requests.post(server.api + "/run-prompt", json={"taskId": task_id, "prompt": "hi"},
+                          timeout=10)
+        assert state.completed.wait(5)
+    finally:
+        monitor.disconnect()
+    assert monitor.events_ignored == 0
+    assert state.chunks_received == 5
@@ -0,0 +1,97 @@
+"""The local AiderDesk + Ollama stand-in: helpers, REST, the event stream and residency."""
+
+import time
+
+import pytest
+import requests
+
+from fake_aiderdesk_server import go_duration_text, parse_keep_alive
+from ollama_prompt import EventMonitor, go_duration
+
+
+@pytest.mark.parametrize("value, seconds", [
+    (0, 0.0), (30, 30.0), ("90", 90.0), ("5m", 300.0), ("24h", 86400.0), ("1.5s", 1.5),
+    (-1, float("inf")), ("-1m", float("inf")),
+])
+def test_parse_keep_alive(value, seconds):
+    assert parse_keep_alive(value) == seconds
+
+
+@pytest.mark.parametrize("seconds", [0.0005, 0.25, 3.021554916, 62.5])
+def test_go_duration_text_round_trips(seconds):
+    assert go_duration(go_duration_text(seconds)) == pytest.approx(seconds, rel=1e-3)
+
+
+def new_task(server, project_dir):
+    r = requests.post(server.api + "/project/tasks/new", json={"projectDir": project_dir},
+                      timeout=5)
+    return r.json()["id"]
+
+
+def test_run_prompt_streams_to_the_runner_monitor(start_fake_server, tmp_path):
+    server = start_fake_server("--chunks", "10", "--chunk-interval", "0.01",
+                               "--first-chunk-latency", "0", "--prompt-tokens", "123")
+    project_dir = str(tmp_path)
+    monitor = EventMonitor(server.base_url, project_dir)
+    assert monitor.connect("admin", "admin")
+    try:
+        task_id = new_task(server, project_dir)
+        state = monitor.track(task_id)
+        r = requests.post(server.api + "/run-prompt",
+                          json={"taskId": task_id, "prompt": "hello"}, timeout=10)
+        assert r.status_code == 200
+        assert state.completed.wait(5)
+    finally:
+        monitor.disconnect()
+
+    assert state.chunks_received == 10
+    assert state.response_completed_count == 1
+    assert state.prompt_tokens == 123
+    assert server.tasks(project_dir)[task_id]["state"] == "READY_FOR_REVIEW"
+    assert server.stats()["tasks_completed"] == 1
+
+
+def test_stalled_task_waits_for_the_interrupt(start_fake_server, tmp_path):
+    server = start_fake_server("--chunks", "10", "--chunk-interval", "0.01",
+                               "--stall-rate", "1")
+    task_id = new_task(server, str(tmp_path))
+    with pytest.raises(requests.Timeout):
+        requests.post(server.api + "/run-prompt", json={"taskId": task_id, "prompt": "hi"},
+                      timeout=1)
+    requests.post(server.api + "/project/interrupt", json={"taskId": task_id}, timeout=5)
+    deadline = time.time() + 5
+    while server.tasks(str(tmp_path))[task_id]["state"] != "INTERRUPTED":
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert server.stats()["tasks_stalled"] == 1
+
+
+def test_failing_run_prompt(start_fake_server, tmp_path):
+    server = start_fake_server("--fail-rate", "1")
+    task_id = new_task(server, str(tmp_path))
+    r = requests.post(server.api + "/run-prompt", json={"taskId": task_id, "prompt": "hi"},
+                      timeout=5)
+    assert r.status_code == 500
+
+
+def test_ollama_load_and_unload(start_fake_server):
+    server = start_fake_server("--models", "a:7b", "b:7b", "--model-load-time", "0.2")
+
+    def loaded():
+        return [m["name"] for m in requests.get(server.ollama_url + "/api/ps", timeout=5)
+                .json()["models"]]
+
+    assert loaded() == []
+    r = requests.post(server.ollama_url + "/api/generate", json={"model": "a:7b"}, timeout=5)
+    assert r.json()["done_reason"] == "load"
+    assert r.json()["load_duration"] >= 0.2e9
+    assert loaded() == ["a:7b"]
+
+    r = requests.post(server.ollama_url + "/api/generate", json={"model": "a:7b"}, timeout=5)
+    assert r.json()["load_duration"] == 0  # already resident
+
+    requests.post(server.ollama_url + "/api/generate", json={"model": "a:7b", "keep_alive": 0},
+                  timeout=5)
+    assert loaded() == []
+    r = requests.post(server.ollama_url + "/api/generate", json={"model": "missing"}, timeout=5)
+    assert r.status_code == 404
@@ -0,0 +1,92 @@
+"""HttpClient: keep-alive pooling, Basic auth, retry rules and per-endpoint counters."""
+
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_prompt import HttpClient, api_get, api_post
+
+
+class Backend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    calls = []     # (method, path, client port, Authorization)
+    status = {}    # path → status to answer with (default 200)
+
+    def _answer(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        path = self.path.split("?", 1)[0]
+        Backend.calls.append((self.command, path, self.client_address[1],
+                              self.headers.get("Authorization")))
+        body = json.dumps({"ok": True}).encode()
+        self.send_response(Backend.status.get(path, 200))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def backend():
+    Backend.calls, Backend.status = [], {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Backend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api"
+    server.shutdown()
+    server.server_close()
+
+
+def test_auth_header_and_keep_alive(backend):
+    client = HttpClient(backend, "admin", "secret")
+    for _ in range(3):
+        assert api_get(client, "/settings").status_code == 200
+    api_post(client, "/project/add-open", {"projectDir": "/tmp/p"})
+
+    expected = "Basic " + base64.b64encode(b"admin:secret").decode()
+    assert {auth for _, _, _, auth in Backend.calls} == {expected}
+    assert len({port for _, _, port, _ in Backend.calls}) == 1  # one pooled connection
+    client.close()
+
+
+def test_get_is_retried_on_503_but_post_is_not(backend):
+    Backend.status = {"/api/flaky": 503}
+    client = HttpClient(backend, retries=2, backoff=0)
+
+    assert client.get("/flaky").status_code == 503
+    assert client.post("/flaky", json={}).status_code == 503
+
+    methods = [method for method, path, _, _ in Backend.calls if path == "/api/flaky"]
+    assert methods == ["GET", "GET", "GET", "POST"]  # run-prompt must never be sent twice
+    client.close()
+
+
+def test_latency_counters_per_endpoint(backend):
+    Backend.status = {"/api/missing": 404}
+    client = HttpClient(backend, retries=0)
+    client.get("/project/tasks?projectDir=/a")
+    client.get("/project/tasks?projectDir=/b")
+    client.post("/missing", json={})
+
+    rows = {row["endpoint"]: row for row in client.latency_report()}
+
+    assert set(rows) == {"GET /project/tasks", "POST /missing"}
+    assert rows["GET /project/tasks"]["calls"] == 2
+    assert rows["GET /project/tasks"]["errors"] == 0
+    assert rows["POST /missing"]["errors"] == 1
+    client.close()
+
+
+def test_connection_errors_are_counted():
+    client = HttpClient("http://127.0.0.1:9", retries=0)
+    with pytest.raises(Exception):
+        client.get("/settings", timeout=1)
+    assert client.latency_report()[0]["errors"] == 1
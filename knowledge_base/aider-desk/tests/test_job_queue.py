@@ -0,0 +1,213 @@
+"""
+--queue-db: the JobStore and crash recovery against the fake server.
+
+Each recovery test leaves the queue the way a runner killed mid-attempt
+would: the job "running" with its attempt's task id. The task is started on
+the fake server directly, then the runner is started on the queue file.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from conftest import LIB
+from ollama_prompt import THREAD_IO, EventMonitor, HttpClient, JobStore, reattach_jobs, run_sync
+
+ENGINES = ["threads", "asyncio"]
+
+
+def crashed_queue(db_path, task_id, job_id="job-1"):
+    """A queue with one job left running on task_id at attempt 1."""
+    store = JobStore(str(db_path))
+    job = {"id": job_id, "prompt": "Say hello"}
+    store.add([job])
+    store.started(job)
+    store.progress(job, "attempt_start", {"attempt": 1, "task_id": task_id})
+    store.close()
+
+
+def start_task(server, project_dir):
+    """Create a task and run a prompt on it in the background, as the crashed runner did."""
+    r = requests.post(server.api + "/project/tasks/new",
+                      json={"projectDir": project_dir, "name": "Prompt #1 [job-1]"}, timeout=5)
+    task_id = r.json()["id"]
+    prompt = threading.Thread(target=requests.post, args=(server.api + "/run-prompt",),
+                              kwargs={"json": {"taskId": task_id, "prompt": "Say hello"},
+                                      "timeout": 30})
+    prompt.start()
+    wait_for_state(server, project_dir, task_id, "IN_PROGRESS")
+    return task_id, prompt
+
+
+def wait_for_state(server, project_dir, task_id, state, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.tasks(project_dir)[task_id]["state"] == state:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"task {task_id} never reached {state}")
+
+
+def run_queue(server, project_dir, db_path, engine):
+    """Run the runner on the queue file until it is empty; returns (exit code, output)."""
+    proc = subprocess.run(
+        [sys.executable, os.path.join(LIB, "ollama_prompt.py"),
+         "--base-url", server.base_url, "--ollama-url", server.ollama_url,
+         "--project-dir", project_dir, "--no-tail-logs", "--engine", engine,
+         "--queue-db", str(db_path)],
+        capture_output=True, text=True, timeout=90)
+    return proc.returncode, proc.stdout + proc.stderr
+
+
+def job_counts(db_path):
+    store = JobStore(str(db_path))
+    try:
+        return store.counts()
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_running_task_is_reattached(fake_server, tmp_path, engine):
+    project_dir, db_path = str(tmp_path), tmp_path / "queue.db"
+    task_id, prompt = start_task(fake_server, project_dir)
+    crashed_queue(db_path, task_id)
+
+    code, output = run_queue(fake_server, project_dir, db_path, engine)
+    prompt.join()
+
+    assert code == 0, output
+    assert f"Re-attached to task {task_id} (state=IN_PROGRESS)" in output
+    assert job_counts(db_path)["done"] == 1
+    stats = fake_server.stats()
+    assert stats["tasks_created"] == 1          # waited on the same task
+    assert stats["POST /api/run-prompt"] == 1   # and did not send the prompt again
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_finished_task_completes_at_once(fake_server, tmp_path, engine):
+    project_dir, db_path = str(tmp_path), tmp_path / "queue.db"
+    task_id, prompt = start_task(fake_server, project_dir)
+    crashed_queue(db_path, task_id)
+    prompt.join()  # finishes while no runner is watching
+
+    code, output = run_queue(fake_server, project_dir, db_path, engine)
+
+    assert code == 0, output
+    assert f"Re-attached to task {task_id} (state=READY_FOR_REVIEW)" in output
+    assert job_counts(db_path)["done"] == 1
+    stats = fake_server.stats()
+    assert stats["tasks_created"] == 1
+    assert stats["POST /api/run-prompt"] == 1
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_interrupted_task_is_run_again(fake_server, tmp_path, engine):
+    project_dir, db_path = str(tmp_path), tmp_path / "queue.db"
+    task_id, prompt = start_task(fake_server, project_dir)
+    crashed_queue(db_path, task_id)
+    requests.post(fake_server.api + "/project/interrupt", json={"taskId": task_id}, timeout=5)
+    prompt.join()
+    wait_for_state(fake_server, project_dir, task_id, "INTERRUPTED")
+
+    code, output = run_queue(fake_server, project_dir, db_path, engine)
+
+    assert code == 0, output
+    assert f"Task {task_id} is INTERRUPTED — attempt 1 runs again" in output
+    assert job_counts(db_path)["done"] == 1
+    stats = fake_server.stats()
+    assert stats["tasks_created"] == 2
+    assert stats["POST /api/run-prompt"] == 2
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_missing_task_is_run_again(fake_server, tmp_path, engine):
+    project_dir, db_path = str(tmp_path), tmp_path / "queue.db"
+    crashed_queue(db_path, "no-such-task")
+
+    code, output = run_queue(fake_server, project_dir, db_path, engine)
+
+    assert code == 0, output
+    assert "Task no-such-task is gone — attempt 1 runs again" in output
+    assert job_counts(db_path)["done"] == 1
+    assert fake_server.stats()["tasks_created"] == 1
+
+
+def test_one_runner_per_queue_file(fake_server, tmp_path):
+    db_path = tmp_path / "queue.db"
+    store = JobStore(str(db_path))
+    try:
+        with pytest.raises(RuntimeError, match="in use by another runner"):
+            JobStore(str(db_path))
+        code, output = run_queue(fake_server, str(tmp_path), db_path, "threads")
+        assert code == 1
+        assert "in use by another runner" in output
+    finally:
+        store.close()
+    JobStore(str(db_path)).close()  # free again once the first runner is gone
+
+
+def test_pending_order(tmp_path):
+    store = JobStore(str(tmp_path / "queue.db"))
+    try:
+        store.add([{"id": "low", "prompt": "p"}, {"id": "high", "prompt": "p", "priority": 5},
+                   {"id": "crashed", "prompt": "p", "priority": -1}, {"id": "done", "prompt": "p"}])
+        crashed = {"id": "crashed"}
+        store.started(crashed)
+        store.progress(crashed, "attempt_start", {"attempt": 2, "task_id": "t-1"})
+        store.started({"id": "done"})
+        store.finished({"id": "done"}, {"success": True, "failure_reason": None, "attempts": 1})
+
+        jobs = store.pending()
+        assert [job["id"] for job in jobs] == ["crashed", "high", "low"]
+        assert jobs[0]["resume"] == {"task_id": "t-1", "attempt": 2}
+        assert store.active_task_ids() == {"t-1"}
+        assert store.add([{"id": "low", "prompt": "again"}]) == 0
+        assert store.counts() == {"queued": 2, "running": 1, "done": 1, "failed": 0}
+    finally:
+        store.close()
+
+
+def reattach_ctx(server, project_dir, retries):
+    return SimpleNamespace(aiderdesk=HttpClient(server.api, "admin", "admin", retries=retries,
+                                                backoff=0.05),
+                           monitor=EventMonitor(server.base_url, project_dir), io=THREAD_IO,
+                           project_dir=project_dir)
+
+
+def resumed_job(task_id):
+    return {"id": "job-1", "prompt": "Say hello", "resume": {"task_id": task_id, "attempt": 1}}
+
+
+def test_failed_listing_keeps_the_tasks(start_fake_server, tmp_path):
+    server = start_fake_server("--fail-task-list", "100")
+    ctx = reattach_ctx(server, str(tmp_path), retries=1)
+    job = resumed_job("maybe-alive")
+
+    run_sync(reattach_jobs(ctx, [job]))
+
+    assert server.stats()["task_lists_failed"] == 2  # retried once
+    assert job["resume"]["task_id"] == "maybe-alive"  # run_prompt() waits on it
+    assert "maybe-alive" in ctx.monitor.tasks
+
+
+def test_listing_is_retried(start_fake_server, tmp_path):
+    server = start_fake_server("--fail-task-list", "1")
+    project_dir = str(tmp_path)
+    task_id = requests.post(server.api + "/project/tasks/new",
+                            json={"projectDir": project_dir}, timeout=5).json()["id"]
+    ctx = reattach_ctx(server, project_dir, retries=2)
+    jobs = [resumed_job(task_id), dict(resumed_job("gone"), id="job-2")]
+
+    run_sync(reattach_jobs(ctx, jobs))
+
+    assert server.stats()["task_lists_failed"] == 1
+    assert jobs[0]["resume"]["task_id"] == task_id
+    assert jobs[1]["resume"]["task_id"] is None  # absent from a good listing: runs again
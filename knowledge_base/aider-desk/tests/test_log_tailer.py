@@ -0,0 +1,107 @@
+"""LogTailer: following a log from its end through partial lines, truncation and rotation."""
+
+import os
+import time
+from datetime import datetime
+
+from ollama_prompt import LogTailer, log_activity_age, start_log_tailer
+
+
+def append(path, text):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def opened(path, label="AIDERDESK"):
+    tailer = LogTailer(str(path), label)
+    assert tailer.open()
+    return tailer
+
+
+def test_starts_at_the_end_and_buffers_partial_lines(tmp_path, capsys):
+    path = tmp_path / "main.log"
+    append(path, "old line\n")
+    tailer = opened(path)
+
+    append(path, "first\nsecond, half")
+    assert tailer.poll() is False
+    append(path, " done\n")
+    tailer.poll()
+
+    out = capsys.readouterr().out
+    assert "old line" not in out
+    assert "first" in out and "second, half done" in out
+    assert tailer.lines == 2
+    assert tailer.bytes == len("first\nsecond, half done\n")
+    assert log_activity_age("AIDERDESK") < 5
+
+
+def test_poll_stops_early_after_max_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr("ollama_prompt.LOG_READ_SIZE", 8)
+    path = tmp_path / "main.log"
+    append(path, "")
+    tailer = opened(path)
+    append(path, "".join(f"line {i}\n" for i in range(10)))
+    assert tailer.poll(max_blocks=2) is True
+    assert tailer.poll() is False
+    assert tailer.lines == 10
+
+
+def test_truncation_reads_from_the_start(tmp_path, capsys):
+    path = tmp_path / "main.log"
+    append(path, "a long line before the truncation\n")
+    tailer = opened(path)
+    with open(path, "w") as f:
+        f.write("after\n")
+    tailer.poll()
+    assert tailer.truncations == 1
+    assert "after" in capsys.readouterr().out
+
+
+def test_rotation_follows_the_new_file(tmp_path, capsys):
+    path = tmp_path / "main.log"
+    append(path, "")
+    tailer = opened(path)
+    append(path, "before rotation\n")
+    os.rename(path, tmp_path / "main.log.1")
+    tailer.poll()
+    append(path, "in the new file\n")
+    tailer.poll()
+
+    out = capsys.readouterr().out
+    assert "before rotation" in out and "in the new file" in out
+    assert tailer.rotations == 1
+    tailer.close()
+
+
+def test_dated_path_is_expanded(tmp_path):
+    tailer = LogTailer(str(tmp_path / "combined-%Y-%m-%d.log"), "AIDERDESK")
+    assert tailer.path == str(tmp_path / datetime.now().strftime("combined-%Y-%m-%d.log"))
+    assert not tailer.open()
+
+
+def test_ollama_error_lines_are_flagged(tmp_path, capsys):
+    path = tmp_path / "server.log"
+    append(path, "")
+    tailer = opened(path, "OLLAMA")
+    append(path, "level=INFO msg=\"listening\"\nlevel=WARN msg=\"CUDA error: device busy\"\n")
+    tailer.poll()
+
+    assert tailer.matches == 1
+    assert "⚠️  level=WARN" in capsys.readouterr().out
+    assert tailer.stats()["matches"] == 1 and tailer.stats()["lines"] == 2
+
+
+def test_background_tailer(tmp_path, capsys):
+    path = tmp_path / "main.log"
+    append(path, "")
+    tailer = start_log_tailer(str(path), "AIDERDESK")
+    try:
+        append(path, "from the thread\n")
+        deadline = time.time() + 5
+        while tailer.lines == 0 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        tailer.stop_event.set()
+    assert tailer.lines == 1 and tailer.mode in ("inotify", "poll")
+    assert start_log_tailer(str(tmp_path / "missing.log"), "AIDERDESK").mode == "off"
@@ -0,0 +1,85 @@
+"""Prometheus metrics: the registry, the text exposition, the textfile and /metrics."""
+
+import requests
+
+from ollama_prompt import METRIC_FAMILIES, Metrics, TaskState
+
+MODEL = "ollama/qwen2.5-coder:32b"
+
+
+def sample_lines(text, name):
+    return [line for line in text.splitlines() if line.startswith(f"ollama_prompt_{name}")]
+
+
+def test_every_family_is_declared_even_without_samples():
+    text = Metrics(MODEL, "code", None).render()
+    for name, (kind, _, _) in METRIC_FAMILIES.items():
+        assert f"# TYPE ollama_prompt_{name} {kind}" in text
+
+
+def test_counters_carry_the_base_labels():
+    metrics = Metrics(MODEL, "code", None)
+    metrics.inc("prompts_total", outcome="success")
+    metrics.inc("prompts_total", outcome="success")
+    metrics.inc("prompts_total", model="ollama/llama3:8b", outcome="failed", reason=None)
+
+    assert sample_lines(metrics.render(), "prompts_total") == [
+        'ollama_prompt_prompts_total{edit_format="default",mode="code",'
+        'model="ollama/llama3:8b",outcome="failed"} 1',
+        'ollama_prompt_prompts_total{edit_format="default",mode="code",'
+        'model="ollama/qwen2.5-coder:32b",outcome="success"} 2',
+    ]
+
+
+def test_histograms_are_cumulative():
+    metrics = Metrics(MODEL, "code", "diff")
+    for value in (0.3, 4.0, 900.0):
+        metrics.observe("completion_seconds", value)
+    lines = sample_lines(metrics.render(), "completion_seconds")
+    labels = 'edit_format="diff",mode="code",model="ollama/qwen2.5-coder:32b"'
+    assert f'ollama_prompt_completion_seconds_bucket{{{labels},le="0.25"}} 0' in lines
+    assert f'ollama_prompt_completion_seconds_bucket{{{labels},le="0.5"}} 1' in lines
+    assert f'ollama_prompt_completion_seconds_bucket{{{labels},le="5"}} 2' in lines
+    assert f'ollama_prompt_completion_seconds_bucket{{{labels},le="600"}} 2' in lines
+    assert f'ollama_prompt_completion_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f"ollama_prompt_completion_seconds_sum{{{labels}}} 904.3" in lines
+    assert f"ollama_prompt_completion_seconds_count{{{labels}}} 3" in lines
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics('say "hi"\\\n', "code", None)
+    metrics.inc("retries_total")
+    [line] = sample_lines(metrics.render(), "retries_total")
+    assert 'model="say \\"hi\\"\\\\\\n"' in line
+
+
+def test_record_attempt(tmp_path):
+    metrics = Metrics(MODEL, "code", None, textfile=str(tmp_path / "ollama_prompt.prom"))
+    state = TaskState("task-1")
+    state.chunks_received = 40
+    metrics.record_attempt(MODEL, 2, state, "failed", "partial",
+                           {"first_chunk": 1.2, "retry_latency": 0.4}, {"task_chunks_per_s": 12.0})
+
+    text = open(metrics.textfile).read()
+    assert text == metrics.render()
+    assert len(sample_lines(text, "retries_total")) == 1
+    assert 'reason="partial"} 1' in "\n".join(sample_lines(text, "failures_total"))
+    assert sample_lines(text, "chunks_total")[0].endswith(" 40")
+    assert sample_lines(text, "completion_seconds") == []
+    assert any(line.endswith(" 1") for line in sample_lines(text, "chunks_per_second_count"))
+
+
+def test_serves_metrics_over_http():
+    metrics = Metrics(MODEL, "code", None)
+    metrics.serve("127.0.0.1", 0)
+    try:
+        metrics.record_http("aiderdesk", "GET /settings", 0.02, error=True)
+        url = f"http://127.0.0.1:{metrics.server.server_address[1]}"
+        r = requests.get(url + "/metrics", timeout=5)
+        assert r.status_code == 200
+        assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert 'endpoint="GET /settings"' in r.text
+        assert sample_lines(r.text, "http_errors_total")[0].endswith(" 1")
+        assert requests.get(url + "/other", timeout=5).status_code == 404
+    finally:
+        metrics.close()
@@ -0,0 +1,150 @@
+"""Ollama log events: parsing server.log lines, attributing them to attempts, classification."""
+
+import pytest
+
+import ollama_prompt as op
+from ollama_prompt import (FailureReason, OllamaLogEvents, TaskState, classify_failure,
+                           go_duration, parse_ollama_event)
+
+
+# ── parse_ollama_event ──────────────────────────────────────────────────────
+
+def test_parse_request_line():
+    line = '[GIN] 2024/08/06 - 10:20:41 | 200 |  3.021554916s |  127.0.0.1 | POST  "/api/chat"'
+    event = parse_ollama_event(line, at=12.5)
+    assert event["event"] == OllamaLogEvents.REQUEST
+    assert event["at"] == 12.5
+    assert event["status"] == 200
+    assert event["duration"] == pytest.approx(3.021554916)
+    assert (event["method"], event["path"]) == ("POST", "/api/chat")
+
+
+def test_parse_out_of_memory_wins_over_runner_crash():
+    line = ('time=2024-08-06T10:20:41.000+02:00 level=ERROR source=server.go '
+            'msg="llama runner process has terminated" error="cudaMalloc failed: out of memory"')
+    event = parse_ollama_event(line, at=1.0)
+    assert event["event"] == OllamaLogEvents.OUT_OF_MEMORY
+    assert event["error"] == "cudaMalloc failed: out of memory"
+    assert OllamaLogEvents.is_fatal(event)
+
+
+def test_parse_runner_crash():
+    event = parse_ollama_event('level=ERROR msg="llama runner process no longer running"', at=1.0)
+    assert event["event"] == OllamaLogEvents.RUNNER_CRASHED
+
+
+def test_parse_context_overflow_counts():
+    line = 'level=WARN source=runner.go msg="truncating input prompt" limit=2048 prompt=4096 keep=4 new=2048'
+    event = parse_ollama_event(line, at=1.0)
+    assert event["event"] == OllamaLogEvents.CONTEXT_EXCEEDED
+    assert (event["limit"], event["prompt"], event["keep"], event["new"]) == (2048, 4096, 4, 2048)
+
+
+def test_parse_model_load():
+    loading = parse_ollama_event('level=INFO msg="loading model" model="/models/blobs/sha256-abc"', at=1.0)
+    assert loading["event"] == OllamaLogEvents.MODEL_LOADING
+    assert loading["model"] == "/models/blobs/sha256-abc"
+    loaded = parse_ollama_event('level=INFO msg="llama runner started in 4.52 seconds"', at=2.0)
+    assert loaded["event"] == OllamaLogEvents.MODEL_LOADED
+    assert loaded["seconds"] == 4.52
+    assert op.model_load_in([loading]) and op.model_load_in([loaded])
+
+
+def test_parse_other_lines():
+    assert parse_ollama_event('level=INFO msg="inference compute" id=0 library=cuda') is None
+    assert parse_ollama_event("") is None
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("3.021554916s", 3.021554916), ("512.3µs", 512.3e-6), ("1m2.5s", 62.5), ("15ms", 0.015),
+])
+def test_go_duration(text, seconds):
+    assert go_duration(text) == pytest.approx(seconds)
+    assert go_duration("n/a") is None
+
+
+@pytest.mark.parametrize("line, kind", [
+    ('level=ERROR msg="failed to allocate 2.0 GiB"', OllamaLogEvents.OUT_OF_MEMORY),
+    ('msg="model requires more system memory (40 GiB) than is available"',
+     OllamaLogEvents.OUT_OF_MEMORY),
+    ('level=ERROR msg="input exceeds maximum context length"', OllamaLogEvents.CONTEXT_EXCEEDED),
+    ('level=ERROR msg="llama runner terminated" error="signal: killed"',
+     OllamaLogEvents.RUNNER_CRASHED),
+    ('level=INFO msg="starting llama server" cmd="/usr/bin/ollama runner"',
+     OllamaLogEvents.MODEL_LOADING),
+    ('level=INFO msg="new model will fit in available VRAM in single GPU"',
+     OllamaLogEvents.MODEL_LOADING),
+])
+def test_event_rules(line, kind):
+    assert parse_ollama_event(line, at=1.0)["event"] == kind
+
+
+def test_one_pass_regex_agrees_with_the_rules():
+    lines = ['[GIN] 2024/08/06 | 200 | 1s | 127.0.0.1 | POST "/api/chat"',
+             'level=INFO msg="loading model"', 'level=INFO msg="inference compute"']
+    hits = [bool(op.OLLAMA_EVENT_RE.search(line.lower())) for line in lines]
+    assert hits == [parse_ollama_event(line) is not None for line in lines]
+
+
+# ── OllamaLogEvents ─────────────────────────────────────────────────────────
+
+def event(kind, at=1.0):
+    return {"event": kind, "at": at, "line": ""}
+
+
+def test_fatal_events_signal_every_watched_attempt():
+    events, a, b = OllamaLogEvents(), TaskState("a"), TaskState("b")
+    events.watch(a)
+    events.watch(b)
+    events.add(event(OllamaLogEvents.OUT_OF_MEMORY))
+    assert "ollama_log" in a.signals and "ollama_log" in b.signals
+
+    events.unwatch(b)
+    c = TaskState("c")
+    events.add(event(OllamaLogEvents.MODEL_LOADED))  # not fatal
+    assert "ollama_log" not in c.signals
+
+
+def test_context_overflow_is_ambiguous_with_several_attempts():
+    events, a = OllamaLogEvents(), TaskState("a")
+    events.watch(a)
+    events.add(event(OllamaLogEvents.CONTEXT_EXCEEDED, at=1.0))
+    assert "ollama_log" in a.signals
+
+    events.watch(TaskState("b"))
+    events.add(event(OllamaLogEvents.CONTEXT_EXCEEDED, at=2.0))
+    first, second = events.since(0)
+    assert OllamaLogEvents.is_fatal(first)
+    assert second["ambiguous"] and not OllamaLogEvents.is_fatal(second)
+
+
+def test_since_filters_by_time_and_kind():
+    events = OllamaLogEvents()
+    for at, kind in [(1, OllamaLogEvents.REQUEST), (2, OllamaLogEvents.MODEL_LOADING),
+                     (3, OllamaLogEvents.REQUEST)]:
+        events.add(event(kind, at))
+    assert [e["at"] for e in events.since(2)] == [2, 3]
+    assert [e["at"] for e in events.since(0, kinds=(OllamaLogEvents.REQUEST,))] == [1, 3]
+
+
+# ── classify_failure ────────────────────────────────────────────────────────
+
+def test_a_fatal_log_event_outranks_the_heuristics():
+    state = TaskState("a")
+    state.chunks_received = 5
+    log_events = [event(OllamaLogEvents.MODEL_LOADING), event(OllamaLogEvents.RUNNER_CRASHED)]
+    assert classify_failure(state, {"error": "500"}, 10, log_events=log_events) == \
+        FailureReason.RUNNER_CRASHED
+
+
+def test_a_model_load_explains_an_attempt_without_chunks():
+    state = TaskState("a")
+    assert classify_failure(state, {}, 120, log_events=[event(OllamaLogEvents.MODEL_LOADED)]) == \
+        FailureReason.MODEL_LOADING
+    assert classify_failure(state, {}, 120) == FailureReason.COLD_START
+
+
+def test_ambiguous_events_do_not_classify():
+    state = TaskState("a")
+    overflow = dict(event(OllamaLogEvents.CONTEXT_EXCEEDED), ambiguous=True)
+    assert classify_failure(state, {}, 5, log_events=[overflow]) == FailureReason.CONNECTION_ERROR
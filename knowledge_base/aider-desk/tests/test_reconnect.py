@@ -0,0 +1,99 @@
+"""Socket.IO reconnect and re-sync: what a reconnect applies to the tracked tasks."""
+
+import time
+
+import requests
+
+import ollama_prompt as op
+from ollama_prompt import EventMonitor, HttpClient, Metrics
+
+
+def monitor_with(*task_ids, base_url="http://localhost:1", project_dir="/tmp/project"):
+    monitor = EventMonitor(base_url, project_dir, reconnect_delay=0.1, reconnect_delay_max=0.2)
+    return monitor, [monitor.track(task_id) for task_id in task_ids]
+
+
+def test_resync_completes_tasks_that_finished_while_disconnected(monkeypatch):
+    monitor, (done, running, gone) = monitor_with("done", "running", "gone")
+    monkeypatch.setattr(op, "clock", lambda: 500.0)
+    running.last_activity = 100.0
+    running.wake.clear()
+
+    found = monitor._apply_resync([
+        {"id": "done", "state": "READY_FOR_REVIEW", "completedAt": "2026-01-01T00:00:00Z"},
+        {"id": "running", "state": "IN_PROGRESS"},
+        {"id": "someone-else", "state": "DONE"},
+        "not a task",
+    ])
+
+    assert found == 1 and monitor.resynced == 1
+    assert done.completed.is_set() and "completed" in done.signals
+    # The synthetic task-updated goes through _on_event like a streamed one
+    assert monitor.event_counts == {"task-updated": 1}
+    # An unfinished task's chunk-gap clock restarts: the gap spans the outage
+    assert not running.completed.is_set()
+    assert running.last_activity == 500.0 and running.wake.is_set()
+    assert not gone.completed.is_set()
+
+
+def test_resync_skips_tasks_already_completed():
+    monitor, (state,) = monitor_with("done")
+    state.completed.set()
+    assert monitor._apply_resync([{"id": "done", "state": "DONE"}]) == 0
+    assert monitor.event_counts == {}
+
+
+def test_resync_needs_a_client_and_tracked_tasks():
+    monitor, _ = monitor_with("task-1")
+    assert monitor.resync() == 0  # resync_client not set
+    monitor, _ = monitor_with()
+    monitor.resync_client = HttpClient("http://127.0.0.1:9")
+    assert monitor.resync() == 0
+
+
+def test_resync_survives_a_failed_listing():
+    monitor, (state,) = monitor_with("task-1")
+    monitor.resync_client = HttpClient("http://127.0.0.1:9", retries=0)
+    assert monitor.resync() == 0
+    assert not state.completed.is_set()
+
+
+def test_reconnects_are_counted():
+    monitor, _ = monitor_with()
+    monitor.sio.emit = lambda *args, **kwargs: None
+    monitor.resync = lambda: 0
+    monitor.metrics = Metrics("m", "code", None)
+    monitor._on_connect()
+    monitor.disconnected_at = op.clock() - 2
+    monitor._on_connect()
+
+    assert monitor.event_stats()["reconnects"] == 1
+    text = monitor.metrics.render()
+    assert 'ollama_prompt_socketio_connects_total{edit_format="default",mode="code",model="m"} 2' in text
+    assert 'ollama_prompt_socketio_reconnects_total{edit_format="default",mode="code",model="m"} 1' in text
+
+
+def test_reconnects_after_a_server_side_drop(start_fake_server, tmp_path):
+    server = start_fake_server("--sio-drop-every", "0.5", "--sio-down-for", "0.3",
+                               "--chunks", "40", "--chunk-interval", "0.05")
+    project_dir = str(tmp_path)
+    monitor, _ = monitor_with(base_url=server.base_url, project_dir=project_dir)
+    monitor.resync_client = HttpClient(server.api, "admin", "admin")
+    assert monitor.connect("admin", "admin")
+    try:
+        task_id = requests.post(server.api + "/project/tasks/new",
+                                json={"projectDir": project_dir}, timeout=5).json()["id"]
+        state = monitor.track(task_id)
+        requests.post(server.api + "/run-prompt", json={"taskId": task_id, "prompt": "hi"},
+                      timeout=10)
+        # Whatever the stream missed, the re-sync after the next reconnect applies
+        assert state.completed.wait(10)
+        deadline = time.time() + 5
+        while monitor.connects < 2 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        monitor.disconnect()
+
+    stats = server.stats()
+    assert monitor.connects >= 2
+    assert stats["sio_drops"] >= 1 and stats["sio_subscribes"] >= 2
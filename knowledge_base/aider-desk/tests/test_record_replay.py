@@ -0,0 +1,97 @@
+"""--record / --replay: the recording format and replaying it through AttemptWatch."""
+
+import re
+
+import pytest
+
+import ollama_prompt as op
+from ollama_prompt import EventMonitor, Recorder, read_recording, replay_recording
+
+T0 = 1_700_000_000.0
+
+
+@pytest.mark.parametrize("name", ["events.jsonl", "events.jsonl.gz"])
+def test_recorder_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    monitor = EventMonitor("http://localhost:1", "/tmp/project")
+    monitor.recorder = Recorder(path, {"project_dir": "/tmp/project", "model": "m"})
+    monitor.track("task-1")
+    monitor.mark("attempt", T0, task_id="task-1", attempt=1)
+    monitor._on_event({"type": "response-chunk", "data": {"taskId": "task-1", "chunk": "a"}})
+    monitor._on_event({"type": "response-chunk", "data": {"taskId": "other", "chunk": "b"}})
+    monitor.recorder.close()
+
+    header, mark, *events = read_recording(path)
+    assert header["type"] == "header" and header["version"] == Recorder.VERSION
+    assert header["project_dir"] == "/tmp/project"
+    assert mark == {"t": T0, "mark": "attempt", "task_id": "task-1", "attempt": 1}
+    # Every raw payload is kept, including other tasks' events
+    assert [e["e"]["data"]["taskId"] for e in events] == ["task-1", "other"]
+    assert monitor.recorder.events == 2
+
+
+def write_recording(path, *records):
+    recorder = Recorder(str(path), {"project_dir": "/tmp/project"})
+    for record in records:
+        recorder._write(record)
+    recorder.close()
+    return str(path)
+
+
+def attempt_mark(timeout=10, **fields):
+    return {"t": T0, "mark": "attempt", "task_id": "task-1", "id": "p1", "attempt": 1,
+            "timeout": timeout, **fields}
+
+
+def chunk(t):
+    return {"t": T0 + t, "e": {"type": "response-chunk", "data": {"taskId": "task-1",
+                                                                    "chunk": "tok "}}}
+
+
+def replayed(capsys):
+    out = capsys.readouterr().out
+    return re.search(r"recorded=(.+?)\s+replayed=(\S+)\s+(\S*)\s*chunks=(\d+)", out).groups(), out
+
+
+def test_replay_of_a_completed_attempt(tmp_path, capsys):
+    path = write_recording(
+        tmp_path / "done.jsonl", attempt_mark(), chunk(0.5), chunk(1.0), chunk(1.5),
+        {"t": T0 + 2.0, "e": {"type": "task-updated",
+                              "data": {"id": "task-1", "state": "READY_FOR_REVIEW"}}},
+        {"t": T0 + 2.1, "mark": "attempt_end", "task_id": "task-1", "outcome": "completed"})
+
+    assert replay_recording(path, speed=0) == 0
+
+    (recorded, outcome, reason, chunks), out = replayed(capsys)
+    assert (recorded, outcome, reason, chunks) == ("completed", "completed", "", "3")
+    assert "first_chunk=0.5 completion=2.0" in out
+    assert op.clock is op.time.time  # the live clock is back
+
+
+def test_replay_runs_a_cut_off_attempt_to_its_timeout(tmp_path, capsys):
+    path = write_recording(tmp_path / "cut.jsonl", attempt_mark(timeout=10), chunk(0.5), chunk(1.0))
+
+    assert replay_recording(path, speed=0) == 0
+
+    (recorded, outcome, reason, chunks), _ = replayed(capsys)
+    assert (recorded, outcome, reason, chunks) == ("(cut off)", "timeout", "partial", "2")
+
+
+def test_replay_applies_the_recorded_stall_verdict(tmp_path, capsys):
+    path = write_recording(
+        tmp_path / "stall.jsonl",
+        attempt_mark(timeout=120, stall_policy="abort", stall_timeout=5), chunk(0.5),
+        {"t": T0 + 6.0, "mark": "stall_check", "task_id": "task-1", "confirmed": True,
+         "why": "model loaded but no chunks"})
+
+    replay_recording(path, speed=0)
+
+    (_, outcome, reason, _), out = replayed(capsys)
+    assert (outcome, reason) == ("stalled", "stalled")
+    assert "s saved)" in out
+
+
+def test_replay_of_an_unreadable_file(tmp_path):
+    assert replay_recording(str(tmp_path / "missing.jsonl")) == 1
+    empty = write_recording(tmp_path / "empty.jsonl")
+    assert replay_recording(empty) == 1
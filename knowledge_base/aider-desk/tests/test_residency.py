@@ -0,0 +1,161 @@
+"""--manage-residency: job ordering, unload / preload plans and waiting for in-flight loads."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from ollama_prompt import (THREAD_IO, HttpClient, ModelResidency, model_switches,
+                           order_jobs_by_model, residency_acquire, run_sync)
+
+try:
+    import ollama_prompt_async as opa
+except ImportError:
+    opa = None
+
+DEFAULT = "ollama/a:7b"
+
+
+def jobs(*models, **fields):
+    return [{"id": f"p{i}", "model": m, **fields} for i, m in enumerate(models)]
+
+
+# ── Ordering ────────────────────────────────────────────────────────────────
+
+def test_jobs_are_grouped_by_model_resident_first():
+    batch = jobs("ollama/a:7b", "ollama/b:7b", "ollama/a:7b", "ollama/b:7b")
+    ordered = order_jobs_by_model(batch, DEFAULT, loaded={"b:7b"})
+    assert [j["id"] for j in ordered] == ["p1", "p3", "p0", "p2"]
+    assert (model_switches(batch, DEFAULT), model_switches(ordered, DEFAULT)) == (3, 1)
+
+
+def test_grouping_never_crosses_priorities_and_resumed_jobs_stay_first():
+    batch = [
+        {"id": "low-a", "model": "ollama/a:7b"},
+        {"id": "high-b", "model": "ollama/b:7b", "priority": 5},
+        {"id": "resumed", "model": "ollama/a:7b", "resume": {"task_id": "t1"}},
+        {"id": "high-a", "model": "ollama/a:7b", "priority": 5},
+        {"id": "low-b", "model": "ollama/b:7b"},
+        {"id": "high-b2", "priority": 5},  # --model
+    ]
+    ordered = [j["id"] for j in order_jobs_by_model(batch, DEFAULT)]
+    # The second level starts with a:7b, the model the resumed job ends on
+    assert ordered == ["resumed", "high-a", "high-b2", "high-b", "low-b", "low-a"]
+
+
+# ── ModelResidency ──────────────────────────────────────────────────────────
+
+def residency(queue, running=(), sizes=None, budget_gb=None):
+    return ModelResidency(jobs(*queue), DEFAULT, [{"name": n, "size": 0} for n in running],
+                          sizes, budget_gb)
+
+
+def test_unload_plan_drops_idle_models_nobody_needs():
+    r = residency(["ollama/a:7b", "ollama/b:7b"], running=["c:7b", "d:7b"])
+    r.job_started("d:7b")
+    assert r.unload_plan("a:7b") == ["c:7b"]   # d:7b has a prompt in flight
+    assert r.unload_plan("a:7b") == []         # already being unloaded
+    r.observe([{"name": "d:7b"}])
+    assert (r.unloads, r.evictions) == (1, 0)
+
+
+def test_unload_plan_with_a_budget_drops_the_model_needed_latest():
+    gb = 1e9
+    r = residency(["ollama/c:7b", "ollama/a:7b", "ollama/b:7b"], running=["a:7b", "b:7b"],
+                  sizes={"a:7b": 20 * gb, "b:7b": 20 * gb, "c:7b": 20 * gb}, budget_gb=45)
+    assert r.unload_plan("c:7b") == ["b:7b"]
+    assert r.unload_plan("a:7b") == []  # resident
+
+
+def test_next_preload_needs_a_budget_and_room():
+    gb = 1e9
+    sizes = {"a:7b": 20 * gb, "b:7b": 20 * gb}
+    assert residency(["ollama/a:7b", "ollama/b:7b"], ["a:7b"], sizes).next_preload("a:7b") is None
+
+    r = residency(["ollama/a:7b", "ollama/b:7b"], ["a:7b"], sizes, budget_gb=30)
+    assert r.next_preload("a:7b") is None  # 40GB would not fit in 30
+
+    r = residency(["ollama/a:7b", "ollama/b:7b"], ["a:7b"], sizes, budget_gb=45)
+    assert r.next_preload("a:7b") == "b:7b"
+    assert r.next_preload("a:7b") is None  # already loading
+    assert not r.begin_load("b:7b") and r.load_pending("b:7b") is not None
+    assert r.summary()["model_preloads"] == 1
+
+
+def test_begin_load_hands_others_the_pending_load():
+    r = residency(["ollama/a:7b"])
+    assert r.begin_load("a:7b")
+    assert not r.begin_load("a:7b")
+    pending = r.load_pending("a:7b")
+    assert not pending.is_set()
+    r.load_done("a:7b")
+    assert pending.is_set()
+    assert r.load_pending("a:7b") is None
+    assert r.begin_load("a:7b")  # not resident yet: load again
+
+
+def test_begin_load_skips_resident_models():
+    r = residency(["ollama/a:7b"], running=["a:7b"])
+    assert not r.begin_load("a:7b")
+    assert r.load_pending("a:7b") is None
+
+
+# ── Waiting for an in-flight load ───────────────────────────────────────────
+
+def set_later(event, delay):
+    threading.Timer(delay, event.set).start()
+
+
+def test_wait_event_on_threads():
+    event = threading.Event()
+    assert THREAD_IO.wait_event(event, 0.05).value is False
+    set_later(event, 0.05)
+    assert THREAD_IO.wait_event(event, 5).value is True
+
+
+@pytest.mark.skipif(opa is None or opa.aiohttp is None, reason="the asyncio engine needs aiohttp")
+def test_wait_event_does_not_block_the_loop():
+    io = opa.LoopIO()
+    event = threading.Event()
+    ticks = []
+
+    async def tick():
+        while not event.is_set():
+            ticks.append(time.time())
+            await opa.asyncio.sleep(0.01)
+
+    async def both():
+        io.spawn(tick())
+        set_later(event, 0.2)
+        return await io.wait_event(event, 5)
+
+    try:
+        assert io.run(both()) is True
+    finally:
+        io.close()
+    assert len(ticks) > 5
+
+
+def test_second_job_waits_for_the_load_in_progress(start_fake_server):
+    server = start_fake_server("--models", "a:7b", "--model-load-time", "0.5")
+    ollama = HttpClient(server.ollama_url)
+    ctx = SimpleNamespace(residency=residency(["ollama/a:7b", "ollama/a:7b"]), ollama=ollama,
+                          io=THREAD_IO, model=DEFAULT, args=SimpleNamespace(warmup_timeout=10))
+    resident_when_done = []
+
+    def acquire():
+        run_sync(residency_acquire(ctx, {"id": "p"}))
+        models = requests.get(server.ollama_url + "/api/ps", timeout=5).json()["models"]
+        resident_when_done.append([m["name"] for m in models])
+
+    workers = [threading.Thread(target=acquire) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+        time.sleep(0.1)  # the second one finds the first one's load in progress
+    for worker in workers:
+        worker.join(10)
+
+    assert resident_when_done == [["a:7b"], ["a:7b"]]
+    assert ctx.residency.loads == 1
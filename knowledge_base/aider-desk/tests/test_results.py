@@ -0,0 +1,75 @@
+"""--results-json / --results-jsonl: record envelopes and appending across runs."""
+
+import json
+from types import SimpleNamespace
+
+from ollama_prompt import ResultsWriter, finish_results, make_results_writer, prompt_hash
+
+
+def results_args(tmp_path, json_file=True, jsonl_file=True):
+    return SimpleNamespace(
+        results_json=str(tmp_path / "results.json") if json_file else None,
+        results_jsonl=str(tmp_path / "results.jsonl") if jsonl_file else None,
+        model="ollama/qwen2.5-coder:32b", mode="code", edit_format="diff", engine="threads")
+
+
+def one_run(args, exit_code=0):
+    writer = ResultsWriter(args)
+    writer.write("attempt", attempt=1, outcome="completed", phases={"completion": 1.5})
+    writer.write("prompt", id="p1", outcome="success")
+    finish_results(writer, exit_code, {"setup": 0.2})
+    return writer.envelope["run_id"]
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_no_writer_without_a_path(tmp_path):
+    assert make_results_writer(results_args(tmp_path, False, False)) is None
+    finish_results(None, 0, {})  # no-op
+
+
+def test_records_share_the_envelope(tmp_path):
+    args = results_args(tmp_path)
+    run_id = one_run(args)
+
+    records = read_jsonl(args.results_jsonl)
+    assert [r["type"] for r in records] == ["attempt", "prompt", "run"]
+    for record in records:
+        assert record["run_id"] == run_id
+        assert (record["model"], record["mode"], record["edit_format"], record["engine"]) == \
+            ("ollama/qwen2.5-coder:32b", "code", "diff", "threads")
+        assert "timestamp" in record
+    assert records[0]["phases"] == {"completion": 1.5}
+    assert records[2]["exit_code"] == 0
+
+    with open(args.results_json) as f:
+        assert json.load(f) == records
+
+
+def test_both_files_accumulate_across_runs(tmp_path):
+    args = results_args(tmp_path)
+    first, second = one_run(args), one_run(args, exit_code=1)
+
+    for records in (read_jsonl(args.results_jsonl), json.load(open(args.results_json))):
+        assert len(records) == 6
+        assert [r["run_id"] for r in records] == [first] * 3 + [second] * 3
+
+
+def test_unparsable_json_file_is_not_clobbered(tmp_path):
+    args = results_args(tmp_path, jsonl_file=False)
+    with open(args.results_json, "w") as f:
+        f.write("{not json")
+
+    run_id = one_run(args)
+
+    assert open(args.results_json).read() == "{not json"
+    assert len(json.load(open(f"{args.results_json}.{run_id}"))) == 3
+
+
+def test_prompt_hash_is_stable():
+    assert prompt_hash("Say hello") == prompt_hash("Say hello")
+    assert prompt_hash("Say hello") != prompt_hash("Say hello!")
+    assert len(prompt_hash("x")) == 64
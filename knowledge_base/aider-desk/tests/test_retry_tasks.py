@@ -0,0 +1,78 @@
+"""--retry-task new|reuse|prefetch: which task a retry runs in, against the stand-in server."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from ollama_prompt import (THREAD_IO, EventMonitor, HttpClient, TaskState, discard_prefetched,
+                           next_task, prefetch_task, run_sync, settled)
+
+JOB = {"id": "p1", "prompt": "hello"}
+
+
+def test_settled():
+    state = TaskState("task-1")
+    assert not settled(state, {"done": False})
+    assert settled(state, {"done": True})
+    state.completed.set()
+    assert settled(state, {"done": False})
+
+
+@pytest.fixture
+def retry_ctx(fake_server, tmp_path):
+    def _make(retry_task="new", context_file=()):
+        project_dir = str(tmp_path)
+        return SimpleNamespace(
+            aiderdesk=HttpClient(fake_server.api, "admin", "admin"), project_dir=project_dir,
+            monitor=EventMonitor(fake_server.base_url, project_dir), io=THREAD_IO,
+            model="ollama/qwen2.5-coder:32b", mode="code",
+            args=SimpleNamespace(retry_task=retry_task, context_file=list(context_file)))
+    return _make
+
+
+def new_task_id(ctx):
+    task_id, source = run_sync(next_task(ctx, JOB, 1, None, None))
+    assert source == "new" and task_id in ctx.monitor.tasks
+    return task_id
+
+
+def test_new_creates_a_task_per_attempt(retry_ctx, fake_server):
+    ctx = retry_ctx("new")
+    first = new_task_id(ctx)
+    second, source = run_sync(next_task(ctx, JOB, 2, first, None))
+    assert source == "new" and second != first
+    assert fake_server.tasks(ctx.project_dir)[second]["name"].startswith("Prompt #2 [p1]")
+
+
+def test_reuse_resets_a_settled_task(retry_ctx, fake_server):
+    ctx = retry_ctx("reuse")
+    first = new_task_id(ctx)
+    assert run_sync(next_task(ctx, JOB, 2, first, None)) == (first, "reset")
+    assert fake_server.stats()["tasks_reset"] == 1
+
+
+def test_reuse_falls_back_to_a_new_task(retry_ctx):
+    ctx = retry_ctx("reuse")
+    first = new_task_id(ctx)
+    # previous=None: the interrupted task did not settle
+    task_id, source = run_sync(next_task(ctx, JOB, 2, None, None))
+    assert source == "new" and task_id != first
+    # the reset is refused (the task is gone)
+    task_id, source = run_sync(next_task(ctx, JOB, 3, "deleted-task", None))
+    assert source == "new"
+
+
+def test_prefetched_task_is_used_for_the_retry(retry_ctx, fake_server):
+    ctx = retry_ctx("prefetch")
+    pending = prefetch_task(ctx, JOB, 2)
+    task_id, source = run_sync(next_task(ctx, JOB, 2, None, pending))
+    assert source == "prefetched"
+    assert task_id in fake_server.tasks(ctx.project_dir)
+
+
+def test_unused_prefetched_task_is_deleted(retry_ctx, fake_server):
+    ctx = retry_ctx("prefetch", context_file=["README.md"])
+    pending = prefetch_task(ctx, JOB, 2)
+    run_sync(discard_prefetched(ctx, pending))
+    assert fake_server.tasks(ctx.project_dir) == {}
+    assert ctx.monitor.tasks == {}
@@ -0,0 +1,102 @@
+"""--stall-policy abort: the stall verdict and AttemptWatch's abort / recheck decisions."""
+
+import time
+
+import ollama_prompt as op
+from ollama_prompt import AttemptWatch, FailureReason, TaskState, stall_verdict
+
+MODEL = "ollama/qwen2.5-coder:32b"
+LOADED = [{"name": "qwen2.5-coder:32b"}]
+
+
+# ── stall_verdict ───────────────────────────────────────────────────────────
+
+def quiet_state(seconds=40, last_chunk_ago=40, step_completed_ago=None):
+    now = op.clock()
+    state = TaskState("task-1")
+    state.last_activity = now - seconds
+    state.last_chunk_at = now - last_chunk_ago
+    if step_completed_ago is not None:
+        state.step_completed_at = now - step_completed_ago
+    return state
+
+
+def test_stall_confirmed_when_model_not_loaded():
+    confirmed, why = stall_verdict(quiet_state(), [], MODEL, log_age=1, stall_timeout=30)
+    assert confirmed
+    assert "not loaded" in why
+
+
+def test_stall_deferred_while_ollama_log_active():
+    confirmed, why = stall_verdict(quiet_state(), LOADED, MODEL, log_age=5, stall_timeout=30)
+    assert not confirmed
+    assert "log active" in why
+
+
+def test_stall_deferred_between_agent_steps():
+    state = quiet_state(last_chunk_ago=50, step_completed_ago=45)
+    confirmed, why = stall_verdict(state, LOADED, MODEL, log_age=None, stall_timeout=30)
+    assert not confirmed
+    assert "between agent steps" in why
+
+
+def test_stall_confirmed_when_loaded_and_silent():
+    confirmed, why = stall_verdict(quiet_state(seconds=40), LOADED, MODEL, log_age=60,
+                                   stall_timeout=30)
+    assert confirmed
+    assert "no chunks or Ollama log output for 40s" in why
+
+
+def test_stall_non_ollama_model_skips_residency_check():
+    confirmed, _ = stall_verdict(quiet_state(), [], "anthropic/claude", log_age=None,
+                                 stall_timeout=30)
+    assert confirmed
+
+
+# ── AttemptWatch ────────────────────────────────────────────────────────────
+
+def stalled_watch(stall_policy="abort", timeout=120, stale_timeout=5):
+    state = TaskState("task-1")
+    prompt_result = {"status": None, "error": None, "done": False}
+    watch = AttemptWatch(state, prompt_result, timeout, {}, start=time.time(),
+                         stale_timeout=stale_timeout, stall_policy=stall_policy)
+    state.chunks_received = 3
+    state.first_chunk_at = state.last_chunk_at = state.last_activity = watch.start + 1
+    return watch, state, prompt_result
+
+
+def test_warn_policy_never_aborts():
+    watch, _, _ = stalled_watch(stall_policy="warn")
+    assert watch.step(watch.start + 30) is None
+
+
+def test_abort_policy_reports_a_stall_after_the_window():
+    watch, _, _ = stalled_watch()
+    assert watch.step(watch.start + 5.5) is None
+    assert watch.step(watch.start + 6.5) == AttemptWatch.STALL
+
+
+def test_no_stall_once_run_prompt_has_returned():
+    watch, _, prompt_result = stalled_watch()
+    prompt_result.update(done=True, status=200)
+    assert watch.step(watch.start + 30) is None
+
+
+def test_unconfirmed_stalls_are_rechecked_then_aborted():
+    watch, _, _ = stalled_watch()
+    now = watch.start + 7
+    for _ in range(AttemptWatch.MAX_STALL_DEFERRALS):
+        assert watch.step(now) == AttemptWatch.STALL
+        assert watch.defer_stall(now, "Ollama log active")
+        assert watch.step(now + 1) is None
+        assert watch.wake_at() == now + 5
+        now += 5
+    assert watch.step(now) == AttemptWatch.STALL
+    assert not watch.defer_stall(now, "Ollama log active")
+
+
+def test_stall_report_records_the_time_saved():
+    watch, _, _ = stalled_watch(timeout=120)
+    assert watch.stall_report(watch.start + 20, "model not loaded") == FailureReason.STALLED
+    assert watch.time_saved == 100.0
+    assert watch.phases["stall_abort"] == 20.0
@@ -0,0 +1,84 @@
+"""Concurrent startup: the phase graph scheduler and its critical path."""
+
+import threading
+import time
+
+from ollama_prompt import critical_path, run_phase_graph
+
+
+def sleeper(seconds, result=None, log=None, name=None):
+    def _phase():
+        if log is not None:
+            log.append(name)
+        time.sleep(seconds)
+        return result
+    return _phase
+
+
+def test_independent_phases_run_concurrently():
+    graph = [("a", (), sleeper(0.3)), ("b", (), sleeper(0.3)), ("c", (), sleeper(0.3))]
+    t0 = time.time()
+    spans, failed = run_phase_graph(graph)
+    assert failed is None
+    assert set(spans) == {"a", "b", "c"}
+    assert time.time() - t0 < 0.8  # one after another would be 0.9s
+
+
+def test_phases_start_after_their_deps():
+    graph = [
+        ("health", (), sleeper(0.1)),
+        ("open", ("health",), sleeper(0.05)),
+        ("settings", ("open",), sleeper(0.01)),
+        ("cleanup", ("open",), sleeper(0.01)),
+    ]
+    spans, failed = run_phase_graph(graph)
+    assert failed is None
+    assert spans["open"][0] >= spans["health"][1]
+    assert spans["settings"][0] >= spans["open"][1]
+    assert spans["cleanup"][0] >= spans["open"][1]
+
+
+def test_a_failed_phase_stops_the_graph():
+    started = []
+    graph = [
+        ("health", (), sleeper(0.01, result=False)),
+        ("open", ("health",), sleeper(0, log=started, name="open")),
+    ]
+    spans, failed = run_phase_graph(graph)
+    assert failed == "health"
+    assert started == [] and spans == {}
+
+
+def test_a_crashing_phase_fails_without_waiting_for_the_others():
+    release = threading.Event()
+
+    def _crash():
+        raise RuntimeError("boom")
+
+    graph = [("slow", (), lambda: release.wait(5)), ("crash", (), _crash)]
+    t0 = time.time()
+    _, failed = run_phase_graph(graph)
+    release.set()
+    assert failed == "crash"
+    assert time.time() - t0 < 1
+
+
+def test_critical_path_follows_the_latest_dependency():
+    graph = [
+        ("aiderdesk_health", (), None),
+        ("ollama_health", (), None),
+        ("project_open", ("aiderdesk_health",), None),
+        ("project_settings", ("project_open",), None),
+        ("warm_up", ("ollama_health",), None),
+    ]
+    spans = {
+        "aiderdesk_health": (0.0, 0.1),
+        "ollama_health": (0.0, 0.2),
+        "project_open": (0.1, 0.3),
+        "project_settings": (0.3, 0.4),
+        "warm_up": (0.2, 2.0),
+    }
+    assert critical_path(graph, spans) == ["ollama_health", "warm_up"]
+
+    spans["warm_up"] = (0.2, 0.35)
+    assert critical_path(graph, spans) == ["aiderdesk_health", "project_open", "project_settings"]
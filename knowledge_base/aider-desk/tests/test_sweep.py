@@ -0,0 +1,69 @@
+"""sweep_ollama_prompt.py: the batch it writes, cell scheduling and the per-cell summary."""
+
+import json
+
+import sweep_ollama_prompt as sweep
+
+MODEL_A, MODEL_B = "ollama/a:7b", "ollama/b:7b"
+
+
+def test_write_jobs_repeats_each_prompt(tmp_path):
+    path = str(tmp_path / "jobs.jsonl")
+    jobs = [{"id": "p1", "prompt": "one", "priority": 2}, {"id": "p2", "prompt": "two"}]
+    assert sweep.write_jobs(path, jobs, 2) == 4
+    with open(path) as f:
+        written = [json.loads(line) for line in f]
+    assert [j["id"] for j in written] == ["p1#r1", "p1#r2", "p2#r1", "p2#r2"]
+    assert written[0] == {"id": "p1#r1", "prompt": "one", "priority": 2}
+
+
+def test_write_jobs_drops_a_prompts_own_model(tmp_path, capsys):
+    path = str(tmp_path / "jobs.jsonl")
+    jobs = [{"id": "p1", "prompt": "one", "model": MODEL_B}]
+    sweep.write_jobs(path, jobs, 1)
+    with open(path) as f:
+        assert json.loads(f.read()) == {"id": "p1#r1", "prompt": "one"}
+    assert jobs[0]["model"] == MODEL_B  # the caller's jobs are left alone
+    assert 'Ignoring the "model" of 1 prompt(s) (p1)' in capsys.readouterr().out
+
+
+def test_cells_run_model_by_model_resident_first():
+    cells = sweep.schedule_cells([MODEL_A, MODEL_B], ["code", "agent"], ["diff", "whole"],
+                                 loaded=["b:7b"])
+    assert [c["model"] for c in cells] == [MODEL_B] * 4 + [MODEL_A] * 4
+    assert [(c["edit_format"], c["mode"]) for c in cells[:4]] == [
+        ("diff", "code"), ("diff", "agent"), ("whole", "code"), ("whole", "agent")]
+
+
+def prompt_record(model, success=True, completion=10.0, first_chunk=1.0, edit_format=None):
+    return {"type": "prompt", "model": model, "mode": "code", "edit_format": edit_format,
+            "success": success, "attempts": 1 if success else 3,
+            "phases": {"completion": completion, "first_chunk": first_chunk},
+            "throughput": {"task_gen_tps": 20.0}}
+
+
+def test_summarize_cells_matches_records_to_cells():
+    cells = [{"model": MODEL_A, "mode": "code", "edit_format": sweep.DEFAULT_EDIT_FORMAT},
+             {"model": MODEL_B, "mode": "code", "edit_format": "diff"}]
+    records = [
+        prompt_record(MODEL_A, completion=10.0),
+        prompt_record(MODEL_A, success=False, completion=30.0),
+        prompt_record(MODEL_B, edit_format="whole"),  # another cell's run
+        {"type": "run", "model": MODEL_A, "mode": "code", "edit_format": None,
+         "phases": {"warm_up": 1.7}},
+    ]
+    first, second = sweep.summarize_cells(cells, records)
+    assert (first["prompts"], first["succeeded"], first["success_rate"], first["attempts"]) == \
+        (2, 1, 0.5, 4)
+    assert (first["completion_median"], first["completion_p95"], first["warm_up"]) == \
+        (20.0, 30.0, 1.7)
+    assert (second["prompts"], second["success_rate"], second["warm_up"]) == (0, None, None)
+
+
+def test_markdown_table():
+    row = {"model": MODEL_A, "mode": "code", "edit_format": "diff", "success_rate": 0.5,
+           "completion_median": 20.0}
+    header, rule, line = sweep.markdown_table([row]).split("\n")
+    assert header.startswith("| Model | Mode | Edit format | Success |")
+    assert rule == "|" + "---|" * len(sweep.SUMMARY_COLUMNS)
+    assert line.startswith("| ollama/a:7b | code | diff | 50% | 20.0s | — |")
@@ -0,0 +1,84 @@
+"""Task cleanup: the filters, durations and the pooled delete against the stand-in server."""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from ollama_prompt import RUNNER_TASK_NAME, HttpClient, TaskCleanup, parse_duration, task_name_for
+
+NOW = datetime(2026, 1, 2, 12, 0, tzinfo=timezone.utc)
+
+
+def cleanup_args(project_dir="/tmp/project", prefix=None, runner_only=False, older_than=None):
+    return SimpleNamespace(project_dir=project_dir, cleanup_prefix=prefix,
+                           cleanup_runner_only=runner_only, cleanup_older_than=older_than,
+                           cleanup_concurrency=4, cleanup_background=False)
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("90", 90.0), ("90s", 90.0), ("30m", 1800.0), ("2h", 7200.0), ("7d", 604800.0), (" 1.5h ", 5400.0),
+])
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "soon", "5w", "m"])
+def test_parse_duration_rejects(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_duration(text)
+
+
+def test_runner_task_names():
+    assert RUNNER_TASK_NAME.match(task_name_for({}, 1))
+    assert RUNNER_TASK_NAME.match(task_name_for({"id": "fizzbuzz-3"}, 12))
+    assert not RUNNER_TASK_NAME.match("Prompt #1 - later")
+    assert not RUNNER_TASK_NAME.match("Refactor the parser")
+
+
+def task(name, age=None, created=None):
+    if created is None and age is not None:
+        created = (NOW - timedelta(seconds=age)).isoformat().replace("+00:00", "Z")
+    return {"id": name, "name": name, "createdAt": created}
+
+
+def test_no_filters_match_everything():
+    cleanup = TaskCleanup(cleanup_args(), None)
+    assert cleanup.matches(task("anything"), NOW)
+    assert cleanup.matches({"id": "unnamed"}, NOW)
+
+
+def test_every_given_filter_must_match():
+    cleanup = TaskCleanup(cleanup_args(prefix="Prompt", runner_only=True, older_than=3600), None)
+    assert cleanup.matches(task("Prompt #1 - 10:00:00", age=7200), NOW)
+    assert not cleanup.matches(task("Prompt #1 - 10:00:00", age=60), NOW)
+    assert not cleanup.matches(task("Prompt notes", age=7200), NOW)
+    assert not cleanup.matches(task("Other #1 - 10:00:00", age=7200), NOW)
+
+
+def test_older_than_skips_tasks_without_a_usable_date():
+    cleanup = TaskCleanup(cleanup_args(older_than=60), None)
+    assert not cleanup.matches(task("no date"), NOW)
+    assert not cleanup.matches(task("bad date", created="yesterday"), NOW)
+    assert cleanup.matches(task("naive", created="2026-01-01T00:00:00"), NOW)  # read as UTC
+
+
+def test_cleanup_deletes_the_matches_and_keeps_tasks_to_reattach(fake_server, tmp_path):
+    project_dir = str(tmp_path)
+
+    def new(name):
+        r = requests.post(fake_server.api + "/project/tasks/new",
+                          json={"projectDir": project_dir, "name": name}, timeout=5)
+        return r.json()["id"]
+
+    runner = [new(f"Prompt #1 [p{i}] - 10:00:0{i}") for i in range(5)]
+    mine = new("Hand-written task")
+    cleanup = TaskCleanup(cleanup_args(project_dir, runner_only=True),
+                          HttpClient(fake_server.api, "admin", "admin"), keep=[runner[0]])
+    cleanup.run()
+
+    assert set(fake_server.tasks(project_dir)) == {runner[0], mine}
+    assert cleanup.finish({}) == {"listed": 6, "matched": 4, "deleted": 4, "failed": 0,
+                                  "tasks_per_s": cleanup.rate()}
@@ -0,0 +1,83 @@
+"""--measure-tokens: Ollama's generate counters and the per-task token rates."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_prompt import (HttpClient, TaskState, ollama_generate_stats, record_warm_up_stats,
+                           task_throughput, warm_up_ollama)
+
+FINAL = {"done": True, "load_duration": 2_000_000_000, "prompt_eval_count": 100,
+         "prompt_eval_duration": 500_000_000, "eval_count": 50, "eval_duration": 1_000_000_000}
+
+
+def test_ollama_generate_stats():
+    stats = ollama_generate_stats(FINAL, ttft=2.6)
+    assert stats == {"load": 2.0, "prompt_eval": 0.5, "eval": 1.0, "prompt_tokens": 100,
+                     "gen_tokens": 50, "ttft": 2.6, "prompt_tps": 200.0, "gen_tps": 50.0}
+
+
+def test_ollama_generate_stats_without_counters():
+    stats = ollama_generate_stats({"done": True})
+    assert stats["prompt_tps"] is None and stats["gen_tps"] is None
+    assert "ttft" not in stats
+
+
+def test_record_warm_up_stats_splits_timings_and_rates():
+    phases, throughput = {}, {}
+    record_warm_up_stats(ollama_generate_stats(FINAL, ttft=2.6), phases, throughput)
+    assert phases == {"warm_up_ttft": 2.6, "warm_up_load": 2.0, "warm_up_prompt_eval": 0.5,
+                      "warm_up_eval": 1.0}
+    assert throughput == {"warm_up_prompt_tokens": 100, "warm_up_gen_tokens": 50,
+                          "warm_up_prompt_tps": 200.0, "warm_up_gen_tps": 50.0}
+
+
+def test_task_throughput():
+    state = TaskState("task-1")
+    start = 1000.0
+    state.first_chunk_at, state.last_chunk_at = start + 2.0, start + 6.0
+    state.chunks_received, state.chunk_bytes = 41, 800
+    state.prompt_tokens, state.completion_tokens = 1000, 200
+
+    assert task_throughput(state, start) == {
+        "task_prompt_tokens": 1000, "task_gen_tokens": 200, "task_prompt_tps": 500.0,
+        "task_gen_tps": 50.0, "task_chunks_per_s": 10.0, "task_bytes_per_s": 200.0}
+
+
+def test_task_throughput_without_chunks():
+    assert task_throughput(TaskState("task-1"), 1000.0) == {}
+    assert task_throughput(None, 1000.0) == {}
+
+
+class StreamingGenerate(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        time.sleep(0.1)
+        for msg in ({"response": "Hel"}, {"response": "lo"}, FINAL):
+            self.wfile.write(json.dumps(msg).encode() + b"\n")
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StreamingGenerate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield HttpClient(f"http://127.0.0.1:{server.server_address[1]}")
+    server.shutdown()
+    server.server_close()
+
+
+def test_streamed_warm_up_fills_the_stats(ollama):
+    stats = {}
+    assert warm_up_ollama(ollama, "ollama/qwen2.5-coder:32b", timeout=5, stats=stats)
+    assert 0.1 <= stats["ttft"] < 2
+    assert (stats["prompt_tps"], stats["gen_tps"]) == (200.0, 50.0)
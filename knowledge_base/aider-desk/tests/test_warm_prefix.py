@@ -0,0 +1,70 @@
+"""Prefix cache warm-up: the primed text, request options and the cache-hit measurement."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from ollama_prompt import (READ_ONLY_FILES_HEADER, HttpClient, load_warm_prefix, ollama_options,
+                           prime_prefix, record_prefix_stats, render_context_files)
+
+
+def prefix_args(project_dir, warm_prefix=None, warm_context=False, context_file=None, num_ctx=None):
+    return SimpleNamespace(project_dir=str(project_dir), warm_prefix=warm_prefix,
+                           warm_context=warm_context, context_file=context_file, num_ctx=num_ctx)
+
+
+def test_context_files_render_like_aider(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "style.md").write_text("Use two spaces.")
+    (tmp_path / "NOTES").write_text("none")
+    assert render_context_files(str(tmp_path), ["docs/style.md", "NOTES"]) == (
+        READ_ONLY_FILES_HEADER
+        + "docs/style.md\n```\nUse two spaces.\n```\n\n"
+        + "NOTES\n```\nnone\n```\n\n")
+
+
+def test_load_warm_prefix_sources(tmp_path):
+    (tmp_path / "conventions.md").write_text("Be brief.")
+    prefix_file = tmp_path / "prefix.txt"
+    prefix_file.write_text("SYSTEM: you are terse")
+
+    assert load_warm_prefix(prefix_args(tmp_path)) is None
+    assert load_warm_prefix(prefix_args(tmp_path, context_file=["conventions.md"])) is None
+    assert load_warm_prefix(prefix_args(tmp_path, warm_context=True,
+                                        context_file=["conventions.md"])).endswith("Be brief.\n```\n\n")
+    # --warm-prefix wins over --warm-context
+    assert load_warm_prefix(prefix_args(tmp_path, warm_prefix=str(prefix_file), warm_context=True,
+                                        context_file=["conventions.md"])) == "SYSTEM: you are terse"
+
+
+def test_unreadable_prefix_exits(tmp_path):
+    with pytest.raises(SystemExit):
+        load_warm_prefix(prefix_args(tmp_path, warm_prefix=str(tmp_path / "missing.txt")))
+
+
+def test_ollama_options():
+    assert ollama_options(SimpleNamespace(num_ctx=None)) == {}
+    assert ollama_options(SimpleNamespace(num_ctx=8192)) == {"num_ctx": 8192}
+
+
+def test_record_prefix_stats():
+    phases, throughput = {}, {}
+    record_prefix_stats({"prefix_tokens": 4521, "cold_prompt_eval": 2.26049,
+                         "warm_prompt_eval": 0.0021, "warm_tokens": 1}, phases, throughput)
+    assert phases == {"warm_prefix_cold_prompt_eval": 2.26, "warm_prefix_warm_prompt_eval": 0.002}
+    assert throughput == {"warm_prefix_tokens": 4521, "warm_prefix_reeval_tokens": 1}
+
+
+def test_prime_prefix_against_the_prompt_cache(start_fake_server):
+    server = start_fake_server("--prompt-cache", "--prompt-tps", "2000")
+    prefix = " ".join(f"word{i}" for i in range(400))
+    stats = prime_prefix(HttpClient(server.ollama_url), "ollama/qwen2.5-coder:32b", prefix,
+                         {"num_ctx": 4096})
+    assert stats["prefix_tokens"] == 400
+    assert stats["warm_tokens"] < 400
+    assert stats["warm_prompt_eval"] < stats["cold_prompt_eval"]
+
+
+def test_prime_prefix_failure_is_not_fatal(start_fake_server):
+    server = start_fake_server()
+    assert prime_prefix(HttpClient(server.ollama_url), "ollama/missing:1b", "text") is None